@@ -11,6 +11,7 @@ import kotlinx.coroutines.CancellationException
 import kotlinx.io.readUByte
 import kotlinx.serialization.SerialName
 import kotlinx.serialization.Serializable
+import kotlinx.serialization.Transient
 import kotlinx.serialization.json.Json
 import mindustry.Vars
 import mindustry.gen.Building
@@ -19,6 +20,8 @@ import mindustry.world.blocks.logic.LogicBlock.LogicBuild
 import mindustry.world.blocks.logic.MemoryBlock.MemoryBuild
 import mindustry.world.blocks.logic.MessageBlock.MessageBuild
 import mindustry.world.blocks.logic.SwitchBlock.SwitchBuild
+import java.nio.ByteBuffer
+import java.nio.ByteOrder
 import kotlin.concurrent.thread
 import kotlin.coroutines.resume
 import kotlin.coroutines.resumeWithException
@@ -53,8 +56,9 @@ class ProcessorAccess(
 
     val ramStartProc = (romEnd / ROM_PROC_BYTES.toUInt()).toInt()
 
-    fun flashRom(file: Fi): Int {
-        val data = file.readBytes()
+    fun flashRom(file: Fi): Int = flashRom(file.readBytes())
+
+    fun flashRom(data: ByteArray): Int {
         require(data.size.mod(4) == 0) { "Data length must be a multiple of 4 bytes." }
         require(data.size <= romSize) { "Data is too large to fit into the processor's ROM." }
 
@@ -84,19 +88,157 @@ class ProcessorAccess(
     }
 
     fun dumpRam(file: Fi, startAddress: UInt, bytes: Int) {
+        file.writeBytes(readRam(startAddress, bytes))
+    }
+
+    fun readRam(startAddress: UInt, bytes: Int): ByteArray {
         require(bytes > 0) { "Bytes must be positive." }
         require(bytes <= ramSize) { "Bytes must not be greater than the RAM size." }
         require(bytes.mod(4) == 0) { "Bytes must be aligned to 4 bytes." }
 
-        val writes = file.writes()
+        val data = ByteArray(bytes)
+        var i = 0
         for ((lvar, _) in ramWordsSequence(startAddress).take(bytes / 4)) {
             val word = lvar.numval.toUInt()
-            writes.b(((word shr 24) and 0xffu).toInt())
-            writes.b(((word shr 16) and 0xffu).toInt())
-            writes.b(((word shr 8) and 0xffu).toInt())
-            writes.b((word and 0xffu).toInt())
+            data[i++] = (word shr 24).toByte()
+            data[i++] = (word shr 16).toByte()
+            data[i++] = (word shr 8).toByte()
+            data[i++] = word.toByte()
+        }
+        return data.copyOf(i)
+    }
+
+    /**
+     * Reads little-endian words from [space], stopping early at the end of the region containing [startAddress].
+     */
+    fun readMemory(space: MemorySpace, startAddress: UInt, bytes: Int): ByteArray {
+        requireAligned(startAddress, bytes)
+
+        val words = when (space) {
+            MemorySpace.memory -> when (startAddress) {
+                in ROM_START..<romEnd -> return readRom(startAddress, bytes)
+                in RAM_START..<ramEnd -> ramWordsSequence(startAddress).map { (lvar, _) -> lvar.numval.toUInt() }
+                else -> throw IllegalArgumentException("Address must be within ROM or RAM.")
+            }
+
+            MemorySpace.registers -> wordIndices(startAddress, registers.memory.size)
+                .asSequence()
+                .map { registers.memory[it].toUInt() }
+
+            MemorySpace.csrs -> wordIndices(startAddress, csrs.executor.vars.size - 1)
+                .asSequence()
+                .map { csrs.executor.vars[it + 1].numu() }
+        }
+
+        val buffer = ByteBuffer.allocate(bytes).order(ByteOrder.LITTLE_ENDIAN)
+        for (word in words.take(bytes / 4)) {
+            buffer.putInt(word.toInt())
+        }
+        return buffer.array().copyOf(buffer.position())
+    }
+
+    /**
+     * Writes little-endian words to [space]. Writing to ROM reflashes each ROM proc that was modified.
+     */
+    fun writeMemory(space: MemorySpace, startAddress: UInt, data: ByteArray) {
+        requireAligned(startAddress, data.size)
+
+        val words = ByteBuffer.wrap(data).order(ByteOrder.LITTLE_ENDIAN).asIntBuffer()
+        val count = words.remaining()
+        when (space) {
+            MemorySpace.memory -> when (startAddress) {
+                in ROM_START..<romEnd -> {
+                    require(startAddress + data.size.toUInt() <= romEnd) { "Data must fit within ROM." }
+                    writeRom(startAddress, data)
+                }
+
+                in RAM_START..<ramEnd -> {
+                    require(startAddress + data.size.toUInt() <= ramEnd) { "Data must fit within RAM." }
+                    for ((lvar, _) in ramWordsSequence(startAddress).take(count)) {
+                        lvar.setnum(words.get().toUInt().toDouble())
+                    }
+                }
+
+                else -> throw IllegalArgumentException("Address must be within ROM or RAM.")
+            }
+
+            MemorySpace.registers -> {
+                val indices = wordIndices(startAddress, registers.memory.size).toList()
+                require(count <= indices.size) { "Data must fit within the registers." }
+                for (i in indices.take(count)) {
+                    registers.memory[i] = words.get().toUInt().toDouble()
+                }
+            }
+
+            MemorySpace.csrs -> {
+                val indices = wordIndices(startAddress, csrs.executor.vars.size - 1).toList()
+                require(count <= indices.size) { "Data must fit within the CSRs." }
+                for (i in indices.take(count)) {
+                    csrs.executor.vars[i + 1].setnum(words.get().toUInt().toDouble())
+                }
+            }
+        }
+    }
+
+    private fun requireAligned(address: UInt, bytes: Int) {
+        require(bytes >= 0) { "Bytes must not be negative." }
+        require(address.mod(4u) == 0u && bytes.mod(4) == 0) { "Address and bytes must be aligned to 4 bytes." }
+    }
+
+    private fun wordIndices(startAddress: UInt, words: Int): IntRange {
+        val start = (startAddress / 4u).toInt()
+        require(startAddress / 4u < words.toUInt()) { "Address out of range." }
+        return start..<words
+    }
+
+    private fun readRom(startAddress: UInt, bytes: Int): ByteArray {
+        val end = min(startAddress.toLong() + bytes, romEnd.toLong()).toUInt()
+        val result = ByteArray((end - startAddress).toInt())
+
+        var address = startAddress
+        while (address < end) {
+            val offset = (address % ROM_PROC_BYTES.toUInt()).toInt()
+            val count = min(ROM_PROC_BYTES - offset, (end - address).toInt())
+            val data = getRomData(address)
+            for (i in 0..<count) {
+                // anything after the end of the flashed data reads as 0
+                val char = data.getOrNull(offset + i) ?: break
+                result[(address - startAddress).toInt() + i] = (char.code - ROM_BYTE_OFFSET).toByte()
+            }
+            address += count.toUInt()
         }
-        writes.close()
+
+        return result
+    }
+
+    private fun writeRom(startAddress: UInt, data: ByteArray) {
+        var address = startAddress
+        var index = 0
+        while (index < data.size) {
+            val procAddress = address - address % ROM_PROC_BYTES.toUInt()
+            val offset = (address - procAddress).toInt()
+            val count = min(ROM_PROC_BYTES - offset, data.size - index)
+
+            val bytes = getRomData(address)
+                .map { (it.code - ROM_BYTE_OFFSET).toByte() }
+                .toMutableList()
+            while (bytes.size < offset + count) {
+                bytes.add(0)
+            }
+            for (i in 0..<count) {
+                bytes[offset + i] = data[index + i]
+            }
+            flashRomProc(procAddress, bytes)
+
+            address += count.toUInt()
+            index += count
+        }
+    }
+
+    private fun getRomData(address: UInt): String {
+        val proc = getRomProc(address)
+            ?: throw IllegalStateException("ROM proc not found at address: $address")
+        return proc.executor.optionalVar("v")?.obj() as? String ?: ""
     }
 
     fun isServerRunning() = serverThread != null && serverJob != null && serverBuildId == build.id
@@ -270,6 +412,9 @@ class ProcessorAccess(
                     break
                 }
                 tx.writeStringUtf8(Json.encodeToString(response) + "\n")
+                if (response is DataResponse) {
+                    tx.writeFully(response.data)
+                }
             }
             Log.info("Client disconnected.")
         }
@@ -400,6 +545,47 @@ data class DumpRequest(
     }
 }
 
+/**
+ * Flashes an image sent inline after the request, as exactly [size] raw bytes.
+ */
+@Serializable
+@SerialName("flashBytes")
+data class FlashBytesRequest(
+    val size: Int,
+) : Request() {
+    override suspend fun handle(processor: ProcessorAccess, rx: ByteReadChannel, tx: ByteWriteChannel): Response {
+        require(size >= 0) { "Size must not be negative." }
+        if (size > processor.romSize) {
+            // skip the payload so the next request can still be parsed
+            rx.discard(size.toLong())
+            throw IllegalArgumentException("Data is too large to fit into the processor's ROM.")
+        }
+
+        val data = rx.readByteArray(size)
+        return runOnMainThread {
+            val bytes = processor.flashRom(data)
+            SuccessResponse("Successfully flashed $bytes bytes to ROM.")
+        }
+    }
+}
+
+/**
+ * Dumps RAM inline, as a [DataResponse] followed by the raw bytes.
+ */
+@Serializable
+@SerialName("dumpBytes")
+data class DumpBytesRequest(
+    val address: UInt?,
+    val bytes: Int?,
+) : Request() {
+    override suspend fun handle(processor: ProcessorAccess, rx: ByteReadChannel, tx: ByteWriteChannel) = runOnMainThread {
+        val address = address ?: ProcessorAccess.RAM_START
+        val bytes = bytes ?: (processor.ramEnd - address).toInt()
+
+        DataResponse(processor.readRam(address, bytes))
+    }
+}
+
 @Serializable
 @SerialName("start")
 data class StartRequest(
@@ -434,6 +620,146 @@ data class WaitRequest(
     }
 }
 
+/**
+ * Reads [bytes] bytes from [space] as little-endian words, responding with a [DataResponse]. The response is shorter
+ * than requested if the read reaches the end of the region.
+ */
+@Serializable
+@SerialName("readMemory")
+data class ReadMemoryRequest(
+    val space: MemorySpace = MemorySpace.memory,
+    val address: UInt,
+    val size: Int,
+) : Request() {
+    override suspend fun handle(processor: ProcessorAccess, rx: ByteReadChannel, tx: ByteWriteChannel) = runOnMainThread {
+        DataResponse(processor.readMemory(space, address, size))
+    }
+}
+
+/**
+ * Writes exactly [size] raw bytes sent inline after the request to [space], as little-endian words.
+ */
+@Serializable
+@SerialName("writeMemory")
+data class WriteMemoryRequest(
+    val space: MemorySpace = MemorySpace.memory,
+    val address: UInt,
+    val size: Int,
+) : Request() {
+    override suspend fun handle(processor: ProcessorAccess, rx: ByteReadChannel, tx: ByteWriteChannel): Response {
+        require(size >= 0) { "Size must not be negative." }
+        if (size > maxOf(processor.romSize, processor.ramSize)) {
+            // skip the payload so the next request can still be parsed
+            rx.discard(size.toLong())
+            throw IllegalArgumentException("Data is too large to fit into memory.")
+        }
+
+        val data = rx.readByteArray(size)
+        return runOnMainThread {
+            processor.writeMemory(space, address, data)
+            SuccessResponse("Successfully wrote $size bytes to $space.")
+        }
+    }
+}
+
+@Serializable
+enum class MemorySpace {
+    /** The physical address space (ROM and RAM). */
+    memory,
+
+    /** The registers memory cell. Address 4*n is register xn. */
+    registers,
+
+    /** The CSRs proc. Address 4*n is CSR n, for CSRs which are stored in that proc. */
+    csrs,
+}
+
+/**
+ * Single-steps up to [steps] instructions, stopping early if the processor stops, reaches [pc], or has retired
+ * [instret] instructions. Responds with a [DataResponse] containing a packed little-endian record for each
+ * instruction executed: pc (u32), instruction (u32), the register it changed or 0 if none (u8), and that register's
+ * new value (u32).
+ */
+@Serializable
+@SerialName("step")
+data class StepRequest(
+    val steps: Int,
+    val pc: UInt? = null,
+    val instret: ULong? = null,
+) : Request() {
+    override suspend fun handle(processor: ProcessorAccess, rx: ByteReadChannel, tx: ByteWriteChannel): Response {
+        require(steps > 0) { "Steps must be positive." }
+        runOnMainThread {
+            require(processor.powerSwitch.enabled) { "Processor is not running!" }
+            require(processor.singleStepSwitch.enabled) { "Processor is not single-stepping!" }
+        }
+
+        val records = ByteBuffer.allocate(steps * TRACE_RECORD_BYTES).order(ByteOrder.LITTLE_ENDIAN)
+        var previous = waitForPause(processor)
+        for (i in 0..<steps) {
+            if (
+                !previous.running
+                || (pc != null && previous.pc == pc)
+                || (instret != null && previous.minstret >= instret)
+            ) break
+
+            runOnMainThread { processor.pauseSwitch.configure(false) }
+            val status = waitForPause(processor)
+
+            val rd = (1..<status.registers.size).firstOrNull { status.registers[it] != previous.registers[it] } ?: 0
+            records.putInt((previous.pc ?: 0u).toInt())
+            records.putInt((previous.instruction ?: 0u).toInt())
+            records.put(rd.toByte())
+            records.putInt(status.registers[rd].toInt())
+
+            previous = status
+        }
+
+        return DataResponse(records.array().copyOf(records.position()))
+    }
+
+    companion object {
+        const val TRACE_RECORD_BYTES = 13
+    }
+}
+
+/**
+ * Pushes a [StatusEvent] each time the processor pauses, and finally when it stops, then responds with
+ * [SuccessResponse]. If [unpause] is set, the processor is unpaused after each event.
+ */
+@Serializable
+@SerialName("subscribe")
+data class SubscribeRequest(
+    val unpause: Boolean = false,
+) : Request() {
+    override suspend fun handle(processor: ProcessorAccess, rx: ByteReadChannel, tx: ByteWriteChannel): Response {
+        var previous: StatusResponse? = null
+        while (true) {
+            if (rx.isClosedForRead || tx.isClosedForWrite) {
+                throw RuntimeException("Client disconnected!")
+            }
+
+            val status = waitForPause(processor)
+            tx.writeStringUtf8(Json.encodeToString<Response>(StatusEvent.diff(previous, status)) + "\n")
+            previous = status
+
+            if (!status.running) {
+                return SuccessResponse("Processor stopped.")
+            }
+
+            if (unpause) {
+                runOnMainThread { processor.pauseSwitch.configure(false) }
+            } else {
+                // wait for someone else to unpause it
+                // also check if it moved, in case it ran a step and paused again between two checks
+                while (runOnMainThread { isPausedAt(processor, status) }) {
+                    delay(1000/60) // 1 tick
+                }
+            }
+        }
+    }
+}
+
 @Serializable
 enum class UartDevice {
     uart0,
@@ -547,6 +873,26 @@ data object StatusRequest : Request() {
     }
 }
 
+private suspend fun waitForPause(processor: ProcessorAccess): StatusResponse {
+    while (true) {
+        val status = runOnMainThread {
+            if (processor.powerSwitch.enabled && !processor.pauseSwitch.enabled) {
+                null
+            } else {
+                processor.getStatus()
+            }
+        }
+        if (status != null) return status
+        delay(1000/60) // 1 tick
+    }
+}
+
+private fun isPausedAt(processor: ProcessorAccess, status: StatusResponse): Boolean {
+    if (!processor.powerSwitch.enabled || !processor.pauseSwitch.enabled) return false
+    val current = processor.getStatus()
+    return current.pc == status.pc && current.minstret == status.minstret
+}
+
 @Serializable
 sealed class Response
 
@@ -554,6 +900,18 @@ sealed class Response
 @SerialName("success")
 data class SuccessResponse(val message: String) : Response()
 
+/**
+ * Followed by exactly [size] raw bytes of [data].
+ */
+@Serializable
+@SerialName("data")
+class DataResponse(
+    val size: Int,
+    @Transient val data: ByteArray = ByteArray(0),
+) : Response() {
+    constructor(data: ByteArray) : this(data.size, data)
+}
+
 @Serializable
 @SerialName("status")
 data class StatusResponse(
@@ -576,7 +934,59 @@ data class StatusResponse(
     val mcycle: ULong,
     val minstret: ULong,
     val mtime: ULong,
-) : Response()
+) : Response() {
+    fun csrs() = mapOf(
+        "mscratch" to mscratch.toULong(),
+        "mtvec" to mtvec.toULong(),
+        "mepc" to mepc.toULong(),
+        "mcause" to mcause.toULong(),
+        "mtval" to mtval.toULong(),
+        "mstatus" to mstatus.toULong(),
+        "mip" to mip.toULong(),
+        "mie" to mie.toULong(),
+        "mcycle" to mcycle,
+        "minstret" to minstret,
+        "mtime" to mtime,
+    )
+}
+
+/**
+ * A [StatusResponse] containing only the registers and CSRs that changed since the previous event. [errorOutput] is
+ * null if unchanged.
+ */
+@Serializable
+@SerialName("event")
+data class StatusEvent(
+    val running: Boolean,
+    val paused: Boolean,
+    val state: String,
+    val errorOutput: String?,
+    val pc: UInt?,
+    val instruction: UInt?,
+    val privilegeMode: UInt?,
+    val registers: Map<Int, UInt>,
+    val csrs: Map<String, ULong>,
+) : Response() {
+    companion object {
+        fun diff(previous: StatusResponse?, status: StatusResponse): StatusEvent {
+            val previousCsrs = previous?.csrs()
+            return StatusEvent(
+                running = status.running,
+                paused = status.paused,
+                state = status.state,
+                errorOutput = status.errorOutput.takeIf { it != previous?.errorOutput },
+                pc = status.pc,
+                instruction = status.instruction,
+                privilegeMode = status.privilegeMode,
+                registers = status.registers
+                    .withIndex()
+                    .filter { (i, value) -> previous?.registers?.getOrNull(i) != value }
+                    .associate { (i, value) -> i to value },
+                csrs = status.csrs().filter { (name, value) -> previousCsrs?.get(name) != value },
+            )
+        }
+    }
+}
 
 @Serializable
 @SerialName("error")
@@ -1,5 +1,29 @@
 __all__ = [
+    "AsyncProcessorAccess",
     "ProcessorAccess",
+    "ProcessorPool",
 ]
 
-from .processor_access import ProcessorAccess
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .async_processor_access import AsyncProcessorAccess
+    from .processor_access import ProcessorAccess
+    from .processor_pool import ProcessorPool
+
+
+def __getattr__(name: str) -> Any:
+    # imported lazily so the preprocessor doesn't pay for it on startup
+    if name == "ProcessorAccess":
+        from .processor_access import ProcessorAccess
+
+        return ProcessorAccess
+    if name == "AsyncProcessorAccess":
+        from .async_processor_access import AsyncProcessorAccess
+
+        return AsyncProcessorAccess
+    if name == "ProcessorPool":
+        from .processor_pool import ProcessorPool
+
+        return ProcessorPool
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import socket
+from collections import deque
+from pathlib import Path
+from typing import Any, AsyncIterator
+
+from pydantic import ValidationError
+
+from .processor_access import (
+    CACHE_SAFE_REQUESTS,
+    DataResponse,
+    DumpBytesRequest,
+    DumpRequest,
+    ErrorResponse,
+    FlashBytesRequest,
+    FlashRequest,
+    MemorySpace,
+    PageCache,
+    ProcessorError,
+    ReadMemoryRequest,
+    Request,
+    SerialRequest,
+    StartRequest,
+    StatusRequest,
+    StatusResponse,
+    StepRequest,
+    StopRequest,
+    SuccessResponse,
+    TraceRecord,
+    UartDevice,
+    UnpauseRequest,
+    WaitRequest,
+    WriteMemoryRequest,
+    encode_request,
+    parse_trace,
+    response_adapter,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncProcessorAccess:
+    """asyncio client for the ProcessorAccess server, with the same API as
+    `ProcessorAccess`.
+
+    Requests are pipelined: each one is written immediately, and since the server
+    handles the requests on a connection in order, responses are matched to requests
+    in the order they were sent. Many requests can be outstanding at once, eg.
+    `asyncio.gather(processor.status(), processor.status())`. Note that `wait` delays
+    the responses to every request sent after it.
+
+    Cancelling a request (or timing out) doesn't affect the others; its response
+    (including any inline data) is discarded when it arrives. If the server closes
+    the connection, pending and later requests raise `ConnectionError`. `serial`
+    opens a separate connection for the stream.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        *,
+        timeout: float | None = None,
+        log_level: int = logging.DEBUG,
+        page_cache_size: int = 64,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.timeout = timeout
+        """The default timeout for each request, in seconds."""
+        self.log_level = log_level
+        self.page_cache = PageCache(page_cache_size)
+
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._pending = deque[tuple[asyncio.Future[Any], type[Any]]]()
+        self._read_task: asyncio.Task[None] | None = None
+
+    async def connect(self):
+        self._reader, self._writer = await self._open_connection()
+        self._read_task = asyncio.create_task(self._read_responses())
+
+    async def disconnect(self):
+        self._fail_pending(ConnectionError("Disconnected"))
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+            self._writer = None
+
+    async def flash(
+        self,
+        path: str | Path,
+        *,
+        absolute: bool = True,
+        timeout: float | None = None,
+    ):
+        path = Path(path)
+        if absolute and not path.is_absolute():
+            raise ValueError("Path must be absolute.")
+
+        return await self._request(
+            FlashRequest(path=path, absolute=absolute), SuccessResponse, timeout
+        )
+
+    async def dump(
+        self,
+        path: str | Path,
+        address: int | None = None,
+        data: int | None = None,
+        *,
+        absolute: bool = True,
+        timeout: float | None = None,
+    ):
+        path = Path(path)
+        if absolute and not path.is_absolute():
+            raise ValueError("Path must be absolute.")
+
+        return await self._request(
+            DumpRequest(path=path, address=address, bytes=data, absolute=absolute),
+            SuccessResponse,
+            timeout,
+        )
+
+    async def flash_bytes(
+        self,
+        data: bytes | bytearray | memoryview,
+        *,
+        timeout: float | None = None,
+    ):
+        return await self._request(
+            FlashBytesRequest(size=len(data)), SuccessResponse, timeout, data
+        )
+
+    async def dump_bytes(
+        self,
+        address: int | None = None,
+        size: int | None = None,
+        *,
+        timeout: float | None = None,
+    ) -> memoryview:
+        return await self._request_data(
+            DumpBytesRequest(address=address, bytes=size), timeout
+        )
+
+    async def read_memory(
+        self,
+        address: int,
+        size: int,
+        *,
+        space: MemorySpace = "memory",
+        timeout: float | None = None,
+    ) -> memoryview:
+        pages, missing = self.page_cache.lookup(space, address, size)
+
+        async def fetch(start: int, length: int):
+            generation = self.page_cache.generation
+            data = await self._request_data(
+                ReadMemoryRequest(space=space, address=start, size=length), timeout
+            )
+            return self.page_cache.store(space, start, data, generation)
+
+        for fetched in await asyncio.gather(*(fetch(*run) for run in missing)):
+            pages |= fetched
+        return PageCache.join(pages, address, size)
+
+    async def write_memory(
+        self,
+        address: int,
+        data: bytes | bytearray | memoryview,
+        *,
+        space: MemorySpace = "memory",
+        timeout: float | None = None,
+    ):
+        if address % 4 or len(data) % 4:
+            raise ValueError("Address and size must be aligned to 4 bytes.")
+
+        self.page_cache.invalidate(space, address, len(data))
+        return await self._request(
+            WriteMemoryRequest(space=space, address=address, size=len(data)),
+            SuccessResponse,
+            timeout,
+            data,
+        )
+
+    async def start(self, *, single_step: bool = False, timeout: float | None = None):
+        return await self._request(
+            StartRequest(single_step=single_step), SuccessResponse, timeout
+        )
+
+    async def wait(
+        self,
+        *,
+        stopped: bool,
+        paused: bool,
+        timeout: float | None = None,
+    ):
+        return await self._request(
+            WaitRequest(stopped=stopped, paused=paused), SuccessResponse, timeout
+        )
+
+    async def unpause(self, *, timeout: float | None = None):
+        return await self._request(UnpauseRequest(), SuccessResponse, timeout)
+
+    async def stop(self, *, timeout: float | None = None):
+        return await self._request(StopRequest(), SuccessResponse, timeout)
+
+    async def status(self, *, timeout: float | None = None):
+        return await self._request(StatusRequest(), StatusResponse, timeout)
+
+    def step(
+        self,
+        steps: int = 1,
+        *,
+        batch_size: int = 1024,
+        timeout: float | None = None,
+    ) -> AsyncIterator[TraceRecord]:
+        return self.run_until(max_steps=steps, batch_size=batch_size, timeout=timeout)
+
+    async def run_until(
+        self,
+        *,
+        pc: int | None = None,
+        instret: int | None = None,
+        max_steps: int | None = None,
+        batch_size: int = 1024,
+        timeout: float | None = None,
+    ) -> AsyncIterator[TraceRecord]:
+        remaining = max_steps
+        while remaining is None or remaining > 0:
+            steps = batch_size if remaining is None else min(batch_size, remaining)
+            data = await self._request_data(
+                StepRequest(steps=steps, pc=pc, instret=instret), timeout
+            )
+            records = parse_trace(data)
+
+            for record in records:
+                yield record
+            if len(records) < steps:
+                return
+            if remaining is not None:
+                remaining -= len(records)
+
+    async def serial(
+        self,
+        device: UartDevice,
+        *,
+        stop_on_halt: bool = False,
+        disconnect_on_halt: bool = False,
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Opens a dedicated connection streaming to and from a UART.
+
+        The caller is responsible for closing the returned writer.
+        """
+
+        reader, writer = await self._open_connection()
+        request = SerialRequest(
+            device=device,
+            direction="both",
+            stopOnHalt=stop_on_halt,
+            disconnectOnHalt=disconnect_on_halt,
+        )
+        self._log("Sending request", encode_request(request))
+        writer.write(encode_request(request))
+        await writer.drain()
+        return reader, writer
+
+    async def _open_connection(self):
+        reader, writer = await asyncio.open_connection(self.hostname, self.port)
+        sock: socket.socket | None = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return reader, writer
+
+    async def _request[T](
+        self,
+        request: Request,
+        response_type: type[T],
+        timeout: float | None,
+        payload: bytes | bytearray | memoryview | None = None,
+    ) -> T:
+        return await self._send(request, response_type, timeout, payload)
+
+    async def _request_data(
+        self,
+        request: Request,
+        timeout: float | None,
+    ) -> memoryview:
+        """Sends a request answered with a `DataResponse`, and returns its payload."""
+
+        return await self._send(request, DataResponse, timeout)
+
+    async def _send(
+        self,
+        request: Request,
+        response_type: type[Any],
+        timeout: float | None,
+        payload: bytes | bytearray | memoryview | None = None,
+    ) -> Any:
+        if self._writer is None or self._read_task is None:
+            raise ConnectionError("Not connected")
+        if self._read_task.done():
+            # nothing would ever resolve the response
+            raise ConnectionError("Connection closed by server")
+
+        message = encode_request(request)
+        self._log("Sending request", message)
+        if not isinstance(request, CACHE_SAFE_REQUESTS):
+            self.page_cache.clear()
+
+        # write and enqueue without awaiting in between, so responses stay in order
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((future, response_type))
+        self._writer.write(message)
+        if payload is not None:
+            self._writer.write(payload)
+
+        await self._writer.drain()
+        return await asyncio.wait_for(future, timeout or self.timeout)
+
+    async def _read_responses(self):
+        assert self._reader is not None
+        # fail everything still pending however this exits, so no request waits
+        # forever on a dead connection
+        error: BaseException = ConnectionError("Connection closed by server")
+        try:
+            while line := await self._reader.readline():
+                self._log("Received response", line)
+                if not self._pending:
+                    logger.warning(f"Received unexpected response: {line!r}")
+                    continue
+
+                future, response_type = self._pending.popleft()
+                if future.done() and response_type is not DataResponse:
+                    # cancelled or timed out
+                    continue
+
+                try:
+                    response = response_adapter(response_type).validate_json(line)
+                except ValidationError as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    await self._skip_payload(line)
+                    continue
+
+                match response:
+                    case DataResponse(size=size):
+                        # always read the payload, even if the request was cancelled
+                        data = memoryview(await self._reader.readexactly(size))
+                        if not future.done():
+                            future.set_result(data)
+                    case _ if future.done():
+                        pass
+                    case ErrorResponse() as e:
+                        future.set_exception(ProcessorError(e))
+                    case _:
+                        future.set_result(response)
+        except asyncio.IncompleteReadError:
+            pass
+        except OSError as e:
+            error = e
+        finally:
+            self._fail_pending(error)
+
+    async def _skip_payload(self, line: bytes):
+        """Discards the payload after an unexpected or invalid data response, so the
+        next response is read from the right place."""
+
+        assert self._reader is not None
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return
+        if not isinstance(message, dict) or message.get("type") != "data":
+            return
+
+        size = message.get("size")
+        if not isinstance(size, int) or size < 0:
+            raise ConnectionError(f"Lost sync with server after response: {line!r}")
+        await self._reader.readexactly(size)
+
+    def _fail_pending(self, exception: BaseException):
+        while self._pending:
+            future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(exception)
+
+    def _log(self, prefix: str, message: bytes):
+        if logger.isEnabledFor(self.log_level):
+            logger.log(self.log_level, f"{prefix}: {message.decode().rstrip()}")
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *_: Any):
+        await self.disconnect()
+        return False  # propagate exceptions
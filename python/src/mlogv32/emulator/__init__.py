@@ -0,0 +1,30 @@
+"""Offline emulator for the mlog code generated by the preprocessor."""
+
+from .blocks import Building, Content, MemoryBuild, MessageBuild, SwitchBuild
+from .compiler import CompiledLogicBuild, CompiledProgram, compile_program
+from .heatmap import Heatmap, ProgramProfile
+from .icache import IcacheMismatch, find_icache_mismatches, mlog_decode
+from .processor import LogicBuild, Program, load_program
+from .world import EmulatedCpu, Uart, World
+
+__all__ = [
+    "Building",
+    "CompiledLogicBuild",
+    "CompiledProgram",
+    "Content",
+    "EmulatedCpu",
+    "Heatmap",
+    "IcacheMismatch",
+    "LogicBuild",
+    "MemoryBuild",
+    "MessageBuild",
+    "Program",
+    "ProgramProfile",
+    "SwitchBuild",
+    "Uart",
+    "World",
+    "compile_program",
+    "find_icache_mismatches",
+    "load_program",
+    "mlog_decode",
+]
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import sys
+import time
+from pathlib import Path
+from typing import Annotated
+
+from typer import Exit, Option, Typer
+
+from mlogv32.preprocessor.icache import IcacheDecoder
+from mlogv32.preprocessor.models import BuildConfig
+from mlogv32.preprocessor.sourcemap import SourceMap
+
+from .heatmap import Heatmap
+from .icache import find_icache_mismatches
+from .world import EmulatedCpu, World
+
+app = Typer(
+    pretty_exceptions_show_locals=False,
+)
+
+
+@app.callback()
+def main():
+    """Offline mlog emulator for mlogv32 schematics."""
+
+
+@app.command()
+def run(
+    path: Path,
+    max_ticks: Annotated[int, Option("-t", "--ticks")] = 60 * 60,
+    uart: Annotated[bool, Option("--uart/--no-uart")] = True,
+    compiled: Annotated[bool, Option("--compile/--interpret")] = True,
+    profile: Annotated[bool, Option("-p", "--profile")] = False,
+    source_maps: Annotated[list[Path] | None, Option("--source-map")] = None,
+    annotate_dir: Annotated[Path | None, Option("--annotate")] = None,
+    top: Annotated[int, Option("--top")] = 20,
+):
+    """Run a CPU schematic until it halts, and report instructions per tick.
+
+    The schematic must contain a CPU and its peripherals, eg.:
+
+    python -m mlogv32.preprocessor build src/cpu/cpu.yaml -c micropython -w 4 -h 4 -C -P -M --bin program.bin -o program.msch
+
+    Profiling (--profile):
+
+    Counts how many times each mlog instruction is executed, and prints the most
+    executed lines and labels. Counts are combined for processors with the same code.
+
+    --source-map maps the counts back to template lines, using the source maps written
+    by `build --source-map` (eg. src/cpu/worker.mlog.map.json). --annotate writes a copy
+    of the code of each processor with the count of each line to a directory. Both
+    imply --profile.
+    """
+
+    profile = profile or bool(source_maps or annotate_dir)
+
+    world = World.load(path, compiled=compiled, profile=profile)
+    cpu = EmulatedCpu.find(world)
+
+    start_time = time.perf_counter()
+    cpu.power_on()
+
+    # measure from the start of the tick where the workers take over
+    start_tick = None
+    start_executed = 0
+    while not cpu.halted and world.ticks < max_ticks:
+        tick = world.ticks
+        executed = world.executed
+        world.tick()
+
+        if start_tick is None and cpu.started:
+            start_tick = tick
+            start_executed = executed
+
+        if uart and (data := cpu.uarts[0].read()):
+            sys.stdout.write(data.decode(errors="replace"))
+            sys.stdout.flush()
+
+    elapsed = time.perf_counter() - start_time
+
+    if uart:
+        print()
+    if not cpu.halted:
+        print(f"[WARNING] CPU did not halt after {max_ticks} ticks.")
+    if cpu.error_output.text:
+        print(f"Error output: {cpu.error_output.text}")
+
+    print(f"Ticks: {world.ticks}")
+    print(f"Wall time: {elapsed:.3f}s ({world.executed / elapsed:,.0f} mlog/s)")
+    print(f"mlog instructions: {world.executed}")
+
+    if start_tick is None:
+        print("[WARNING] CPU never started.")
+        return
+
+    ticks = max(world.ticks - start_tick, 1)
+    minstret = cpu.minstret
+    print(f"CPU started at tick: {start_tick}")
+    print(
+        f"mlog instructions per tick: {(world.executed - start_executed) / ticks:.1f}"
+    )
+    print(f"RISC-V instructions: {minstret}")
+    print(f"RISC-V instructions per tick: {minstret / ticks:.1f}")
+
+    if profile:
+        heatmap = Heatmap.collect(
+            world,
+            [SourceMap.load(source_map) for source_map in source_maps or []],
+        )
+        print()
+        heatmap.print_report(top)
+        if annotate_dir:
+            for annotated in heatmap.write_annotated(annotate_dir):
+                print(f"Wrote annotated code: {annotated}")
+
+
+@app.command()
+def verify_icache(
+    path: Path,
+    bin_path: Path,
+    yaml_path: Annotated[Path, Option("--yaml")] = Path("src/cpu/cpu.yaml"),
+    size: Annotated[int | None, Option("-s", "--size")] = None,
+    top: Annotated[int, Option("--top")] = 20,
+):
+    """Check icache payloads decoded in Python against the worker's mlog decoder.
+
+    Decodes the program (the same bin used to build the schematic) sequentially with
+    both the worker's `decode` subroutine and the Python decoder used by `build
+    --preload-icache`, and reports instructions where the payloads differ. If the
+    schematic was built with --preload-icache, the payloads written by the icache
+    loaders are also checked.
+
+    By default, the preloaded part of the program is checked, or the entire program
+    if the icache isn't preloaded.
+    """
+
+    world = World.load(path)
+    cpu = EmulatedCpu.find(world)
+
+    # the controller initializes LABELS after it's powered on
+    cpu.power_on()
+    start_ticks = world.ticks
+    while not cpu.started:
+        if world.ticks - start_ticks > 600:
+            raise TimeoutError("CPU did not start after 600 ticks")
+        world.tick()
+
+    config = BuildConfig.load(yaml_path)
+    decoder = IcacheDecoder(config.instructions)
+    data = bin_path.read_bytes()
+
+    assert world.metadata is not None
+    if size is None:
+        size = world.metadata.icache_preload_size or -(-len(data) // 4) * 4
+
+    def describe(payload: int | None) -> str:
+        if payload is None:
+            return "-"
+        return f"0x{payload & 0xFFFF_FFFF_FFFF_FFFF:016x} ({decoder.handler(payload >> 47)})"
+
+    mismatches = list(
+        find_icache_mismatches(
+            world,
+            decoder,
+            data,
+            size,
+            ram_proc_vars=int(config.inputs["RAM_PROC_VARS"]),
+        )
+    )
+    for mismatch in mismatches[:top]:
+        print(
+            f"[WARNING] 0x{mismatch.address:08x}: 0x{mismatch.instruction:08x}"
+            + f"  mlog={describe(mismatch.expected)}"
+            + f"  python={describe(mismatch.python)}"
+            + f"  loaded={describe(mismatch.loaded)}"
+        )
+
+    print(f"Checked {size // 4} instructions: {len(mismatches)} mismatches")
+    if mismatches:
+        raise Exit(1)
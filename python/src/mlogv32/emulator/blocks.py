@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+from mlogv32.scripts.ram_proc import BLOCK_IDS
+
+# block sizes that aren't 1x1 (only needed for getblock)
+BLOCK_SIZES = {
+    "memory-bank": 2,
+    "logic-display": 3,
+    "large-logic-display": 6,
+}
+
+MEMORY_CAPACITIES = {
+    "memory-cell": 64,
+    "memory-bank": 512,
+    "world-cell": 512,
+}
+
+
+@dataclass(frozen=True)
+class Content:
+    """A content value, eg. the result of `lookup block`."""
+
+    type: str
+    name: str
+
+    @classmethod
+    def lookup(cls, type: str, id: int) -> Content | None:
+        match type:
+            case "block" if 0 <= id < len(BLOCK_IDS):
+                return cls(type, BLOCK_IDS[id])
+            case _:
+                return None
+
+
+@dataclass(eq=False)
+class Building:
+    """A block in the simulated world.
+
+    Buildings are compared by identity, like in Mindustry.
+    """
+
+    block: str
+    x: int
+    y: int
+    enabled: bool = field(default=True, kw_only=True)
+
+    @property
+    def size(self) -> int:
+        return BLOCK_SIZES.get(self.block, 1)
+
+    @property
+    def link_name(self) -> str:
+        """The prefix of the variable name for links to this building (see
+        `LogicBlock.getLinkName`)."""
+
+        if "-" not in self.block:
+            return self.block
+        *rest, last = self.block.split("-")
+        if last == "large" or _is_float(last):
+            return rest[-1]
+        return last
+
+    def tiles(self):
+        offset = -((self.size - 1) // 2)
+        for dx in range(self.size):
+            for dy in range(self.size):
+                yield self.x + dx + offset, self.y + dy + offset
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.block}, {self.x}, {self.y})"
+
+
+@dataclass(eq=False, repr=False)
+class MemoryBuild(Building):
+    memory: list[float] = field(default_factory=list[float], kw_only=True)
+
+    def __post_init__(self):
+        if not self.memory:
+            self.memory = [0.0] * MEMORY_CAPACITIES[self.block]
+
+
+@dataclass(eq=False, repr=False)
+class SwitchBuild(Building):
+    pass
+
+
+@dataclass(eq=False, repr=False)
+class MessageBuild(Building):
+    text: str = field(default="", kw_only=True)
+
+
+def _is_float(value: str):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
@@ -0,0 +1,704 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from functools import cache
+from typing import Any, Callable, Iterator, MutableMapping
+
+from mlogv32.scripts.ram_proc import BLOCK_IDS
+
+from .blocks import MEMORY_CAPACITIES, Building, Content, MemoryBuild, MessageBuild
+from .processor import (
+    BINARY_OPS,
+    MAX_INSTRUCTION_SCALE,
+    MAX_IPT,
+    MISSING,
+    TICK_SECONDS,
+    UNARY_OPS,
+    LogicBuild,
+    Missing,
+    Program,
+    Value,
+    condition,
+    num,
+    sense,
+    to_long,
+    to_string,
+)
+
+# added to the counter returned by an instruction to make the processor yield
+_YIELD = 1 << 40
+
+_BLOCKS = tuple(Content("block", name) for name in BLOCK_IDS)
+
+# Java's long range, with a margin so int() never needs to clamp
+_LONG_LIMIT = 9.2e18
+
+type Instruction = Callable[[], int]
+type LinkLayout = tuple[tuple[str, str], ...]
+"""The name and block of each link, which is all the compiler needs to know about
+them."""
+
+
+@dataclass(eq=False, repr=False)
+class CompiledLogicBuild(LogicBuild):
+    """A processor that runs a program compiled by `compile_program`.
+
+    Variables are stored in a flat list instead of a dict, and each instruction is a
+    Python function that returns the next value of @counter, so the update loop is
+    just `counter = instructions[counter]()`. The observable behaviour is the same as
+    `LogicBuild`, except that an out-of-range @counter is reset to 0 immediately
+    rather than before the next instruction.
+    """
+
+    slots: dict[str, int] = field(init=False)
+    values: list[Value] = field(init=False)
+
+    _instructions: list[Instruction] | None = field(default=None, init=False)
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.slots = variable_slots(self.program)
+        self.values = [None] * len(self.slots)
+        self.variables = SlotView(self.slots, self.values)
+
+    def update(self):
+        if not self.enabled or self.halted or not self.program.statements:
+            return
+
+        if self._instructions is None:
+            layout = tuple(
+                (name, building.block) for name, building in self.link_names.items()
+            )
+            self._instructions = compile_program(
+                self.program, layout, profile=self.hits is not None
+            ).bind(self)
+
+        accumulator = min(
+            self.accumulator + self.ipt,
+            MAX_INSTRUCTION_SCALE * self.ipt,
+        )
+
+        # the number of iterations of the loop in LogicBuild.update, since i counts up
+        # while the accumulator counts down
+        limit = int((accumulator + 1) // 2)
+
+        instructions = self._instructions
+        counter = self.counter
+        if not 0 <= counter < len(instructions):
+            counter = 0
+
+        executed = limit
+        for i in range(limit):
+            counter = instructions[counter]()
+            if counter >= _YIELD:
+                counter -= _YIELD
+                executed = i + 1
+                break
+
+        self.counter = counter
+        self.accumulator = accumulator - executed
+        self.executed += executed
+
+    # helpers for compiled instructions
+
+    def _read_from(self, target: Value, position: Value, counter: int):
+        match target:
+            case MemoryBuild(memory=memory):
+                address = int(num(position))
+                return True, memory[address] if 0 <= address < len(memory) else 0.0
+            case LogicBuild() if isinstance(position, str):
+                if target is self and position == "@counter":
+                    return True, float(counter)
+                return target.read_variable(position)
+            case str():
+                address = int(num(position))
+                if 0 <= address < len(target):
+                    return True, float(ord(target[address]))
+                return True, 0.0
+            case _:
+                return False, None
+
+    def _write_to(self, value: Value, target: Value, position: Value, counter: int):
+        match target:
+            case MemoryBuild(memory=memory):
+                address = int(num(position))
+                if 0 <= address < len(memory):
+                    memory[address] = num(value)
+            case LogicBuild() if isinstance(position, str):
+                if target is self and position == "@counter":
+                    return _to_counter(value, len(self.program))
+                target.write_variable(position, value)
+            case _:
+                pass
+        return counter
+
+    def _getblock(self, kind: str, x: float, y: float) -> Value:
+        building = self.world.building_at(math.floor(x + 0.5), math.floor(y + 0.5))
+        match kind:
+            case "building":
+                return building
+            case "block":
+                return building and Content("block", building.block)
+            case _:
+                return None
+
+    def _printflush(self, target: Value):
+        if isinstance(target, MessageBuild):
+            target.text = "".join(self._text_buffer)
+        self._text_buffer.clear()
+
+
+class SlotView(MutableMapping[str, Value]):
+    """A dict-like view of the variables of a `CompiledLogicBuild`."""
+
+    def __init__(self, slots: dict[str, int], values: list[Value]):
+        self._slots = slots
+        self._values = values
+
+    def __getitem__(self, name: str) -> Value:
+        return self._values[self._slots[name]]
+
+    def __setitem__(self, name: str, value: Value):
+        self._values[self._slots[name]] = value
+
+    def __delitem__(self, name: str):
+        raise TypeError("Processor variables cannot be deleted")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._slots)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._slots
+
+
+@cache
+def variable_slots(program: Program) -> dict[str, int]:
+    return {name: i for i, name in enumerate(sorted(program.variables))}
+
+
+@dataclass
+class CompiledProgram:
+    """The generated Python code for a program with a specific link layout."""
+
+    source: str
+    constants: list[Any]
+    layout: LinkLayout
+    factory: Callable[..., list[Instruction]]
+
+    def bind(self, processor: CompiledLogicBuild) -> list[Instruction]:
+        """Creates the instruction functions for a processor, which share its variable
+        list and links."""
+
+        return self.factory(
+            processor,
+            processor.values,
+            processor.world,
+            processor.links,
+            [processor.link_names[name] for name, _ in self.layout],
+            self.constants,
+            processor.hits,
+        )
+
+
+@cache
+def compile_program(
+    program: Program,
+    layout: LinkLayout,
+    *,
+    profile: bool = False,
+) -> CompiledProgram:
+    """Translates a program into Python code.
+
+    Operands are resolved once: literals become Python constants, links become
+    closure variables, and every other variable becomes an index into the processor's
+    variable list. Jump targets and @counter reads are resolved to instruction indices,
+    and reads and writes to linked memory are specialized.
+
+    If `profile` is True, each instruction also increments its entry in the
+    processor's `hits` list.
+    """
+
+    compiler = _Compiler(program, layout, profile)
+    source = compiler.compile()
+    namespace = dict(_GLOBALS)
+    exec(compile(source, f"<mlog {len(program)} instructions>", "exec"), namespace)
+    return CompiledProgram(
+        source=source,
+        constants=compiler.constants,
+        layout=layout,
+        factory=namespace["bind"],
+    )
+
+
+def _to_counter(value: Value, length: int) -> int:
+    counter = int(num(value))
+    return counter if 0 <= counter < length else 0
+
+
+def _wrap_long(value: int) -> float:
+    value &= 0xFFFF_FFFF_FFFF_FFFF
+    return float(value - (1 << 64) if value >= 1 << 63 else value)
+
+
+_GLOBALS: dict[str, Any] = {
+    "Building": Building,
+    "Content": Content,
+    "BLOCKS": _BLOCKS,
+    "MAX_IPT": MAX_IPT,
+    "TICK_SECONDS": TICK_SECONDS,
+    "condition": condition,
+    "fmod": math.fmod,
+    "lng": to_long,
+    "num": num,
+    "sense": sense,
+    "to_counter": _to_counter,
+    "to_string": to_string,
+    "wrap": _wrap_long,
+    **{f"B_{name}": op for name, op in BINARY_OPS.items()},
+    **{f"U_{name}": op for name, op in UNARY_OPS.items()},
+}
+
+# binary ops that don't need to call a function
+_FAST_BINARY_OPS = {
+    "add": "{a} + {b}",
+    "sub": "{a} - {b}",
+    "mul": "{a} * {b}",
+    "div": "{a} / {b} if {b} != 0.0 else 0.0",
+    "idiv": "({a} / {b}) // 1.0 if {b} != 0.0 else 0.0",
+    "mod": "fmod({a}, {b}) if {b} != 0.0 else 0.0",
+    "land": "1.0 if {a} != 0.0 and {b} != 0.0 else 0.0",
+    "max": "{a} if {a} >= {b} else {b}",
+    "min": "{a} if {a} <= {b} else {b}",
+}
+
+_FAST_UNARY_OPS = {
+    "abs": "abs({a})",
+    "floor": "{a} // 1.0",
+    "ceil": "-(-{a} // 1.0)",
+    "round": "({a} + 0.5) // 1.0",
+}
+
+_LONG_OPS = {
+    "shr": "float({A} >> ({B} & 63))",
+    "or": "float({A} | {B})",
+    "and": "float({A} & {B})",
+    "xor": "float({A} ^ {B})",
+    "shl": "wrap({A} << ({B} & 63))",
+    "ushr": "wrap(({A} & 0xFFFFFFFFFFFFFFFF) >> ({B} & 63))",
+}
+
+_NUMBER_COMPARISONS = {
+    "lessThan": "<",
+    "lessThanEq": "<=",
+    "greaterThan": ">",
+    "greaterThanEq": ">=",
+}
+
+
+@dataclass
+class _Operand:
+    expr: str
+    is_number: bool
+    """True if the value is always a float."""
+    literal: Value | Missing = MISSING
+
+
+class _Compiler:
+    def __init__(self, program: Program, layout: LinkLayout, profile: bool):
+        self.program = program
+        self.profile = profile
+        self.length = len(program)
+        self.links = {name: (i, block) for i, (name, block) in enumerate(layout)}
+        self.slots = variable_slots(program)
+        self.constants = list[Any]()
+        self.preamble = list[str]()
+        self._names = dict[str, str]()
+
+    def compile(self) -> str:
+        functions = list[str]()
+        for index, statement in enumerate(self.program.statements):
+            name = str(statement.name)
+            args = [str(arg) for arg in statement.args]
+            body = self.statement(index, name, args)
+            if self.profile:
+                body.insert(0, f"H[{index}] += 1")
+            functions.append(
+                f"    def i{index}():\n" + "".join(f"        {line}\n" for line in body)
+            )
+
+        return (
+            "def bind(p, v, w, links, L, K, H):\n"
+            + "".join(f"    {line}\n" for line in self.preamble)
+            + "".join(functions)
+            + f"    return [{', '.join(f'i{i}' for i in range(self.length))}]\n"
+        )
+
+    def local(self, name: str, expr: str) -> str:
+        """Adds a variable to the preamble, which instructions can use as a closure
+        variable."""
+
+        if name not in self._names:
+            self._names[name] = expr
+            self.preamble.append(f"{name} = {expr}")
+        return name
+
+    def constant(self, value: Any) -> str:
+        self.constants.append(value)
+        i = len(self.constants) - 1
+        return self.local(f"k{i}", f"K[{i}]")
+
+    # operands
+
+    def operand(self, index: int, token: str | None) -> _Operand:
+        if token is None:
+            return _Operand("None", False, None)
+
+        literal = self.program.literals.get(token, MISSING)
+        match literal:
+            case float() if math.isfinite(literal):
+                return _Operand(repr(literal), True, literal)
+            case float():
+                return _Operand(self.constant(literal), True, literal)
+            case str() | None:
+                return _Operand(repr(literal), False, literal)
+            case _:
+                pass
+
+        if token[0] == "@":
+            match token:
+                case "@counter":
+                    return _Operand(repr(float(index + 1)), True)
+                case "@this":
+                    return _Operand("p", False)
+                case "@thisx":
+                    return _Operand("float(p.x)", True)
+                case "@thisy":
+                    return _Operand("float(p.y)", True)
+                case "@ipt":
+                    return _Operand("float(p.ipt)", True)
+                case "@links":
+                    return _Operand("float(len(links))", True)
+                case "@time":
+                    return _Operand("w.time", True)
+                case "@tick":
+                    return _Operand("float(w.ticks)", True)
+                case "@second":
+                    return _Operand("(w.time / 1000)", True)
+                case "@minute":
+                    return _Operand("(w.time / 60000)", True)
+                case _:
+                    return _Operand("None", False, None)
+
+        if (link := self.links.get(token)) is not None:
+            return _Operand(self.local(f"l{link[0]}", f"L[{link[0]}]"), False)
+
+        return _Operand(f"v[{self.slots[token]}]", False)
+
+    def number(self, lines: list[str], operand: _Operand, temp: str) -> str:
+        """Returns an expression for the numeric value of an operand."""
+
+        if operand.is_number:
+            return operand.expr
+        if operand.literal is not MISSING:
+            return repr(num(operand.literal))
+        lines.append(f"{temp} = {operand.expr}")
+        lines.append(f"if type({temp}) is not float: {temp} = num({temp})")
+        return temp
+
+    def long(self, lines: list[str], operand: _Operand, temp: str) -> str:
+        expr = self.number(lines, operand, temp)
+        if operand.literal is not MISSING:
+            return repr(to_long(num(operand.literal)))
+        lines.append(
+            f"{temp.upper()} = int({expr}) if -{_LONG_LIMIT} < {expr} < {_LONG_LIMIT} else lng({expr})"
+        )
+        return temp.upper()
+
+    def memory(self, token: str) -> tuple[str, int] | None:
+        """If the operand is a link to a memory block, returns a closure variable for
+        its memory list and its capacity."""
+
+        if (link := self.links.get(token)) is not None:
+            i, block = link
+            if (capacity := MEMORY_CAPACITIES.get(block)) is not None:
+                return self.local(f"m{i}", f"L[{i}].memory"), capacity
+        return None
+
+    def store(
+        self,
+        lines: list[str],
+        token: str,
+        expr: str,
+        is_number: bool,
+    ) -> bool:
+        """Stores a value in a variable. Returns True if this writes @counter, in which
+        case the instruction has already returned."""
+
+        if token == "@counter":
+            if is_number:
+                lines.append(f"c = int({expr})")
+                lines.append(f"return c if 0 <= c < {self.length} else 0")
+            else:
+                lines.append(f"return to_counter({expr}, {self.length})")
+            return True
+        if (
+            token[0] != "@"
+            and token not in self.program.literals
+            and token not in self.links
+        ):
+            lines.append(f"v[{self.slots[token]}] = {expr}")
+        return False
+
+    # instructions
+
+    def statement(self, index: int, name: str, args: list[str]) -> list[str]:
+        lines = list[str]()
+        next_counter = index + 1 if index + 1 < self.length else 0
+
+        def arg(i: int) -> str | None:
+            return args[i] if i < len(args) else None
+
+        def operand(i: int) -> _Operand:
+            return self.operand(index, arg(i))
+
+        returned = False
+        match name:
+            case "set" if len(args) >= 2:
+                value = operand(1)
+                returned = self.store(lines, args[0], value.expr, value.is_number)
+
+            case "op" if len(args) >= 2:
+                result = self.op(lines, args[0], operand(2), operand(3))
+                returned = self.store(lines, args[1], result, True)
+
+            case "jump" if len(args) >= 2:
+                target = self.program.labels.get(args[0])
+                if target is None:
+                    try:
+                        target = int(args[0])
+                    except ValueError:
+                        pass
+                if target is not None:
+                    if not 0 <= target < self.length:
+                        target = 0
+                    cond = self.condition(lines, args[1], operand(2), operand(3))
+                    lines.append(f"if {cond}: return {target}")
+
+            case "select" if len(args) >= 2:
+                cond = self.condition(lines, args[1], operand(2), operand(3))
+                a = operand(4)
+                b = operand(5)
+                lines.append(f"r = {a.expr} if {cond} else {b.expr}")
+                returned = self.store(lines, args[0], "r", a.is_number and b.is_number)
+
+            case "read" if len(args) >= 3:
+                position = operand(2)
+                if memory := self.memory(args[1]):
+                    returned = self.read_memory(lines, args[0], memory, position)
+                else:
+                    target = operand(1)
+                    lines.append(
+                        f"f, r = p._read_from({target.expr}, {position.expr}, {index + 1})"
+                    )
+                    # the output is only written if the variable exists
+                    store = list[str]()
+                    self.store(store, args[0], "r", False)
+                    if store:
+                        lines.append(f"if f: {store[0]}")
+
+            case "write" if len(args) >= 3:
+                value = operand(0)
+                position = operand(2)
+                if memory := self.memory(args[1]):
+                    self.write_memory(lines, memory, value, position)
+                else:
+                    target = operand(1)
+                    lines.append(
+                        f"return p._write_to({value.expr}, {target.expr}, {position.expr}, {next_counter})"
+                    )
+                    returned = True
+
+            case "getlink" if len(args) >= 2:
+                i = self.number(lines, operand(1), "a")
+                lines.append(f"i = int({i})")
+                lines.append("r = links[i] if 0 <= i < len(links) else None")
+                returned = self.store(lines, args[0], "r", False)
+
+            case "getblock" if len(args) >= 4:
+                x = self.number(lines, operand(2), "a")
+                y = self.number(lines, operand(3), "b")
+                lines.append(f"r = p._getblock({args[0]!r}, {x}, {y})")
+                returned = self.store(lines, args[1], "r", False)
+
+            case "lookup" if len(args) >= 3:
+                if args[0] == "block":
+                    i = self.number(lines, operand(2), "a")
+                    lines.append(f"i = int({i})")
+                    lines.append(f"r = BLOCKS[i] if 0 <= i < {len(_BLOCKS)} else None")
+                else:
+                    lines.append("r = None")
+                returned = self.store(lines, args[1], "r", False)
+
+            case "sensor" if len(args) >= 3:
+                target = operand(1)
+                if args[2] == "@name":
+                    lines.append(f"x = {target.expr}")
+                    lines.append(
+                        "r = x.name if type(x) is Content else sense(x, '@name')"
+                    )
+                else:
+                    lines.append(f"r = sense({target.expr}, {args[2]!r})")
+                returned = self.store(lines, args[0], "r", False)
+
+            case "control" if len(args) >= 3 and args[0] == "enabled":
+                enabled = self.number(lines, operand(2), "a")
+                lines.append(f"x = {operand(1).expr}")
+                lines.append(f"if isinstance(x, Building): x.enabled = {enabled} != 0")
+
+            case "print" if args:
+                lines.append(f"p._text_buffer.append(to_string({operand(0).expr}))")
+
+            case "printchar" if args:
+                lines.append(f"x = {operand(0).expr}")
+                lines.append("if type(x) is float: p._text_buffer.append(chr(int(x)))")
+
+            case "format" if args:
+                lines.append(f"p.format(to_string({operand(0).expr}))")
+
+            case "printflush" if args:
+                lines.append(f"p._printflush({operand(0).expr})")
+
+            case "wait" if args:
+                timer = self.local(f"t{index}", "0.0")
+                seconds = self.number(lines, operand(0), "a")
+                lines.insert(0, f"nonlocal {timer}")
+                lines.append(f"if {timer} >= {seconds}:")
+                lines.append(f"    {timer} = 0.0")
+                lines.append(f"    return {next_counter}")
+                lines.append(f"{timer} += TICK_SECONDS")
+                lines.append(f"return {index + _YIELD}")
+                returned = True
+
+            case "stop":
+                lines.append("p.halted = True")
+                lines.append(f"return {index + _YIELD}")
+                returned = True
+
+            case "end":
+                lines.append("return 0")
+                returned = True
+
+            case "setrate" if args:
+                rate = self.number(lines, operand(0), "a")
+                lines.append(
+                    f"if p.privileged: p.ipt = max(1, min(int({rate}), MAX_IPT))"
+                )
+
+            case _:
+                # eg. noop, draw, drawflush, setmarker
+                pass
+
+        if not returned:
+            lines.append(f"return {next_counter}")
+        return lines
+
+    def op(self, lines: list[str], op: str, a: _Operand, b: _Operand) -> str:
+        """Emits code for an op instruction, and returns an expression for the
+        result."""
+
+        if op in ("equal", "notEqual", "strictEqual") or op in _NUMBER_COMPARISONS:
+            return f"(1.0 if {self.condition(lines, op, a, b)} else 0.0)"
+
+        if template := _LONG_OPS.get(op):
+            return template.format(
+                A=self.long(lines, a, "a"),
+                B=self.long(lines, b, "b"),
+            )
+        if op == "not":
+            return f"float(~{self.long(lines, a, 'a')})"
+
+        if template := _FAST_BINARY_OPS.get(op):
+            expr = template.format(
+                a=self.number(lines, a, "a"),
+                b=self.number(lines, b, "b"),
+            )
+        elif template := _FAST_UNARY_OPS.get(op):
+            expr = template.format(a=self.number(lines, a, "a"))
+        elif op in UNARY_OPS:
+            expr = f"U_{op}({self.number(lines, a, 'a')})"
+        elif op in BINARY_OPS:
+            expr = f"B_{op}({self.number(lines, a, 'a')}, {self.number(lines, b, 'b')})"
+        else:
+            return "0.0"
+
+        # like LVar.setnum
+        lines.append(f"r = {expr}")
+        return "(r if r - r == 0.0 else 0.0)"
+
+    def condition(self, lines: list[str], op: str, a: _Operand, b: _Operand) -> str:
+        """Emits code for a comparison, and returns a boolean expression."""
+
+        if op == "always":
+            return "True"
+
+        if (comparison := _NUMBER_COMPARISONS.get(op)) is not None:
+            x = self.number(lines, a, "a")
+            y = self.number(lines, b, "b")
+            return f"{x} {comparison} {y}"
+
+        if op not in ("equal", "notEqual"):
+            if op == "strictEqual":
+                return f"condition('strictEqual', {a.expr}, {b.expr})"
+            return "False"
+
+        if a.is_number or b.is_number:
+            equal = f"abs({self.number(lines, a, 'a')} - {self.number(lines, b, 'b')}) < 0.000001"
+        else:
+            x = self.value(lines, a, "x")
+            y = self.value(lines, b, "y")
+            if a.literal is not MISSING:
+                x, y = y, x
+                b = a
+            if b.literal is not MISSING:
+                # comparing with a string or null
+                equal = f"({x} == {y} if type({x}) is not float else abs({x} - {num(b.literal)!r}) < 0.000001)"
+            else:
+                equal = f"({x} == {y} if type({x}) is not float and type({y}) is not float else abs(num({x}) - num({y})) < 0.000001)"
+
+        return equal if op == "equal" else f"not {equal}"
+
+    def value(self, lines: list[str], operand: _Operand, temp: str) -> str:
+        if operand.literal is not MISSING:
+            return operand.expr
+        lines.append(f"{temp} = {operand.expr}")
+        return temp
+
+    def read_memory(
+        self,
+        lines: list[str],
+        output: str,
+        memory: tuple[str, int],
+        position: _Operand,
+    ) -> bool:
+        name, capacity = memory
+        address = self.number(lines, position, "a")
+        lines.append(f"i = int({address})")
+        lines.append(f"r = {name}[i] if 0 <= i < {capacity} else 0.0")
+        return self.store(lines, output, "r", True)
+
+    def write_memory(
+        self,
+        lines: list[str],
+        memory: tuple[str, int],
+        value: _Operand,
+        position: _Operand,
+    ):
+        name, capacity = memory
+        address = self.number(lines, position, "a")
+        number = self.number(lines, value, "b")
+        lines.append(f"i = int({address})")
+        lines.append(f"if 0 <= i < {capacity}: {name}[i] = {number}")
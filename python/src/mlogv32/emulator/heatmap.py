@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import cache, cached_property
+from pathlib import Path
+from typing import Iterable
+
+from mlogv32.preprocessor.sourcemap import SourceMap
+from mlogv32.utils.cache import text_digest
+
+from .processor import LogicBuild, Program
+from .world import World
+
+
+@dataclass
+class HotLine:
+    location: str
+    count: int
+    instructions: int
+    """The number of mlog instructions generated by this line."""
+    text: str
+
+
+@dataclass
+class ProgramProfile:
+    """The execution counts of every processor running the same program."""
+
+    program: Program
+    source_map: SourceMap | None
+    processors: list[LogicBuild] = field(default_factory=list[LogicBuild])
+    hits: list[int] = field(default_factory=list[int])
+    """The total number of times each instruction was executed."""
+
+    def __post_init__(self):
+        if not self.hits:
+            self.hits = [0] * len(self.program)
+
+    @cached_property
+    def name(self) -> str:
+        if self.source_map:
+            for location in self.source_map.lines:
+                if location is not None:
+                    return location.template.removesuffix(".jinja")
+        processor = self.processors[0]
+        return f"{processor.block}-{processor.x}-{processor.y}"
+
+    @property
+    def total(self) -> int:
+        return sum(self.hits)
+
+    def line_hits(self) -> dict[int, int]:
+        """Returns the total count for each line of code with an instruction."""
+
+        result = defaultdict[int, int](int)
+        for statement, count in zip(self.program.statements, self.hits):
+            result[statement.name.line or 0] += count
+        return result
+
+    def label_hits(self) -> list[tuple[str, int, int]]:
+        """Returns the name, total count, and number of instructions of the code
+        between each label and the next one.
+
+        Labels at the same instruction are combined, and instructions before the
+        first label are reported as `(start)`.
+        """
+
+        names = defaultdict[int, list[str]](list)
+        for name, index in self.program.labels.items():
+            names[index].append(name)
+        names.setdefault(0, ["(start)"])
+
+        starts = sorted(names)
+        ends = starts[1:] + [len(self.program)]
+        return [
+            (", ".join(names[start]), sum(self.hits[start:end]), end - start)
+            for start, end in zip(starts, ends)
+            if end > start
+        ]
+
+    def annotate(self) -> str:
+        """Returns the program's code, with the execution count and template location
+        of each line in the left margin."""
+
+        line_hits = self.line_hits()
+        total = max(self.total, 1)
+        lines = list[str]()
+        for i, line in enumerate(self.program.code.split("\n"), 1):
+            location = ""
+            if self.source_map and (loc := self.source_map.location(i)):
+                location = f"{loc.template}:{loc.line}"
+            if i in line_hits:
+                count = line_hits[i]
+                gutter = f"{count:>12} {count / total:>7.2%}"
+            else:
+                gutter = " " * 20
+            lines.append(f"{gutter}  {location:<28} | {line}".rstrip())
+        return "\n".join(lines) + "\n"
+
+
+@dataclass
+class Heatmap:
+    """Per-line and per-label execution counts collected from a profiled `World`.
+
+    Counts are combined for processors with the same code (eg. the workers), and are
+    mapped back to template lines for programs with a matching source map (see
+    `build --source-map`).
+    """
+
+    programs: list[ProgramProfile]
+
+    @classmethod
+    def collect(cls, world: World, source_maps: Iterable[SourceMap] = ()) -> Heatmap:
+        if not world.profile:
+            raise ValueError("World is not profiled")
+
+        maps = {source_map.digest: source_map for source_map in source_maps}
+        profiles = dict[Program, ProgramProfile]()
+        for processor in world.processors:
+            assert processor.hits is not None
+            program = processor.program
+            if (profile := profiles.get(program)) is None:
+                profile = profiles[program] = ProgramProfile(
+                    program,
+                    maps.pop(text_digest(program.code), None),
+                )
+            profile.processors.append(processor)
+            for i, count in enumerate(processor.hits):
+                profile.hits[i] += count
+
+        for source_map in maps.values():
+            print(
+                f"[WARNING] Source map for {source_map.root} doesn't match the code of any processor."
+            )
+
+        return cls(list(profiles.values()))
+
+    @property
+    def total(self) -> int:
+        return sum(profile.total for profile in self.programs)
+
+    def hot_lines(self) -> list[HotLine]:
+        """Returns the execution count of each source line, sorted from most to least
+        executed.
+
+        Lines of programs with a source map are reported as template lines, which may
+        generate many instructions (eg. in macros or loops).
+        """
+
+        hot_lines = dict[tuple[str, int], HotLine]()
+        for profile in self.programs:
+            code_lines = profile.program.code.split("\n")
+            for line, count in profile.line_hits().items():
+                location = None
+                if profile.source_map:
+                    location = profile.source_map.location(line)
+
+                if location is not None:
+                    assert profile.source_map is not None
+                    key = (location.template, location.line)
+                    path = profile.source_map.template_path(location)
+                    text = _read_lines(path)[location.line - 1]
+                else:
+                    key = (profile.name, line)
+                    text = code_lines[line - 1]
+
+                if (hot_line := hot_lines.get(key)) is None:
+                    hot_line = hot_lines[key] = HotLine(
+                        location=f"{key[0]}:{key[1]}",
+                        count=0,
+                        instructions=0,
+                        text=text.strip(),
+                    )
+                hot_line.count += count
+                hot_line.instructions += 1
+
+        return sorted(hot_lines.values(), key=lambda hot_line: -hot_line.count)
+
+    def print_report(self, top: int = 20):
+        total = max(self.total, 1)
+
+        print(f"Hot lines (top {top}):")
+        print(f"  {'count':>12} {'%':>7} {'instrs':>6}  {'location':<28} source")
+        for hot_line in self.hot_lines()[:top]:
+            print(
+                f"  {hot_line.count:>12} {hot_line.count / total:>7.2%} {hot_line.instructions:>6}  {hot_line.location:<28} {hot_line.text}"
+            )
+
+        for profile in sorted(self.programs, key=lambda profile: -profile.total):
+            if profile.total == 0 or not profile.program.labels:
+                continue
+            print()
+            print(
+                f"Labels in {profile.name} ({len(profile.processors)} processors, {profile.total / total:.2%} of instructions):"
+            )
+            print(f"  {'count':>12} {'%':>7} {'instrs':>6}  label")
+            labels = sorted(profile.label_hits(), key=lambda label: -label[1])
+            for name, count, instructions in labels[:top]:
+                if count == 0:
+                    break
+                print(f"  {count:>12} {count / total:>7.2%} {instructions:>6}  {name}")
+
+    def write_annotated(self, directory: Path) -> list[Path]:
+        """Writes an annotated copy of the code of each program that was executed.
+        Returns the paths of the written files."""
+
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = list[Path]()
+        for profile in self.programs:
+            if profile.total == 0:
+                continue
+            path = directory / f"{profile.name}.heatmap.txt"
+            path.write_text(profile.annotate(), "utf-8")
+            paths.append(path)
+        return paths
+
+
+@cache
+def _read_lines(path: Path) -> list[str]:
+    return path.read_text("utf-8").split("\n")
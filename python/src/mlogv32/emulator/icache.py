@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from mlogv32.preprocessor.icache import IcacheDecoder
+from mlogv32.scripts.ram_proc import VariableFormat
+
+from .processor import LogicBuild, num
+from .world import World
+
+# generous upper bound on the length of any path through the decoder
+MAX_DECODE_INSTRUCTIONS = 1000
+
+
+@dataclass
+class IcacheMismatch:
+    address: int
+    instruction: int
+    expected: int
+    """The payload produced by the worker's mlog decoder."""
+    python: int
+    """The payload produced by `IcacheDecoder`."""
+    loaded: int | None
+    """The payload in the icache proc, or None if the icache isn't preloaded."""
+
+
+def find_decoder(world: World) -> LogicBuild:
+    """Returns a copy of a worker, which can run its `decode` subroutine without
+    affecting the CPU."""
+
+    for processor in world.processors:
+        if "decode" in processor.program.labels:
+            return LogicBuild(
+                processor.block,
+                processor.x,
+                processor.y,
+                world=world,
+                program=processor.program,
+                links=processor.links,
+                link_names=processor.link_names,
+            )
+    raise ValueError("Schematic does not contain a worker")
+
+
+def mlog_decode(decoder: LogicBuild, values: Iterable[int]) -> Iterator[int]:
+    """Runs the worker's mlog decoder on each instruction in order, and yields the
+    icache payloads it would write.
+
+    The LABELS jump table must already be initialized by the controller, which
+    happens after the CPU is powered on.
+    """
+
+    entry = decoder.program.labels["decode"]
+    sentinel = len(decoder.program)
+
+    decoder.variables["imm"] = 0.0
+    for value in values:
+        decoder.variables["value"] = float(value)
+        decoder.variables["address"] = None
+        decoder.variables["ret3"] = float(sentinel)
+        decoder.counter = entry
+        for _ in range(MAX_DECODE_INSTRUCTIONS):
+            if decoder.counter == sentinel:
+                break
+            decoder.run_once()
+        else:
+            raise RuntimeError(f"Decoder did not return for instruction 0x{value:08x}")
+
+        op_id = int(num(decoder.variables.get("op_id")))
+        result = int(num(decoder.variables.get("result")))
+        imm = int(num(decoder.variables.get("imm")))
+        yield (op_id << 47) | result | imm
+
+
+def find_icache_mismatches(
+    world: World,
+    decoder: IcacheDecoder,
+    data: bytes,
+    size: int,
+    ram_proc_vars: int,
+) -> Iterator[IcacheMismatch]:
+    """Cross-checks the icache payloads for the first `size` bytes of a program
+    between the worker's mlog decoder, `IcacheDecoder`, and (if preloaded by
+    `build --preload-icache`) the icache procs in the world."""
+
+    meta = world.metadata
+    assert meta is not None
+
+    icache_procs = list[LogicBuild]()
+    if meta.icache_preload_size:
+        assert (
+            meta.memory is not None
+            and meta.memory_width is not None
+            and meta.rom_processors is not None
+            and meta.ram_processors is not None
+        )
+        base_x, base_y = meta.memory
+        icache_start = meta.rom_processors + meta.ram_processors
+        for i in range(-(-meta.icache_preload_size // (ram_proc_vars * 4))):
+            index = icache_start + i
+            proc = world.building_at(
+                base_x + index % meta.memory_width,
+                base_y + index // meta.memory_width,
+            )
+            if not isinstance(proc, LogicBuild):
+                raise ValueError(f"Expected an icache proc, but got {proc}")
+            icache_procs.append(proc)
+
+    data = data[:size].ljust(size, b"\0")
+    values = [int.from_bytes(data[i : i + 4], "little") for i in range(0, size, 4)]
+
+    expected_payloads = mlog_decode(find_decoder(world), values)
+    for word, (value, expected, python) in enumerate(
+        zip(values, expected_payloads, map(decoder.decode, values))
+    ):
+        loaded = None
+        if (i := word // ram_proc_vars) < len(icache_procs):
+            _, loaded_value = icache_procs[i].read_variable(
+                VariableFormat.mlogv32.get_variable(word % ram_proc_vars)
+            )
+            loaded = int(num(loaded_value))
+
+        if expected != python or (loaded is not None and expected != loaded):
+            yield IcacheMismatch(
+                address=word * 4,
+                instruction=value,
+                expected=expected,
+                python=python,
+                loaded=loaded,
+            )
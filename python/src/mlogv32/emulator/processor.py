@@ -0,0 +1,588 @@
+from __future__ import annotations
+
+import math
+import random
+import re
+from dataclasses import dataclass, field
+from enum import Enum
+from functools import cache
+from typing import TYPE_CHECKING, Callable, Final, MutableMapping
+
+from mlogv32.preprocessor.parser import Label, Statement, parse_mlog
+
+from .blocks import Building, Content, MemoryBuild, MessageBuild
+
+if TYPE_CHECKING:
+    from .world import World
+
+type Value = float | str | Building | Content | None
+
+PROCESSOR_IPT = {
+    "micro-processor": 2,
+    "logic-processor": 8,
+    "hyper-processor": 25,
+    "world-processor": 8,
+}
+
+MAX_INSTRUCTION_SCALE = 5
+MAX_IPT = 1000
+
+# seconds per tick at 60 fps
+TICK_SECONDS = 1 / 60
+
+_NUMBER_RE = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+_HEX_RE = re.compile(r"[+-]?0x[0-9a-fA-F]+")
+_BIN_RE = re.compile(r"[+-]?0b[01]+")
+
+
+class Missing(Enum):
+    MISSING = "MISSING"
+
+
+# an enum member instead of object() so that pyright can narrow `is not MISSING`
+MISSING: Final = Missing.MISSING
+
+
+@dataclass(eq=False)
+class Program:
+    """A parsed mlog program.
+
+    Programs are shared between processors with the same code (see `load_program`),
+    and are compared by identity.
+    """
+
+    code: str
+    statements: list[Statement]
+    labels: dict[str, int]
+    literals: dict[str, Value]
+    """The value of each constant operand in the code (eg. numbers and strings)."""
+    variables: frozenset[str]
+    """The variables declared by the code, which other processors can read and write
+    even if they haven't been assigned yet."""
+
+    @classmethod
+    def parse(cls, code: str) -> Program:
+        statements = list[Statement]()
+        labels = dict[str, int]()
+        for node in parse_mlog(code if code.endswith("\n") else code + "\n"):
+            match node:
+                case Label(name=name):
+                    labels[str(name)] = len(statements)
+                case Statement():
+                    statements.append(node)
+                case _:
+                    pass
+
+        literals = dict[str, Value]()
+        variables = set[str]()
+        for statement in statements:
+            args = statement.args
+            if statement.name == "jump":
+                args = args[1:]
+            for arg in args:
+                name = str(arg)
+                if name in literals or name in variables:
+                    continue
+                if (value := parse_literal(name)) is not MISSING:
+                    literals[name] = value
+                elif not name.startswith("@"):
+                    variables.add(name)
+
+        return cls(
+            code=code,
+            statements=statements,
+            labels=labels,
+            literals=literals,
+            variables=frozenset(variables),
+        )
+
+    def __len__(self):
+        return len(self.statements)
+
+
+@cache
+def load_program(code: str) -> Program:
+    return Program.parse(code)
+
+
+def parse_literal(token: str) -> Value | Missing:
+    """Returns the value of a constant operand, or `MISSING` if it's a variable."""
+
+    if len(token) >= 2 and token[0] == token[-1] == '"':
+        return token[1:-1].replace("\\n", "\n")
+    match token:
+        case "null":
+            return None
+        case "true":
+            return 1.0
+        case "false":
+            return 0.0
+        case _:
+            pass
+    if _NUMBER_RE.fullmatch(token):
+        return float(token)
+    if _HEX_RE.fullmatch(token):
+        return float(int(token, 16))
+    if _BIN_RE.fullmatch(token):
+        return float(int(token, 2))
+    return MISSING
+
+
+@dataclass(eq=False, repr=False)
+class LogicBuild(Building):
+    """A processor, which runs a `Program` with a straightforward interpreter."""
+
+    world: World = field(kw_only=True)
+    program: Program = field(kw_only=True)
+    links: list[Building] = field(default_factory=list[Building], kw_only=True)
+    link_names: dict[str, Building] = field(
+        default_factory=dict[str, Building], kw_only=True
+    )
+
+    ipt: int = field(init=False)
+    privileged: bool = field(init=False)
+    variables: MutableMapping[str, Value] = field(
+        default_factory=dict[str, Value], init=False
+    )
+    counter: int = field(default=0, init=False)
+    accumulator: float = field(default=0, init=False)
+    halted: bool = field(default=False, init=False)
+    """True if the processor executed `stop`, until @counter is written externally."""
+    executed: int = field(default=0, init=False)
+    """The number of instructions executed so far."""
+    hits: list[int] | None = field(default=None, init=False)
+    """If the world is profiled, the number of times each instruction was executed."""
+
+    _yield: bool = field(default=False, init=False)
+    _wait_times: dict[int, float] = field(default_factory=dict[int, float], init=False)
+    _text_buffer: list[str] = field(default_factory=list[str], init=False)
+
+    def __post_init__(self):
+        self.ipt = PROCESSOR_IPT.get(self.block, 2)
+        self.privileged = self.block == "world-processor"
+        if self.world.profile:
+            self.hits = [0] * len(self.program)
+
+    # updates
+
+    def update(self):
+        """Runs one tick's worth of instructions.
+
+        This mirrors `LogicBuild.updateTile`, including how the accumulator is
+        decremented inside the loop condition.
+        """
+
+        if not self.enabled or self.halted or not self.program.statements:
+            return
+
+        self.accumulator = min(
+            self.accumulator + self.ipt,
+            MAX_INSTRUCTION_SCALE * self.ipt,
+        )
+
+        i = 0
+        while i < int(self.accumulator):
+            self.run_once()
+            self.accumulator -= 1
+            if self._yield:
+                self._yield = False
+                break
+            i += 1
+
+    def run_once(self):
+        if not 0 <= self.counter < len(self.program.statements):
+            self.counter = 0
+
+        index = self.counter
+        self.counter += 1
+        self.executed += 1
+        if self.hits is not None:
+            self.hits[index] += 1
+        self.execute(index, self.program.statements[index])
+
+    # variables
+
+    def get(self, name: str) -> Value:
+        if (value := self.program.literals.get(name, MISSING)) is not MISSING:
+            return value
+        if name[0] == "@":
+            return self.builtin(name)
+        if (link := self.link_names.get(name)) is not None:
+            return link
+        return self.variables.get(name)
+
+    def set(self, name: str, value: Value):
+        if name == "@counter":
+            self.counter = int(num(value))
+        elif (
+            name[0] != "@"
+            and name not in self.program.literals
+            and name not in self.link_names
+        ):
+            self.variables[name] = value
+
+    def builtin(self, name: str) -> Value:
+        match name:
+            case "@counter":
+                return float(self.counter)
+            case "@this":
+                return self
+            case "@thisx":
+                return float(self.x)
+            case "@thisy":
+                return float(self.y)
+            case "@ipt":
+                return float(self.ipt)
+            case "@links":
+                return float(len(self.links))
+            case "@time":
+                return self.world.time
+            case "@tick":
+                return float(self.world.ticks)
+            case "@second":
+                return self.world.time / 1000
+            case "@minute":
+                return self.world.time / 60_000
+            case _:
+                return None
+
+    def read_variable(self, name: str) -> tuple[bool, Value]:
+        """Reads a variable by name from another processor. Returns False if this
+        processor doesn't have a variable with that name."""
+
+        if name == "@counter":
+            return True, float(self.counter)
+        if (link := self.link_names.get(name)) is not None:
+            return True, link
+        if name in self.variables:
+            return True, self.variables[name]
+        if name in self.program.variables:
+            return True, None
+        return False, None
+
+    def write_variable(self, name: str, value: Value):
+        """Writes a variable by name from another processor."""
+
+        if name == "@counter":
+            self.counter = int(num(value))
+            self.halted = False
+        elif name in self.link_names:
+            pass
+        elif name in self.variables or name in self.program.variables:
+            self.variables[name] = value
+
+    # instructions
+
+    def execute(self, index: int, statement: Statement):
+        args = statement.args
+        get = self.get
+
+        match statement.name:
+            case "set":
+                self.set(args[0], get(args[1]))
+
+            case "op":
+                self.set(args[1], operate(args[0], *(get(arg) for arg in args[2:4])))
+
+            case "jump":
+                if condition(args[1], *(get(arg) for arg in args[2:4])):
+                    if (target := self.jump_target(args[0])) is not None:
+                        self.counter = target
+
+            case "select":
+                cond = condition(args[1], get(args[2]), get(args[3]))
+                self.set(args[0], get(args[4] if cond else args[5]))
+
+            case "read":
+                self.read(args[0], get(args[1]), get(args[2]))
+
+            case "write":
+                self.write(get(args[0]), get(args[1]), get(args[2]))
+
+            case "getlink":
+                i = int(num(get(args[1])))
+                self.set(args[0], self.links[i] if 0 <= i < len(self.links) else None)
+
+            case "getblock":
+                x = math.floor(num(get(args[2])) + 0.5)
+                y = math.floor(num(get(args[3])) + 0.5)
+                building = self.world.building_at(x, y)
+                match args[0]:
+                    case "building":
+                        self.set(args[1], building)
+                    case "block":
+                        self.set(args[1], building and Content("block", building.block))
+                    case _:
+                        self.set(args[1], None)
+
+            case "lookup":
+                self.set(args[1], Content.lookup(args[0], int(num(get(args[2])))))
+
+            case "sensor":
+                self.set(args[0], sense(get(args[1]), args[2]))
+
+            case "control":
+                target = get(args[1])
+                if args[0] == "enabled" and isinstance(target, Building):
+                    target.enabled = num(get(args[2])) != 0
+
+            case "print":
+                self._text_buffer.append(to_string(get(args[0])))
+
+            case "printchar":
+                if type(value := get(args[0])) is float:
+                    self._text_buffer.append(chr(int(value)))
+
+            case "format":
+                self.format(to_string(get(args[0])))
+
+            case "printflush":
+                if isinstance(target := get(args[0]), MessageBuild):
+                    target.text = "".join(self._text_buffer)
+                self._text_buffer.clear()
+
+            case "wait":
+                elapsed = self._wait_times.get(index, 0.0)
+                if elapsed >= num(get(args[0])):
+                    self._wait_times[index] = 0.0
+                else:
+                    self._wait_times[index] = elapsed + TICK_SECONDS
+                    self.counter -= 1
+                    self._yield = True
+
+            case "stop":
+                self.counter -= 1
+                self._yield = True
+                self.halted = True
+
+            case "end":
+                self.counter = len(self.program.statements)
+
+            case "setrate":
+                if self.privileged:
+                    self.ipt = max(1, min(int(num(get(args[0]))), MAX_IPT))
+
+            case _:
+                # eg. noop, draw, drawflush, setmarker
+                pass
+
+    def jump_target(self, label: str) -> int | None:
+        if (target := self.program.labels.get(label)) is not None:
+            return target
+        try:
+            return int(label)
+        except ValueError:
+            return None
+
+    def read(self, output: str, target: Value, position: Value):
+        match target:
+            case MemoryBuild(memory=memory):
+                address = int(num(position))
+                self.set(output, memory[address] if 0 <= address < len(memory) else 0.0)
+            case LogicBuild() if isinstance(position, str):
+                found, value = target.read_variable(position)
+                if found:
+                    self.set(output, value)
+            case str():
+                address = int(num(position))
+                self.set(
+                    output,
+                    float(ord(target[address])) if 0 <= address < len(target) else 0.0,
+                )
+            case _:
+                pass
+
+    def write(self, value: Value, target: Value, position: Value):
+        match target:
+            case MemoryBuild(memory=memory):
+                address = int(num(position))
+                if 0 <= address < len(memory):
+                    memory[address] = num(value)
+            case LogicBuild() if isinstance(position, str):
+                target.write_variable(position, value)
+            case _:
+                pass
+
+    def format(self, value: str):
+        text = "".join(self._text_buffer)
+        placeholders = re.findall(r"\{(\d)\}", text)
+        if placeholders:
+            placeholder = "{" + min(placeholders) + "}"
+            self._text_buffer[:] = [text.replace(placeholder, value, 1)]
+
+    @property
+    def text_buffer(self) -> str:
+        return "".join(self._text_buffer)
+
+
+# values
+
+
+def num(value: Value) -> float:
+    if type(value) is float:
+        return value
+    return 0.0 if value is None else 1.0
+
+
+def to_string(value: Value) -> str:
+    match value:
+        case None:
+            return "null"
+        case float():
+            if abs(value - round(value)) < 0.00001:
+                return str(round(value))
+            return str(value)
+        case str():
+            return value
+        case Content(name=name):
+            return name
+        case Building(block=block):
+            return block
+        case _:
+            return str(value)
+
+
+def sense(target: Value, prop: str) -> Value:
+    match target, prop:
+        case Content(name=name), "@name":
+            return name
+        case Building(), "@enabled":
+            return 1.0 if target.enabled else 0.0
+        case Building(), "@x":
+            return float(target.x)
+        case Building(), "@y":
+            return float(target.y)
+        case Building(), "@size":
+            return float(target.size)
+        case _:
+            return None
+
+
+def to_long(value: float) -> int:
+    # Java's (long) cast
+    if value != value:
+        return 0
+    if value >= 2**63:
+        return 2**63 - 1
+    if value <= -(2**63):
+        return -(2**63)
+    return int(value)
+
+
+def _wrap_long(value: int) -> float:
+    value &= 0xFFFF_FFFF_FFFF_FFFF
+    if value >= 2**63:
+        value -= 2**64
+    return float(value)
+
+
+def _div(a: float, b: float) -> float:
+    # Java would return infinity or NaN, which are both stored as 0
+    return a / b if b != 0 else math.nan
+
+
+def _mod(a: float, b: float) -> float:
+    if b == 0:
+        return math.nan
+    return math.fmod(a, b)
+
+
+def _pow(a: float, b: float) -> float:
+    try:
+        return math.pow(a, b)
+    except (OverflowError, ValueError):
+        return math.nan
+
+
+def _log(a: float) -> float:
+    return math.log(a) if a > 0 else math.nan
+
+
+BINARY_OPS: dict[str, Callable[[float, float], float]] = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "mul": lambda a, b: a * b,
+    "div": _div,
+    "idiv": lambda a, b: float(math.floor(q)) if math.isfinite(q := _div(a, b)) else q,
+    "mod": _mod,
+    "emod": lambda a, b: _mod(_mod(a, b) + b, b),
+    "pow": _pow,
+    "land": lambda a, b: float(a != 0 and b != 0),
+    "shl": lambda a, b: _wrap_long(to_long(a) << (to_long(b) & 63)),
+    "shr": lambda a, b: float(to_long(a) >> (to_long(b) & 63)),
+    "ushr": lambda a, b: _wrap_long(
+        (to_long(a) & 0xFFFF_FFFF_FFFF_FFFF) >> (to_long(b) & 63)
+    ),
+    "or": lambda a, b: float(to_long(a) | to_long(b)),
+    "and": lambda a, b: float(to_long(a) & to_long(b)),
+    "xor": lambda a, b: float(to_long(a) ^ to_long(b)),
+    "max": max,
+    "min": min,
+    "angle": lambda a, b: math.degrees(math.atan2(b, a)) % 360,
+    "len": math.hypot,
+    "logn": lambda a, b: _div(_log(a), _log(b)),
+}
+
+UNARY_OPS: dict[str, Callable[[float], float]] = {
+    "not": lambda a: float(~to_long(a)),
+    "abs": abs,
+    "sign": lambda a: float((a > 0) - (a < 0)),
+    "log": _log,
+    "log10": lambda a: math.log10(a) if a > 0 else math.nan,
+    "floor": lambda a: float(math.floor(a)),
+    "ceil": lambda a: float(math.ceil(a)),
+    "round": lambda a: float(math.floor(a + 0.5)),
+    "sqrt": lambda a: math.sqrt(a) if a >= 0 else math.nan,
+    "rand": lambda a: random.random() * a,
+    "sin": lambda a: math.sin(math.radians(a)),
+    "cos": lambda a: math.cos(math.radians(a)),
+    "tan": lambda a: math.tan(math.radians(a)),
+    "asin": lambda a: math.degrees(math.asin(a)) if -1 <= a <= 1 else math.nan,
+    "acos": lambda a: math.degrees(math.acos(a)) if -1 <= a <= 1 else math.nan,
+    "atan": lambda a: math.degrees(math.atan(a)),
+}
+
+COMPARISONS: dict[str, Callable[[float, float], bool]] = {
+    "equal": lambda a, b: abs(a - b) < 0.000001,
+    "notEqual": lambda a, b: abs(a - b) >= 0.000001,
+    "lessThan": lambda a, b: a < b,
+    "lessThanEq": lambda a, b: a <= b,
+    "greaterThan": lambda a, b: a > b,
+    "greaterThanEq": lambda a, b: a >= b,
+}
+
+OBJECT_COMPARISONS: dict[str, Callable[[Value, Value], bool]] = {
+    "equal": lambda a, b: a == b,
+    "notEqual": lambda a, b: a != b,
+}
+
+
+def operate(op: str, a: Value = None, b: Value = None) -> float:
+    if op in ("equal", "notEqual", "strictEqual"):
+        return float(condition(op, a, b))
+    if op in COMPARISONS:
+        return float(COMPARISONS[op](num(a), num(b)))
+
+    if (unary := UNARY_OPS.get(op)) is not None:
+        result = unary(num(a))
+    elif (binary := BINARY_OPS.get(op)) is not None:
+        result = binary(num(a), num(b))
+    else:
+        return 0.0
+
+    # like LVar.setnum
+    return result if math.isfinite(result) else 0.0
+
+
+def condition(op: str, a: Value = None, b: Value = None) -> bool:
+    if op == "always":
+        return True
+    a_obj = type(a) is not float
+    b_obj = type(b) is not float
+    if op == "strictEqual":
+        return a_obj == b_obj and a == b
+    if a_obj and b_obj and (compare := OBJECT_COMPARISONS.get(op)) is not None:
+        return compare(a, b)
+    if (compare := COMPARISONS.get(op)) is not None:
+        return compare(num(a), num(b))
+    return False
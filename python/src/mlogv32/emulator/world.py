@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+from mlogv32.preprocessor.constants import CSRS
+from mlogv32.preprocessor.models import Metadata
+from mlogv32.scripts.ram_proc import VariableFormat
+from mlogv32.utils.msch import (
+    ProcessorConfigUTF8,
+    SchematicTile,
+    read_schematic_tiles,
+)
+
+from .blocks import (
+    MEMORY_CAPACITIES,
+    Building,
+    MemoryBuild,
+    MessageBuild,
+    SwitchBuild,
+)
+from .compiler import CompiledLogicBuild
+from .processor import PROCESSOR_IPT, TICK_SECONDS, LogicBuild, load_program, num
+
+
+@dataclass
+class World:
+    """A simulated Mindustry world containing the blocks of a schematic."""
+
+    buildings: list[Building] = field(default_factory=list[Building])
+    processors: list[LogicBuild] = field(default_factory=list[LogicBuild])
+    """Processors in update order."""
+    metadata: Metadata | None = None
+    ticks: int = 0
+    compiled: bool = True
+    """If True, processors compile their code to Python functions (see
+    `CompiledLogicBuild`). Otherwise, they use the reference interpreter."""
+    profile: bool = False
+    """If True, processors count the number of times each instruction is executed (see
+    `LogicBuild.hits`)."""
+
+    _tiles: dict[tuple[int, int], Building] = field(
+        default_factory=dict[tuple[int, int], Building]
+    )
+
+    @classmethod
+    def load(
+        cls,
+        path: str | Path,
+        *,
+        compiled: bool = True,
+        profile: bool = False,
+    ) -> World:
+        """Loads a schematic generated by `python -m mlogv32.preprocessor build`."""
+
+        tags, tiles = read_schematic_tiles(Path(path).read_bytes())
+        world = cls(compiled=compiled, profile=profile)
+        world.add_tiles(tiles)
+        if metadata := tags.get("mlogv32_metadata"):
+            world.metadata = Metadata.model_validate_json(metadata)
+        return world
+
+    @property
+    def time(self) -> float:
+        """The value of @time in milliseconds, assuming 60 ticks per second."""
+
+        return self.ticks * TICK_SECONDS * 1000
+
+    def add_tiles(self, tiles: Iterable[SchematicTile]):
+        """Places the blocks of a schematic, then links processors to them.
+
+        Blocks are updated in the order they're added.
+        """
+
+        configs = list[tuple[LogicBuild, ProcessorConfigUTF8]]()
+        for tile in tiles:
+            match tile.block:
+                case block if block in MEMORY_CAPACITIES:
+                    building = MemoryBuild(block, tile.x, tile.y)
+                case "switch":
+                    building = SwitchBuild(
+                        tile.block, tile.x, tile.y, enabled=bool(tile.config)
+                    )
+                case "message":
+                    building = MessageBuild(
+                        tile.block, tile.x, tile.y, text=tile.config or ""
+                    )
+                case block if block in PROCESSOR_IPT:
+                    config = ProcessorConfigUTF8.decompress(tile.config)
+                    processor_type = CompiledLogicBuild if self.compiled else LogicBuild
+                    building = processor_type(
+                        block,
+                        tile.x,
+                        tile.y,
+                        world=self,
+                        program=load_program(config.code),
+                    )
+                    configs.append((building, config))
+                case block:
+                    building = Building(block, tile.x, tile.y)
+            self.add_building(building)
+
+        for building, config in configs:
+            self.link(building, config)
+
+    def add_building(self, building: Building):
+        self.buildings.append(building)
+        for tile in building.tiles():
+            self._tiles[tile] = building
+        if isinstance(building, LogicBuild):
+            self.processors.append(building)
+
+    def building_at(self, x: int, y: int) -> Building | None:
+        return self._tiles.get((x, y))
+
+    def link(self, processor: LogicBuild, config: ProcessorConfigUTF8):
+        """Resolves the links of a processor config, which are relative to the
+        processor.
+
+        Like `LogicBuild.readCompressed`, the saved name is only kept if it starts with
+        the default name for that block, and otherwise the lowest unused number is
+        used. Links to missing blocks are skipped.
+        """
+
+        names = list[str]()
+        for link in config.links:
+            target = self.building_at(processor.x + link.x, processor.y + link.y)
+            name = link.name
+            if target is not None:
+                if not name.startswith(target.link_name):
+                    name = _find_link_name(target.link_name, names)
+                processor.links.append(target)
+                processor.link_names[name] = target
+            names.append(name)
+
+    def tick(self):
+        for processor in self.processors:
+            processor.update()
+        self.ticks += 1
+
+    @property
+    def executed(self) -> int:
+        """The total number of instructions executed by all processors."""
+
+        return sum(processor.executed for processor in self.processors)
+
+
+def _find_link_name(prefix: str, names: list[str]) -> str:
+    taken = set[int]()
+    for name in names:
+        if name.startswith(prefix):
+            try:
+                taken.add(int(name.removeprefix(prefix)))
+            except ValueError:
+                pass
+    i = 1
+    while i in taken:
+        i += 1
+    return f"{prefix}{i}"
+
+
+@dataclass
+class Uart:
+    """Host side of a UART memory bank (see `UartAccess` in the mod)."""
+
+    build: MemoryBuild
+    capacity: int
+
+    def read(self) -> bytes:
+        """Reads all bytes transmitted by the CPU."""
+
+        memory = self.build.memory
+        rptr = int(memory[510])
+        wptr = int(memory[511])
+
+        result = bytearray()
+        while rptr != wptr:
+            result.append(int(memory[256 + rptr]) & 0xFF)
+            rptr = (rptr + 1) % (self.capacity + 1)
+
+        memory[510] = float(rptr)
+        return bytes(result)
+
+    def write(self, data: bytes) -> int:
+        """Writes as many bytes as possible to the CPU, and returns the number of
+        bytes written."""
+
+        memory = self.build.memory
+        rptr = int(memory[254])
+        for i, byte in enumerate(data):
+            wptr = int(memory[255]) & 0xFF
+            next_wptr = (wptr + 1) % (self.capacity + 1)
+            if next_wptr == rptr:
+                return i
+            memory[wptr] = float(byte)
+            memory[255] = float(next_wptr)
+        return len(data)
+
+
+@dataclass
+class EmulatedCpu:
+    """The blocks of an mlogv32 CPU in a `World`, found from the schematic metadata."""
+
+    world: World
+    controller: LogicBuild
+    csrs: LogicBuild
+    power_switch: SwitchBuild
+    error_output: MessageBuild
+    uarts: list[Uart]
+    config: LogicBuild | None = None
+    """The config proc, if the icache is preloaded (see `build --preload-icache`)."""
+    powered: bool = field(default=False, init=False)
+
+    @classmethod
+    def find(cls, world: World) -> EmulatedCpu:
+        meta = world.metadata
+        if meta is None or meta.cpu is None:
+            raise ValueError(
+                "Schematic does not contain a CPU (build it with --cpu or --all)"
+            )
+        if (
+            meta.csrs is None
+            or meta.power_switch is None
+            or meta.error_output is None
+            or meta.uart_fifo_capacity is None
+        ):
+            raise ValueError(
+                "Schematic does not contain peripherals (build it with --peripherals or --all)"
+            )
+
+        return cls(
+            world=world,
+            controller=_building_at(world, meta.cpu, LogicBuild),
+            csrs=_building_at(world, meta.csrs, LogicBuild),
+            power_switch=_building_at(world, meta.power_switch, SwitchBuild),
+            error_output=_building_at(world, meta.error_output, MessageBuild),
+            uarts=[
+                Uart(_building_at(world, uart, MemoryBuild), meta.uart_fifo_capacity)
+                for uart in meta.uarts
+            ],
+            config=_building_at(world, meta.config, LogicBuild)
+            if meta.icache_preload_size and meta.config
+            else None,
+        )
+
+    def power_on(self, max_ticks: int = 600):
+        """Waits for the other processors to initialize, then enables the power switch.
+
+        The controller starts at `halt`, which disables the power switch, and table
+        processors (eg. the lookup procs) run a list of `set` instructions ending with
+        `stop`, which takes a couple of seconds for micro processors. In the game, a
+        schematic would usually be placed well before the CPU is started.
+
+        If the icache is preloaded, this also waits for every icache loader to finish.
+        """
+
+        pending = [
+            processor
+            for processor in self.world.processors
+            if processor.program.statements
+            and processor.program.statements[-1].name == "stop"
+        ]
+        for _ in range(max_ticks):
+            pending = [processor for processor in pending if not processor.halted]
+            if (
+                not pending
+                and self.controller.variables.get("state") == "halt"
+                and self.icache_loaded
+            ):
+                break
+            self.world.tick()
+        else:
+            raise TimeoutError(f"CPU did not initialize after {max_ticks} ticks")
+
+        self.power_switch.enabled = True
+        self.powered = True
+
+    @property
+    def icache_loaded(self) -> bool:
+        """False if the icache loaders are still running."""
+
+        if self.config is None:
+            return True
+        return self.config.variables.get("ICACHE_PRELOAD_PENDING") == 0
+
+    @property
+    def halted(self) -> bool:
+        """True if the CPU disabled the power switch after `power_on`."""
+
+        return self.powered and not self.power_switch.enabled
+
+    @property
+    def started(self) -> bool:
+        """True if a worker has taken over from the controller."""
+
+        return self.hart is not self.controller
+
+    @property
+    def hart(self) -> LogicBuild:
+        """The processor containing the current hart state."""
+
+        prev_proc = self.controller.variables.get("prev_proc")
+        if isinstance(prev_proc, LogicBuild):
+            return prev_proc
+        return self.controller
+
+    @property
+    def state(self) -> str | None:
+        state = self.hart.variables.get("state")
+        return state if isinstance(state, str) else None
+
+    @property
+    def running(self) -> bool:
+        return self.power_switch.enabled
+
+    @property
+    def minstret(self) -> int:
+        return self._csr64("minstret")
+
+    @property
+    def mcycle(self) -> int:
+        return self._csr64("mcycle")
+
+    def _csr64(self, name: str) -> int:
+        _, high = self.csrs.read_variable(
+            VariableFormat.mlogv32.get_variable(CSRS[f"{name}h"])
+        )
+        low = self.hart.variables.get(f"csr_{name}")
+        return (int(num(high)) << 32) | int(num(low))
+
+
+def _building_at[T: Building](
+    world: World,
+    position: tuple[int, int],
+    building_type: type[T],
+) -> T:
+    building = world.building_at(*position)
+    if not isinstance(building, building_type):
+        raise ValueError(
+            f"Expected {building_type.__name__} at {position}, but got {building}"
+        )
+    return building
@@ -0,0 +1,566 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+
+from lark import Token
+
+from .parser import AST, Directive, MlogError, Statement, analyze_mlog, parse_mlog
+from .parser.cfg import ControlFlowGraph, written_positions
+
+
+@dataclass
+class AllocationReport:
+    manual: int | None
+    """The number of local variables used by the manual allocation, if known."""
+    allocated: int
+    """The number of local variables used by the liveness-based allocation."""
+    webs: int
+    """The number of independent live ranges (def-use webs)."""
+    names: int
+    """The number of distinct local variable names."""
+
+    def print(self):
+        manual = "unknown" if self.manual is None else self.manual
+        print(
+            f"Local variable count: {self.allocated} (manual allocation: {manual}, {self.names} names, {self.webs} live ranges)"
+        )
+
+
+@dataclass
+class _Call:
+    index: int
+    """The statement that stores the return address."""
+    address: int
+    """The return address."""
+    var: str
+    """The variable that holds the return address."""
+    body: set[int] = field(default_factory=set)
+    """The statements that may run before returning, including nested calls."""
+
+
+@dataclass
+class _Occurrence:
+    index: int
+    """Statement index."""
+    arg: int
+    token: Token
+    is_def: bool
+
+
+def allocate_local_variables(
+    text: str,
+    *,
+    reference: str | None = None,
+    tables: dict[int, list[int]] | None = None,
+    prefix: str = "local",
+) -> tuple[str, AllocationReport]:
+    """Assigns `localN` variables to the named local variables (`$foo`) in code
+    rendered with symbolic local variables.
+
+    Each def-use web of a name (found by reaching definitions) is allocated
+    separately, and webs that are live at the same time get different variables. The
+    interference graph is colored with DSatur. Calls through return address variables
+    are analyzed separately for each call site.
+
+    `tables` gives the possible targets of jump tables and other dynamic jumps by
+    statement index (see `ControlFlowGraph.successors` and
+    `mlogv32.preprocessor.cost.worker_tables`).
+
+    Some jumps can only be taken for certain values (eg. the MMIO offset jump table in
+    load_mmio_word), which makes values look live for longer than they are. If
+    `reference` is the same code rendered with the manual allocation, two webs that it
+    puts in the same variable are assumed not to interfere, so the manual allocation
+    is always a valid coloring.
+
+    Explicit local variables (`local_variable(n)`, eg. in the fetch block) are left
+    unchanged, so the fetch block must restore at least as many variables as the
+    result uses.
+    """
+
+    ast = parse_mlog(text)
+    _check_directives(ast)
+
+    statements = [node for node in ast if isinstance(node, Statement)]
+    n = len(statements)
+    labels = analyze_mlog(ast).labels
+    cfg = ControlFlowGraph.build(ast, labels)
+
+    # collect occurrences of local variables
+    occurrences = list[_Occurrence]()
+    defs_at = [list[int]() for _ in range(n)]
+    uses_at = [list[int]() for _ in range(n)]
+    for i, statement in enumerate(statements):
+        args = [str(arg) for arg in statement.args]
+        written = set(written_positions(str(statement.name), args))
+        for j, token in enumerate(statement.args):
+            if not _is_local(token):
+                continue
+            k = len(occurrences)
+            occurrences.append(_Occurrence(i, j, token, is_def=j in written))
+            (defs_at if j in written else uses_at)[i].append(k)
+
+    manual_slots = None
+    if reference is not None:
+        manual_slots = _reference_slots(reference, statements, occurrences, prefix)
+    manual = max(manual_slots, default=0) if manual_slots is not None else None
+
+    if not occurrences:
+        return text, AllocationReport(manual, 0, 0, 0)
+
+    names = sorted({str(o.token) for o in occurrences})
+    name_ids = {name: i for i, name in enumerate(names)}
+
+    successors = [cfg.successors(i, tables) for i in range(n)]
+
+    # Returns through address variables (eg. `set @counter ret`) can go back to any
+    # call site, so a plain dataflow analysis would leak values from one caller into
+    # every other caller. Instead, each call is treated as jumping directly to its
+    # return address, and the return only brings back definitions made by the called
+    # code. While the called code runs, anything that is live after the call is
+    # treated as live too.
+    returns = dict[str, list[int]]()
+    for instruction in cfg.instructions:
+        for target in instruction.targets:
+            if isinstance(target, str):
+                returns.setdefault(target, []).append(instruction.index)
+
+    calls = list[_Call]()
+    writers = dict[str, set[int]]()
+    for instruction in cfg.instructions:
+        for var, values in instruction.address_writes.items():
+            writers.setdefault(var, set()).add(instruction.index)
+            if var in returns and values is not None and len(values) == 1:
+                address = values[0]
+                if isinstance(address, int) and 0 <= address < n:
+                    calls.append(_Call(instruction.index, address, var))
+
+    local_successors = [set(targets) for targets in successors]
+    for var, indices in returns.items():
+        stored = {call.address for call in calls if call.var == var}
+        for i in indices:
+            local_successors[i] -= stored - set(cfg.static_successors(i))
+    for call in calls:
+        local_successors[call.index].add(call.address)
+
+    _find_called_code(cfg, calls, local_successors, returns, writers)
+
+    # reaching definitions
+    # bits 0..len(names)-1 are "undefined at entry" pseudo-definitions
+    # the bit for occurrence k is len(names) + k
+    base = len(names)
+    name_masks = [1 << i for i in range(len(names))]
+    for k, occurrence in enumerate(occurrences):
+        if occurrence.is_def:
+            name_masks[name_ids[str(occurrence.token)]] |= 1 << (base + k)
+
+    gen = [0] * n
+    kill = [0] * n
+    for i in range(n):
+        for k in defs_at[i]:
+            name_mask = name_masks[name_ids[str(occurrences[k].token)]]
+            kill[i] |= name_mask
+            gen[i] = (gen[i] & ~name_mask) | (1 << (base + k))
+
+    # incoming edges, with a mask of the definitions that flow along each edge
+    incoming = [list[tuple[int, int]]() for _ in range(n)]
+    for i, targets in enumerate(local_successors):
+        for target in targets:
+            incoming[target].append((i, -1))
+    for call in calls:
+        body_gen = 0
+        for i in call.body:
+            body_gen |= gen[i]
+        for i in returns[call.var]:
+            if i in call.body:
+                incoming[call.address].append((i, body_gen))
+
+    reach_out = _solve_forward(n, incoming, gen, kill, entry=(1 << base) - 1)
+    reach_in = [0] * n
+    for i in range(n):
+        for p, mask in incoming[i]:
+            reach_in[i] |= reach_out[p] & mask
+    reach_in[0] |= (1 << base) - 1
+
+    # build webs by unioning each use with every definition that reaches it
+    parent = list(range(base + len(occurrences)))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(a: int, b: int):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    for i in range(n):
+        for k in uses_at[i]:
+            reaching = reach_in[i] & name_masks[name_ids[str(occurrences[k].token)]]
+            while reaching:
+                bit = reaching & -reaching
+                union(base + k, bit.bit_length() - 1)
+                reaching ^= bit
+
+    web_of = [find(base + k) for k in range(len(occurrences))]
+    web_ids = {web: i for i, web in enumerate(sorted(set(web_of)))}
+    webs = [web_ids[web] for web in web_of]
+
+    # liveness of webs
+    use_webs = [0] * n
+    def_webs = [0] * n
+    for i in range(n):
+        for k in uses_at[i]:
+            use_webs[i] |= 1 << webs[k]
+        for k in defs_at[i]:
+            def_webs[i] |= 1 << webs[k]
+
+    # a value that the called code always overwrites isn't live before the call
+    name_defs = [0] * n
+    for i in range(n):
+        for k in defs_at[i]:
+            name_defs[i] |= 1 << name_ids[str(occurrences[k].token)]
+    name_webs = [0] * len(names)
+    for occurrence, web in zip(occurrences, webs):
+        name_webs[name_ids[str(occurrence.token)]] |= 1 << web
+
+    outgoing = [{target: -1 for target in targets} for targets in local_successors]
+    for call in calls:
+        if call.address in cfg.static_successors(call.index):
+            continue
+        names_defined = _must_define(call, local_successors, name_defs, returns)
+        mask = outgoing[call.index].get(call.address, 0)
+        killed = 0
+        while names_defined:
+            bit = names_defined & -names_defined
+            killed |= name_webs[bit.bit_length() - 1]
+            names_defined ^= bit
+        outgoing[call.index][call.address] = mask & ~killed if mask else ~killed
+
+    live_in, live_out = _solve_backward(n, outgoing, use_webs, def_webs)
+    for call in calls:
+        for i in call.body:
+            live_out[i] |= live_in[call.address]
+
+    # a web only needs a variable where one of its definitions may have run, since
+    # any other read would see an undefined value anyway
+    defined = [0] * n
+    for i in range(n):
+        reaching = reach_out[i] >> base
+        while reaching:
+            bit = reaching & -reaching
+            defined[i] |= 1 << webs[bit.bit_length() - 1]
+            reaching ^= bit
+
+    # interference: a definition conflicts with everything live after it
+    neighbors = [0] * len(web_ids)
+    for i in range(n):
+        defs = def_webs[i]
+        while defs:
+            bit = defs & -defs
+            web = bit.bit_length() - 1
+            others = live_out[i] & defined[i] & ~bit
+            neighbors[web] |= others
+            while others:
+                other_bit = others & -others
+                neighbors[other_bit.bit_length() - 1] |= bit
+                others ^= other_bit
+            defs ^= bit
+
+    if manual_slots is not None:
+        slots = [set[int]() for _ in web_ids]
+        for web, slot in zip(webs, manual_slots):
+            slots[web].add(slot)
+        shared = dict[int, int]()
+        for web, web_slots in enumerate(slots):
+            if len(web_slots) == 1:
+                shared[web] = next(iter(web_slots))
+        by_slot = dict[int, int]()
+        for web, slot in shared.items():
+            by_slot[slot] = by_slot.get(slot, 0) | (1 << web)
+        for web, slot in shared.items():
+            neighbors[web] &= ~by_slot[slot]
+
+    colors = _dsatur(neighbors)
+
+    # replace each occurrence with its allocated variable
+    parts = list[str]()
+    pos = 0
+    for occurrence, web in sorted(
+        zip(occurrences, webs),
+        key=lambda item: item[0].token.start_pos or 0,
+    ):
+        token = occurrence.token
+        if token.start_pos is None or token.end_pos is None:
+            raise MlogError(f"Internal error: invalid token: {token}", token)
+        parts += [text[pos : token.start_pos], f"{prefix}{colors[web] + 1}"]
+        pos = token.end_pos
+    parts += [text[pos:]]
+
+    return "".join(parts), AllocationReport(
+        manual=manual,
+        allocated=max(colors) + 1,
+        webs=len(web_ids),
+        names=len(names),
+    )
+
+
+def _reference_slots(
+    reference: str,
+    statements: list[Statement],
+    occurrences: list[_Occurrence],
+    prefix: str,
+) -> list[int]:
+    """Returns the manually allocated variable of each occurrence."""
+
+    reference_statements = [
+        node for node in parse_mlog(reference) if isinstance(node, Statement)
+    ]
+    if len(reference_statements) != len(statements):
+        # point at the first statement that only one of them has
+        n = min(len(reference_statements), len(statements))
+        extra = max(reference_statements, statements, key=len)[n]
+        raise MlogError(
+            f"Reference has {len(reference_statements)} statements, expected {len(statements)}",
+            extra.name,
+        )
+
+    slots = list[int]()
+    for occurrence in occurrences:
+        statement = reference_statements[occurrence.index]
+        if len(statement.args) <= occurrence.arg:
+            raise MlogError(
+                f"Reference statement doesn't match: {statement.name}", statement.name
+            )
+        token = statement.args[occurrence.arg]
+        match = re.fullmatch(rf"{re.escape(prefix)}(\d+)", str(token))
+        if match is None:
+            raise MlogError(
+                f"Expected a local variable for {occurrence.token} in reference, but got {token}",
+                token,
+            )
+        slots.append(int(match[1]))
+    return slots
+
+
+def _is_local(token: Token):
+    return token.type == "TOKEN" and len(token) > 1 and token.startswith("$")
+
+
+def _check_directives(ast: AST):
+    for node in ast:
+        if isinstance(node, Directive):
+            for token in node.args:
+                if _is_local(token):
+                    raise MlogError(
+                        f"Local variables can't be used in directives: {token}", token
+                    )
+
+
+def _predecessors(successors: list[set[int]]) -> list[list[int]]:
+    predecessors = [list[int]() for _ in successors]
+    for i, targets in enumerate(successors):
+        for target in targets:
+            predecessors[target].append(i)
+    return predecessors
+
+
+def _solve_forward(
+    n: int,
+    incoming: list[list[tuple[int, int]]],
+    gen: list[int],
+    kill: list[int],
+    entry: int,
+) -> list[int]:
+    outgoing = [set[int]() for _ in range(n)]
+    for i, edges in enumerate(incoming):
+        for p, _ in edges:
+            outgoing[p].add(i)
+
+    out_sets = [0] * n
+    queue = list(reversed(range(n)))
+    queued = set(queue)
+    while queue:
+        i = queue.pop()
+        queued.discard(i)
+
+        value = entry if i == 0 else 0
+        for p, mask in incoming[i]:
+            value |= out_sets[p] & mask
+
+        out = gen[i] | (value & ~kill[i])
+        if out != out_sets[i]:
+            out_sets[i] = out
+            for s in outgoing[i]:
+                if s not in queued:
+                    queued.add(s)
+                    queue.append(s)
+
+    return out_sets
+
+
+def _solve_backward(
+    n: int,
+    outgoing: list[dict[int, int]],
+    uses: list[int],
+    defs: list[int],
+) -> tuple[list[int], list[int]]:
+    """Solves liveness, where `outgoing` maps each successor to a mask of the values
+    that can flow back along that edge."""
+
+    predecessors = _predecessors([set(edges) for edges in outgoing])
+
+    live_in = [0] * n
+    live_out = [0] * n
+    queue = list(range(n))
+    queued = set(queue)
+    while queue:
+        i = queue.pop()
+        queued.discard(i)
+
+        out = 0
+        for target, mask in outgoing[i].items():
+            out |= live_in[target] & mask
+        live_out[i] = out
+
+        value = uses[i] | (out & ~defs[i])
+        if value != live_in[i]:
+            live_in[i] = value
+            for p in predecessors[i]:
+                if p not in queued:
+                    queued.add(p)
+                    queue.append(p)
+
+    return live_in, live_out
+
+
+def _must_define(
+    call: _Call,
+    successors: list[set[int]],
+    defs: list[int],
+    returns: dict[str, list[int]],
+) -> int:
+    """Returns the names that are written on every path from a call to its return."""
+
+    nodes = call.body | {call.index}
+    exits = [i for i in returns[call.var] if i in call.body]
+    if not exits:
+        return 0
+
+    predecessors = dict[int, list[int]]()
+    for i in nodes:
+        for target in successors[i]:
+            if target in call.body and not (i == call.index and target == call.address):
+                predecessors.setdefault(target, []).append(i)
+
+    everything = -1
+    must_out = {i: everything for i in nodes}
+    must_out[call.index] = defs[call.index]
+    changed = True
+    while changed:
+        changed = False
+        for i in sorted(call.body):
+            value = everything
+            for p in predecessors.get(i, []):
+                value &= must_out[p]
+            if i not in predecessors:
+                # only reachable through a nested call's return
+                value = 0
+            value |= defs[i]
+            if value != must_out[i]:
+                must_out[i] = value
+                changed = True
+
+    result = everything
+    for i in exits:
+        result &= must_out[i]
+    return result if result != everything else 0
+
+
+def _find_called_code(
+    cfg: ControlFlowGraph,
+    calls: list[_Call],
+    successors: list[set[int]],
+    returns: dict[str, list[int]],
+    writers: dict[str, set[int]],
+):
+    """Finds the statements that may run between each call and its return.
+
+    Calls to other functions are skipped over using `successors`, and then their
+    bodies are added. Paths that reach another call through the same variable (eg.
+    after a trap) are a new call, so they aren't followed.
+    """
+
+    predecessors = _predecessors(successors)
+    calls_at = dict[int, list[_Call]]()
+    for call in calls:
+        calls_at.setdefault(call.index, []).append(call)
+
+    direct = dict[int, set[int]]()
+    for call in calls:
+        stops = set(returns[call.var])
+        excluded = writers[call.var]
+
+        forward = set[int]()
+        queue = list(cfg.static_successors(call.index))
+        while queue:
+            i = queue.pop()
+            if i in forward or i in excluded:
+                continue
+            forward.add(i)
+            if i not in stops:
+                queue += successors[i]
+
+        backward = set[int]()
+        queue = [i for i in stops if i in forward]
+        while queue:
+            i = queue.pop()
+            if i in backward or i not in forward:
+                continue
+            backward.add(i)
+            queue += predecessors[i]
+
+        direct[id(call)] = backward
+
+    for call in calls:
+        body = set[int]()
+        seen = {id(call)}
+        queue = [call]
+        while queue:
+            current = queue.pop()
+            body |= direct[id(current)]
+            for i in direct[id(current)]:
+                for nested in calls_at.get(i, []):
+                    if id(nested) not in seen:
+                        seen.add(id(nested))
+                        queue.append(nested)
+        call.body = body
+
+
+def _dsatur(neighbors: list[int]) -> list[int]:
+    """Colors a graph given as adjacency bitmasks, using the DSatur heuristic."""
+
+    n = len(neighbors)
+    colors = [-1] * n
+    neighbor_colors = [set[int]() for _ in range(n)]
+    degrees = [neighbors[i].bit_count() for i in range(n)]
+
+    for _ in range(n):
+        node = max(
+            (i for i in range(n) if colors[i] < 0),
+            key=lambda i: (len(neighbor_colors[i]), degrees[i], -i),
+        )
+        color = 0
+        while color in neighbor_colors[node]:
+            color += 1
+        colors[node] = color
+
+        others = neighbors[node]
+        while others:
+            bit = others & -others
+            neighbor_colors[bit.bit_length() - 1].add(color)
+            others ^= bit
+
+    return colors
@@ -1,38 +1,60 @@
 from __future__ import annotations
 
+import json
 import re
+from collections import defaultdict
 from pathlib import Path
-from typing import Annotated, Any, Iterable, Literal, Unpack, cast, overload
+from typing import Annotated, Any, Iterable, Unpack, cast, overload
 
 import yaml
-from jinja2 import Environment, FileSystemLoader, StrictUndefined
+from jinja2 import BytecodeCache, Environment, FileSystemLoader, StrictUndefined
 from jinja2.ext import Extension
 from pymsch import Block, Content, ProcessorLink, Schematic
-from typer import Option, Typer
+from typer import Exit, Option, Typer
 
+from mlogv32.utils.cache import default_cache_dir, text_digest
 from mlogv32.utils.msch import (
     BEContent,
+    ProcessorConfigCompressor,
     ProcessorConfigUTF8,
 )
-
+from mlogv32.utils.rom import RomEncoder, RomImage, rom_proc_config
+
+from .allocator import allocate_local_variables
+from .cache import (
+    BuildCache,
+    RenderedTemplate,
+    jinja_bytecode_cache,
+    template_digest,
+)
+from .cost import worker_cost_report, worker_tables
 from .extensions import (
     CommentStatement,
     LineExpression,
     LineExpressionEnv,
     LocalVariables,
     LocalVariablesEnv,
+    SourceMapMarkers,
 )
 from .filters import FILTERS, ram_var
+from .handoff import external_variables, replace_fetch_block, saved_variable_report
+from .icache import IcacheDecoder, icache_loader_config, preload_size
 from .models import BuildConfig, Metadata
+from .optimizer import optimize_mlog, shared_variables
 from .parser import (
+    AST,
+    ControlFlowGraph,
     MlogError,
-    check_unsaved_variables,
+    analyze_mlog,
     count_statements,
     iter_labels,
     parse_mlog,
     replace_symbolic_labels,
 )
+from .profiling import BuildProfiler
+from .sourcemap import SourceMap, render_source_map
 from .types import ConfigArgs, ConfigsYaml, Labels
+from .watch import BuildSession, watch_build
 
 app = Typer(
     pretty_exceptions_show_locals=False,
@@ -43,10 +65,19 @@ app = Typer(
 def file_command(
     path: Path,
     output: Annotated[Path | None, Option("-o", "--output")] = None,
+    use_cache: Annotated[bool, Option("--cache/--no-cache")] = True,
+    cache_dir: Annotated[Path | None, Option("--cache-dir")] = None,
 ):
     """Preprocess a single .mlog.jinja file."""
 
-    render_template(path.resolve(), output)
+    path = path.resolve()
+    env = create_jinja_env(
+        path.parent,
+        bytecode_cache=jinja_bytecode_cache(
+            (cache_dir or default_cache_dir()) if use_cache else None
+        ),
+    )
+    render_template(path, output, env)
 
 
 @app.command()
@@ -78,14 +109,62 @@ def labels(
 
 
 @app.command()
-def configs(yaml_path: Path):
+def cost(
+    yaml_path: Path,
+    worker_path: Annotated[Path | None, Option("--worker")] = None,
+    json_path: Annotated[Path | None, Option("--json")] = None,
+    baseline_path: Annotated[Path | None, Option("--baseline")] = None,
+):
+    """Estimate the number of mlog instructions executed per RISC-V instruction.
+
+    Analyzes the rendered worker code (by default, the output of the last build) and
+    prints the shortest and longest path through the worker for each instruction
+    handler, both with address translation disabled (bare) and enabled (sv32).
+
+    If --baseline is given, exits with an error if any worst-case cost increased
+    compared to a previous --json report.
+    """
+
+    config = BuildConfig.load(yaml_path)
+    if worker_path is None:
+        worker_path = get_template_output_path(config.templates.worker)
+
+    ast = parse_mlog(worker_path.read_text("utf-8"))
+    cfg = ControlFlowGraph.build(ast, analyze_mlog(ast).labels)
+    report = worker_cost_report(cfg, config.instructions, config.csrs)
+    report.print()
+
+    if json_path:
+        json_path.write_text(json.dumps(report.to_json(), indent=2), "utf-8")
+
+    if baseline_path:
+        messages = report.compare(json.loads(baseline_path.read_text("utf-8")))
+        for message in messages:
+            print(f"[WARNING] {message}")
+        if messages:
+            raise Exit(1)
+
+
+@app.command()
+def configs(
+    yaml_path: Path,
+    use_cache: Annotated[bool, Option("--cache/--no-cache")] = True,
+    cache_dir: Annotated[Path | None, Option("--cache-dir")] = None,
+):
     """Generate CPU configs."""
 
+    render_configs(
+        yaml_path,
+        jinja_bytecode_cache((cache_dir or default_cache_dir()) if use_cache else None),
+    )
+
+
+def render_configs(yaml_path: Path, bytecode_cache: BytecodeCache | None = None):
     with yaml_path.open("rb") as f:
         data: ConfigsYaml = yaml.load(f, yaml.Loader)
 
     output_dir = yaml_path.parent
-    env = create_jinja_env(output_dir)
+    env = create_jinja_env(output_dir, bytecode_cache=bytecode_cache)
     template = env.get_template(data["template"])
 
     for name, args in data["configs"].items():
@@ -108,6 +187,20 @@ def build(
     include_memory: Annotated[bool, Option("-M", "--memory")] = False,
     include_debugger: Annotated[bool, Option("-D", "--debugger")] = False,
     include_keyboard: Annotated[bool, Option("--keyboard/--no-keyboard")] = True,
+    use_cache: Annotated[bool, Option("--cache/--no-cache")] = True,
+    cache_dir: Annotated[Path | None, Option("--cache-dir")] = None,
+    jobs: Annotated[int | None, Option("-j", "--jobs")] = None,
+    profile: Annotated[bool, Option("--profile")] = False,
+    profile_json: Annotated[Path | None, Option("--profile-json")] = None,
+    profile_dir: Annotated[Path | None, Option("--profile-dir")] = None,
+    watch: Annotated[bool, Option("--watch")] = False,
+    watch_interval: Annotated[float, Option("--watch-interval")] = 0.25,
+    optimize: Annotated[bool, Option("-O", "--optimize")] = False,
+    allocate_locals: Annotated[bool, Option("--allocate-locals")] = False,
+    check_saved: Annotated[bool, Option("--check-saved")] = False,
+    minimize_saved: Annotated[bool, Option("--minimize-saved")] = False,
+    source_map: Annotated[bool, Option("--source-map")] = False,
+    preload_icache: Annotated[bool, Option("--preload-icache")] = False,
 ):
     """Generate a CPU schematic.
 
@@ -140,6 +233,61 @@ def build(
     - rom=2,ram=12,icache=2,width=16
 
     - rom=2,drom=8,ram=2,icache=4
+
+    Program image (--bin):
+
+    Either a flat binary, which is stored in ROM starting at address 0, or an ELF
+    file, whose PT_LOAD segments are stored at their physical addresses (like
+    `objcopy --output-target binary`). ROM procs that don't contain any data are left
+    empty, and the utilization of program ROM and data ROM is reported.
+
+    Profiling (--profile):
+
+    Prints the wall time and peak memory usage of each build stage. --profile-json
+    also writes the report as JSON, and --profile-dir dumps a cProfile stats file
+    for each stage. Both imply --profile.
+
+    Watch mode (--watch):
+
+    Rebuilds whenever one of the files used by the build changes. Jinja environments,
+    the build config, schematics, and build artifacts are kept in memory between
+    rebuilds, so only the artifacts affected by a change are regenerated.
+
+    Optimization (--optimize):
+
+    Runs a peephole optimizer on the rendered worker and controller code (jump
+    threading, constant folding, dead store elimination, and unreachable code
+    removal), and reports the number of instructions saved after each label.
+
+    Local variable allocation (--allocate-locals):
+
+    Renders the worker with symbolic local variables ($foo) and assigns them to
+    localN variables using liveness analysis and graph coloring, instead of the
+    manual allocation from reset_locals/free_locals. Variables that the manual
+    allocation puts in the same slot are assumed to never be live at the same time.
+
+    Saved variables (--check-saved, --minimize-saved):
+
+    Finds the variables that are live across a worker handoff (including those read
+    or written by the controller and debugger), and reports variables that the fetch
+    block restores unnecessarily or doesn't restore. --minimize-saved also rewrites
+    the fetch block in the rendered worker to restore exactly those variables.
+
+    Source maps (--source-map):
+
+    Writes a source map next to the rendered worker and controller (eg.
+    worker.mlog.map.json), which maps each line of the final code in the schematic
+    back to the template line that produced it. The emulator uses these to report
+    execution counts per template line (see `python -m mlogv32.emulator run --help`).
+
+    Icache preloading (--preload-icache):
+
+    Decodes the start of the program ROM at build time, and replaces the icache procs
+    that cover it with world processors that write the decoded instructions to their
+    own variables when placed. On reset, the controller then starts with those pages
+    already in the icache instead of decoding them at runtime. Requires --bin,
+    --memory, and --peripherals. Use `python -m mlogv32.emulator verify-icache` to
+    check the decoded instructions against the worker's decoder.
     """
 
     if size:
@@ -157,18 +305,88 @@ def build(
         include_memory = True
         include_debugger = True
 
+    session = BuildSession(watch=watch)
+    cache = BuildCache(
+        (cache_dir or default_cache_dir()) if use_cache else None,
+        memory=watch,
+    )
+
+    def run():
+        cache.hits = cache.misses = 0
+        profiler = BuildProfiler(
+            profile or bool(profile_json or profile_dir),
+            cprofile_dir=profile_dir,
+        )
+        _build(
+            session,
+            cache,
+            profiler,
+            yaml_path,
+            cpu_config_name=cpu_config_name,
+            width=width,
+            height=height,
+            output=output,
+            bin_path=bin_path,
+            include_cpu=include_cpu,
+            include_peripherals=include_peripherals,
+            include_memory=include_memory,
+            include_debugger=include_debugger,
+            include_keyboard=include_keyboard,
+            jobs=jobs,
+            optimize=optimize,
+            allocate_locals=allocate_locals,
+            check_saved=check_saved,
+            minimize_saved=minimize_saved,
+            source_map=source_map,
+            preload_icache=preload_icache,
+        )
+        profiler.finish(profile_json)
+
+    if watch:
+        watch_build(session, run, interval=watch_interval)
+    else:
+        run()
+
+
+def _build(
+    session: BuildSession,
+    cache: BuildCache,
+    profiler: BuildProfiler,
+    yaml_path: Path,
+    *,
+    cpu_config_name: str | None,
+    width: int,
+    height: int,
+    output: Path | None,
+    bin_path: Path | None,
+    include_cpu: bool,
+    include_peripherals: bool,
+    include_memory: bool,
+    include_debugger: bool,
+    include_keyboard: bool,
+    jobs: int | None,
+    optimize: bool,
+    allocate_locals: bool,
+    check_saved: bool,
+    minimize_saved: bool,
+    source_map: bool,
+    preload_icache: bool,
+):
     meta = Metadata()
 
-    config = BuildConfig.load(yaml_path)
+    config = session.load_file(yaml_path, BuildConfig.load)
+
+    bytecode_cache = jinja_bytecode_cache(cache.root)
 
     if cpu_config_name:
-        with config.configs.open("rb") as f:
-            cpu_configs: ConfigsYaml = yaml.load(f, yaml.Loader)
+        configs_yaml: ConfigsYaml = session.load_file(config.configs, load_yaml)
+        session.add_dependency(config.configs.parent / configs_yaml["template"])
 
-        if config_args := cpu_configs["configs"].get(cpu_config_name):
-            config_args = cpu_configs["defaults"] | config_args
+        if config_args := configs_yaml["configs"].get(cpu_config_name):
+            config_args = configs_yaml["defaults"] | config_args
 
-            configs(config.configs)
+            with profiler.stage("render"):
+                render_configs(config.configs, bytecode_cache)
 
             config_code = (
                 (config.configs.parent / cpu_config_name)
@@ -180,11 +398,16 @@ def build(
             if not config_args:
                 raise KeyError(f"Invalid config: {cpu_config_name}")
 
-            config_code = render_template(
-                config.configs.parent / cpu_configs["template"],
-                yaml_path.parent / "generated_config.mlog",
-                **config_args,
-            )
+            with profiler.stage("render"):
+                config_code = render_template(
+                    config.configs.parent / configs_yaml["template"],
+                    yaml_path.parent / "generated_config.mlog",
+                    create_jinja_env(
+                        config.configs.parent,
+                        bytecode_cache=bytecode_cache,
+                    ),
+                    **config_args,
+                )
 
         meta.uart_fifo_capacity = int(config_args["UART_FIFO_CAPACITY"])
         meta.mtime_frequency = int(config_args["MTIME_FREQUENCY"])
@@ -196,43 +419,91 @@ def build(
         config_args = {}
         config_code = ""
 
-    @overload
-    def _render_template(
-        template: Path,
-        extensions: Iterable[type[Extension] | str] = (),
-        *,
-        force: Literal[True],
-        **kwargs: Any,
-    ) -> tuple[str, Environment, Path]: ...
-
-    @overload
-    def _render_template(
-        template: Path,
-        extensions: Iterable[type[Extension] | str] = (),
-        *,
-        force: Literal[False] = False,
-        **kwargs: Any,
-    ) -> tuple[str, Environment | None, Path | None]: ...
+    icache_preload_size = icache_loaders = 0
+    if preload_icache:
+        if not (bin_path and include_memory and include_peripherals):
+            raise ValueError(
+                "--preload-icache requires --bin, --memory, and --peripherals"
+            )
+        icache_proc_bytes = int(config.inputs["RAM_PROC_BYTES"])
+        icache_preload_size = preload_size(
+            session.load_file(bin_path, RomImage.load).size,
+            capacity=config_args["MEMORY_WIDTH"]
+            * min(config_args["PROGRAM_ROM_ROWS"], config_args["ICACHE_ROWS"])
+            * icache_proc_bytes,
+        )
+        icache_loaders = -(-icache_preload_size // icache_proc_bytes)
+        # the loaders count down ICACHE_PRELOAD_PENDING, and the last one to finish
+        # sets ICACHE_PRELOAD_SIZE
+        config_code = (
+            "set ICACHE_PRELOAD_SIZE 0\n"
+            + f"set ICACHE_PRELOAD_PENDING {icache_loaders}\n"
+            + config_code
+        )
+        meta.icache_preload_size = icache_preload_size
 
     def _render_template(
         template: Path,
         extensions: Iterable[type[Extension] | str] = (),
         *,
         force: bool = False,
+        symbolic_locals: bool = False,
         **kwargs: Any,
-    ) -> tuple[str, Environment | None, Path | None]:
+    ) -> RenderedTemplate:
         if template.suffix == ".mlog" and not force:
-            return template.read_text("utf-8"), None, None
-
-        template_output = get_template_output_path(template)
-        template_env = create_jinja_env(template.parent, extensions)
-        rendered = render_template(
-            template,
-            template_output,
-            template_env,
-            **kwargs,
+            return RenderedTemplate(session.load_file(template, read_text), None)
+
+        extensions = list(extensions)
+        # symbolic code is only used as input to allocate_locals, so don't write it
+        template_output = (
+            None if symbolic_locals else get_template_output_path(template)
         )
-        return rendered, template_env, template_output
+
+        template_env = session.jinja_env(
+            template.parent,
+            extensions,
+            lambda: create_jinja_env(
+                template.parent,
+                extensions,
+                bytecode_cache=bytecode_cache,
+            ),
+        )
+        session.track_template(template_env, template.name)
+
+        key = cache.key(template_digest(template), extensions, symbolic_locals, kwargs)
+        if (result := cache.load("render", key)) is not None:
+            if template_output is not None:
+                write_if_changed(template_output, result.code)
+            return result
+
+        if LocalVariables in extensions:
+            LocalVariablesEnv.reset(template_env, symbolic=symbolic_locals)
+
+        with profiler.stage("render"):
+            if template_output is None:
+                rendered = template_env.get_template(template.name).render(**kwargs)
+            else:
+                rendered = render_template(
+                    template,
+                    template_output,
+                    template_env,
+                    **kwargs,
+                )
+
+        result = RenderedTemplate(rendered, template_output)
+        if LocalVariables in extensions:
+            result.local_variables = LocalVariablesEnv.of(
+                template_env
+            ).largest_local_variable
+
+        cache.store("render", key, result)
+        return result
+
+    # preprocess other code snippets
+
+    debugger_code = _render_template(config.templates.debugger).code
+
+    display_code = _render_template(config.templates.display).code
 
     # preprocess and check worker
 
@@ -253,73 +524,263 @@ def build(
             value = "3"
         variable_0_to_page_offset.append(value)
 
-    worker_code, worker_env, worker_output = _render_template(
+    worker = _render_template(
         config.templates.worker,
         [LocalVariables],
         force=True,
         VARIABLE_0_TO_PAGE_OFFSET="".join(variable_0_to_page_offset),
         **config.inputs,
     )
+    worker_output = get_template_output_path(config.templates.worker)
+
+    symbolic_worker = None
+    if allocate_locals:
+        symbolic_worker = _render_template(
+            config.templates.worker,
+            [LocalVariables],
+            force=True,
+            symbolic_locals=True,
+            VARIABLE_0_TO_PAGE_OFFSET="".join(variable_0_to_page_offset),
+            **config.inputs,
+        )
+    else:
+        print(f"Local variable count: {worker.local_variables}")
 
-    i = LocalVariablesEnv.of(worker_env).largest_local_variable
-    print(f"Local variable count: {i}")
+    # shared with the source map, which must render the same code
+    controller_kwargs = dict[str, Any](
+        instructions=config.instructions,
+        csrs=config.csrs,
+        preload_icache=icache_preload_size > 0,
+        VARIABLE_0_TO_PAGE_OFFSET="".join(variable_0_to_page_offset),
+        **config.inputs,
+    )
 
-    worker_ast = parse_mlog(worker_code)
+    def _render_controller(labels: dict[str, int]):
+        return _render_template(
+            config.templates.controller,
+            [LocalVariables],
+            force=True,
+            labels=labels,
+            **controller_kwargs,
+        ).code
 
-    try:
-        check_unsaved_variables(worker_ast)
-        worker_labels = dict(iter_labels(worker_ast))
-        worker_code = replace_symbolic_labels(worker_code, worker_ast, worker_labels)
-    except MlogError as e:
-        e.add_note(f"{worker_output}:{e.token.line}")
-        raise
+    def _write_source_map(
+        template: Path,
+        rendered: str,
+        code: str,
+        extensions: Iterable[type[Extension] | str] = (),
+        **kwargs: Any,
+    ):
+        # not cached, since this is only used for profiling
+        with profiler.stage("render"):
+            source, result = render_source_map(
+                create_jinja_env(template.parent, [*extensions, SourceMapMarkers]),
+                template,
+                **kwargs,
+            )
+        if source != rendered:
+            print(
+                f"[WARNING] Skipping source map for {template.name}, since the template renders differently with source map markers."
+            )
+            return
+        write_if_changed(
+            SourceMap.path_for(get_template_output_path(template)),
+            result.align(source, code).model_dump_json(),
+        )
+
+    other_asts: list[AST] | None = None
+    shared: set[str] | None = None
+
+    def _other_asts():
+        # the controller only uses the worker's labels as values, so placeholder
+        # labels are fine here
+        nonlocal other_asts
+        if other_asts is None:
+            other_asts = [
+                parse_mlog(code if code.endswith("\n") else code + "\n")
+                for code in [
+                    _render_controller(defaultdict(int)),
+                    debugger_code,
+                    display_code,
+                ]
+            ]
+        return other_asts
+
+    def _shared_variables():
+        # variables accessed by name from other processors can't be optimized out
+        nonlocal shared
+        if shared is None:
+            shared = shared_variables(parse_mlog(worker.code), *_other_asts())
+        return shared
+
+    def _worker_tables(ast: AST):
+        cfg = ControlFlowGraph.build(ast, analyze_mlog(ast).labels)
+        return worker_tables(cfg, config.instructions, config.csrs).all()
+
+    worker_key = cache.key(
+        text_digest(worker.code),
+        optimize,
+        symbolic_worker and text_digest(symbolic_worker.code),
+        check_saved or minimize_saved,
+        minimize_saved,
+    )
+    if cached_worker := cache.load("worker", worker_key):
+        (
+            worker_code,
+            worker_analysis,
+            worker_optimization,
+            worker_allocation,
+            worker_saved,
+        ) = cached_worker
+    else:
+        worker_code = worker.code
+        worker_optimization = None
+        worker_allocation = None
+        worker_saved = None
+        if symbolic_worker:
+            with profiler.stage("allocate"):
+                try:
+                    worker_code, worker_allocation = allocate_local_variables(
+                        symbolic_worker.code,
+                        reference=worker.code,
+                        tables=_worker_tables(parse_mlog(symbolic_worker.code)),
+                    )
+                except MlogError as e:
+                    e.add_note(f"{worker_output}:{e.token.line}")
+                    raise
+
+        if optimize:
+            # may render the controller, so this can't be inside the stage
+            shared_names = _shared_variables()
+            with profiler.stage("optimize"):
+                worker_code, worker_optimization = optimize_mlog(
+                    worker_code, shared=shared_names
+                )
+
+        if check_saved or minimize_saved:
+            # may render the controller, so this can't be inside the stage
+            external_reads, external_writes = external_variables(*_other_asts())
+            with profiler.stage("analyze"):
+                ast = parse_mlog(worker_code)
+                worker_saved = saved_variable_report(
+                    ast,
+                    tables=_worker_tables(ast),
+                    external_reads=external_reads,
+                    external_writes=external_writes,
+                )
+            if minimize_saved:
+                worker_code = replace_fetch_block(worker_code, worker_saved)
+
+        with profiler.stage("parse"):
+            worker_ast = parse_mlog(worker_code)
+
+        try:
+            with profiler.stage("analyze"):
+                worker_analysis = analyze_mlog(worker_ast)
+                worker_code = replace_symbolic_labels(
+                    worker_code, worker_analysis, worker_analysis.labels
+                )
+        except MlogError as e:
+            e.add_note(f"{worker_output}:{e.token.line}")
+            raise
+
+        cache.store(
+            "worker",
+            worker_key,
+            (
+                worker_code,
+                worker_analysis,
+                worker_optimization,
+                worker_allocation,
+                worker_saved,
+            ),
+        )
+
+    if worker_allocation:
+        worker_allocation.print()
+    worker_analysis.print_warnings(unsaved=worker_saved is None)
+    if worker_saved:
+        worker_saved.print(minimized=minimize_saved)
+    worker_labels = worker_analysis.labels
+    worker_statements = worker_analysis.statements
 
     # hack
-    worker_output.write_text(worker_code, "utf-8")
+    write_if_changed(worker_output, worker_code)
+
+    if source_map:
+        _write_source_map(
+            config.templates.worker,
+            worker.code,
+            worker_code,
+            [LocalVariables],
+            VARIABLE_0_TO_PAGE_OFFSET="".join(variable_0_to_page_offset),
+            **config.inputs,
+        )
 
     print(
         f"""\
 Worker:
-  Instructions: {count_statements(worker_ast)} / 1000
+  Instructions: {worker_statements} / 1000
   Bytes: {len(worker_code.encode())} / {1024 * 100}"""
     )
+    if worker_optimization:
+        worker_optimization.print("Worker")
 
     # preprocess controller
 
-    controller_code, _, _ = _render_template(
-        config.templates.controller,
-        [LocalVariables],
-        force=True,
-        instructions=config.instructions,
-        csrs=config.csrs,
-        labels=worker_labels,
-        VARIABLE_0_TO_PAGE_OFFSET="".join(variable_0_to_page_offset),
-        **config.inputs,
-    )
+    controller_code = rendered_controller = _render_controller(worker_labels)
+
+    controller_key = cache.key(text_digest(controller_code), optimize)
+    if cached_controller := cache.load("controller", controller_key):
+        controller_code, controller_statements, controller_optimization = (
+            cached_controller
+        )
+    else:
+        controller_optimization = None
+        if optimize:
+            shared_names = _shared_variables()
+            with profiler.stage("optimize"):
+                controller_code, controller_optimization = optimize_mlog(
+                    controller_code, shared=shared_names
+                )
+
+        with profiler.stage("parse"):
+            controller_statements = count_statements(parse_mlog(controller_code))
+
+        cache.store(
+            "controller",
+            controller_key,
+            (controller_code, controller_statements, controller_optimization),
+        )
 
-    controller_ast = parse_mlog(controller_code)
     print(
         f"""\
 Controller:
-  Instructions: {count_statements(controller_ast)} / 1000
+  Instructions: {controller_statements} / 1000
   Bytes: {len(controller_code.encode())} / {1024 * 100}"""
     )
-
-    # preprocess other code snippets
-
-    debugger_code, _, _ = _render_template(config.templates.debugger)
-
-    display_code, _, _ = _render_template(config.templates.display)
+    if controller_optimization:
+        controller_optimization.print("Controller")
+
+    if source_map:
+        _write_source_map(
+            config.templates.controller,
+            rendered_controller,
+            controller_code,
+            [LocalVariables],
+            labels=worker_labels,
+            **controller_kwargs,
+        )
 
     # load schematics
 
-    lookups_schem = Schematic.read_file(str(config.schematics.lookups))
-    assert lookups_schem.get_dimensions() == (4, 4)
+    with profiler.stage("schematics"):
+        lookups_schem = session.load_file(config.schematics.lookups, read_schematic)
+        ram_schem = session.load_file(config.schematics.ram, read_schematic)
+        sortkb_schem = session.load_file(config.schematics.sortkb, read_schematic)
 
-    ram_schem = Schematic.read_file(str(config.schematics.ram))
+    assert lookups_schem.get_dimensions() == (4, 4)
     assert ram_schem.get_dimensions() == (1, 1)
-
-    sortkb_schem = Schematic.read_file(str(config.schematics.sortkb))
     assert sortkb_schem.get_dimensions() == (5, 4)
 
     # begin generating output schematic
@@ -493,14 +954,51 @@ Controller:
         meta.cpu_width = width
         meta.cpu_height = height
 
-        schem.add_block(
-            Block(
-                block=Content.WORLD_PROCESSOR,
-                x=16,
-                y=0,
-                config=ProcessorConfigUTF8(
-                    code=controller_code,
-                    links=relative_links(
+        # the controller is always first
+        cpu_positions = [(controller_link.x, controller_link.y)] + [
+            (x, y)
+            for x in lenrange(16, width)
+            for y in lenrange(0, height)
+            if (x, y) != (controller_link.x, controller_link.y)
+        ]
+
+        cpu_key = cache.key(
+            text_digest(controller_code),
+            text_digest(worker_code),
+            cpu_positions,
+        )
+        cpu_configs: list[bytearray] | None = cache.load("cpu", cpu_key)
+        if cpu_configs is None:
+            with profiler.stage("compress"):
+                cpu_configs = [
+                    ProcessorConfigUTF8(
+                        code=controller_code,
+                        links=relative_links(
+                            *lookup_links,
+                            *uart_links,
+                            registers_link,
+                            labels_link,
+                            csrs_link,
+                            incr_link,
+                            config_link,
+                            csr_labels_link,
+                            error_output_link,
+                            power_switch_link,
+                            pause_switch_link,
+                            single_step_switch_link,
+                            x=controller_link.x,
+                            y=controller_link.y,
+                        ),
+                    ).compress()
+                ]
+
+                # every worker has the same code, so only the links need to be compressed
+                worker_compressor = ProcessorConfigCompressor(
+                    worker_code,
+                    max_workers=jobs,
+                )
+                cpu_configs += worker_compressor.compress_many(
+                    relative_links(
                         *lookup_links,
                         *uart_links,
                         registers_link,
@@ -509,60 +1007,43 @@ Controller:
                         incr_link,
                         config_link,
                         csr_labels_link,
+                        controller_link,
                         error_output_link,
-                        power_switch_link,
-                        pause_switch_link,
-                        single_step_switch_link,
-                        x=16,
-                        y=0,
-                    ),
-                ).compress(),
-                rotation=0,
-            )
-        )
-
-        for x in lenrange(16, width):
-            for y in lenrange(0, height):
-                # controller
-                if x == 16 and y == 0:
-                    continue
-
-                schem.add_block(
-                    Block(
-                        block=Content.WORLD_PROCESSOR,
                         x=x,
                         y=y,
-                        config=ProcessorConfigUTF8(
-                            code=worker_code,
-                            links=relative_links(
-                                *lookup_links,
-                                *uart_links,
-                                registers_link,
-                                labels_link,
-                                csrs_link,
-                                incr_link,
-                                config_link,
-                                csr_labels_link,
-                                controller_link,
-                                error_output_link,
-                                x=x,
-                                y=y,
-                            ),
-                        ).compress(),
-                        rotation=0,
                     )
+                    for x, y in cpu_positions[1:]
+                )
+
+            cache.store("cpu", cpu_key, cpu_configs)
+
+        for (x, y), cpu_config in zip(cpu_positions, cpu_configs, strict=True):
+            schem.add_block(
+                Block(
+                    block=Content.WORLD_PROCESSOR,
+                    x=x,
+                    y=y,
+                    config=cpu_config,
+                    rotation=0,
                 )
+            )
 
     # memory
     if include_memory:
-        i = 0
         if bin_path:
-            data = bin_path.read_bytes()
-            if len(data) % 4 != 0:
+            image = session.load_file(bin_path, RomImage.load)
+            if image.size % 4 != 0:
                 print("[WARNING] Bin is not aligned to 4 bytes, appending zeros.")
-                data += bytes([0, 0, 0, 0])[: len(data) % 4]
+                image = image.pad(4)
         else:
-            data = bytes()
+            image = RomImage([])
+
+        rom_encoder = RomEncoder(
+            byte_offset=int(config.inputs["ROM_BYTE_OFFSET"]),
+            proc_bytes=int(config.inputs["ROM_PROC_BYTES"]),
+        )
+        rom_payloads = rom_encoder.iter_image_payloads(image)
+        empty_rom_config = rom_proc_config("")
 
         base_x = config_link.x + config_args["MEMORY_X_OFFSET"]
         base_y = config_link.y + config_args["MEMORY_Y_OFFSET"]
@@ -577,37 +1058,94 @@ Controller:
         meta.memory_width = memory_width
         meta.memory_height = memory_height
 
-        meta.rom_processors = memory_width * rom_height
+        rom_processors = memory_width * rom_height
+        meta.rom_processors = rom_processors
+
+        program_rom_procs = memory_width * config_args["PROGRAM_ROM_ROWS"]
+        rom_regions = [
+            ("Program ROM", 0, program_rom_procs),
+            ("Data ROM", program_rom_procs, rom_processors),
+        ]
+        used_rom_procs = [0] * len(rom_regions)
         meta.ram_processors = memory_width * config_args["RAM_ROWS"]
         meta.icache_processors = memory_width * config_args["ICACHE_ROWS"]
 
-        for y in lenrange(0, memory_height):
-            for x in lenrange(base_x, memory_width):
-                if y < rom_height:
-                    if i < len(data):
-                        payload = "".join(chr(174 + c) for c in data[i : i + 16384])
-                        i += 16384
-                    else:
-                        payload = ""
-
-                    schem.add_block(
-                        Block(
-                            block=Content.MICRO_PROCESSOR,
-                            x=x,
-                            y=base_y + y,
-                            config=ProcessorConfigUTF8(
-                                code=f'set v "{payload}"; stop',
-                                links=[],
-                            ).compress(),
-                            rotation=0,
+        icache_start_row = rom_height + config_args["RAM_ROWS"]
+        icache_payloads = list[int]()
+        if icache_preload_size:
+            with profiler.stage("icache"):
+                icache_payloads = IcacheDecoder(config.instructions).decode_image(
+                    image.read(0, icache_preload_size), icache_preload_size
+                )
+        ram_proc_vars = int(config.inputs["RAM_PROC_VARS"])
+
+        def icache_loader_config_at(x: int, y: int) -> bytearray | None:
+            i = (y - icache_start_row) * memory_width + x - base_x
+            if y < icache_start_row or not (
+                payloads := icache_payloads[i * ram_proc_vars : (i + 1) * ram_proc_vars]
+            ):
+                return None
+            return icache_loader_config(
+                payloads,
+                size=icache_preload_size,
+                ram_proc_vars=ram_proc_vars,
+                lookup_proc_size=int(config.inputs["LOOKUP_PROC_SIZE"]),
+                lookup_offset=(lookup_links[0].x - x, lookup_links[0].y - base_y - y),
+                config_offset=(config_link.x - x, config_link.y - base_y - y),
+            )
+
+        with profiler.stage("rom"):
+            for y in lenrange(0, memory_height):
+                for x in lenrange(base_x, memory_width):
+                    if y < rom_height:
+                        # all-zero procs are left empty, since out-of-bounds reads return 0
+                        if payload := next(rom_payloads, ""):
+                            rom_config = rom_proc_config(payload)
+                            used_rom_procs[y >= config_args["PROGRAM_ROM_ROWS"]] += 1
+                        else:
+                            rom_config = empty_rom_config
+
+                        schem.add_block(
+                            Block(
+                                block=Content.MICRO_PROCESSOR,
+                                x=x,
+                                y=base_y + y,
+                                config=rom_config,
+                                rotation=0,
+                            )
                         )
-                    )
-                else:
-                    schem.add_schem(ram_schem, x, base_y + y)
+                    elif loader_config := icache_loader_config_at(x, y):
+                        schem.add_block(
+                            Block(
+                                block=Content.WORLD_PROCESSOR,
+                                x=x,
+                                y=base_y + y,
+                                config=loader_config,
+                                rotation=0,
+                            )
+                        )
+                    else:
+                        schem.add_schem(ram_schem, x, base_y + y)
+
+        for (name, start, end), used_procs in zip(rom_regions, used_rom_procs):
+            if start == end:
+                continue
+            capacity = (end - start) * rom_encoder.proc_bytes
+            used_bytes = image.used_bytes(
+                start * rom_encoder.proc_bytes, end * rom_encoder.proc_bytes
+            )
+            print(
+                f"{name}: {used_bytes} / {capacity} bytes used ({used_bytes / capacity:.1%}), {used_procs} / {end - start} procs used"
+            )
+        if icache_preload_size:
+            print(
+                f"Icache: {icache_preload_size} bytes preloaded into {icache_loaders} procs"
+            )
 
-        if i < len(data):
+        rom_capacity = rom_processors * rom_encoder.proc_bytes
+        if image.size > rom_capacity:
             print(
-                f"[WARNING] Bin is too large to fit into the generated ROM ({len(data) - i} bytes overflowed)."
+                f"[WARNING] Bin is too large to fit into the generated ROM ({image.size - rom_capacity} bytes overflowed)."
             )
 
     # debugger
@@ -652,12 +1190,16 @@ Controller:
         w, h = schem.get_dimensions()
         print(f"Schematic size: {w}x{h}")
 
-        if output:
-            print(f"Writing schematic to file: {output}")
-            schem.write_file(str(output))
-        else:
-            print("Copying schematic to clipboard.")
-            schem.write_clipboard()
+        if cache.enabled:
+            print(f"Build cache: {cache.hits} hits, {cache.misses} misses")
+
+        with profiler.stage("write"):
+            if output:
+                print(f"Writing schematic to file: {output}")
+                schem.write_file(str(output))
+            else:
+                print("Copying schematic to clipboard.")
+                schem.write_clipboard()
 
 
 def parse_config_str(config: str) -> ConfigArgs | None:
@@ -727,9 +1269,12 @@ def relative_links(*links: ProcessorLink, x: int, y: int):
 def create_jinja_env(
     template_dir: Path,
     extensions: Iterable[type[Extension] | str] = (),
+    *,
+    bytecode_cache: BytecodeCache | None = None,
 ):
     env = Environment(
         loader=FileSystemLoader(template_dir),
+        bytecode_cache=bytecode_cache,
         line_statement_prefix="#%",
         line_comment_prefix="#%#",
         autoescape=False,
@@ -771,6 +1316,35 @@ def render_template(
     return result
 
 
+def load_yaml(path: Path) -> Any:
+    with path.open("rb") as f:
+        return yaml.load(f, yaml.Loader)
+
+
+def read_text(path: Path):
+    return path.read_text("utf-8")
+
+
+def read_schematic(path: Path):
+    return Schematic.read_file(str(path))
+
+
+def write_if_changed(path: Path, text: str):
+    """Writes text to a file, unless the file already contains exactly that text.
+
+    This avoids touching the file's mtime (and waking up file watchers) when a
+    cached build produces the same output.
+    """
+
+    try:
+        if path.read_text("utf-8") == text:
+            return
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, "utf-8")
+
+
 def get_template_output_path(path: Path):
     if path.suffix != ".jinja":
         raise ValueError(f"Expected .jinja suffix, but got {path.suffix}: {path}")
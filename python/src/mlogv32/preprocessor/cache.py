@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import re
+from dataclasses import dataclass
+from functools import cache
+from importlib import metadata, resources
+from pathlib import Path
+from typing import Any
+
+from jinja2 import Environment
+from jinja2.bccache import Bucket, FileSystemBytecodeCache
+from pydantic import BaseModel
+
+from mlogv32.utils.cache import text_digest
+
+# matches the template names in {% include %}, {% import %}, {% from %}, and {% extends %}
+# this is intentionally a bit too eager, since hashing an extra file is harmless
+_template_ref_re = re.compile(
+    r"""\b(?:include|import|from|extends)\s+(['"])([^'"\n]+)\1"""
+)
+
+
+@dataclass
+class RenderedTemplate:
+    code: str
+    output: Path | None
+    local_variables: int | None = None
+
+
+class BuildCache:
+    """Persistent content-addressed cache for intermediate build artifacts.
+
+    Entries are grouped into stages (eg. `render`, `cpu`), and each stage only keeps
+    the most recently used `max_entries` entries.
+
+    If `memory` is True, entries are also kept in memory, so a long-running process
+    (eg. `build --watch`) can skip unpickling unchanged artifacts. If `root` is None,
+    only the in-memory cache is used (if enabled).
+    """
+
+    def __init__(
+        self,
+        root: Path | None,
+        *,
+        max_entries: int = 16,
+        memory: bool = False,
+    ):
+        self.root = root
+        self.max_entries = max_entries
+        self.memory = memory
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = dict[str, dict[str, Any]]()
+
+    @property
+    def enabled(self):
+        return self.root is not None or self.memory
+
+    def key(self, *parts: Any) -> str:
+        """Returns a stable digest of `parts`, which must be JSON-serializable (with
+        `str` as a fallback) and should fully determine the cached value."""
+
+        data = json.dumps(
+            [tool_version(), *parts],
+            default=_json_default,
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def load(self, stage: str, key: str) -> Any | None:
+        if self.memory:
+            entries = self._memory.setdefault(stage, {})
+            if key in entries:
+                # mark as recently used
+                entries[key] = entries.pop(key)
+                self.hits += 1
+                return entries[key]
+
+        if self.root is None:
+            if self.memory:
+                self.misses += 1
+            return None
+
+        path = self._path(stage, key)
+        try:
+            with path.open("rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            print(f"[WARNING] Ignoring invalid cache entry {path}: {e}")
+            self.misses += 1
+            return None
+
+        # mark as recently used
+        path.touch()
+        self.hits += 1
+        self._store_memory(stage, key, value)
+        return value
+
+    def store(self, stage: str, key: str, value: Any):
+        self._store_memory(stage, key, value)
+
+        if self.root is None:
+            return
+
+        path = self._path(stage, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # write atomically so an interrupted build can't leave a truncated entry
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with tmp_path.open("wb") as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(path)
+
+        self._evict(path.parent)
+
+    def _store_memory(self, stage: str, key: str, value: Any):
+        if not self.memory:
+            return
+
+        entries = self._memory.setdefault(stage, {})
+        entries.pop(key, None)
+        entries[key] = value
+        while len(entries) > self.max_entries:
+            del entries[next(iter(entries))]
+
+    def _path(self, stage: str, key: str):
+        assert self.root is not None
+        return self.root / "build" / stage / f"{key}.pickle"
+
+    def _evict(self, stage_dir: Path):
+        entries = sorted(
+            stage_dir.glob("*.pickle"),
+            key=lambda p: p.stat().st_mtime,
+            reverse=True,
+        )
+        for path in entries[self.max_entries :]:
+            path.unlink(missing_ok=True)
+
+
+class JinjaBytecodeCache(FileSystemBytecodeCache):
+    """Size-bounded persistent cache for compiled Jinja templates.
+
+    Jinja invalidates entries when the template source changes. The cache key also
+    includes the environment's extensions and the preprocessor's own version, since
+    extensions like `LocalVariables` change the generated code for the same source.
+
+    When the total size of the cache exceeds `max_bytes`, the least recently used
+    entries are removed.
+    """
+
+    def __init__(self, directory: Path, *, max_bytes: int = 32 * 1024 * 1024):
+        directory.mkdir(parents=True, exist_ok=True)
+        super().__init__(str(directory))
+        self.max_bytes = max_bytes
+
+    def get_bucket(
+        self,
+        environment: Environment,
+        name: str,
+        filename: str | None,
+        source: str,
+    ) -> Bucket:
+        key = text_digest(
+            json.dumps([tool_version(), sorted(environment.extensions), name, filename])
+        )
+        bucket = Bucket(environment, key, self.get_source_checksum(source))
+        self.load_bytecode(bucket)
+        return bucket
+
+    def load_bytecode(self, bucket: Bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is not None:
+            # mark as recently used
+            Path(self._get_cache_filename(bucket)).touch()
+
+    def dump_bytecode(self, bucket: Bucket):
+        super().dump_bytecode(bucket)
+        self._evict()
+
+    def _evict(self):
+        entries = list[tuple[float, int, Path]]()
+        for path in Path(self.directory).glob(self.pattern % "*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort(reverse=True)
+
+        total = 0
+        for _, size, path in entries:
+            total += size
+            if total > self.max_bytes:
+                path.unlink(missing_ok=True)
+
+
+def jinja_bytecode_cache(root: Path | None) -> JinjaBytecodeCache | None:
+    """Returns the bytecode cache stored in the given cache directory, or None if
+    caching is disabled."""
+
+    if root is None:
+        return None
+    return JinjaBytecodeCache(root / "jinja")
+
+
+def _json_default(value: Any) -> Any:
+    match value:
+        case BaseModel():
+            return value.model_dump(mode="json")
+        case type():
+            return f"{value.__module__}.{value.__qualname__}"
+        case _:
+            return str(value)
+
+
+def template_digest(path: Path) -> str:
+    """Returns a digest of a template and every template that it (transitively)
+    includes or imports, relative to the template's directory."""
+
+    root = path.parent
+    h = hashlib.sha256()
+
+    seen = set[Path]()
+    queue = [path.resolve()]
+    while queue:
+        current = queue.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+
+        try:
+            source = current.read_bytes()
+        except FileNotFoundError:
+            # let jinja raise a nicer error later
+            continue
+
+        h.update(str(current).encode("utf-8") + b"\0")
+        h.update(hashlib.sha256(source).digest())
+
+        for _, name in _template_ref_re.findall(source.decode("utf-8")):
+            queue.append((root / name).resolve())
+
+    return h.hexdigest()
+
+
+@cache
+def tool_version() -> str:
+    """Returns a digest of the preprocessor's own source code and the versions of the
+    libraries that affect its output."""
+
+    h = hashlib.sha256()
+    for dist in ["jinja2", "lark", "pymsch"]:
+        try:
+            version = metadata.version(dist)
+        except metadata.PackageNotFoundError:
+            version = None
+        h.update(f"{dist}={version};".encode())
+
+    package = Path(str(resources.files("mlogv32")))
+    for path in sorted(package.rglob("*")):
+        if path.suffix in {".py", ".lark"}:
+            h.update(path.relative_to(package).as_posix().encode("utf-8") + b"\0")
+            h.update(path.read_bytes())
+
+    return h.hexdigest()
@@ -0,0 +1,536 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+from .models import BuildConfig
+from .parser.cfg import ControlFlowGraph, Instruction
+
+type AddressState = tuple[tuple[str, int], ...]
+
+# worker labels that end a RISC-V instruction
+WORKER_BOUNDARIES = ("main", "fire_interrupts", "poll_interrupts")
+
+# worker labels that are only reached by traps, interrupts, and other slow paths
+WORKER_TRAPS = (
+    "trap",
+    "trap_without_mtval",
+    "interrupt",
+    "translate_virtual_address__page_fault",
+    "default_xtvec_handler",
+    "main__breakpoint",
+    "reset",
+)
+
+# the jump table in main that dispatches to the runtime instruction handlers
+WORKER_DISPATCH = "main__no_breakpoint"
+
+# the first address of the runtime instruction handlers in the LABELS table
+HANDLER_TABLE_START = 128
+
+
+@dataclass(frozen=True)
+class PathCost:
+    """The number of mlog instructions executed along the shortest and longest paths."""
+
+    min: int
+    max: int
+    unresolved: bool = False
+    """Whether some path ended at an indirect jump that couldn't be resolved."""
+    complete: bool = True
+    """Whether `min` and `max` are from complete paths. If False, every path ended at
+    an unresolved jump, and the costs are lower bounds."""
+
+    def merge(self, other: PathCost):
+        if self.complete != other.complete:
+            # ignore partial paths if there are any complete ones
+            base = self if self.complete else other
+            return PathCost(base.min, base.max, unresolved=True)
+        return PathCost(
+            min=min(self.min, other.min),
+            max=max(self.max, other.max),
+            unresolved=self.unresolved or other.unresolved,
+            complete=self.complete,
+        )
+
+    def shift(self, n: int):
+        return PathCost(self.min + n, self.max + n, self.unresolved, self.complete)
+
+    def __str__(self):
+        suffix = "?" if not self.complete else "+" if self.unresolved else ""
+        if self.min == self.max:
+            return f"{self.min}{suffix}"
+        return f"{self.min}-{self.max}{suffix}"
+
+
+@dataclass
+class CostModel:
+    """Assumptions about which conditional branches are taken."""
+
+    name: str
+    always: set[int] = field(default_factory=set)
+    """Conditional jumps to these addresses are always taken."""
+    never: set[int] = field(default_factory=set)
+    """These addresses are never reached."""
+
+
+class PathExplorer:
+    """Enumerates the paths through a CFG from a start address to a boundary,
+    following return addresses stored in address variables.
+
+    Each (address, address variable state) pair may be visited at most `loop_limit`
+    times along a single path, which bounds loops like the page table walk in
+    `translate_virtual_address`.
+
+    `tables` gives the possible targets of jump tables and other dynamic jumps (eg.
+    the CSR handler jumps), by instruction index.
+    """
+
+    def __init__(
+        self,
+        cfg: ControlFlowGraph,
+        model: CostModel,
+        *,
+        boundaries: Iterable[int],
+        tables: dict[int, list[int]],
+        loop_limit: int = 2,
+    ):
+        self.cfg = cfg
+        self.model = model
+        self.boundaries = set(boundaries)
+        self.tables = tables
+        self.loop_limit = loop_limit
+
+        self._live = cfg.live_address_variables()
+        self._memo = dict[tuple[int, AddressState, int], PathCost | None]()
+
+    def cost(self, start: int) -> PathCost | None:
+        """Returns the cost of all paths from `start` to a boundary, or None if there
+        are no feasible paths."""
+
+        return self._walk(start, (), defaultdict(int), first=True)
+
+    def _walk(
+        self,
+        pc: int,
+        state: AddressState,
+        stack: defaultdict[tuple[int, AddressState], int],
+        *,
+        first: bool = False,
+    ) -> PathCost | None:
+        # results are memoized per visit count, which is exact as long as every loop
+        # has a single entry point (like the ones in the worker)
+        memo_key = (pc, state, stack[pc, state])
+        if not first and memo_key in self._memo:
+            return self._memo[memo_key]
+
+        instructions = self.cfg.instructions
+        path = list[tuple[int, AddressState]]()
+        count = 0
+        result: PathCost | None = None
+
+        try:
+            while True:
+                if not first and pc in self.boundaries:
+                    result = PathCost(count, count)
+                    break
+                first = False
+
+                if not (0 <= pc < len(instructions)):
+                    result = PathCost(count, count, unresolved=True, complete=False)
+                    break
+
+                if pc in self.model.never:
+                    break
+
+                key = (pc, state)
+                if stack[key] >= self.loop_limit:
+                    break
+                stack[key] += 1
+                path.append(key)
+
+                instruction = instructions[pc]
+                count += 1
+
+                if instruction.halts:
+                    result = PathCost(count, count)
+                    break
+
+                successors = self._successors(instruction, state)
+                if successors is None:
+                    result = PathCost(count, count, unresolved=True, complete=False)
+                    break
+
+                if len(successors) == 1:
+                    pc, state = successors[0]
+                    continue
+
+                for next_pc, next_state in successors:
+                    sub = self._walk(next_pc, next_state, stack)
+                    if sub is not None:
+                        result = sub if result is None else result.merge(sub)
+                if result is not None:
+                    result = result.shift(count)
+                break
+        finally:
+            for key in path:
+                stack[key] -= 1
+
+        self._memo[memo_key] = result
+        return result
+
+    def _successors(
+        self,
+        instruction: Instruction,
+        state: AddressState,
+    ) -> list[tuple[int, AddressState]] | None:
+        """Returns the possible next addresses and states, or None if the next address
+        can't be resolved."""
+
+        states = _update_state(state, instruction)
+        model = self.model
+
+        if instruction.table is not None or instruction.dynamic:
+            targets = self.tables.get(instruction.index)
+            if targets is None:
+                return None
+        else:
+            targets = list[int]()
+            for target in instruction.targets:
+                if isinstance(target, str):
+                    value = dict(state).get(target)
+                    if value is None:
+                        return None
+                    target = value
+                targets.append(target)
+
+            if instruction.conditional:
+                target = targets[0]
+                if target in model.always:
+                    targets = [target]
+                elif target in model.never:
+                    targets = [instruction.index + 1]
+                else:
+                    targets = [target, instruction.index + 1]
+            elif instruction.falls_through:
+                targets.append(instruction.index + 1)
+            elif forced := [t for t in targets if t in model.always]:
+                targets = forced
+
+        # forget return addresses that can't be used anymore, so that paths which
+        # only differ in dead state can share memoized results
+        return list(
+            dict.fromkeys(
+                (target, self._prune(target, next_state))
+                for target in targets
+                for next_state in states
+            )
+        )
+
+    def _prune(self, pc: int, state: AddressState) -> AddressState:
+        if not (0 <= pc < len(self._live)):
+            return state
+        live = self._live[pc]
+        return tuple(item for item in state if item[0] in live)
+
+
+def _update_state(state: AddressState, instruction: Instruction) -> list[AddressState]:
+    if not instruction.address_writes:
+        return [state]
+
+    states = [dict(state)]
+    for var, values in instruction.address_writes.items():
+        if values is None:
+            for s in states:
+                s.pop(var, None)
+            continue
+
+        states = [
+            s | {var: value}
+            for s in states
+            for value in values
+            if isinstance(value, int)
+        ]
+
+    return [tuple(sorted(s.items())) for s in states]
+
+
+@dataclass
+class OpcodeCost:
+    label: str
+    costs: dict[str, PathCost | None]
+    """Cost per model, or None if every path traps."""
+    traps: dict[str, PathCost | None]
+    """Cost per model, including paths that trap."""
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "label": self.label,
+            "costs": {name: _cost_json(c) for name, c in self.costs.items()},
+            "traps": {name: _cost_json(c) for name, c in self.traps.items()},
+        }
+
+
+@dataclass
+class WorkerCostReport:
+    """Static cost of each RISC-V instruction handler in the worker, in mlog
+    instructions per RISC-V instruction (including the icache fetch in `main` and
+    `end_instruction`)."""
+
+    models: list[str]
+    opcodes: list[OpcodeCost]
+    fetch: dict[str, PathCost | None]
+    """Cost of an icache miss (`main__slow_instruction_fetch` through `decode`)."""
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "models": self.models,
+            "opcodes": [opcode.to_json() for opcode in self.opcodes],
+            "fetch": {name: _cost_json(c) for name, c in self.fetch.items()},
+        }
+
+    def print(self):
+        width = max(len(opcode.label) for opcode in self.opcodes) + 2
+        header = "Opcode".ljust(width) + "".join(name.rjust(14) for name in self.models)
+        print(header)
+        print("-" * len(header))
+        for opcode in self.opcodes:
+            print(
+                opcode.label.ljust(width)
+                + "".join(
+                    _format_cost(opcode.costs[name], opcode.traps[name]).rjust(14)
+                    for name in self.models
+                )
+            )
+        print("-" * len(header))
+        print(
+            "icache miss".ljust(width)
+            + "".join(
+                _format_cost(self.fetch[name], None).rjust(14) for name in self.models
+            )
+        )
+        print()
+        print("min-max mlog instructions from main to the next instruction")
+        print("+: some paths end at an unresolved indirect jump and are not counted")
+        print("?: every path ends at an unresolved indirect jump (lower bound)")
+        print("t: every path traps")
+
+    def compare(self, baseline: dict[str, Any]) -> list[str]:
+        """Returns a message for each opcode whose worst-case cost increased compared
+        to a previous `to_json()` result."""
+
+        old = {
+            (opcode["label"], name): cost
+            for opcode in baseline["opcodes"]
+            for name, cost in opcode["costs"].items()
+        }
+
+        messages = list[str]()
+        for opcode in self.opcodes:
+            for name, cost in opcode.costs.items():
+                previous = old.get((opcode.label, name))
+                if cost is None or previous is None:
+                    continue
+                if cost.max > previous["max"]:
+                    messages.append(
+                        f"{opcode.label} ({name}): max cost increased from {previous['max']} to {cost.max}"
+                    )
+        return messages
+
+
+def worker_cost_models(labels: dict[str, int]) -> list[CostModel]:
+    """Returns the bare and Sv32 cost models for the worker.
+
+    Both models assume an icache hit and no instret overflow, and never take traps or
+    interrupts. The Sv32 model assumes that address translation is enabled and
+    always succeeds.
+    """
+
+    common_always = addresses_of(labels, ["main__read_icache", "end_instruction_trap"])
+    traps = addresses_of(labels, WORKER_TRAPS)
+
+    return [
+        CostModel(
+            name="bare",
+            always=common_always,
+            never=traps | addresses_of(labels, ["translate_virtual_address"]),
+        ),
+        CostModel(
+            name="sv32",
+            always=common_always | addresses_of(labels, ["translate_virtual_address"]),
+            never=traps
+            | addresses_of(labels, ["translate_virtual_address__unchanged"]),
+        ),
+    ]
+
+
+@dataclass
+class WorkerTables:
+    """The targets of the worker's `read @counter` jump tables."""
+
+    handlers: dict[str, int]
+    """The address of each runtime instruction handler, by label."""
+    dispatch: int
+    """The index of the jump that dispatches to the instruction handlers."""
+    decode: dict[int, list[int]]
+    """The possible targets of every other jump table (the decoders)."""
+    csr: dict[int, list[int]] = field(default_factory=dict)
+    """The possible targets of the CSR read and write handler jumps
+    (`op mod @counter ...`), if the CSRs were given."""
+
+    def all(self) -> dict[int, list[int]]:
+        return (
+            self.decode
+            | self.csr
+            | {self.dispatch: sorted(set(self.handlers.values()))}
+        )
+
+
+def worker_tables(
+    cfg: ControlFlowGraph,
+    instructions: list[BuildConfig.Instruction],
+    csrs: dict[str, BuildConfig.CSR] | None = None,
+) -> WorkerTables:
+    labels = cfg.labels
+    table = dict[int, str]()
+    for instruction in instructions:
+        assert instruction.address is not None
+        for i in range(instruction.count):
+            table[instruction.address + i * instruction.align] = instruction.label
+
+    handlers = dict[str, int]()
+    decoders = set[int]()
+    for address, label in table.items():
+        if label not in labels:
+            raise ValueError(f"Instruction label not found in worker: {label}")
+        if address >= HANDLER_TABLE_START:
+            handlers.setdefault(label, labels[label])
+        else:
+            decoders.add(labels[label])
+
+    # the dispatch jump is the first table lookup after WORKER_DISPATCH
+    dispatch = next(
+        instruction.index
+        for instruction in cfg.instructions[labels[WORKER_DISPATCH] :]
+        if instruction.table is not None
+    )
+    decode_tables = {
+        instruction.index: sorted(decoders)
+        for instruction in cfg.instructions
+        if instruction.table is not None and instruction.index != dispatch
+    }
+
+    # the CSR lookup table (see controller.mlog.jinja) contains the read and write
+    # handler labels, which modify_csr jumps to in that order
+    csr_tables = dict[int, list[int]]()
+    if csrs is not None:
+        csr_jumps = [
+            instruction.index
+            for instruction in cfg.instructions
+            if instruction.dynamic
+            and instruction.statement.name == "op"
+            and str(instruction.statement.args[0]) == "mod"
+        ]
+        if len(csr_jumps) != 2:
+            raise ValueError(
+                f"Expected 2 CSR handler jumps in worker, but found {len(csr_jumps)}"
+            )
+        read_labels = {f"csr_read_{csr.read}" for csr in csrs.values()}
+        write_labels = {
+            "ILLEGAL_OP" if csr.write is None else f"csr_write_{csr.write}"
+            for csr in csrs.values()
+        }
+        for index, names in zip(csr_jumps, [read_labels, write_labels]):
+            missing = names - labels.keys()
+            if missing:
+                raise ValueError(f"CSR labels not found in worker: {sorted(missing)}")
+            csr_tables[index] = sorted({labels[name] for name in names})
+
+    return WorkerTables(handlers, dispatch, decode_tables, csr_tables)
+
+
+def worker_cost_report(
+    cfg: ControlFlowGraph,
+    instructions: list[BuildConfig.Instruction],
+    csrs: dict[str, BuildConfig.CSR] | None = None,
+) -> WorkerCostReport:
+    labels = cfg.labels
+    tables = worker_tables(cfg, instructions, csrs)
+    handlers = tables.handlers
+    dispatch = tables.dispatch
+    decode_tables = tables.decode | tables.csr
+
+    boundaries = addresses_of(labels, WORKER_BOUNDARIES)
+    models = worker_cost_models(labels)
+
+    opcodes = list[OpcodeCost]()
+    for label, address in handlers.items():
+        costs = dict[str, PathCost | None]()
+        traps = dict[str, PathCost | None]()
+        for model in models:
+            explorer = PathExplorer(
+                cfg,
+                model,
+                boundaries=boundaries,
+                tables=decode_tables | {dispatch: [address]},
+            )
+            costs[model.name] = explorer.cost(labels["main"])
+            if costs[model.name] is not None:
+                traps[model.name] = costs[model.name]
+                continue
+
+            # this instruction always traps (eg. ECALL), so include the trap handler
+            trap_model = CostModel(
+                name=model.name,
+                always=model.always,
+                never=model.never - addresses_of(labels, WORKER_TRAPS),
+            )
+            explorer = PathExplorer(
+                cfg,
+                trap_model,
+                boundaries=boundaries,
+                tables=decode_tables | {dispatch: [address]},
+            )
+            traps[model.name] = explorer.cost(labels["main"])
+        opcodes.append(OpcodeCost(label, costs, traps))
+
+    fetch = dict[str, PathCost | None]()
+    for model in models:
+        # stop at the handler dispatch, since the handler cost is reported separately
+        explorer = PathExplorer(
+            cfg,
+            model,
+            boundaries=boundaries | {dispatch},
+            tables=decode_tables,
+        )
+        fetch[model.name] = explorer.cost(labels["main__slow_instruction_fetch"])
+
+    return WorkerCostReport(
+        models=[model.name for model in models],
+        opcodes=opcodes,
+        fetch=fetch,
+    )
+
+
+def addresses_of(labels: dict[str, int], names: Iterable[str]):
+    return {labels[name] for name in names if name in labels}
+
+
+def _cost_json(cost: PathCost | None):
+    if cost is None:
+        return None
+    return {
+        "min": cost.min,
+        "max": cost.max,
+        "unresolved": cost.unresolved,
+        "complete": cost.complete,
+    }
+
+
+def _format_cost(cost: PathCost | None, trap_cost: PathCost | None):
+    if cost is not None:
+        return str(cost)
+    if trap_cost is not None:
+        return f"{trap_cost}t"
+    return "-"
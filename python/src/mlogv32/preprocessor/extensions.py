@@ -130,6 +130,9 @@ class LocalVariablesEnv(Protocol):
     local_variable_cache: dict[str, int]
     freed_local_variables: list[int]
     """Sorted in reverse order."""
+    symbolic_local_variables: bool
+    """If True, named local variables are rendered as-is (eg. `$foo`), so they can be
+    allocated after rendering (see `mlogv32.preprocessor.allocator`)."""
 
     @staticmethod
     def of(environment: Environment) -> LocalVariablesEnv:
@@ -142,8 +145,21 @@ class LocalVariablesEnv(Protocol):
             largest_local_variable=0,
             local_variable_cache={},
             freed_local_variables=[],
+            symbolic_local_variables=False,
         )
 
+    @staticmethod
+    def reset(environment: Environment, *, symbolic: bool = False):
+        """Resets the allocator state so the environment can be reused for another
+        render."""
+
+        env = LocalVariablesEnv.of(environment)
+        env.local_variable_index = 1
+        env.largest_local_variable = 0
+        env.local_variable_cache.clear()
+        env.freed_local_variables.clear()
+        env.symbolic_local_variables = symbolic
+
 
 class LocalVariables(Extension):
     """Allows giving names to anonymous local variables.
@@ -262,6 +278,8 @@ class LocalVariables(Extension):
 
             self._env.largest_local_variable = max(i, self._env.largest_local_variable)
 
+        if self._env.symbolic_local_variables:
+            return f"${name}"
         return f"local{cache[name]}"
 
     @override
@@ -298,3 +316,44 @@ class LocalVariables(Extension):
 
             if pos < len(token.value):
                 yield Token(lineno, "data", token.value[pos:])
+
+
+SOURCE_MAP_MARKER = "\x00"
+"""Delimits the template location markers added by `SourceMapMarkers`."""
+
+
+class SourceMapMarkers(Extension):
+    """Tags each line of output with the template line that produced it.
+
+    Before each newline in the template's literal text, this adds a marker containing
+    the template name and line number (eg. `\\0worker.mlog.jinja:123\\0`). Lines
+    emitted by a macro are tagged with the line in the macro body.
+
+    The markers are only valid mlog after being removed by
+    `mlogv32.preprocessor.sourcemap.render_source_map`. Jinja's built-in bytecode
+    caches don't depend on the enabled extensions, so environments with this
+    extension must either use `mlogv32.preprocessor.cache.JinjaBytecodeCache`
+    (which includes the extensions in its key) or no bytecode cache at all.
+    """
+
+    # run after the other extensions, so they see the original text
+    priority = 1000
+
+    @override
+    def filter_stream(self, stream: TokenStream) -> TokenStream | Iterable[Token]:
+        for token in stream:
+            if token.type != "data" or "\n" not in token.value:
+                yield token
+                continue
+
+            lineno = token.lineno
+            lines = token.value.split("\n")
+            value = lines[0]
+            for line in lines[1:]:
+                value += (
+                    f"{SOURCE_MAP_MARKER}{stream.name}:{lineno}{SOURCE_MAP_MARKER}\n"
+                )
+                value += line
+                lineno += 1
+
+            yield Token(token.lineno, "data", value)
@@ -5,8 +5,6 @@ from typing import Any, Callable
 from jinja2.runtime import Context
 from jinja2.utils import Namespace
 
-from mlogv32.scripts.ram_proc import VariableFormat
-
 from .constants import CSRS, MEMORY_K, MEMORY_M
 
 FILTERS = dict[str, Callable[..., Any]]()
@@ -46,6 +44,9 @@ def make_jinja_exceptions_suck_a_bit_less[**P, R](f: Callable[P, R]) -> Callable
 @make_jinja_exceptions_suck_a_bit_less
 @register_filter()
 def ram_var(index: int):
+    # ram_proc pulls in typer and pymsch, which most templates don't need
+    from mlogv32.scripts.ram_proc import VariableFormat
+
     return VariableFormat.mlogv32.get_variable(index)
 
 
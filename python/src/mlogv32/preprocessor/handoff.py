@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from lark import Token
+
+from .parser import AST, Directive, MlogError, Statement, analyze_mlog
+from .parser.cfg import ControlFlowGraph, read_positions, written_positions
+
+# the variable that the fetch block reads from
+PREV_PROC = "prev_proc"
+
+
+@dataclass
+class SavedVariableReport:
+    """The variables that must be restored when a worker takes over from the previous
+    worker (see `saved_variable_report`)."""
+
+    live: list[str]
+    """Variables that may be read after a handoff before being written, sorted."""
+    restored: list[str]
+    """Variables restored by the fetch block, in order."""
+    exempt: set[str] = field(default_factory=set)
+    """Variables exempted with `push_saved`."""
+
+    @property
+    def under_saved(self) -> list[str]:
+        restored = set(self.restored)
+        return [var for var in self.live if var not in restored]
+
+    @property
+    def over_saved(self) -> list[str]:
+        live = set(self.live)
+        return [var for var in self.restored if var not in live]
+
+    def print(self, *, minimized: bool = False):
+        """Prints the report. If `minimized` is True, the fetch block was rewritten by
+        `replace_fetch_block`, so the differences are reported as changes."""
+
+        if minimized:
+            for var in self.under_saved:
+                print(f"Added variable to fetch block: {var}")
+            for var in self.over_saved:
+                print(f"Removed variable from fetch block: {var}")
+        else:
+            for var in self.under_saved:
+                print(
+                    f"[WARNING] Variable is live across handoff but not restored: {var}"
+                )
+            for var in self.over_saved:
+                print(
+                    f"[WARNING] Restored variable is never live across handoff: {var}"
+                )
+        print(
+            f"Variables live across handoff: {len(self.live)} (restored: {len(self.restored)})"
+        )
+
+
+def saved_variable_report(
+    ast: AST,
+    *,
+    tables: dict[int, list[int]] | None = None,
+    external_reads: Iterable[str] = (),
+    external_writes: Iterable[str] = (),
+) -> SavedVariableReport:
+    """Finds the variables that are live across a worker handoff.
+
+    A worker may stop at any statement after the fetch block, and the next worker
+    resumes from there (`set @counter __counter`), so a variable needs to be restored
+    if it may be read before being written starting from any such statement. Variables
+    that are only written before the fetch block (eg. the config values read in
+    `reset`) are the same in every worker, so they don't need to be restored.
+
+    `external_reads` are variables that other processors read from the worker (eg.
+    the controller and debugger), so they're always live, and `external_writes` are
+    variables that other processors write to the worker by name (eg. the controller
+    updating `csr_mtime`), so they need to be restored even if the worker doesn't
+    write them itself.
+
+    `tables` gives the possible targets of jump tables and other dynamic jumps (see
+    `ControlFlowGraph.successors`), and variables pushed with `push_saved` are exempt
+    while pushed.
+    """
+
+    analysis = analyze_mlog(ast)
+    cfg = ControlFlowGraph.build(ast, analysis.labels)
+    n = len(cfg)
+
+    fetch_start: int | None = None
+    fetch_end: int | None = None
+    pushed = set[str]()
+    exempt_at = list[frozenset[str]]()
+    exempt = set[str]()
+    restored = list[str]()
+    counter = 0
+    for node in ast:
+        match node:
+            case Directive(name="start_fetch"):
+                fetch_start = counter
+            case Directive(name="end_fetch"):
+                fetch_end = counter
+            case Directive(name="push_saved", args=args):
+                pushed |= {str(arg) for arg in args}
+                exempt |= pushed
+            case Directive(name="pop_saved", args=args):
+                pushed -= {str(arg) for arg in args}
+            case Statement(name="read", args=[var, source, name]) if (
+                fetch_start is not None
+                and fetch_end is None
+                and str(source) == PREV_PROC
+            ):
+                if str(name) != f'"{var}"':
+                    raise MlogError(f"Invalid variable restoration: {var}", var)
+                restored.append(str(var))
+                exempt_at.append(frozenset(pushed))
+                counter += 1
+            case Statement():
+                exempt_at.append(frozenset(pushed))
+                counter += 1
+            case _:
+                pass
+
+    if fetch_start is None or fetch_end is None:
+        raise ValueError("Missing start_fetch or end_fetch directive")
+
+    uses = list[set[str]]()
+    defs = list[set[str]]()
+    written_after_fetch = set[str]()
+    for instruction in cfg.instructions:
+        statement = instruction.statement
+        name = str(statement.name)
+        args = [str(arg) for arg in statement.args]
+        uses.append(
+            {
+                args[i]
+                for i in read_positions(name, args)
+                if _is_variable(statement.args[i])
+            }
+        )
+        written = {
+            args[i]
+            for i in written_positions(name, args)
+            if _is_variable(statement.args[i])
+        }
+        defs.append(written)
+        if instruction.index >= fetch_end:
+            written_after_fetch |= written
+
+    successors = [cfg.successors(i, tables) for i in range(n)]
+    predecessors = [list[int]() for _ in range(n)]
+    for i, targets in enumerate(successors):
+        for target in targets:
+            predecessors[target].append(i)
+
+    live_in = [frozenset[str]() for _ in range(n)]
+    queue = list(range(n))
+    queued = set(queue)
+    while queue:
+        i = queue.pop()
+        queued.discard(i)
+
+        live_out = frozenset[str]().union(*(live_in[t] for t in successors[i]))
+        value = frozenset(uses[i] | (live_out - defs[i]))
+        if value != live_in[i]:
+            live_in[i] = value
+            for p in predecessors[i]:
+                if p not in queued:
+                    queued.add(p)
+                    queue.append(p)
+
+    live = set[str]()
+    for i in range(fetch_end, n):
+        live |= live_in[i] - exempt_at[i]
+    live |= set(external_reads)
+    live &= written_after_fetch | set(external_writes)
+    live.discard("@counter")
+
+    return SavedVariableReport(
+        live=sorted(live),
+        restored=restored,
+        exempt=exempt,
+    )
+
+
+def external_variables(controller: AST, *others: AST) -> tuple[set[str], set[str]]:
+    """Returns the variables that the controller and other processors read from and
+    write to the worker state.
+
+    The controller restores the worker state with its own fetch block, so every
+    variable that it reads is a worker variable, and so is every variable that other
+    processors read from it by name.
+    """
+
+    reads = set[str]()
+    writes = set[str]()
+    for node in controller:
+        match node:
+            case Statement(name="read", args=[_, source, _]) if (
+                str(source) == PREV_PROC
+            ):
+                pass
+            case Statement(name="write", args=[_, target, var]) if (
+                str(target) == PREV_PROC and var.type == "STRING"
+            ):
+                writes.add(var[1:-1])
+            case Statement(name=name, args=args):
+                str_args = [str(arg) for arg in args]
+                reads |= {
+                    str_args[i]
+                    for i in read_positions(str(name), str_args)
+                    if _is_variable(args[i])
+                }
+            case _:
+                pass
+
+    for ast in others:
+        for node in ast:
+            match node:
+                case Statement(name="read", args=[_, _, var]) if var.type == "STRING":
+                    reads.add(var[1:-1])
+                case _:
+                    pass
+
+    return reads, writes
+
+
+def replace_fetch_block(text: str, report: SavedVariableReport) -> str:
+    """Removes the over-saved variables from the fetch block of `text`, and adds the
+    under-saved variables to the end of it."""
+
+    lines = text.splitlines(keepends=True)
+    start = end = None
+    for i, line in enumerate(lines):
+        match line.split():
+            case ["#directive", "start_fetch", *_]:
+                start = i + 1
+            case ["#directive", "end_fetch", *_]:
+                end = i
+            case _:
+                pass
+    if start is None or end is None:
+        raise ValueError("Missing start_fetch or end_fetch directive")
+
+    over_saved = set(report.over_saved)
+    block = list[str]()
+    indent = ""
+    for line in lines[start:end]:
+        match line.split():
+            case ["read", var, source, _] if source == PREV_PROC:
+                indent = line[: len(line) - len(line.lstrip())]
+                if var in over_saved:
+                    continue
+            case _:
+                pass
+        block.append(line)
+
+    # add missing variables before any trailing blank lines
+    insert = len(block)
+    while insert > 0 and not block[insert - 1].strip():
+        insert -= 1
+    block[insert:insert] = [
+        f'{indent}read {var} {PREV_PROC} "{var}"\n' for var in report.under_saved
+    ]
+
+    return "".join(lines[:start] + block + lines[end:])
+
+
+def _is_variable(token: Token):
+    if token.type != "TOKEN" or token.startswith("@"):
+        return False
+    if token in ("null", "true", "false"):
+        return False
+    try:
+        int(token, base=0)
+        return False
+    except ValueError:
+        pass
+    try:
+        float(token)
+        return False
+    except ValueError:
+        return True
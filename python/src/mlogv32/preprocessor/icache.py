@@ -0,0 +1,399 @@
+from __future__ import annotations
+
+import itertools
+from dataclasses import dataclass, field
+from functools import cache
+from typing import Any, Callable
+
+from mlogv32.scripts.ram_proc import VariableFormat, generate_code
+from mlogv32.utils.msch import ProcessorConfigUTF8
+
+from .models import BuildConfig
+
+# the LABELS indices of the decoders and instruction handlers (see cpu.yaml)
+DECODER_TABLE_SIZE = 128
+HANDLER_TABLE_OFFSET = 192
+
+PAGE_SIZE = 4096
+
+# icache payloads are stored in five strings: op_id + 64 (7 bits), then the low 47
+# bits in four 12-bit chunks, each offset like ROM bytes to avoid special characters
+PAYLOAD_CHAR_OFFSET = 174
+PAYLOAD_CHUNK_BITS = 12
+PAYLOAD_CHUNKS = 4
+
+MAX_CODE_BYTES = 1024 * 100
+
+
+type Decoder = Callable[[int, int, int, int, int], None]
+
+
+@dataclass
+class IcacheDecoder:
+    """A Python port of the worker's instruction decoder (`decode` in
+    worker.mlog.jinja), which produces the same icache payloads.
+
+    Decoders are dispatched through the `instructions` table from cpu.yaml, like the
+    jump table in `LABELS`. The mlog decoder doesn't set `imm` for R-type and illegal
+    instructions, so payloads depend on the previously decoded instruction; this
+    decoder keeps the same state, so decoding an image sequentially gives exactly the
+    same result as `MLOGSYS`.
+    """
+
+    instructions: list[BuildConfig.Instruction]
+    imm: int = 0
+    """The value of `imm` left over from the previous instruction."""
+
+    op_id: int = field(default=0, init=False)
+    result: int = field(default=0, init=False)
+
+    _decoders: list[Decoder] = field(init=False, repr=False)
+    _handlers: dict[int, str] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        decoders = {
+            "decode_LUI": self._decode_lui_auipc,
+            "decode_AUIPC": self._decode_lui_auipc,
+            "decode_JAL": self._decode_jal,
+            "decode_JALR": self._decode_jalr,
+            "decode_BRANCH": self._decode_branch,
+            "decode_LOAD": self._decode_load,
+            "decode_STORE": self._decode_store,
+            "decode_AMO": self._decode_amo,
+            "decode_OP-IMM": self._decode_op_imm,
+            "decode_OP": self._decode_op,
+            "decode_MISC-MEM": self._decode_misc_mem,
+            "decode_SYSTEM": self._decode_system,
+            "decode_custom-0": self._decode_custom_0,
+            "decode_illegal_instruction": self._decode_illegal_instruction,
+        }
+
+        table = dict[int, str]()
+        for instruction in self.instructions:
+            assert instruction.address is not None
+            for i in range(instruction.count):
+                table[instruction.address + i * instruction.align] = instruction.label
+
+        self._decoders = list[Decoder]()
+        for address in range(0, DECODER_TABLE_SIZE, 4):
+            label = table.get(address)
+            if label not in decoders:
+                raise ValueError(f"Unsupported decoder at address {address}: {label}")
+            self._decoders.append(decoders[label])
+
+        self._handlers = {
+            address - HANDLER_TABLE_OFFSET: label
+            for address, label in table.items()
+            if address >= DECODER_TABLE_SIZE
+        }
+
+    def handler(self, op_id: int) -> str | None:
+        """Returns the label of the instruction handler for an op_id."""
+
+        return self._handlers.get(op_id)
+
+    def decode(self, value: int) -> int:
+        """Decodes an instruction, and returns its icache payload."""
+
+        self.result = value & 0b1111111111000000000000000
+        if value & 0b11 != 0b11:
+            self._decode_illegal_instruction()
+        else:
+            instruction_11_7 = value & 0b0000000000000111110000000
+            self.result = (self.result << 22) + (instruction_11_7 << 25)
+
+            imm_4_0 = instruction_11_7 >> 7
+            funct12 = value >> 20
+            funct7 = funct12 >> 5
+            funct3 = (value >> 12) & 0b111
+            opcode_6_2 = value & 0b1111100
+
+            self._decoders[opcode_6_2 >> 2](value, imm_4_0, funct12, funct7, funct3)
+
+        self.imm &= 0xFFFF_FFFF
+        return (self.op_id << 47) | self.result | self.imm
+
+    def decode_image(self, data: bytes, size: int) -> list[int]:
+        """Decodes the first `size` bytes of an image, which is padded with zeros."""
+
+        data = data[:size].ljust(size, b"\0")
+        return [
+            self.decode(int.from_bytes(data[i : i + 4], "little"))
+            for i in range(0, size, 4)
+        ]
+
+    # decoders
+
+    def _decode_lui_auipc(self, value: int, *_: int):
+        self.op_id = -53 if value & 0b1111100 == 0b0110100 else -8
+        self.imm = value & 0b11111111111111111111000000000000
+
+    def _decode_jal(self, value: int, imm_4_0: int, funct12: int, *_: int):
+        imm = (
+            ((value >> 11) & 0b100000000000000000000)
+            + (value & 0b011111111000000000000)
+            + ((value >> 9) & 0b000000000100000000000)
+            + (funct12 & 0b000000000011111111110)
+        )
+        self.imm = _extend_sign(imm, 21)
+        self.op_id = -62
+
+    def _decode_jalr(self, value: int, imm_4_0: int, funct12: int, *_: int):
+        self.op_id = -61
+        self._decode_i_type(funct12)
+
+    def _decode_branch(
+        self, value: int, imm_4_0: int, funct12: int, funct7: int, funct3: int
+    ):
+        if funct3 in (2, 3):
+            return self._decode_illegal_instruction()
+        imm = (
+            ((value >> 19) & 0b1000000000000)
+            + ((value << 4) & 0b0100000000000)
+            + (funct12 & 0b0011111100000)
+            + (imm_4_0 & 0b0000000011110)
+        )
+        self.imm = _extend_sign(imm, 13)
+        self.op_id = -64 + funct3
+
+    def _decode_load(
+        self, value: int, imm_4_0: int, funct12: int, funct7: int, funct3: int
+    ):
+        if funct3 == 3:
+            return self._decode_illegal_instruction()
+        self.op_id = -56 + funct3
+        if funct3 < 6:
+            self._decode_i_type(funct12)
+        else:
+            self._decode_illegal_instruction()
+
+    def _decode_store(
+        self, value: int, imm_4_0: int, funct12: int, funct7: int, funct3: int
+    ):
+        self.imm = _extend_sign((funct7 << 5) + imm_4_0, 12)
+        self.op_id = -50 + funct3
+        if funct3 >= 3:
+            self._decode_illegal_instruction()
+
+    def _decode_amo(
+        self, value: int, imm_4_0: int, funct12: int, funct7: int, funct3: int
+    ):
+        if funct3 != 0b010:
+            return self._decode_illegal_instruction()
+        funct5 = funct7 >> 2
+        self.op_id = -47 + funct5
+        if funct5 <= 0b11:
+            return
+        self.op_id = -44 + (funct5 >> 2)
+        if funct5 & 0b11 != 0:
+            self._decode_illegal_instruction()
+
+    def _decode_op_imm(
+        self, value: int, imm_4_0: int, funct12: int, funct7: int, funct3: int
+    ):
+        match funct3:
+            case 5:
+                # SRLI/SRAI
+                self.op_id = -2
+                if funct7 == 0b0000000:
+                    self.imm = funct12
+                    return
+                self.op_id = -1
+                if funct7 == 0b0100000:
+                    self.imm = funct12 & 0b11111
+                else:
+                    self._decode_illegal_instruction()
+            case 1:
+                # SLLI
+                self.op_id = -3
+                if funct7 == 0b0000000:
+                    self.imm = funct12
+                else:
+                    self._decode_illegal_instruction()
+            case _:
+                self.op_id = -36 + funct3
+                self._decode_i_type(funct12)
+
+    def _decode_i_type(self, funct12: int):
+        self.imm = _extend_sign(funct12, 12)
+
+    def _decode_op(
+        self, value: int, imm_4_0: int, funct12: int, funct7: int, funct3: int
+    ):
+        match funct7:
+            case 0b0000000:
+                self.op_id = -28 + funct3
+            case 0b0000001:
+                self.op_id = -20 + funct3
+            case 0b0100000 if funct3 == 0b000:
+                self.op_id = -35
+            case 0b0100000 if funct3 == 0b101:
+                self.op_id = -31
+            case _:
+                self._decode_illegal_instruction()
+
+    def _decode_misc_mem(
+        self, value: int, imm_4_0: int, funct12: int, funct7: int, funct3: int
+    ):
+        self.op_id = -4
+        if funct3 < 2:
+            self.imm = funct12
+        else:
+            self._decode_illegal_instruction()
+
+    def _decode_system(
+        self, value: int, imm_4_0: int, funct12: int, funct7: int, funct3: int
+    ):
+        self.op_id = -12 + funct3
+        if funct3 != 4:
+            self.imm = funct12
+        else:
+            self._decode_illegal_instruction()
+
+    def _decode_custom_0(
+        self, value: int, imm_4_0: int, funct12: int, funct7: int, funct3: int
+    ):
+        self.op_id = 1 + funct3
+        if funct3 < 1:
+            self.imm = funct12
+        else:
+            self._decode_illegal_instruction()
+
+    def _decode_illegal_instruction(self, *_: int):
+        self.op_id = 0
+
+
+def _extend_sign(value: int, bits: int) -> int:
+    sign = 1 << (bits - 1)
+    return (value ^ sign) - sign
+
+
+def preload_size(data_size: int, capacity: int) -> int:
+    """Returns the number of bytes of ROM to preload into the icache, which is rounded
+    up to a page boundary like `MLOGSYS`."""
+
+    return min(-(-data_size // PAGE_SIZE) * PAGE_SIZE, capacity)
+
+
+def encode_payloads(payloads: list[int]) -> list[str]:
+    """Encodes icache payloads into strings which can be read one character at a time
+    by `icache_loader_code`."""
+
+    mask = (1 << PAYLOAD_CHUNK_BITS) - 1
+    strings = [list[str]() for _ in range(PAYLOAD_CHUNKS + 1)]
+    for payload in payloads:
+        op_id = payload >> 47
+        assert -64 <= op_id < 64, f"Invalid op_id: {op_id}"
+        strings[0].append(chr(PAYLOAD_CHAR_OFFSET + op_id + 64))
+        for i in range(PAYLOAD_CHUNKS):
+            shift = PAYLOAD_CHUNK_BITS * (PAYLOAD_CHUNKS - 1 - i)
+            strings[i + 1].append(
+                chr(PAYLOAD_CHAR_OFFSET + ((payload >> shift) & mask))
+            )
+    return ["".join(chars) for chars in strings]
+
+
+@cache
+def _ram_proc_declarations(ram_proc_vars: int) -> str:
+    _, ram_proc = generate_code(ram_proc_vars, VariableFormat.mlogv32)
+    return ram_proc.removeprefix("stop\n")
+
+
+def icache_loader_code(
+    payloads: list[int],
+    *,
+    size: int,
+    ram_proc_vars: int,
+    lookup_proc_size: int,
+    lookup_offset: tuple[int, int],
+    config_offset: tuple[int, int],
+) -> str:
+    """Generates the code for an icache proc that initializes its own variables.
+
+    A schematic can't contain the values of processor variables, so the payloads are
+    encoded into strings, and the proc writes each one to its variable (found with the
+    lookup procs, like `lookup_variable` in the worker) when it's placed. When every
+    loader is done, the last one stores `size` in `ICACHE_PRELOAD_SIZE` in the config
+    proc, which the controller uses as `__etext` on the next reset (and then clears).
+
+    The offsets are relative to this proc. This must be a world proc, since it uses
+    `getblock` and `setrate`.
+    """
+
+    if len(payloads) > ram_proc_vars:
+        raise ValueError(
+            f"Too many icache payloads for one proc: {len(payloads)} > {ram_proc_vars}"
+        )
+
+    strings = encode_payloads(payloads)
+    low_offset = sum(
+        PAYLOAD_CHAR_OFFSET << (PAYLOAD_CHUNK_BITS * i) for i in range(PAYLOAD_CHUNKS)
+    )
+    lookup_x, lookup_y = lookup_offset
+    config_x, config_y = config_offset
+
+    lines = [
+        "setrate 1000",
+        f"op add _lookup_x @thisx {lookup_x}",
+        f"op add _lookup_y @thisy {lookup_y}",
+        *(f'set _payload{i} "{string}"' for i, string in enumerate(strings)),
+        "set _index 0",
+        "loop:",
+        f"op idiv _lookup _index {lookup_proc_size}",
+        "op mod _block_x _lookup 4",
+        "op add _block_x _block_x _lookup_x",
+        "op idiv _block_y _lookup 4",
+        "op add _block_y _block_y _lookup_y",
+        "getblock building _lookup _block_x _block_y",
+        f"op mod _variable _index {lookup_proc_size}",
+        "lookup block _variable _variable",
+        "sensor _variable _variable @name",
+        "set _name null",
+        "read _name _lookup _variable",
+        # wait for the lookup procs to initialize
+        "jump load notEqual _name null",
+        "wait 0.1",
+        "jump loop always",
+        "load:",
+        "read _op_id _payload0 _index",
+        f"op sub _op_id _op_id {PAYLOAD_CHAR_OFFSET + 64}",
+        "op shl _op_id _op_id 47",
+        "read _low _payload1 _index",
+        *itertools.chain.from_iterable(
+            [
+                f"op mul _low _low {1 << PAYLOAD_CHUNK_BITS}",
+                f"read _chunk _payload{i} _index",
+                "op add _low _low _chunk",
+            ]
+            for i in range(2, PAYLOAD_CHUNKS + 1)
+        ),
+        f"op sub _low _low {low_offset}",
+        "op or _value _op_id _low",
+        "write _value @this _name",
+        "op add _index _index 1",
+        f"jump loop lessThan _index {len(payloads)}",
+        f"op add _block_x @thisx {config_x}",
+        f"op add _block_y @thisy {config_y}",
+        "getblock building _config _block_x _block_y",
+        # yield, so that the next instructions run in the same tick
+        "wait 0.0001",
+        'read _pending _config "ICACHE_PRELOAD_PENDING"',
+        "op sub _pending _pending 1",
+        'write _pending _config "ICACHE_PRELOAD_PENDING"',
+        "jump done greaterThan _pending 0",
+        f'write {size} _config "ICACHE_PRELOAD_SIZE"',
+        "done:",
+        "stop",
+    ]
+    return "\n".join(lines) + "\n" + _ram_proc_declarations(ram_proc_vars)
+
+
+def icache_loader_config(payloads: list[int], **kwargs: Any) -> bytearray:
+    """Returns the compressed config for `icache_loader_code`."""
+
+    code = icache_loader_code(payloads, **kwargs)
+    if (code_bytes := len(code.encode())) > MAX_CODE_BYTES:
+        raise ValueError(
+            f"icache loader code is too large: {code_bytes} / {MAX_CODE_BYTES} bytes"
+        )
+    return ProcessorConfigUTF8(code=code, links=[]).compress()
@@ -196,5 +196,6 @@ class Metadata(BaseModel):
     rom_processors: int | None = None
     ram_processors: int | None = None
     icache_processors: int | None = None
+    icache_preload_size: int | None = None
 
     mtime_frequency: int | None = None
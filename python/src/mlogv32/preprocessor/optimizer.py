@@ -0,0 +1,452 @@
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+
+from .parser import AST, Directive, Statement, analyze_mlog, parse_mlog
+from .parser.cfg import ControlFlowGraph, written_variables
+
+PASSES = ("thread", "fold", "dse", "unreachable")
+
+# after this many rounds, give up on reaching a fixed point
+MAX_ROUNDS = 8
+
+# statements that only write their output variable
+_PURE_STATEMENTS = {"set", "op", "select", "lookup", "packcolor", "read", "sensor"}
+
+# double precision integers are exact up to 2^53
+_MAX_EXACT_INT = 2**53
+
+# integer literals in the forms mlog parses; anything else (eg. 0o17) is a variable
+_INT_RE = re.compile(r"[+-]?(?:\d+|0x[0-9a-fA-F]+|0b[01]+)")
+
+_FOLD_OPS: dict[str, Callable[[int, int], int | None]] = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "mul": lambda a, b: a * b,
+    "and": lambda a, b: a & b,
+    "or": lambda a, b: a | b,
+    "xor": lambda a, b: a ^ b,
+    "shl": lambda a, b: a << b if 0 <= b < 64 else None,
+    "shr": lambda a, b: a >> b if 0 <= b < 64 else None,
+    "min": min,
+    "max": max,
+}
+
+_FOLD_CONDITIONS: dict[str, Callable[[int, int], bool]] = {
+    "equal": lambda a, b: a == b,
+    "notEqual": lambda a, b: a != b,
+    "strictEqual": lambda a, b: a == b,
+    "lessThan": lambda a, b: a < b,
+    "lessThanEq": lambda a, b: a <= b,
+    "greaterThan": lambda a, b: a > b,
+    "greaterThanEq": lambda a, b: a >= b,
+}
+
+
+@dataclass
+class OptimizationReport:
+    saved: Counter[str] = field(default_factory=Counter[str])
+    """Number of instructions removed after each label."""
+    changes: Counter[str] = field(default_factory=Counter[str])
+    """Number of statements changed or removed by each pass."""
+    rounds: int = 0
+
+    @property
+    def total_saved(self):
+        return self.saved.total()
+
+    def print(self, name: str):
+        print(f"{name} optimizer:")
+        print(f"  Instructions saved: {self.total_saved}")
+        for pass_name in PASSES:
+            print(f"  {pass_name}: {self.changes[pass_name]}")
+        for label, n in sorted(self.saved.items(), key=lambda item: -item[1]):
+            print(f"    {label}: {n}")
+
+
+def optimize_mlog(
+    text: str,
+    passes: Iterable[str] = PASSES,
+    *,
+    shared: Iterable[str] = (),
+) -> tuple[str, OptimizationReport]:
+    """Runs peephole optimizations on rendered mlog code (before label references are
+    replaced), and returns the new code.
+
+    Passes:
+
+    - `thread`: retargets jumps to unconditional jumps, and removes jumps to the next
+      statement.
+    - `fold`: folds `op` and `jump` with constant integer operands.
+    - `dse`: removes writes that are overwritten before being read or jumping away.
+      Variables in `shared` (see `shared_variables`) and saved variables are never
+      removed, since other processors may read them at any time.
+    - `unreachable`: removes statements that can't be reached from any label.
+
+    Statements are only removed if doing so can't change the address of anything that
+    depends on it: statements in `start_assert_length` regions and before
+    `assert_counter` are kept, as are statements skipped by `@counter` arithmetic (eg.
+    the jump between `op add ret @counter 1` and its return address) and jump tables
+    indexed by `op add @counter @counter <var>` (up to the next label). If the code
+    jumps to a numeric address or reads @counter in any other way, nothing is removed.
+
+    Only statements on their own line are changed, so comments and directives are
+    preserved.
+    """
+
+    passes = list(passes)
+    shared = set(shared)
+    for pass_name in passes:
+        if pass_name not in PASSES:
+            raise ValueError(f"Unknown optimizer pass: {pass_name}")
+
+    report = OptimizationReport()
+    expected_statements: int | None = None
+
+    for _ in range(MAX_ROUNDS):
+        program = _Program(text, parse_mlog(text), shared)
+        if (
+            expected_statements is not None
+            and len(program.statements) != expected_statements
+        ):
+            raise AssertionError(
+                f"Optimization failed: expected {expected_statements} statements, but got {len(program.statements)}"
+            )
+
+        edits = dict[int, tuple[str | None, str]]()
+        for pass_name in passes:
+            for index, new_text in _PASS_FUNCTIONS[pass_name](program):
+                if index in edits or not program.editable(index):
+                    continue
+                if new_text is None and index in program.frozen:
+                    continue
+                edits[index] = (new_text, pass_name)
+
+        if not edits:
+            break
+
+        report.rounds += 1
+        for index, (new_text, pass_name) in edits.items():
+            report.changes[pass_name] += 1
+            if new_text is None:
+                report.saved[program.label_of(index)] += 1
+
+        text = program.apply(edits)
+        expected_statements = len(program.statements) - sum(
+            1 for new_text, _ in edits.values() if new_text is None
+        )
+
+    return text, report
+
+
+def shared_variables(*asts: AST) -> set[str]:
+    """Returns the names of variables that are accessed by name from another
+    processor (eg. `read pc prev_proc "pc"`)."""
+
+    result = set[str]()
+    for ast in asts:
+        for node in ast:
+            match node:
+                case Statement(name="read" | "write", args=[_, _, name, *_]) if (
+                    len(name) >= 2 and name[0] == name[-1] == '"'
+                ):
+                    result.add(name[1:-1])
+                case _:
+                    pass
+    return result
+
+
+class _Program:
+    def __init__(self, text: str, ast: AST, shared: set[str]):
+        self.text = text
+        self.shared = shared
+        self.statements = [node for node in ast if isinstance(node, Statement)]
+        self.args = [[str(arg) for arg in s.args] for s in self.statements]
+
+        analysis = analyze_mlog(ast)
+        self.labels = {str(name): value for name, value in analysis.labels.items()}
+        self.saved_variables = analysis.saved_variables
+        self.cfg = ControlFlowGraph.build(ast, self.labels)
+
+        # the first label at each address
+        self._label_names = dict[int, str]()
+        for label, value in self.labels.items():
+            self._label_names.setdefault(value, label)
+        self._label_addresses = sorted(self._label_names)
+
+        self.frozen = self._find_frozen(ast)
+
+    def label_of(self, index: int) -> str:
+        """Returns the last label at or before a statement."""
+
+        i = bisect_right(self._label_addresses, index) - 1
+        if i < 0:
+            return "(start)"
+        return self._label_names[self._label_addresses[i]]
+
+    def next_label(self, index: int) -> int:
+        """Returns the address of the first label after a statement."""
+
+        i = bisect_right(self._label_addresses, index)
+        if i < len(self._label_addresses):
+            return self._label_addresses[i]
+        return len(self.statements)
+
+    def editable(self, index: int):
+        return self._line_span(index) is not None
+
+    def statement_text(self, name: str, args: list[str]):
+        return " ".join([name, *args])
+
+    def apply(self, edits: dict[int, tuple[str | None, str]]) -> str:
+        parts = list[str]()
+        pos = 0
+        for index in sorted(edits):
+            new_text, _ = edits[index]
+            span = self._line_span(index)
+            assert span is not None
+            line_start, start, end, line_end = span
+
+            if new_text is None and not self.text[end:line_end].strip():
+                # remove the whole line
+                parts += [self.text[pos:line_start]]
+                pos = min(line_end + 1, len(self.text))
+            else:
+                parts += [self.text[pos:start], new_text or ""]
+                pos = end
+        parts += [self.text[pos:]]
+        return "".join(parts)
+
+    def _line_span(self, index: int) -> tuple[int, int, int, int] | None:
+        statement = self.statements[index]
+        last = statement.args[-1] if statement.args else statement.name
+        start = statement.name.start_pos
+        end = last.end_pos
+        if start is None or end is None:
+            return None
+
+        text = self.text
+        line_start = text.rfind("\n", 0, start) + 1
+        line_end = text.find("\n", end)
+        if line_end < 0:
+            line_end = len(text)
+
+        after = text[end:line_end].strip()
+        if text[line_start:start].strip() or (after and not after.startswith("#")):
+            return None
+        return line_start, start, end, line_end
+
+    def _find_frozen(self, ast: AST) -> set[int]:
+        """Returns the indices of statements that must not be removed."""
+
+        n = len(self.statements)
+        frozen = set[int]()
+
+        counter = 0
+        region_start = 0
+        for node in ast:
+            match node:
+                case Statement():
+                    counter += 1
+                case Directive(name="start_assert_length"):
+                    region_start = counter
+                case Directive(name="end_assert_length"):
+                    frozen.update(range(region_start, counter))
+                case Directive(name="assert_counter"):
+                    frozen.update(range(counter))
+                case _:
+                    pass
+
+        for i, (statement, args) in enumerate(zip(self.statements, self.args)):
+            name = str(statement.name)
+            match name, args:
+                case "op", ["add", "@counter", "@counter", offset, *_]:
+                    if (k := _parse_int(offset)) is None:
+                        # jump table
+                        frozen.update(range(i + 1, self.next_label(i)))
+                    elif k < 0:
+                        return set(range(n))
+                    else:
+                        frozen.update(range(i + 1, i + 1 + k))
+
+                case "op", ["add", _, "@counter", offset, *_]:
+                    if (k := _parse_int(offset)) is None or k < 0:
+                        return set(range(n))
+                    frozen.update(range(i + 1, i + 1 + k))
+
+                case "jump", [target, *_] if _parse_int(target) is not None:
+                    return set(range(n))
+
+                case "set", [_, "@counter", *_]:
+                    pass
+
+                case _:
+                    writes = written_variables(name, args)
+                    reads = [arg for arg in args if arg == "@counter"]
+                    if len(reads) > writes.count("@counter"):
+                        return set(range(n))
+
+            # numeric jump targets
+            for value in _counter_values(name, args):
+                if value != "@counter" and _parse_int(value) is not None:
+                    return set(range(n))
+
+        return frozen
+
+
+def _thread_jumps(program: _Program) -> Iterable[tuple[int, str | None]]:
+    labels = program.labels
+    statements = program.statements
+
+    def follow(label: str) -> str:
+        seen = {label}
+        while (target := labels.get(label)) is not None and target < len(statements):
+            match str(statements[target].name), program.args[target]:
+                case "jump", [next_label, "always", *_] if next_label in labels:
+                    if next_label in seen:
+                        return label
+                    seen.add(next_label)
+                    label = next_label
+                case _:
+                    return label
+        return label
+
+    for i, (statement, args) in enumerate(zip(program.statements, program.args)):
+        name = str(statement.name)
+        match name, args:
+            case "jump", [label, *rest] if label in labels:
+                new_label = follow(label)
+                if labels[new_label] == i + 1:
+                    yield i, None
+                elif new_label != label:
+                    yield i, program.statement_text(name, [new_label, *rest])
+
+            case (("set" | "select"), ["@counter", *_]):
+                new_args = [
+                    f"%{follow(arg[1:-1])}%" if _is_label_ref(arg, labels) else arg
+                    for arg in args
+                ]
+                if new_args != args:
+                    yield i, program.statement_text(name, new_args)
+
+            case _:
+                pass
+
+
+def _fold_constants(program: _Program) -> Iterable[tuple[int, str | None]]:
+    for i, (statement, args) in enumerate(zip(program.statements, program.args)):
+        name = str(statement.name)
+        match name, args:
+            case "op", [op, var, a, b, *_] if op in _FOLD_OPS:
+                x, y = _parse_int(a), _parse_int(b)
+                if x is None or y is None:
+                    continue
+                result = _FOLD_OPS[op](x, y)
+                if result is None or abs(result) >= _MAX_EXACT_INT:
+                    continue
+                yield i, program.statement_text("set", [var, str(result)])
+
+            case "jump", [label, condition, a, b, *_] if condition in _FOLD_CONDITIONS:
+                x, y = _parse_int(a), _parse_int(b)
+                if x is None or y is None:
+                    continue
+                if _FOLD_CONDITIONS[condition](x, y):
+                    yield i, program.statement_text("jump", [label, "always"])
+                else:
+                    yield i, None
+
+            case _:
+                pass
+
+
+def _eliminate_dead_stores(program: _Program) -> Iterable[tuple[int, str | None]]:
+    instructions = program.cfg.instructions
+    n = len(program.statements)
+
+    for i, (statement, args) in enumerate(zip(program.statements, program.args)):
+        name = str(statement.name)
+        if name not in _PURE_STATEMENTS:
+            continue
+
+        writes = written_variables(name, args)
+        if len(writes) != 1:
+            continue
+        var = writes[0]
+        if (
+            var.startswith("@")
+            or var in program.saved_variables
+            or var in program.shared
+        ):
+            continue
+
+        if name == "set" and args[1:2] == [var]:
+            yield i, None
+            continue
+
+        if instructions[i].branches:
+            continue
+
+        for j in range(i + 1, n):
+            other_name = str(program.statements[j].name)
+            other_args = program.args[j]
+            other_writes = written_variables(other_name, other_args)
+            if other_args.count(var) > other_writes.count(var):
+                # read
+                break
+            if var in other_writes:
+                yield i, None
+                break
+            if instructions[j].branches or other_name == "wait":
+                break
+
+
+def _remove_unreachable(program: _Program) -> Iterable[tuple[int, str | None]]:
+    cfg = program.cfg
+
+    # any label may be used as an entry point (eg. by the LABELS jump table)
+    roots = [0, *program.labels.values(), *cfg.address_constants()]
+    reachable = cfg.reachable(roots)
+
+    for i in range(len(program.statements)):
+        if i not in reachable:
+            yield i, None
+
+
+_PASS_FUNCTIONS: dict[str, Callable[[_Program], Iterable[tuple[int, str | None]]]] = {
+    "thread": _thread_jumps,
+    "fold": _fold_constants,
+    "dse": _eliminate_dead_stores,
+    "unreachable": _remove_unreachable,
+}
+
+
+def _counter_values(name: str, args: list[str]) -> list[str]:
+    match name, args:
+        case "set", ["@counter", value, *_]:
+            return [value]
+        case "select", ["@counter", _, _, _, a, b, *_]:
+            return [a, b]
+        case _:
+            return []
+
+
+def _is_label_ref(arg: str, labels: dict[str, int]):
+    return len(arg) > 2 and arg[0] == arg[-1] == "%" and arg[1:-1] in labels
+
+
+def _parse_int(token: str) -> int | None:
+    if not _INT_RE.fullmatch(token):
+        return None
+    sign, digits = (token[0], token[1:]) if token[0] in "+-" else ("", token)
+    match digits[:2]:
+        case "0x":
+            value = int(digits[2:], 16)
+        case "0b":
+            value = int(digits[2:], 2)
+        case _:
+            value = int(digits)
+    return -value if sign == "-" else value
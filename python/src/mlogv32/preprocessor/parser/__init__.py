@@ -1,25 +1,43 @@
 __all__ = [
+    "AST",
+    "BasicBlock",
+    "ControlFlowGraph",
     "Directive",
     "DirectiveError",
+    "Instruction",
     "Label",
+    "LengthAssertion",
+    "MlogAnalysis",
     "MlogError",
+    "ScanError",
     "Statement",
+    "analyze_mlog",
     "check_unsaved_variables",
     "count_statements",
     "iter_labels",
     "parse_mlog",
     "replace_symbolic_labels",
+    "scan_mlog",
 ]
 
+from .analysis import (
+    LengthAssertion,
+    MlogAnalysis,
+    analyze_mlog,
+    check_unsaved_variables,
+    count_statements,
+    iter_labels,
+    replace_symbolic_labels,
+)
+from .cfg import BasicBlock, ControlFlowGraph, Instruction
 from .mlog import (
+    AST,
     Directive,
     DirectiveError,
     Label,
     MlogError,
+    ScanError,
     Statement,
-    check_unsaved_variables,
-    count_statements,
-    iter_labels,
     parse_mlog,
-    replace_symbolic_labels,
+    scan_mlog,
 )
@@ -0,0 +1,268 @@
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from lark import Token
+
+from .cfg import written_positions
+from .mlog import (
+    AST,
+    Directive,
+    DirectiveError,
+    Label,
+    MlogError,
+    Statement,
+    expect_int,
+    parse_mlog,
+)
+
+# characters that can't be part of a token, so a label reference next to one of these
+# can be replaced by a number without merging into a neighbouring token
+_TOKEN_DELIMITERS = frozenset(" \t\n;#")
+
+
+@dataclass
+class LengthAssertion:
+    token: Token
+    """The length argument of the `start_assert_length` directive."""
+    start: int
+    length: int
+
+
+@dataclass
+class MlogAnalysis:
+    """The result of `analyze_mlog`."""
+
+    labels: dict[str, int] = field(default_factory=dict)
+    statements: int = 0
+    label_refs: list[Token] = field(default_factory=list)
+    """`LABEL_REF` tokens in statement arguments, in source order."""
+    length_assertions: list[LengthAssertion] = field(default_factory=list)
+    """Length assertions that were checked and passed."""
+    saved_variables: set[str] = field(default_factory=lambda: {"@counter"})
+    """Variables restored in the fetch block or pushed with `push_saved`."""
+    unsaved_variables: list[str] = field(default_factory=list)
+    """Variables written after the fetch block without being saved, in the order
+    they were first written."""
+    warnings: list[str] = field(default_factory=list)
+    """Problems with saved variables, in source order."""
+
+    def print_warnings(self, *, unsaved: bool = True):
+        """Prints the warnings and the number of saved variables. If `unsaved` is
+        False, warnings about unsaved variables are skipped (eg. if they were checked
+        more precisely by `mlogv32.preprocessor.handoff`)."""
+
+        skipped = set[str]()
+        if not unsaved:
+            skipped = {f"Unsaved variable: {var}" for var in self.unsaved_variables}
+        for warning in self.warnings:
+            if warning not in skipped:
+                print(f"[WARNING] {warning}")
+        print(f"Saved variable count: {len(self.saved_variables - {'@counter'})}")
+
+
+def analyze_mlog(ast: AST) -> MlogAnalysis:
+    """Collects labels, statement counts, label references, and saved variables in a
+    single pass over `ast`, checking directives along the way.
+
+    Raises `DirectiveError` if a directive is invalid or an assertion fails.
+    """
+
+    result = MlogAnalysis()
+
+    saved_variables = result.saved_variables
+    unsaved_variables = set[str]()
+    state = "init"
+    counter = 0
+    length_assertion: LengthAssertion | None = None
+
+    for node in ast:
+        match node:
+            case Label(name=name):
+                result.labels[name] = counter
+                continue
+
+            case Statement(args=args):
+                counter += 1
+                for token in args:
+                    if token.type == "LABEL_REF":
+                        result.label_refs.append(token)
+
+            case Directive(name="start_assert_length", args=[n]):
+                if length_assertion is not None:
+                    raise DirectiveError(
+                        "Nested length assertions are not supported", node.name
+                    )
+                length_assertion = LengthAssertion(
+                    token=n,
+                    start=counter,
+                    length=expect_int(n, lambda v: v >= 0, "length assertion"),
+                )
+                continue
+
+            case Directive(name="end_assert_length"):
+                if length_assertion is None:
+                    raise DirectiveError(
+                        "Found end_assert_length without matching start_assert_length",
+                        node.name,
+                    )
+                want_length = length_assertion.length
+                start_counter = length_assertion.start
+                got_length = counter - start_counter
+                if want_length != got_length:
+                    raise DirectiveError(
+                        f"Expected @counter to be {start_counter + want_length} (length {want_length}), but got {counter} (length {got_length})",
+                        node.name,
+                    )
+                result.length_assertions.append(length_assertion)
+                length_assertion = None
+                continue
+
+            case Directive(name="assert_counter", args=[n]):
+                if counter != expect_int(n):
+                    raise DirectiveError(
+                        f"Expected @counter to be {n}, but got {counter}", node.name
+                    )
+                continue
+
+            case Directive(name="start_fetch"):
+                state = "fetch"
+                continue
+
+            case Directive(name="end_fetch"):
+                state = "check"
+                continue
+
+            case Directive(name="push_saved", args=args):
+                for var in args:
+                    saved_variables.add(var)
+                continue
+
+            case Directive(name="pop_saved", args=args):
+                for var in args:
+                    saved_variables.remove(var)
+                continue
+
+            case Directive():
+                continue
+
+        # find the variables written by this statement, if any
+        match node:
+            case Statement(name="read", args=[var, target, name]) if (
+                state == "fetch" and target == "prev_proc"
+            ):
+                if var != name[1:-1]:
+                    result.warnings.append(
+                        f"Invalid variable restoration: {var} != {name[1:-1]}"
+                    )
+                elif var in saved_variables:
+                    result.warnings.append(f"Duplicate variable restoration: {var}")
+                saved_variables.add(var)
+                continue
+            case Statement(name=name, args=args) if state == "check":
+                str_args = [str(arg) for arg in args]
+                written = [args[i] for i in written_positions(str(name), str_args)]
+            case _:
+                continue
+
+        for var in written:
+            if var not in saved_variables and var not in unsaved_variables:
+                result.unsaved_variables.append(var)
+                result.warnings.append(f"Unsaved variable: {var}")
+                unsaved_variables.add(var)
+
+    if length_assertion is not None:
+        raise DirectiveError(
+            "Found start_assert_length without matching end_assert_length",
+            length_assertion.token,
+        )
+
+    result.statements = counter
+    return result
+
+
+def iter_labels(ast: AST) -> Iterator[tuple[str, int]]:
+    yield from analyze_mlog(ast).labels.items()
+
+
+def check_unsaved_variables(ast: AST):
+    analyze_mlog(ast).print_warnings()
+
+
+def count_statements(ast: AST):
+    n = 0
+    for node in ast:
+        if isinstance(node, Statement):
+            n += 1
+    return n
+
+
+def replace_symbolic_labels(
+    text: str,
+    ast: AST | MlogAnalysis,
+    labels: dict[str, int],
+    *,
+    check: bool = True,
+    reparse: bool = False,
+) -> str:
+    """Replaces each label reference (eg. `%foo%`) in `text` with the label's address.
+
+    If `check` is True, each replacement is verified by its offsets: the reference
+    must appear at its recorded position in `text` (so `ast` was parsed from this
+    text), must come after the previous reference, and must be delimited (so the
+    number can't merge with a neighbouring token). Since labels and statements are
+    never touched, this guarantees that the labels and statement count are unchanged.
+    If `reparse` is True, the new text is also re-parsed and compared, which is much
+    slower.
+    """
+
+    analysis = ast if isinstance(ast, MlogAnalysis) else analyze_mlog(ast)
+
+    parts = list[str]()
+    start_pos = 0
+
+    for token in analysis.label_refs:
+        label = token[1:-1]
+        if label not in labels:
+            raise MlogError(f"Unknown symbolic label: {label}", token)
+
+        if token.start_pos is None or token.end_pos is None:
+            raise MlogError(f"Internal error: invalid token: {token}", token)
+
+        if check:
+            if (
+                token.start_pos < start_pos
+                or text[token.start_pos : token.end_pos] != token
+            ):
+                raise AssertionError(
+                    f"Source transformation failed: expected {token} at offset {token.start_pos}"
+                )
+            if not (
+                _is_delimited(text, token.start_pos - 1)
+                and _is_delimited(text, token.end_pos)
+            ):
+                raise MlogError(
+                    f"Symbolic label must be separated from other tokens: {token}",
+                    token,
+                )
+
+        parts += [text[start_pos : token.start_pos], str(labels[label])]
+        start_pos = token.end_pos
+
+    parts += text[start_pos:]
+
+    new_text = "".join(parts)
+
+    if reparse:
+        new_analysis = analyze_mlog(parse_mlog(new_text))
+        if analysis.statements != new_analysis.statements:
+            raise AssertionError(
+                "Source transformation failed: mismatched statement count"
+            )
+        if labels != new_analysis.labels:
+            raise AssertionError("Source transformation failed: mismatched labels")
+
+    return new_text
+
+
+def _is_delimited(text: str, pos: int):
+    return pos < 0 or pos >= len(text) or text[pos] in _TOKEN_DELIMITERS
@@ -0,0 +1,479 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from .mlog import AST, Label, Statement
+
+# Targets are either a resolved statement index, or the name of a variable that
+# holds a code address at runtime (eg. `ret` in `set @counter ret`).
+type Target = int | str
+
+NEXT = "@counter"
+"""Target used by `select @counter ... @counter`, which continues to the next
+statement."""
+
+
+# arguments that are keywords rather than variables, by instruction
+_KEYWORD_POSITIONS: dict[str, tuple[int, ...]] = {
+    "op": (0,),
+    "lookup": (0,),
+    "getblock": (0,),
+    "fetch": (0,),
+    "ucontrol": (0,),
+    "control": (0,),
+    "draw": (0,),
+    "jump": (0, 1),
+    "select": (1,),
+    "ulocate": (0, 1),
+    "radar": (0, 1, 2, 3),
+    "uradar": (0, 1, 2, 3),
+}
+
+
+@dataclass
+class Instruction:
+    """Control flow information for a single statement."""
+
+    index: int
+    statement: Statement
+
+    targets: list[Target] = field(default_factory=list)
+    """Possible jump targets, not including falling through to the next statement."""
+    falls_through: bool = True
+    """Whether execution can continue to the next statement."""
+    conditional: bool = False
+    """Whether this is a conditional `jump`."""
+    table: tuple[str, str] | None = None
+    """The memory and index of a jump table lookup (`read @counter memory index`)."""
+    dynamic: bool = False
+    """Whether this writes a value to @counter that can't be resolved statically."""
+    halts: bool = False
+    """Whether this stops or restarts the processor (`stop`, `end`)."""
+    address_writes: dict[str, list[Target] | None] = field(default_factory=dict)
+    """Writes to variables that hold code addresses. None means unknown."""
+
+    @property
+    def branches(self):
+        return (
+            bool(self.targets or self.table or self.dynamic or self.halts)
+            or not self.falls_through
+        )
+
+
+@dataclass
+class BasicBlock:
+    start: int
+    end: int
+    """Exclusive."""
+    successors: set[int] = field(default_factory=set)
+    """Statically known successor blocks, by start index."""
+    dynamic: bool = False
+    """Whether the block ends with a jump whose targets can't be resolved statically."""
+
+
+@dataclass
+class ControlFlowGraph:
+    """Control flow graph of a mlog program, with one instruction per statement.
+
+    Jumps to labels and numeric addresses are resolved statically. Writes to @counter
+    from a variable are recorded as variable targets, and variables that are used as
+    jump targets ("address variables") are tracked so that writes like
+    `op add ret @counter 1` and `set ret %label%` can be followed by a path-sensitive
+    analysis (see `mlogv32.preprocessor.cost`).
+    """
+
+    instructions: list[Instruction]
+    labels: dict[str, int]
+    address_variables: set[str]
+
+    _stored: dict[str, set[int]] | None = field(default=None, init=False, repr=False)
+    _live: list[frozenset[str]] | None = field(default=None, init=False, repr=False)
+
+    @classmethod
+    def build(cls, ast: AST, labels: dict[str, int] | None = None):
+        if labels is None:
+            labels = {}
+            counter = 0
+            for node in ast:
+                match node:
+                    case Label(name=name):
+                        labels[name] = counter
+                    case Statement():
+                        counter += 1
+                    case _:
+                        pass
+
+        # lark tokens only compare equal to tokens of the same type, so use plain
+        # strings for labels and arguments
+        labels = {str(name): value for name, value in labels.items()}
+        statements = [node for node in ast if isinstance(node, Statement)]
+
+        # find every variable that is used as a jump target
+        address_variables = set[str]()
+        for statement in statements:
+            for value in _counter_values(statement):
+                if _resolve(value, labels, 0) is None and value != NEXT:
+                    address_variables.add(str(value))
+
+        instructions = [
+            _build_instruction(i, statement, labels, address_variables)
+            for i, statement in enumerate(statements)
+        ]
+        return cls(instructions, labels, address_variables)
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def label_at(self, index: int) -> list[str]:
+        return [name for name, value in self.labels.items() if value == index]
+
+    def static_successors(self, index: int) -> Iterator[int]:
+        """Yields the successors of an instruction that are known without tracking
+        address variables."""
+
+        instruction = self.instructions[index]
+        for target in instruction.targets:
+            if isinstance(target, int):
+                yield target
+        if instruction.falls_through and index + 1 < len(self.instructions):
+            yield index + 1
+
+    def address_constants(self) -> set[int]:
+        """Returns every code address that is stored in an address variable, eg. the
+        return addresses of function calls."""
+
+        result = set[int]()
+        for instruction in self.instructions:
+            for values in instruction.address_writes.values():
+                for value in values or []:
+                    if isinstance(value, int):
+                        result.add(value)
+        return result
+
+    def indirect_targets(self, index: int) -> set[int]:
+        """Returns every address that an instruction may jump to, using the values
+        stored in address variables for jumps through a variable. Jump tables and
+        other dynamic jumps may go to any label."""
+
+        instruction = self.instructions[index]
+        result = set(self.static_successors(index))
+        if instruction.dynamic or instruction.table:
+            result.update(self.labels.values())
+        for target in instruction.targets:
+            if isinstance(target, str):
+                result |= self._stored_addresses().get(target, set())
+        return {i for i in result if 0 <= i < len(self.instructions)}
+
+    def successors(
+        self,
+        index: int,
+        tables: dict[int, list[int]] | None = None,
+    ) -> set[int]:
+        """Returns every address that an instruction may continue to, like
+        `indirect_targets`, but using `tables` for the targets of jump tables and other
+        dynamic jumps by index. `op add @counter @counter offset` is assumed to jump
+        into the statements before the next label, and execution wraps around to the
+        start after the last instruction."""
+
+        instruction = self.instructions[index]
+        match str(instruction.statement.name), instruction.statement.args:
+            case _ if tables is not None and index in tables:
+                result = set(tables[index])
+            case "op", ["add", "@counter", "@counter", *_] if instruction.dynamic:
+                end = min(
+                    (i for i in self.labels.values() if i > index),
+                    default=len(self.instructions),
+                )
+                result = set(range(index + 1, end))
+            case _:
+                result = self.indirect_targets(index)
+
+        if index == len(self.instructions) - 1 and instruction.falls_through:
+            result.add(0)
+        return result
+
+    def live_address_variables(self) -> list[frozenset[str]]:
+        """Returns the address variables that may be used as a jump target before
+        being overwritten, at the start of each instruction."""
+
+        if self._live is None:
+            self._live = self._compute_liveness()
+        return self._live
+
+    def _compute_liveness(self) -> list[frozenset[str]]:
+        n = len(self.instructions)
+        successors = [self.indirect_targets(i) for i in range(n)]
+        predecessors = [list[int]() for _ in range(n)]
+        for i, targets in enumerate(successors):
+            for target in targets:
+                predecessors[target].append(i)
+
+        uses = [
+            frozenset(t for t in instruction.targets if isinstance(t, str))
+            for instruction in self.instructions
+        ]
+        kills = [
+            frozenset(instruction.address_writes) for instruction in self.instructions
+        ]
+
+        live = [frozenset[str]() for _ in range(n)]
+        queue = list(range(n))
+        queued = set(queue)
+        while queue:
+            i = queue.pop()
+            queued.discard(i)
+
+            live_out = frozenset[str]().union(*(live[t] for t in successors[i]))
+            live_in = uses[i] | (live_out - kills[i])
+            if live_in != live[i]:
+                live[i] = live_in
+                for p in predecessors[i]:
+                    if p not in queued:
+                        queued.add(p)
+                        queue.append(p)
+
+        return live
+
+    def _stored_addresses(self) -> dict[str, set[int]]:
+        if self._stored is None:
+            self._stored = {}
+            for instruction in self.instructions:
+                for var, values in instruction.address_writes.items():
+                    stored = self._stored.setdefault(var, set())
+                    for value in values or []:
+                        if isinstance(value, int):
+                            stored.add(value)
+        return self._stored
+
+    def reachable(self, roots: Iterator[int] | list[int] | None = None) -> set[int]:
+        """Returns the indices of all instructions reachable from `roots`.
+
+        If any reachable instruction jumps to a target that can't be resolved
+        statically, every label and stored code address is also treated as a root.
+        """
+
+        if roots is None:
+            roots = [0]
+
+        seen = set[int]()
+        queue = [root for root in roots if 0 <= root < len(self.instructions)]
+        indirect = False
+        while queue:
+            index = queue.pop()
+            if index in seen or not (0 <= index < len(self.instructions)):
+                continue
+            seen.add(index)
+
+            instruction = self.instructions[index]
+            if not indirect and (
+                instruction.dynamic
+                or instruction.table
+                or any(isinstance(t, str) for t in instruction.targets)
+            ):
+                indirect = True
+                queue += self.labels.values()
+                queue += self.address_constants()
+
+            queue += self.static_successors(index)
+
+        return seen
+
+    def basic_blocks(self) -> list[BasicBlock]:
+        n = len(self.instructions)
+
+        leaders = {0} | {v for v in self.labels.values() if v < n}
+        leaders |= {v for v in self.address_constants() if v < n}
+        for instruction in self.instructions:
+            if instruction.branches:
+                leaders.add(instruction.index + 1)
+                leaders.update(
+                    t for t in instruction.targets if isinstance(t, int) and t < n
+                )
+        starts = sorted(leader for leader in leaders if leader < n)
+
+        blocks = list[BasicBlock]()
+        for start, end in zip(starts, starts[1:] + [n]):
+            last = self.instructions[end - 1]
+            blocks.append(
+                BasicBlock(
+                    start=start,
+                    end=end,
+                    successors=set(self.static_successors(end - 1)),
+                    dynamic=last.dynamic
+                    or last.table is not None
+                    or any(isinstance(t, str) for t in last.targets),
+                )
+            )
+        return blocks
+
+
+def resolve_value(token: str, labels: dict[str, int], index: int) -> int | None:
+    """Resolves a statement argument to a code address, if it is a constant."""
+
+    return _resolve(token, labels, index)
+
+
+def _resolve(token: str, labels: dict[str, int], index: int) -> int | None:
+    if token == NEXT:
+        return index + 1
+    if token.startswith("%") and token.endswith("%") and len(token) > 2:
+        return labels.get(token[1:-1])
+    if token in labels:
+        return labels[token]
+    try:
+        return int(token, base=0)
+    except ValueError:
+        pass
+    try:
+        value = float(token)
+    except ValueError:
+        return None
+    return int(value) if value.is_integer() else None
+
+
+def _target(token: str, labels: dict[str, int], index: int) -> Target:
+    if (value := _resolve(token, labels, index)) is not None:
+        return value
+    return token
+
+
+def _counter_values(statement: Statement) -> list[str]:
+    """Returns the values that a statement may write to @counter."""
+
+    match statement.name, statement.args:
+        case "set", ["@counter", value, *_]:
+            return [value]
+        case "select", ["@counter", _, _, _, a, b, *_]:
+            return [a, b]
+        case _:
+            return []
+
+
+def _build_instruction(
+    index: int,
+    statement: Statement,
+    labels: dict[str, int],
+    address_variables: set[str],
+) -> Instruction:
+    instruction = Instruction(index, statement)
+    name = str(statement.name)
+    args = [str(arg) for arg in statement.args]
+
+    match name, args:
+        case "jump", [target, "always", *_]:
+            instruction.targets = [_target(target, labels, index)]
+            instruction.falls_through = False
+
+        case "jump", [target, *_]:
+            instruction.targets = [_target(target, labels, index)]
+            instruction.conditional = True
+
+        case "set", ["@counter", value, *_]:
+            instruction.targets = [_target(value, labels, index)]
+            instruction.falls_through = False
+
+        case "select", ["@counter", _, _, _, a, b, *_]:
+            instruction.targets = [
+                _target(a, labels, index),
+                _target(b, labels, index),
+            ]
+            instruction.falls_through = False
+
+        case "op", ["add", "@counter", "@counter", n, *_] if (
+            offset := _resolve(n, {}, index)
+        ) is not None:
+            instruction.targets = [index + 1 + offset]
+            instruction.falls_through = False
+
+        case "read", ["@counter", memory, table_index, *_]:
+            instruction.table = (memory, table_index)
+            instruction.falls_through = False
+
+        case "stop", _:
+            # another processor can resume a stopped processor (eg. the controller
+            # at a breakpoint), so this still falls through
+            instruction.halts = True
+
+        case "end", _:
+            instruction.targets = [0]
+            instruction.halts = True
+            instruction.falls_through = False
+
+        case _ if "@counter" in args[:2] and "@counter" in written_variables(
+            name, args
+        ):
+            instruction.dynamic = True
+            instruction.falls_through = False
+
+        case _:
+            pass
+
+    # track writes to address variables
+    match name, args:
+        case "op", ["add", var, "@counter", n, *_] if var in address_variables:
+            offset = _resolve(n, {}, index)
+            instruction.address_writes[var] = (
+                None if offset is None else [index + 1 + offset]
+            )
+
+        case "set", [var, value, *_] if var in address_variables:
+            if value == "@counter":
+                instruction.address_writes[var] = [index + 1]
+            else:
+                resolved = _resolve(value, labels, index)
+                instruction.address_writes[var] = (
+                    None if resolved is None else [resolved]
+                )
+
+        case "select", [var, _, _, _, a, b, *_] if var in address_variables:
+            values = [_resolve(v, labels, index) for v in (a, b)]
+            instruction.address_writes[var] = (
+                None if None in values else [v for v in values if v is not None]
+            )
+
+        case _:
+            for var in written_variables(name, args):
+                if var in address_variables:
+                    instruction.address_writes[var] = None
+
+    return instruction
+
+
+def written_variables(name: str, args: list[str]) -> list[str]:
+    """Returns the variables that a statement may write to."""
+
+    return [args[i] for i in written_positions(name, args)]
+
+
+def read_positions(name: str, args: list[str]) -> list[int]:
+    """Returns the indices of the arguments that a statement may read from a variable,
+    not including keyword arguments like the operation of `op`."""
+
+    keywords = _KEYWORD_POSITIONS.get(name, ())
+    written = written_positions(name, args)
+    return [i for i in range(len(args)) if i not in keywords and i not in written]
+
+
+def written_positions(name: str, args: list[str]) -> list[int]:
+    """Returns the indices of the arguments that a statement may write to."""
+
+    match name, args:
+        case (
+            "read" | "set" | "getlink" | "sensor" | "select" | "packcolor" | "getflag",
+            [_, *_],
+        ):
+            return [0]
+        case "op" | "lookup" | "getblock" | "fetch", [_, _, *_]:
+            return [1]
+        case "unpackcolor", [_, _, _, _, *_]:
+            return [0, 1, 2, 3]
+        case "ucontrol", ["getBlock", _, _, _, _, _, *_]:
+            return [3, 4, 5]
+        case "ulocate", [*_, _, _, _, _]:
+            n = len(args)
+            return [n - 4, n - 3, n - 2, n - 1]
+        case "radar" | "uradar", [*_, _]:
+            return [len(args) - 1]
+        case _:
+            return []
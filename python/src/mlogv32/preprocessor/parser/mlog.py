@@ -1,9 +1,13 @@
+import re
 from dataclasses import dataclass
+from functools import cache
 from importlib import resources
-from typing import TYPE_CHECKING, Callable, Iterator
+from typing import TYPE_CHECKING, Callable
 
 from lark import Lark, Token, Transformer
 
+from mlogv32.utils.cache import default_cache_dir, text_digest
+
 if TYPE_CHECKING:
 
     def v_args[T](
@@ -55,209 +59,172 @@ class MlogTransformer(Transformer[Token, list[ASTNode]]):
 
 GRAMMAR = (resources.files() / "mlog.lark").read_text("utf-8")
 
-PARSER = Lark(
-    GRAMMAR,
-    parser="lalr",
-    strict=True,
-)
 
+@cache
+def get_parser() -> Lark:
+    """Returns the mlog parser.
 
-def parse_mlog(text: str):
-    tree = PARSER.parse(text)
+    The parser is only built on first use, and the LALR tables are cached on disk
+    (see `default_cache_dir`), so commands that don't parse mlog don't pay for
+    building them, and commands that do only pay for it once per grammar change.
+    Lark checks the grammar, options and Lark version before loading the cache.
+    """
+
+    cache_dir = default_cache_dir() / "lark"
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        print(f"[WARNING] Failed to create parser cache directory: {e}")
+        lark_cache = False
+    else:
+        lark_cache = str(cache_dir / f"mlog-{text_digest(GRAMMAR)[:16]}.cache")
+
+    return Lark(
+        GRAMMAR,
+        parser="lalr",
+        strict=True,
+        cache=lark_cache,
+    )
+
+
+def parse_mlog(text: str, *, fast: bool = True) -> AST:
+    """Parses mlog code into a list of labels, statements, and directives.
+
+    If `fast` is True, the code is first parsed with `scan_mlog`, falling back to the
+    Lark parser if that fails (eg. to get a useful error message).
+    """
+
+    if fast:
+        try:
+            return scan_mlog(text)
+        except ScanError:
+            pass
+
+    tree = get_parser().parse(text)
     return MlogTransformer().transform(tree)
 
 
-class MlogError(AssertionError):
-    def __init__(self, message: str, token: Token, *args: object) -> None:
-        super().__init__(message, *args)
-        self.token = token
+class ScanError(ValueError):
+    def __init__(self, message: str, pos: int) -> None:
+        super().__init__(f"{message} at position {pos}")
+        self.pos = pos
 
 
-class DirectiveError(MlogError):
-    pass
+# these match the terminals in mlog.lark, with one pattern for each state of Lark's
+# contextual lexer, and the alternatives in the same order as Lark tries them
+_TOKEN = r"[^\n #\t;]+"
+_COMMENT = r"(?P<COMMENT>#[^\n]*)"
+_NEWLINE = r"(?P<_NEWLINE>[\n;]+)"
+_IGNORE = r"(?P<IGNORE>[ \t]+)"
 
-
-def expect_int(
-    n: Token,
-    predicate: Callable[[int], bool] | None = None,
-    description: str = "value",
-):
-    try:
-        result = int(n)
-    except ValueError as e:
-        raise DirectiveError(str(e), n) from e
-    if predicate is None or predicate(result):
-        return result
-    raise DirectiveError(f"Invalid {description}: {result}", n)
+_LINE_START_RE = re.compile(
+    rf"(?P<LABEL>{_TOKEN}:)|(?P<_DIRECTIVE>#directive)|(?P<TOKEN>{_TOKEN})|{_COMMENT}|{_NEWLINE}|{_IGNORE}"
+)
+_AFTER_LABEL_RE = re.compile(rf"{_COMMENT}|{_NEWLINE}|{_IGNORE}")
+_STATEMENT_RE = re.compile(
+    rf'(?P<STRING>"[^\n"]*")|(?P<LABEL_REF>%{_TOKEN}%)|(?P<LABEL>{_TOKEN}:)|(?P<TOKEN>{_TOKEN})|{_COMMENT}|{_NEWLINE}|{_IGNORE}'
+)
+_DIRECTIVE_NAME_RE = re.compile(
+    rf"{_COMMENT}|{_IGNORE}|(?P<__ANON_0>assert_counter|(?:start|end)_(?:fetch|assert_length)|(?:push|pop)_saved)"
+)
+_DIRECTIVE_RE = re.compile(rf"(?P<TOKEN>{_TOKEN})|{_COMMENT}|{_NEWLINE}|{_IGNORE}")
 
 
-def iter_labels(ast: AST) -> Iterator[tuple[str, int]]:
-    counter = 0
-    length_assertion = None
-    for node in ast:
-        match node:
-            case Label(name=name):
-                yield (name, counter)
-
-            case Statement():
-                counter += 1
-
-            case Directive(name="start_assert_length", args=[n]):
-                if length_assertion is not None:
-                    raise DirectiveError(
-                        "Nested length assertions are not supported", node.name
-                    )
-                # length, start counter, token for errors
-                length_assertion = (
-                    expect_int(n, lambda v: v >= 0, "length assertion"),
-                    counter,
-                    n,
-                )
+def scan_mlog(text: str) -> AST:
+    """Parses mlog code with a hand-written single-pass scanner.
 
-            case Directive(name="end_assert_length"):
-                if length_assertion is None:
-                    raise DirectiveError(
-                        "Found end_assert_length without matching start_assert_length",
-                        node.name,
-                    )
-                want_length, start_counter, _ = length_assertion
-                length_assertion = None
-                got_length = counter - start_counter
-                if want_length != got_length:
-                    raise DirectiveError(
-                        f"Expected @counter to be {start_counter + want_length} (length {want_length}), but got {counter} (length {got_length})",
-                        node.name,
-                    )
-
-            case Directive(name="assert_counter", args=[n]):
-                if counter != expect_int(n):
-                    raise DirectiveError(
-                        f"Expected @counter to be {n}, but got {counter}", node.name
-                    )
-
-            case Directive():
-                pass
+    mlog is line-oriented, so this doesn't need a real parser. The result is identical
+    to the Lark parser's, including token types and positions. Raises `ScanError` if
+    the code is not valid according to the grammar.
+    """
 
-    if length_assertion is not None:
-        _, _, token = length_assertion
-        raise DirectiveError(
-            "Found start_assert_length without matching end_assert_length", token
-        )
-
-
-def check_unsaved_variables(ast: AST):
-    saved_variables = {"@counter"}
-    warned_variables = set[str]()
-    state = "init"
-
-    for node in ast:
-        match node:
-            case Statement(name="read", args=[var, target, name]):
-                if state == "fetch" and target == "prev_proc":
-                    if var != name[1:-1]:
-                        print(
-                            f"[WARNING] Invalid variable restoration: {var} != {name[1:-1]}"
-                        )
-                    elif var in saved_variables:
-                        print(f"[WARNING] Duplicate variable restoration: {var}")
-                    saved_variables.add(var)
-                    continue
-            case Statement(name="getblock", args=[_, var, *_]):
-                pass
-            case Statement(name="getflag", args=[var, *_]):
-                pass
-            case Statement(name="getlink", args=[var, *_]):
-                pass
-            case Statement(name="lookup", args=[_, var, *_]):
-                pass
-            case Statement(name="op", args=[_, var, *_]):
-                pass
-            case Statement(name="sensor", args=[var, *_]):
-                pass
-            case Statement(name="set", args=[var, *_]):
-                pass
-            case Statement(name="select", args=[var, *_]):
-                pass
-            case Directive(name="start_fetch"):
-                state = "fetch"
-                continue
-            case Directive(name="end_fetch"):
-                state = "check"
-                continue
-            case Directive(name="push_saved", args=args):
-                for var in args:
-                    saved_variables.add(var)
-                continue
-            case Directive(name="pop_saved", args=args):
-                for var in args:
-                    saved_variables.remove(var)
-                continue
-            case _:
-                continue
+    ast: AST = []
+    args: list[Token] = []
 
-        if state == "check" and var not in saved_variables | warned_variables:
-            print(f"[WARNING] Unsaved variable: {var}")
-            warned_variables.add(var)
+    pattern = _LINE_START_RE
+    pos = 0
+    line = 1
+    line_start = 0
+    end = len(text)
 
-    print(f"Saved variable count: {len(saved_variables - {'@counter'})}")
+    while pos < end:
+        match = pattern.match(text, pos)
+        if match is None:
+            raise ScanError("Unexpected character", pos)
 
+        kind = match.lastgroup
+        match_end = match.end()
 
-def count_statements(ast: AST):
-    n = 0
-    for node in ast:
-        if isinstance(node, Statement):
-            n += 1
-    return n
+        match kind:
+            case "IGNORE" | "COMMENT":
+                pass
 
+            case "_NEWLINE":
+                if (newlines := text.count("\n", pos, match_end)) > 0:
+                    line += newlines
+                    line_start = text.rindex("\n", pos, match_end) + 1
+                pattern = _LINE_START_RE
 
-def replace_symbolic_labels(
-    text: str,
-    ast: AST,
-    labels: dict[str, int],
-    *,
-    check: bool = True,
-) -> str:
-    parts = list[str]()
+            case "_DIRECTIVE":
+                pattern = _DIRECTIVE_NAME_RE
 
-    start_pos = 0
+            case _:
+                assert kind is not None
+                column = pos - line_start + 1
+                token = Token(
+                    kind,
+                    match.group(),
+                    pos,
+                    line,
+                    column,
+                    line,
+                    column + match_end - pos,
+                    match_end,
+                )
 
-    for token in _iter_label_refs(ast):
-        label = token[1:-1]
-        if label not in labels:
-            raise MlogError(f"Unknown symbolic label: {label}", token)
+                if pattern is _LINE_START_RE:
+                    if kind == "LABEL":
+                        ast.append(Label(token.update(value=token[:-1])))
+                        pattern = _AFTER_LABEL_RE
+                    else:
+                        args = []
+                        ast.append(Statement(token, args))
+                        pattern = _STATEMENT_RE
+                elif pattern is _DIRECTIVE_NAME_RE:
+                    args = []
+                    ast.append(Directive(token, args))
+                    pattern = _DIRECTIVE_RE
+                else:
+                    args.append(token)
 
-        if token.start_pos is None or token.end_pos is None:
-            raise MlogError(f"Internal error: invalid token: {token}", token)
+        pos = match_end
 
-        parts += [
-            text[start_pos : token.start_pos],
-            str(labels[label]),
-        ]
+    # the grammar requires every line (including the last one) to end with a newline
+    if pattern is not _LINE_START_RE:
+        raise ScanError("Unexpected end of input", pos)
 
-        start_pos = token.end_pos
+    return ast
 
-    parts += text[start_pos:]
 
-    new_text = "".join(parts)
+class MlogError(AssertionError):
+    def __init__(self, message: str, token: Token, *args: object) -> None:
+        super().__init__(message, *args)
+        self.token = token
 
-    # sanity checks
-    if check:
-        new_ast = parse_mlog(new_text)
-        if count_statements(ast) != count_statements(new_ast):
-            raise AssertionError(
-                "Source transformation failed: mismatched statement count"
-            )
-        if labels != dict(iter_labels(new_ast)):
-            raise AssertionError("Source transformation failed: mismatched labels")
 
-    return new_text
+class DirectiveError(MlogError):
+    pass
 
 
-def _iter_label_refs(ast: AST) -> Iterator[Token]:
-    for node in ast:
-        if not isinstance(node, Statement):
-            continue
-        for token in node.args:
-            if token.type != "LABEL_REF":
-                continue
-            yield token
+def expect_int(
+    n: Token,
+    predicate: Callable[[int], bool] | None = None,
+    description: str = "value",
+):
+    try:
+        result = int(n)
+    except ValueError as e:
+        raise DirectiveError(str(e), n) from e
+    if predicate is None or predicate(result):
+        return result
+    raise DirectiveError(f"Invalid {description}: {result}", n)
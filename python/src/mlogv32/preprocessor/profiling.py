@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import cProfile
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Generator
+
+
+@dataclass
+class StageStats:
+    name: str
+    calls: int = 0
+    seconds: float = 0
+    peak_bytes: int | None = None
+
+
+class BuildProfiler:
+    """Records wall time and peak memory usage for each stage of a build.
+
+    Stages may be entered multiple times (eg. once per template), in which case the
+    times are summed and the largest peak is kept. Stages must not be nested.
+
+    If `enabled` is False, `stage` does nothing.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        *,
+        memory: bool = True,
+        cprofile_dir: Path | None = None,
+    ):
+        self.enabled = enabled
+        self.memory = memory and enabled
+        self.cprofile_dir = cprofile_dir if enabled else None
+
+        self.stages = dict[str, StageStats]()
+        self._profiles = dict[str, cProfile.Profile]()
+        self._current: str | None = None
+        self._start = time.perf_counter()
+
+        if self.memory:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str) -> Generator[None]:
+        if not self.enabled:
+            yield
+            return
+
+        if self._current is not None:
+            raise RuntimeError(
+                f"Cannot start stage {name} while stage {self._current} is running"
+            )
+        self._current = name
+
+        stats = self.stages.setdefault(name, StageStats(name))
+
+        if self.memory:
+            tracemalloc.reset_peak()
+            start_memory, _ = tracemalloc.get_traced_memory()
+        else:
+            start_memory = 0
+
+        profile = None
+        if self.cprofile_dir:
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+            profile.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats.seconds += time.perf_counter() - start
+            stats.calls += 1
+
+            if profile:
+                profile.disable()
+
+            if self.memory:
+                _, peak = tracemalloc.get_traced_memory()
+                stats.peak_bytes = max(stats.peak_bytes or 0, peak - start_memory)
+
+            self._current = None
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self._start
+
+    def report(self) -> str:
+        total = self.total_seconds
+        lines = [
+            f"{'Stage':<16} {'Calls':>5} {'Time':>10} {'%':>6} {'Peak memory':>12}",
+        ]
+        for stats in self.stages.values():
+            peak = (
+                f"{stats.peak_bytes / 1024 / 1024:.1f} MiB"
+                if stats.peak_bytes is not None
+                else "-"
+            )
+            lines.append(
+                f"{stats.name:<16} {stats.calls:>5} {stats.seconds:>9.3f}s {stats.seconds / total:>6.1%} {peak:>12}"
+            )
+        lines.append(f"{'total':<16} {'':>5} {total:>9.3f}s")
+        return "\n".join(lines)
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "total_seconds": self.total_seconds,
+                "stages": [asdict(stats) for stats in self.stages.values()],
+            },
+            indent=2,
+        )
+
+    def finish(self, json_path: Path | None = None):
+        """Prints the report and writes any requested output files."""
+
+        if not self.enabled:
+            return
+
+        print(self.report())
+
+        if json_path:
+            json_path.parent.mkdir(parents=True, exist_ok=True)
+            json_path.write_text(self.to_json(), "utf-8")
+            print(f"Wrote profile report to file: {json_path}")
+
+        if self.cprofile_dir:
+            self.cprofile_dir.mkdir(parents=True, exist_ok=True)
+            for name, profile in self._profiles.items():
+                profile.dump_stats(self.cprofile_dir / f"{name}.prof")
+            print(f"Wrote cProfile stats to directory: {self.cprofile_dir}")
+
+        if self.memory:
+            tracemalloc.stop()
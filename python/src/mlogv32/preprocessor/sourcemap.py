@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import difflib
+import re
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from jinja2 import Environment
+from pydantic import BaseModel
+
+from mlogv32.utils.cache import text_digest
+
+from .extensions import SOURCE_MAP_MARKER
+
+_MARKER_RE = re.compile(
+    rf"{SOURCE_MAP_MARKER}([^{SOURCE_MAP_MARKER}]*):(\d+){SOURCE_MAP_MARKER}"
+)
+
+
+class SourceLocation(NamedTuple):
+    template: str
+    """The template name, relative to `SourceMap.root`."""
+    line: int
+
+
+class SourceMap(BaseModel):
+    """Maps each line of rendered mlog code to the template line that produced it.
+
+    Source maps are written next to the rendered code by `build --source-map` (see
+    `SourceMap.path_for`), and used by the emulator to map execution counts back to
+    the templates.
+    """
+
+    root: Path
+    """The directory containing the templates."""
+    digest: str
+    """The `text_digest` of the code described by this map."""
+    lines: list[SourceLocation | None]
+    """The template location of each line of code, starting from line 1."""
+
+    @staticmethod
+    def path_for(output: Path) -> Path:
+        return output.with_name(output.name + ".map.json")
+
+    @classmethod
+    def load(cls, path: Path) -> SourceMap:
+        return cls.model_validate_json(path.read_bytes())
+
+    def location(self, line: int) -> SourceLocation | None:
+        if 1 <= line <= len(self.lines):
+            return self.lines[line - 1]
+        return None
+
+    def template_path(self, location: SourceLocation) -> Path:
+        return self.root / location.template
+
+    def align(self, source: str, code: str) -> SourceMap:
+        """Returns a source map for a transformed version of the mapped code (eg. after
+        `optimize_mlog` or `allocate_local_variables`).
+
+        Lines are matched by instruction name (or the entire line, for labels and
+        comments), since transforms may rename variables and labels. Lines that were
+        added by the transform are mapped to the nearest matched line before them.
+        """
+
+        if source == code:
+            return self.model_copy(update={"digest": text_digest(code)})
+
+        source_lines = source.split("\n")
+        code_lines = code.split("\n")
+
+        lines: list[SourceLocation | None] = [None] * len(code_lines)
+        matcher = difflib.SequenceMatcher(
+            None,
+            [_alignment_key(line) for line in source_lines],
+            [_alignment_key(line) for line in code_lines],
+            autojunk=False,
+        )
+        for a, b, size in matcher.get_matching_blocks():
+            lines[b : b + size] = self.lines[a : a + size]
+
+        for i in range(1, len(lines)):
+            if lines[i] is None:
+                lines[i] = lines[i - 1]
+
+        return SourceMap(root=self.root, digest=text_digest(code), lines=lines)
+
+
+def render_source_map(
+    env: Environment,
+    template: Path,
+    **kwargs: Any,
+) -> tuple[str, SourceMap]:
+    """Renders a template in an environment with the `SourceMapMarkers` extension.
+
+    Returns the rendered code without markers, and its source map.
+    """
+
+    rendered = env.get_template(template.name).render(**kwargs)
+
+    code_lines = list[str]()
+    lines = list[SourceLocation | None]()
+    for line in rendered.split("\n"):
+        location = None
+        for match in _MARKER_RE.finditer(line):
+            location = SourceLocation(match.group(1), int(match.group(2)))
+        lines.append(location)
+        code_lines.append(_MARKER_RE.sub("", line))
+
+    # lines without a marker were produced by an expression (eg. a multi-line string),
+    # so they belong to the template line that ends after it
+    for i in reversed(range(len(lines) - 1)):
+        if lines[i] is None:
+            lines[i] = lines[i + 1]
+    for i in range(1, len(lines)):
+        if lines[i] is None:
+            lines[i] = lines[i - 1]
+
+    code = "\n".join(code_lines)
+    return code, SourceMap(root=template.parent, digest=text_digest(code), lines=lines)
+
+
+def _alignment_key(line: str) -> str:
+    line = line.strip()
+    if not line or line.startswith("#") or line.endswith(":"):
+        return line
+    return line.split(maxsplit=1)[0]
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Callable, Hashable, Iterable
+
+from jinja2 import Environment, meta
+from jinja2.ext import Extension
+
+type Snapshot = dict[Path, int | None]
+
+
+class BuildSession:
+    """State that is kept warm between rebuilds in watch mode.
+
+    Files loaded through `load_file` (eg. the build config and schematics) are only
+    reloaded when their mtime changes, and Jinja environments are reused, so templates
+    that haven't changed don't need to be recompiled.
+
+    If `watch` is True, every file that a build reads is recorded in `dependencies`,
+    including templates that are (transitively) included or imported by a rendered
+    template, according to Jinja's own parser.
+    """
+
+    def __init__(self, *, watch: bool = False):
+        self.watch = watch
+        self.dependencies = set[Path]()
+
+        self._files = dict[tuple[Path, Hashable], tuple[int, Any]]()
+        self._envs = dict[tuple[Path, tuple[str, ...]], Environment]()
+
+    def add_dependency(self, path: Path):
+        if self.watch:
+            self.dependencies.add(path.resolve())
+
+    def load_file[T](self, path: Path, loader: Callable[[Path], T]) -> T:
+        """Calls `loader(path)`, or returns the previous result if the file hasn't
+        changed since the last call with the same loader."""
+
+        return self._load_file(path, loader, loader)
+
+    def _load_file[T](
+        self,
+        path: Path,
+        key: Hashable,
+        loader: Callable[[Path], T],
+    ) -> T:
+        path = path.resolve()
+        self.add_dependency(path)
+
+        mtime = path.stat().st_mtime_ns
+        cached = self._files.get((path, key))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        value = loader(path)
+        self._files[path, key] = (mtime, value)
+        return value
+
+    def jinja_env(
+        self,
+        template_dir: Path,
+        extensions: Iterable[type[Extension] | str],
+        create: Callable[[], Environment],
+    ) -> Environment:
+        key = (
+            template_dir.resolve(),
+            tuple(
+                ext if isinstance(ext, str) else f"{ext.__module__}.{ext.__qualname__}"
+                for ext in extensions
+            ),
+        )
+        if (env := self._envs.get(key)) is None:
+            env = self._envs[key] = create()
+        return env
+
+    def track_template(self, env: Environment, name: str):
+        """Records a template and everything it references as dependencies."""
+
+        if not self.watch or env.loader is None:
+            return
+
+        seen = set[str]()
+        queue = [name]
+        while queue:
+            name = queue.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+
+            _, filename, _ = env.loader.get_source(env, name)
+            if filename is None:
+                continue
+
+            queue += self._load_file(
+                Path(filename),
+                ("references", id(env)),
+                lambda path: _referenced_templates(env, path),
+            )
+
+    def snapshot(self) -> Snapshot:
+        return {path: _mtime(path) for path in self.dependencies}
+
+
+def watch_build(
+    session: BuildSession,
+    build: Callable[[], None],
+    *,
+    interval: float = 0.25,
+):
+    """Runs `build`, then runs it again whenever one of its dependencies changes.
+
+    Build errors are printed instead of stopping the watcher. Note that changes to the
+    preprocessor's own Python code are not picked up.
+    """
+
+    while True:
+        session.dependencies.clear()
+
+        start = time.perf_counter()
+        try:
+            build()
+        except Exception:
+            traceback.print_exc()
+            print(f"Build failed after {time.perf_counter() - start:.3f}s.")
+        else:
+            print(f"Build finished in {time.perf_counter() - start:.3f}s.")
+
+        snapshot = session.snapshot()
+        print(f"Watching {len(snapshot)} files for changes...")
+
+        changed = wait_for_changes(snapshot, interval)
+        for path in sorted(changed):
+            print(f"Changed: {path}")
+        print()
+
+
+def wait_for_changes(snapshot: Snapshot, interval: float) -> list[Path]:
+    while True:
+        time.sleep(interval)
+        if changed := [
+            path for path, mtime in snapshot.items() if _mtime(path) != mtime
+        ]:
+            return changed
+
+
+def _referenced_templates(env: Environment, path: Path) -> list[str]:
+    source = path.read_text("utf-8")
+    return [
+        name
+        for name in meta.find_referenced_templates(env.parse(source))
+        if name is not None
+    ]
+
+
+def _mtime(path: Path) -> int | None:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
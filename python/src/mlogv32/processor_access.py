@@ -1,9 +1,23 @@
 from __future__ import annotations
 
+import io
 import logging
 import socket
+import struct
+from collections import OrderedDict
+from functools import cache, lru_cache
 from pathlib import Path
-from typing import Annotated, Any, Literal
+from types import UnionType
+from typing import (
+    Annotated,
+    Any,
+    Callable,
+    Iterator,
+    Literal,
+    NamedTuple,
+    cast,
+    overload,
+)
 
 from pydantic import (
     BaseModel as _BaseModel,
@@ -17,22 +31,43 @@ logger = logging.getLogger(__name__)
 
 
 class ProcessorAccess:
+    """Client for the ProcessorAccess server in the mlogv32 Mindustry mod.
+
+    Requests and responses are newline-delimited JSON. `flash_bytes` and
+    `dump_bytes` send the image or RAM contents inline as raw bytes after the JSON
+    line, whose `size` field gives the length, so the server doesn't need access to
+    the client's filesystem. Responses are read from a single buffered reader for the
+    lifetime of the connection.
+
+    `read_memory` is served from an LRU cache of up to `page_cache_size` pages, which
+    is cleared whenever this client sends a request that might run the processor.
+    """
+
     def __init__(
         self,
         hostname: str,
         port: int,
         *,
         log_level: int = logging.DEBUG,
+        page_cache_size: int = 64,
     ):
         self.hostname = hostname
         self.port = port
         self.log_level = log_level
+        self.page_cache = PageCache(page_cache_size)
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._reader: io.BufferedReader | None = None
 
     def connect(self):
         self.socket.connect((self.hostname, self.port))
+        # requests are small and always followed by a read, so don't wait to batch them
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self.socket.makefile("rb")
 
     def disconnect(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
         self.socket.close()
 
     def flash(self, path: str | Path, *, absolute: bool = True):
@@ -60,6 +95,71 @@ class ProcessorAccess:
         )
         return self._recv_response(SuccessResponse)
 
+    def flash_bytes(self, data: bytes | bytearray | memoryview):
+        """Flashes an image to ROM, sent inline instead of by path."""
+
+        self._send_request(FlashBytesRequest(size=len(data)), data)
+        return self._recv_response(SuccessResponse)
+
+    def dump_bytes(self, address: int | None = None, size: int | None = None):
+        """Returns the contents of RAM, received inline instead of through a file.
+
+        Like `dump`, each word is big-endian.
+        """
+
+        self._send_request(DumpBytesRequest(address=address, bytes=size))
+        response = self._recv_response(DataResponse)
+        return self._recv_exact(response.size)
+
+    def read_memory(
+        self,
+        address: int,
+        size: int,
+        *,
+        space: MemorySpace = "memory",
+    ) -> memoryview:
+        """Reads memory as the processor sees it (ie. little-endian, unlike `dump`).
+
+        `space` selects the physical address space (ROM and RAM), the registers
+        (address `4*n` is `xn`), or the CSRs proc (address `4*n` is CSR `n`).
+
+        The cache is only coherent while the processor is paused or stopped. Call
+        `page_cache.clear()` if another client might have run it.
+        """
+
+        pages, missing = self.page_cache.lookup(space, address, size)
+        for start, length in missing:
+            generation = self.page_cache.generation
+            self._send_request(
+                ReadMemoryRequest(space=space, address=start, size=length)
+            )
+            response = self._recv_response(DataResponse)
+            data = self._recv_exact(response.size)
+            pages |= self.page_cache.store(space, start, data, generation)
+        return PageCache.join(pages, address, size)
+
+    def write_memory(
+        self,
+        address: int,
+        data: bytes | bytearray | memoryview,
+        *,
+        space: MemorySpace = "memory",
+    ):
+        """Writes memory as the processor sees it. `address` and the length of `data`
+        must be multiples of 4.
+
+        Writing to ROM is slow, since each ROM proc that's modified is reflashed.
+        """
+
+        if address % 4 or len(data) % 4:
+            raise ValueError("Address and size must be aligned to 4 bytes.")
+
+        self._send_request(
+            WriteMemoryRequest(space=space, address=address, size=len(data)), data
+        )
+        self.page_cache.invalidate(space, address, len(data))
+        return self._recv_response(SuccessResponse)
+
     def start(self, *, single_step: bool = False):
         self._send_request(StartRequest(single_step=single_step))
         return self._recv_response(SuccessResponse)
@@ -80,6 +180,68 @@ class ProcessorAccess:
         self._send_request(StatusRequest())
         return self._recv_response(StatusResponse)
 
+    def step(self, steps: int = 1, *, batch_size: int = 1024) -> Iterator[TraceRecord]:
+        """Executes up to `steps` instructions, and yields a record for each one.
+
+        See `run_until`.
+        """
+
+        return self.run_until(max_steps=steps, batch_size=batch_size)
+
+    def run_until(
+        self,
+        *,
+        pc: int | None = None,
+        instret: int | None = None,
+        max_steps: int | None = None,
+        batch_size: int = 1024,
+    ) -> Iterator[TraceRecord]:
+        """Single-steps until the processor stops, reaches `pc`, or has retired
+        `instret` instructions, and yields a record for each instruction executed.
+
+        The server executes up to `batch_size` steps per request and returns their
+        records in one block, so this only needs a round trip per batch. The
+        processor must already be running with single-stepping enabled, eg. after
+        `start(single_step=True)`.
+        """
+
+        remaining = max_steps
+        while remaining is None or remaining > 0:
+            steps = batch_size if remaining is None else min(batch_size, remaining)
+            self._send_request(StepRequest(steps=steps, pc=pc, instret=instret))
+            response = self._recv_response(DataResponse)
+            records = parse_trace(self._recv_exact(response.size))
+
+            yield from records
+            if len(records) < steps:
+                return
+            if remaining is not None:
+                remaining -= len(records)
+
+    def subscribe(self, *, unpause: bool = False) -> Iterator[StatusResponse]:
+        """Yields the status each time the processor pauses, and finally when it
+        stops.
+
+        The server pushes only what changed since the previous event, so this is much
+        cheaper than calling `wait` and `status` in a loop. If `unpause` is set, the
+        server unpauses the processor after each event, so single-stepping runs
+        without any further requests.
+
+        The connection can't be used for anything else until the iterator finishes.
+        """
+
+        self._send_request(SubscribeRequest(unpause=unpause))
+        status = None
+        while True:
+            match self._recv_response(StatusEvent | SuccessResponse):
+                case StatusEvent() as event:
+                    status = event.apply(status)
+                    yield status
+                case SuccessResponse():
+                    return
+                case response:
+                    raise ValueError(f"Unexpected response: {response}")
+
     def serial(
         self,
         device: UartDevice,
@@ -97,21 +259,52 @@ class ProcessorAccess:
         )
         return self.socket
 
-    def _send_request(self, request: Request) -> None:
-        message = request.model_dump_json() + "\n"
-        logger.log(self.log_level, f"Sending request: {message.rstrip()}")
-        self.socket.sendall(message.encode("utf-8"))
-
-    def _recv_response[T](self, response_type: type[T]) -> T:
-        with self.socket.makefile("r", encoding="utf-8") as f:
-            line = f.readline()
-        logger.log(self.log_level, f"Received response: {line.rstrip()}")
-        match TypeAdapter(response_type | ErrorResponse).validate_json(line):
+    def _send_request(
+        self,
+        request: Request,
+        payload: bytes | bytearray | memoryview | None = None,
+    ) -> None:
+        message = encode_request(request)
+        if logger.isEnabledFor(self.log_level):
+            logger.log(self.log_level, f"Sending request: {message.decode().rstrip()}")
+        if not isinstance(request, CACHE_SAFE_REQUESTS):
+            self.page_cache.clear()
+        self.socket.sendall(message)
+        if payload is not None:
+            self.socket.sendall(payload)
+
+    @overload
+    def _recv_response[T](self, response_type: type[T]) -> T: ...
+
+    @overload
+    def _recv_response(self, response_type: UnionType) -> Any: ...
+
+    def _recv_response(self, response_type: Any) -> Any:
+        if self._reader is None:
+            raise ConnectionError("Not connected")
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        if logger.isEnabledFor(self.log_level):
+            logger.log(self.log_level, f"Received response: {line.decode().rstrip()}")
+        match response_adapter(response_type).validate_json(line):
             case ErrorResponse() as e:
                 raise ProcessorError(e)
             case response:
                 return response
 
+    def _recv_exact(self, size: int) -> memoryview:
+        if self._reader is None:
+            raise ConnectionError("Not connected")
+        buf = memoryview(bytearray(size))
+        received = 0
+        while received < size:
+            n = self._reader.readinto(buf[received:])
+            if not n:
+                raise ConnectionError("Connection closed by server")
+            received += n
+        return buf
+
     def __enter__(self):
         self.connect()
         return self
@@ -130,13 +323,18 @@ class BaseModel(_BaseModel):
     )
 
 
-class FlashRequest(BaseModel):
+class RequestModel(BaseModel):
+    # frozen so encoded requests can be cached
+    model_config = ConfigDict(frozen=True)
+
+
+class FlashRequest(RequestModel):
     type: Literal["flash"] = "flash"
     path: Path
     absolute: bool
 
 
-class DumpRequest(BaseModel):
+class DumpRequest(RequestModel):
     type: Literal["dump"] = "dump"
     path: Path
     address: int | None
@@ -144,36 +342,85 @@ class DumpRequest(BaseModel):
     absolute: bool
 
 
-class StartRequest(BaseModel):
+class FlashBytesRequest(RequestModel):
+    """Followed by exactly `size` raw bytes of the image."""
+
+    type: Literal["flashBytes"] = "flashBytes"
+    size: int
+
+
+class DumpBytesRequest(RequestModel):
+    type: Literal["dumpBytes"] = "dumpBytes"
+    address: int | None
+    bytes: int | None
+
+
+type MemorySpace = Literal["memory", "registers", "csrs"]
+
+
+class ReadMemoryRequest(RequestModel):
+    """Answered with a `DataResponse`, which is shorter than `size` if the read
+    reaches the end of the region."""
+
+    type: Literal["readMemory"] = "readMemory"
+    space: MemorySpace
+    address: int
+    size: int
+
+
+class WriteMemoryRequest(RequestModel):
+    """Followed by exactly `size` raw bytes to write."""
+
+    type: Literal["writeMemory"] = "writeMemory"
+    space: MemorySpace
+    address: int
+    size: int
+
+
+class StartRequest(RequestModel):
     type: Literal["start"] = "start"
     single_step: bool
 
 
-class WaitRequest(BaseModel):
+class WaitRequest(RequestModel):
     type: Literal["wait"] = "wait"
     stopped: bool
     paused: bool
 
 
-class UnpauseRequest(BaseModel):
+class UnpauseRequest(RequestModel):
     type: Literal["unpause"] = "unpause"
 
 
-class StopRequest(BaseModel):
+class StopRequest(RequestModel):
     type: Literal["stop"] = "stop"
 
 
-class StatusRequest(BaseModel):
+class StatusRequest(RequestModel):
     type: Literal["status"] = "status"
 
 
+class StepRequest(RequestModel):
+    """Answered with a `DataResponse` followed by the packed `TraceRecord`s."""
+
+    type: Literal["step"] = "step"
+    steps: int
+    pc: int | None
+    instret: int | None
+
+
+class SubscribeRequest(RequestModel):
+    type: Literal["subscribe"] = "subscribe"
+    unpause: bool
+
+
 type UartDevice = Literal["uart0", "uart1", "uart2", "uart3"]
 
 
 type UartDirection = Literal["both", "rx", "tx"]
 
 
-class SerialRequest(BaseModel):
+class SerialRequest(RequestModel):
     type: Literal["serial"] = "serial"
     device: UartDevice
     direction: UartDirection
@@ -184,11 +431,17 @@ class SerialRequest(BaseModel):
 type Request = Annotated[
     FlashRequest
     | DumpRequest
+    | FlashBytesRequest
+    | DumpBytesRequest
+    | ReadMemoryRequest
+    | WriteMemoryRequest
     | StartRequest
     | WaitRequest
     | UnpauseRequest
     | StopRequest
     | StatusRequest
+    | StepRequest
+    | SubscribeRequest
     | SerialRequest,
     Field(discriminator="type"),
 ]
@@ -199,6 +452,13 @@ class SuccessResponse(BaseModel):
     message: str
 
 
+class DataResponse(BaseModel):
+    """Followed by exactly `size` raw bytes."""
+
+    type: Literal["data"]
+    size: int
+
+
 class StatusResponse(BaseModel):
     type: Literal["status"]
     running: bool
@@ -222,17 +482,261 @@ class StatusResponse(BaseModel):
     mtime: int
 
 
+CSR_NAMES = (
+    "mscratch",
+    "mtvec",
+    "mepc",
+    "mcause",
+    "mtval",
+    "mstatus",
+    "mip",
+    "mie",
+    "mcycle",
+    "minstret",
+    "mtime",
+)
+
+
+class StatusEvent(BaseModel):
+    """A status update pushed by the server after a `SubscribeRequest`.
+
+    Registers and CSRs are only included if they changed since the previous event,
+    and `error_output` is None if unchanged. The first event is always complete.
+    """
+
+    type: Literal["event"]
+    running: bool
+    paused: bool
+    state: str
+    error_output: str | None
+    pc: int | None
+    instruction: int | None
+    privilege_mode: int | None
+    registers: dict[int, int]
+    csrs: dict[str, int]
+
+    @classmethod
+    def diff(cls, previous: StatusResponse | None, status: StatusResponse):
+        return cls(
+            type="event",
+            running=status.running,
+            paused=status.paused,
+            state=status.state,
+            error_output=(
+                status.error_output
+                if previous is None or status.error_output != previous.error_output
+                else None
+            ),
+            pc=status.pc,
+            instruction=status.instruction,
+            privilege_mode=status.privilege_mode,
+            registers={
+                i: value
+                for i, value in enumerate(status.registers)
+                if previous is None or value != previous.registers[i]
+            },
+            csrs={
+                name: getattr(status, name)
+                for name in CSR_NAMES
+                if previous is None or getattr(status, name) != getattr(previous, name)
+            },
+        )
+
+    def apply(self, previous: StatusResponse | None) -> StatusResponse:
+        """Returns the full status after this event."""
+
+        if previous is None:
+            return StatusResponse(
+                type="status",
+                running=self.running,
+                paused=self.paused,
+                state=self.state,
+                error_output=self.error_output or "",
+                pc=self.pc,
+                instruction=self.instruction,
+                privilege_mode=self.privilege_mode,
+                registers=[self.registers[i] for i in range(len(self.registers))],
+                **self.csrs,
+            )
+
+        registers = previous.registers
+        if self.registers:
+            registers = registers.copy()
+            for i, value in self.registers.items():
+                registers[i] = value
+
+        return previous.model_copy(
+            update={
+                "running": self.running,
+                "paused": self.paused,
+                "state": self.state,
+                "pc": self.pc,
+                "instruction": self.instruction,
+                "privilege_mode": self.privilege_mode,
+                "registers": registers,
+                **self.csrs,
+                **(
+                    {"error_output": self.error_output}
+                    if self.error_output is not None
+                    else {}
+                ),
+            }
+        )
+
+
 class ErrorResponse(BaseModel):
     type: Literal["error"]
     message: str
 
 
 type Response = Annotated[
-    SuccessResponse | StatusResponse | ErrorResponse,
+    SuccessResponse | DataResponse | StatusResponse | StatusEvent | ErrorResponse,
     Field(discriminator="type"),
 ]
 
 
+TRACE_RECORD = struct.Struct("<IIBI")
+
+
+class TraceRecord(NamedTuple):
+    """An instruction executed by a `StepRequest`."""
+
+    pc: int
+    instruction: int
+    rd: int
+    """The register changed by the instruction, or 0 if none."""
+    value: int
+    """The new value of `rd`."""
+
+    def pack(self) -> bytes:
+        return TRACE_RECORD.pack(*self)
+
+
+def parse_trace(data: bytes | bytearray | memoryview) -> list[TraceRecord]:
+    return [TraceRecord._make(fields) for fields in TRACE_RECORD.iter_unpack(data)]
+
+
+# requests that can't change memory behind the page cache's back
+CACHE_SAFE_REQUESTS = (
+    StatusRequest,
+    DumpRequest,
+    DumpBytesRequest,
+    ReadMemoryRequest,
+    WriteMemoryRequest,  # invalidates the pages it writes to
+)
+
+PAGE_SIZE = 1024
+
+
+class PageCache:
+    """An LRU cache of pages of processor memory, for `read_memory`.
+
+    `generation` is incremented whenever pages are invalidated, so reads that were
+    in flight at the time don't store stale data.
+    """
+
+    def __init__(self, max_pages: int):
+        self.max_pages = max_pages
+        self.generation = 0
+        self._pages = OrderedDict[tuple[MemorySpace, int], bytes]()
+
+    def lookup(
+        self,
+        space: MemorySpace,
+        address: int,
+        size: int,
+    ) -> tuple[dict[int, bytes], list[tuple[int, int]]]:
+        """Returns the cached pages covering a read, and the `(address, size)` runs of
+        pages which need to be fetched."""
+
+        if address < 0 or size < 0:
+            raise ValueError("Address and size must not be negative.")
+
+        pages = dict[int, bytes]()
+        missing = list[tuple[int, int]]()
+        for page in range(
+            address - address % PAGE_SIZE,
+            address + size,
+            PAGE_SIZE,
+        ):
+            data = self._pages.get((space, page))
+            if data is not None:
+                self._pages.move_to_end((space, page))
+                pages[page] = data
+            elif missing and sum(missing[-1]) == page:
+                start, length = missing[-1]
+                missing[-1] = (start, length + PAGE_SIZE)
+            else:
+                missing.append((page, PAGE_SIZE))
+        return pages, missing
+
+    def store(
+        self,
+        space: MemorySpace,
+        address: int,
+        data: bytes | bytearray | memoryview,
+        generation: int,
+    ) -> dict[int, bytes]:
+        """Splits a fetched run into pages, and caches them if nothing was invalidated
+        since `generation`."""
+
+        pages = {
+            address + i: bytes(data[i : i + PAGE_SIZE])
+            for i in range(0, len(data), PAGE_SIZE)
+        }
+        if generation == self.generation and self.max_pages > 0:
+            for page, page_data in pages.items():
+                self._pages[(space, page)] = page_data
+                self._pages.move_to_end((space, page))
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return pages
+
+    def invalidate(self, space: MemorySpace, address: int, size: int):
+        self.generation += 1
+        for page in range(address - address % PAGE_SIZE, address + size, PAGE_SIZE):
+            self._pages.pop((space, page), None)
+
+    def clear(self):
+        self.generation += 1
+        self._pages.clear()
+
+    @staticmethod
+    def join(pages: dict[int, bytes], address: int, size: int) -> memoryview:
+        result = bytearray()
+        for page in range(address - address % PAGE_SIZE, address + size, PAGE_SIZE):
+            data = pages.get(page, b"")
+            start = max(address - page, 0)
+            end = min(address + size - page, PAGE_SIZE)
+            if len(data) < end:
+                raise ValueError(
+                    f"Read of {size} bytes at 0x{address:08x} is out of range."
+                )
+            result += data[start:end]
+        return memoryview(result)
+
+
+def _encode_request(request: RequestModel) -> bytes:
+    return request.__pydantic_serializer__.to_json(request) + b"\n"
+
+
+# requests are frozen (so hashable), but pyright only knows that for models declared
+# with frozen=True as a class argument
+encode_request = cast(
+    Callable[[RequestModel], bytes],
+    lru_cache(maxsize=256)(_encode_request),
+)
+"""Returns the JSON line for a request. Encodings are cached, since clients send the
+same few requests over and over."""
+
+
+@cache
+def response_adapter(response_type: Any) -> TypeAdapter[Any]:
+    # Any, since pyright doesn't allow a runtime union as a type form
+    union: Any = response_type | ErrorResponse
+    return TypeAdapter[Any](union)
+
+
 class ProcessorError(RuntimeError):
     def __init__(self, response: ErrorResponse):
         super().__init__(response.message)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import logging
+import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator
+
+from .processor_access import ProcessorAccess
+
+logger = logging.getLogger(__name__)
+
+type Endpoint = tuple[str, int]
+
+
+def parse_endpoints(value: str, *, default_port: int = 5000) -> list[Endpoint]:
+    """Parses a comma- or whitespace-separated list of `host:port` entries."""
+
+    endpoints = list[Endpoint]()
+    for entry in value.replace(",", " ").split():
+        host, sep, port = entry.rpartition(":")
+        if not sep:
+            host, port = entry, str(default_port)
+        if not host:
+            raise ValueError(f"Invalid processor endpoint: {entry!r}")
+        endpoints.append((host, int(port)))
+    if not endpoints:
+        raise ValueError("No processor endpoints given")
+    return endpoints
+
+
+class ProcessorPool:
+    """A pool of connections to several ProcessorAccess servers, eg. one per CPU in
+    a world, which runs jobs concurrently on whichever CPU is idle.
+
+    Each job gets exclusive use of one CPU while it runs. If a job fails with a
+    connection error or timeout, the connection is reopened and the job is retried from the start,
+    so jobs should be idempotent (eg. stop, flash, start, wait, dump).
+    """
+
+    def __init__(
+        self,
+        endpoints: Iterable[Endpoint],
+        *,
+        retries: int = 3,
+        retry_delay: float = 1,
+        log_level: int = logging.DEBUG,
+    ):
+        self.endpoints = list(endpoints)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.log_level = log_level
+
+        self._idle = queue.SimpleQueue[Endpoint]()
+        self._connections = dict[Endpoint, ProcessorAccess]()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def connect(self):
+        for endpoint in self.endpoints:
+            self._connections[endpoint] = self._connect(endpoint)
+            self._idle.put(endpoint)
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(self.endpoints),
+            thread_name_prefix="ProcessorPool",
+        )
+
+    def disconnect(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        for processor in self._connections.values():
+            processor.disconnect()
+        self._connections.clear()
+        while not self._idle.empty():
+            self._idle.get_nowait()
+
+    def submit[T](self, job: Callable[[ProcessorAccess], T]) -> Future[T]:
+        """Schedules `job` to run on the next idle CPU."""
+
+        if self._executor is None:
+            raise ConnectionError("Not connected")
+        return self._executor.submit(self._run, job)
+
+    def map[T, R](
+        self,
+        job: Callable[[ProcessorAccess, T], R],
+        items: Iterable[T],
+    ) -> Iterator[R]:
+        """Runs `job` for each item on the idle CPUs, and yields the results in the
+        order of `items`.
+
+        If a job raises, the exception is raised here and pending jobs are cancelled.
+        """
+
+        futures = [
+            self.submit(lambda processor, item=item: job(processor, item))
+            for item in items
+        ]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _run[T](self, job: Callable[[ProcessorAccess], T]) -> T:
+        endpoint = self._idle.get()
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    return job(self._connections[endpoint])
+                except (ConnectionError, TimeoutError) as e:
+                    if attempt == self.retries:
+                        raise
+                    host, port = endpoint
+                    logger.warning(
+                        f"Connection to {host}:{port} failed ({e}), retrying ({attempt + 1}/{self.retries})"
+                    )
+                    self._connections[endpoint].disconnect()
+                    time.sleep(self.retry_delay)
+                    self._connections[endpoint] = self._reconnect(endpoint)
+            raise AssertionError("unreachable")
+        finally:
+            self._idle.put(endpoint)
+
+    def _reconnect(self, endpoint: Endpoint) -> ProcessorAccess:
+        # the server may still be restarting, so keep trying until the retry budget
+        # for this attempt is used up
+        for attempt in range(self.retries + 1):
+            try:
+                return self._connect(endpoint)
+            except OSError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.retry_delay)
+        raise AssertionError("unreachable")
+
+    def _connect(self, endpoint: Endpoint) -> ProcessorAccess:
+        host, port = endpoint
+        processor = ProcessorAccess(host, port, log_level=self.log_level)
+        try:
+            processor.connect()
+        except OSError:
+            processor.disconnect()
+            raise
+        return processor
+
+    def __enter__(self):
+        try:
+            self.connect()
+        except BaseException:
+            self.disconnect()
+            raise
+        return self
+
+    def __exit__(self, *_: Any):
+        self.disconnect()
+        return False  # propagate exceptions
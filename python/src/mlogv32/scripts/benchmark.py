@@ -0,0 +1,781 @@
+import asyncio
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Annotated, Any, Callable
+
+from lark import Token
+from lark.exceptions import LarkError
+from pydantic import TypeAdapter
+from pymsch import ProcessorLink
+from typer import Argument, Option, Typer
+
+from mlogv32.async_processor_access import AsyncProcessorAccess
+from mlogv32.emulator import EmulatedCpu, World
+from mlogv32.preprocessor.app import create_jinja_env
+from mlogv32.preprocessor.cache import JinjaBytecodeCache
+from mlogv32.preprocessor.extensions import LocalVariables
+from mlogv32.preprocessor.models import BuildConfig
+from mlogv32.preprocessor.parser.mlog import (
+    AST,
+    Label,
+    ScanError,
+    get_parser,
+    parse_mlog,
+    scan_mlog,
+)
+from mlogv32.processor_access import (
+    ErrorResponse,
+    ProcessorAccess,
+    ProcessorError,
+    Request,
+    StatusResponse,
+)
+from mlogv32.processor_pool import ProcessorPool
+from mlogv32.utils.msch import ProcessorConfigCompressor, ProcessorConfigUTF8
+from mlogv32.utils.rom import RomEncoder, rom_proc_config
+
+from .stub_server import RAM_START, StubProcessor, StubServer
+
+app = Typer(
+    pretty_exceptions_show_locals=False,
+)
+
+
+@app.callback()
+def main():
+    """Benchmarks for the mlogv32 build and debugging tools."""
+
+
+@app.command()
+def compress(
+    worker_path: Annotated[Path, Option("--worker")] = Path("src/cpu/worker.mlog"),
+    sizes: Annotated[list[int], Option("-s", "--size")] = [8, 16, 32, 64],
+    jobs: Annotated[int | None, Option("-j", "--jobs")] = None,
+):
+    """Benchmark CPU block config compression against grid size.
+
+    Run `python -m mlogv32.preprocessor build` first to generate the worker code.
+    """
+
+    code = worker_path.read_text("utf-8")
+
+    print_row("size", "workers", "naive", "shared", "shared+pool", "speedup")
+    for size in sizes:
+        links_list = [
+            worker_links(x, y) for x in range(16, 16 + size) for y in range(size)
+        ][1:]
+
+        naive = timed(
+            lambda: [
+                ProcessorConfigUTF8(code, links).compress() for links in links_list
+            ]
+        )
+        shared = timed(
+            lambda: ProcessorConfigCompressor(code, max_workers=1).compress_many(
+                links_list
+            )
+        )
+        pooled = timed(
+            lambda: ProcessorConfigCompressor(code, max_workers=jobs).compress_many(
+                links_list
+            )
+        )
+
+        print_row(
+            f"{size}x{size}",
+            len(links_list),
+            f"{naive:.3f}s",
+            f"{shared:.3f}s",
+            f"{pooled:.3f}s",
+            f"{naive / pooled:.1f}x",
+        )
+
+
+@app.command()
+def rom(
+    bin_path: Annotated[Path | None, Option("--bin")] = None,
+    size_mb: Annotated[int, Option("--size-mb")] = 8,
+    zero_fraction: Annotated[float, Option("--zero-fraction")] = 0.25,
+):
+    """Benchmark ROM payload encoding for a binary image.
+
+    If --bin is not given, a random image is generated with the given fraction of
+    all-zero procs.
+    """
+
+    encoder = RomEncoder()
+
+    if bin_path:
+        data = bin_path.read_bytes()
+    else:
+        procs = size_mb * 1024 * 1024 // encoder.proc_bytes
+        zero_procs = int(procs * zero_fraction)
+        data = os.urandom((procs - zero_procs) * encoder.proc_bytes) + bytes(
+            zero_procs * encoder.proc_bytes
+        )
+
+    def naive():
+        payloads = list[str]()
+        for i in range(0, len(data), 16384):
+            payloads.append("".join(chr(174 + c) for c in data[i : i + 16384]))
+        return payloads
+
+    def vectorized():
+        return list(encoder.iter_payloads(data))
+
+    assert [p for p in naive() if p.strip(chr(174))] == [
+        p for p in vectorized() if p
+    ], "encoders disagree"
+
+    print(f"Image size: {len(data)} bytes")
+    print_row("stage", "naive", "vectorized", "speedup")
+
+    naive_time = timed(naive)
+    vectorized_time = timed(vectorized)
+    print_row(
+        "encode",
+        f"{naive_time:.3f}s",
+        f"{vectorized_time:.3f}s",
+        f"{naive_time / vectorized_time:.1f}x",
+    )
+
+    naive_time = timed(lambda: [rom_proc_config(p) for p in naive()])
+    vectorized_time = timed(
+        lambda: [rom_proc_config(p) if p else None for p in vectorized()]
+    )
+    print_row(
+        "encode+compress",
+        f"{naive_time:.3f}s",
+        f"{vectorized_time:.3f}s",
+        f"{naive_time / vectorized_time:.1f}x",
+    )
+
+
+@app.command()
+def jinja(
+    yaml_path: Annotated[Path, Option("--yaml")] = Path("src/cpu/cpu.yaml"),
+    repeat: Annotated[int, Option("-n", "--repeat")] = 5,
+):
+    """Benchmark template compilation with and without the bytecode cache.
+
+    Each measurement uses a fresh environment, like a new preprocessor invocation.
+    "cold" starts from an empty cache directory, and "warm" reuses it.
+    """
+
+    config = BuildConfig.load(yaml_path)
+    templates = [
+        (config.templates.worker, [LocalVariables]),
+        (config.templates.controller, [LocalVariables]),
+        (config.templates.debugger, []),
+        (config.templates.display, []),
+    ]
+
+    print_row("template", "no cache", "cold", "warm", "speedup")
+    with TemporaryDirectory() as tmp:
+        for path, extensions in templates:
+
+            def compile_template(bytecode_cache: JinjaBytecodeCache | None):
+                env = create_jinja_env(
+                    path.parent,
+                    extensions,
+                    bytecode_cache=bytecode_cache,
+                )
+                env.get_template(path.name)
+
+            uncached = min(timed(lambda: compile_template(None)) for _ in range(repeat))
+
+            cold = float("inf")
+            for i in range(repeat):
+                bytecode_cache = JinjaBytecodeCache(Path(tmp) / str(i))
+                cold = min(cold, timed(lambda: compile_template(bytecode_cache)))
+
+            bytecode_cache = JinjaBytecodeCache(Path(tmp) / "0")
+            warm = min(
+                timed(lambda: compile_template(bytecode_cache)) for _ in range(repeat)
+            )
+
+            print_row(
+                path.name.removesuffix(".mlog.jinja"),
+                f"{uncached:.3f}s",
+                f"{cold:.3f}s",
+                f"{warm:.3f}s",
+                f"{uncached / warm:.1f}x",
+            )
+
+
+@app.command()
+def startup(
+    repeat: Annotated[int, Option("-n", "--repeat")] = 5,
+):
+    """Benchmark preprocessor startup time with a cold and warm parser cache.
+
+    Each command is run in a new process. "cold" uses an empty cache directory for
+    every run, so the LALR tables are built from scratch like before they were cached.
+    """
+
+    with TemporaryDirectory() as tmp:
+        labels_path = Path(tmp) / "small.mlog"
+        labels_path.write_text("foo:\nset a 1\nbar:\nend\n", "utf-8")
+
+        commands = {
+            "--help": ["--help"],
+            "labels": ["labels", str(labels_path)],
+        }
+
+        print_row("command", "cold", "warm", "speedup")
+        for name, args in commands.items():
+
+            def run(cache_dir: Path):
+                subprocess.run(
+                    [sys.executable, "-m", "mlogv32.preprocessor", *args],
+                    env=os.environ | {"MLOGV32_CACHE_DIR": str(cache_dir)},
+                    stdout=subprocess.DEVNULL,
+                    check=True,
+                )
+
+            cold = min(
+                timed(lambda: run(Path(tmp) / f"cold-{name}-{i}"))
+                for i in range(repeat)
+            )
+
+            run(Path(tmp) / "warm")
+            warm = min(timed(lambda: run(Path(tmp) / "warm")) for _ in range(repeat))
+
+            print_row(
+                name,
+                f"{cold:.3f}s",
+                f"{warm:.3f}s",
+                f"{cold / warm:.1f}x",
+            )
+
+
+@app.command()
+def parse(
+    worker_path: Annotated[Path, Option("--worker")] = Path("src/cpu/worker.mlog"),
+    root: Annotated[Path, Option("--root")] = Path("."),
+    repeat: Annotated[int, Option("-n", "--repeat")] = 5,
+):
+    """Check the fast mlog scanner against the Lark parser, then benchmark both.
+
+    Every .mlog file under --root is parsed with both parsers, and the resulting ASTs
+    (including token types and positions) must be identical. Run `python -m
+    mlogv32.preprocessor build` first so the rendered templates are included.
+    """
+
+    paths = [
+        path
+        for path in sorted(root.rglob("*.mlog"))
+        if not any(
+            part.startswith(".") or part == "node_modules" for part in path.parts
+        )
+    ]
+    for path in paths:
+        text = path.read_text("utf-8")
+        try:
+            want = ast_key(parse_mlog(text, fast=False))
+        except LarkError:
+            want = None
+        try:
+            got = ast_key(scan_mlog(text))
+        except ScanError:
+            got = None
+        if want != got:
+            raise AssertionError(f"Parsers disagree on file: {path}")
+    print(f"Checked {len(paths)} files.")
+
+    text = worker_path.read_text("utf-8")
+    get_parser()  # exclude building the parser
+
+    lark = min(timed(lambda: parse_mlog(text, fast=False)) for _ in range(repeat))
+    scan = min(timed(lambda: scan_mlog(text)) for _ in range(repeat))
+
+    print_row("file", "lark", "scanner", "speedup")
+    print_row(
+        worker_path.name,
+        f"{lark:.3f}s",
+        f"{scan:.3f}s",
+        f"{lark / scan:.1f}x",
+    )
+
+
+@app.command()
+def emulator(
+    bin_paths: Annotated[list[Path] | None, Argument(show_default=False)] = None,
+    yaml_path: Annotated[Path, Option("--yaml")] = Path("src/cpu/cpu.yaml"),
+    config: Annotated[str, Option("-c", "--config")] = "micropython",
+    width: Annotated[int, Option("-w", "--width")] = 4,
+    height: Annotated[int, Option("-h", "--height")] = 4,
+    max_ticks: Annotated[int, Option("-t", "--ticks")] = 600,
+):
+    """Benchmark the compiled mlog emulator against the reference interpreter.
+
+    Each binary is built into a CPU schematic, then run with both engines until the
+    CPU halts or for --ticks ticks after powering on. Both runs must execute the same
+    number of mlog and RISC-V instructions.
+
+    Defaults to build/*.bin (`make asm`) and coremark/coremark/coremark.bin (`make
+    coremark`).
+    """
+
+    if not bin_paths:
+        bin_paths = sorted(Path("build").glob("*.bin"))
+        if (coremark := Path("coremark/coremark/coremark.bin")).exists():
+            bin_paths.append(coremark)
+    if not bin_paths:
+        raise FileNotFoundError("No binaries found, run `make asm` first")
+
+    print_row("binary", "ticks", "mlog", "RISC-V", "interpreted", "compiled", "speedup")
+    with TemporaryDirectory() as tmp:
+        for bin_path in bin_paths:
+            schematic_path = Path(tmp) / f"{bin_path.stem}.msch"
+            subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "mlogv32.preprocessor",
+                    "build",
+                    str(yaml_path),
+                    "--config",
+                    config,
+                    "--width",
+                    str(width),
+                    "--height",
+                    str(height),
+                    "--cpu",
+                    "--peripherals",
+                    "--memory",
+                    "--bin",
+                    str(bin_path),
+                    "--output",
+                    str(schematic_path),
+                ],
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+
+            results = list[tuple[int, int, int, float]]()
+            for compiled in [False, True]:
+                world = World.load(schematic_path, compiled=compiled)
+                cpu = EmulatedCpu.find(world)
+                cpu.power_on()
+
+                start_ticks = world.ticks
+                start_executed = world.executed
+
+                def run():
+                    while not cpu.halted and world.ticks - start_ticks < max_ticks:
+                        world.tick()
+                        for uart in cpu.uarts:
+                            uart.read()
+
+                elapsed = timed(run)
+                results.append(
+                    (
+                        world.ticks - start_ticks,
+                        world.executed - start_executed,
+                        cpu.minstret,
+                        elapsed,
+                    )
+                )
+
+            (ticks, executed, minstret, interpreted), (*compiled_result, compiled) = (
+                results
+            )
+            if (ticks, executed, minstret) != tuple(compiled_result):
+                raise AssertionError(f"Engines disagree on binary: {bin_path}")
+
+            print_row(
+                bin_path.stem,
+                ticks,
+                executed,
+                minstret,
+                f"{executed / interpreted:,.0f}/s",
+                f"{executed / compiled:,.0f}/s",
+                f"{interpreted / compiled:.1f}x",
+            )
+
+
+@app.command()
+def processor_access(
+    steps: Annotated[int, Option("-n", "--steps")] = 2000,
+):
+    """Benchmark ProcessorAccess request latency against a local stand-in server.
+
+    Runs the single-step loop from scripts/debug.py (wait, status, and unpause for each
+    instruction) against `scripts/stub_server.py`, with the current client and with the
+    previous implementation, which opened a new socket reader and built a new
+    TypeAdapter for every response.
+    """
+
+    server = StubServer(("localhost", 0), StubProcessor())
+    server.serve_in_background()
+    host, port = server.server_address[:2]
+
+    print_row("client", "steps", "round trips", "time", "round trips/s", "speedup")
+    try:
+        baseline = None
+        for name, client_type in [
+            ("previous", PreviousProcessorAccess),
+            ("current", ProcessorAccess),
+        ]:
+            with client_type(str(host), port) as processor:
+                processor.start(single_step=True)
+
+                def step():
+                    for _ in range(steps):
+                        processor.wait(stopped=True, paused=True)
+                        processor.status()
+                        processor.unpause()
+
+                elapsed = timed(step)
+                processor.stop()
+
+            round_trips = steps * 3
+            baseline = baseline or elapsed
+            print_row(
+                name,
+                steps,
+                round_trips,
+                f"{elapsed:.3f}s",
+                f"{round_trips / elapsed:,.0f}/s",
+                f"{baseline / elapsed:.1f}x",
+            )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@app.command()
+def status_events(
+    steps: Annotated[int, Option("-n", "--steps")] = 2000,
+    latency: Annotated[float, Option("--latency")] = 0.0005,
+):
+    """Benchmark single-step tracing with pushed status events and batched steps
+    against polling.
+
+    Traces --steps instructions from `scripts/stub_server.py`, first with the
+    wait/status/unpause loop that scripts/debug.py used to run, then with
+    `ProcessorAccess.subscribe(unpause=True)`, then with `ProcessorAccess.run_until`.
+    --latency simulates the network round trip, in seconds.
+    """
+
+    server = StubServer(
+        ("localhost", 0),
+        StubProcessor(halt_after=steps),
+        latency=latency,
+    )
+    server.serve_in_background()
+    host, port = str(server.server_address[0]), server.server_address[1]
+
+    def polling(processor: ProcessorAccess):
+        result = list[StatusResponse]()
+        while True:
+            processor.wait(stopped=True, paused=True)
+            result.append(status := processor.status())
+            if not status.running:
+                return result
+            processor.unpause()
+
+    def subscription(processor: ProcessorAccess):
+        return list(processor.subscribe(unpause=True))
+
+    def batched(processor: ProcessorAccess):
+        return list(processor.run_until())
+
+    print_row("client", "steps", "time", "steps/s", "speedup")
+    try:
+        baseline = None
+        results = dict[str, list[Any]]()
+        for name, trace in [
+            ("polling", polling),
+            ("subscribe", subscription),
+            ("run_until", batched),
+        ]:
+            with ProcessorAccess(host, port, log_level=logging.NOTSET) as processor:
+                processor.start(single_step=True)
+                start = time.perf_counter()
+                results[name] = trace(processor)
+                elapsed = time.perf_counter() - start
+                executed = processor.status().minstret
+                processor.stop()
+
+            baseline = baseline or elapsed
+            print_row(
+                name,
+                executed,
+                f"{elapsed:.3f}s",
+                f"{executed / elapsed:,.0f}/s",
+                f"{baseline / elapsed:.1f}x",
+            )
+
+        if results["subscribe"] != results["polling"]:
+            print("[WARNING] Subscription trace differs from polling")
+        if [record.pc for record in results["run_until"]] != [
+            status.pc for status in results["polling"][:-1]
+        ]:
+            print("[WARNING] run_until trace differs from polling")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@app.command()
+def memory(
+    reads: Annotated[int, Option("-n", "--reads")] = 2000,
+    size: Annotated[int, Option("--size")] = 8,
+    span: Annotated[int, Option("--span")] = 0x4000,
+    latency: Annotated[float, Option("--latency")] = 0.0005,
+):
+    """Benchmark small random reads with ProcessorAccess.read_memory, with and
+    without the page cache.
+
+    Reads --size bytes at --reads random word-aligned addresses in the first --span
+    bytes of RAM on `scripts/stub_server.py`, like walking a data structure.
+    --latency simulates the network round trip, in seconds.
+    """
+
+    processor = StubProcessor()
+    processor.ram[:] = random.randbytes(len(processor.ram))
+    server = StubServer(("localhost", 0), processor, latency=latency)
+    server.serve_in_background()
+    host, port = str(server.server_address[0]), server.server_address[1]
+
+    addresses = [RAM_START + random.randrange(0, span - size, 4) for _ in range(reads)]
+
+    print_row("cache", "reads", "time", "reads/s", "speedup")
+    try:
+        baseline = None
+        for cache_size in [0, 64]:
+            with ProcessorAccess(
+                host, port, log_level=logging.NOTSET, page_cache_size=cache_size
+            ) as client:
+                elapsed = timed(
+                    lambda: [client.read_memory(address, size) for address in addresses]
+                )
+                for address in addresses[:100]:
+                    offset = address - RAM_START
+                    if (
+                        client.read_memory(address, size)
+                        != memoryview(processor.ram)[offset : offset + size]
+                    ):
+                        print("[WARNING] Read returned the wrong data")
+                        break
+
+            baseline = baseline or elapsed
+            print_row(
+                f"{cache_size} pages",
+                reads,
+                f"{elapsed:.3f}s",
+                f"{reads / elapsed:,.0f}/s",
+                f"{baseline / elapsed:.1f}x",
+            )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@app.command()
+def async_processor_access(
+    requests: Annotated[int, Option("-n", "--requests")] = 5000,
+    depths: Annotated[list[int], Option("-d", "--depth")] = [1, 4, 16, 64],
+    latency: Annotated[float, Option("--latency")] = 0.001,
+):
+    """Benchmark status request throughput of AsyncProcessorAccess with pipelining.
+
+    Sends --requests status requests to `scripts/stub_server.py` with the blocking
+    ProcessorAccess, then with AsyncProcessorAccess keeping up to --depth requests
+    outstanding on one connection. --latency simulates the network round trip to a
+    remote server, in seconds.
+    """
+
+    server = StubServer(("localhost", 0), StubProcessor(), latency=latency)
+    server.serve_in_background()
+    host, port = str(server.server_address[0]), server.server_address[1]
+
+    async def pipelined(depth: int):
+        async with AsyncProcessorAccess(host, port) as processor:
+
+            async def worker(count: int):
+                for _ in range(count):
+                    await processor.status()
+
+            await asyncio.gather(
+                *(
+                    worker(requests // depth + (i < requests % depth))
+                    for i in range(depth)
+                )
+            )
+
+    print_row("client", "depth", "requests", "time", "requests/s", "speedup")
+    try:
+        with ProcessorAccess(host, port) as processor:
+            baseline = timed(lambda: [processor.status() for _ in range(requests)])
+        print_row(
+            "blocking",
+            1,
+            requests,
+            f"{baseline:.3f}s",
+            f"{requests / baseline:,.0f}/s",
+            "1.0x",
+        )
+
+        for depth in depths:
+            elapsed = timed(lambda: asyncio.run(pipelined(depth)))
+            print_row(
+                "async",
+                depth,
+                requests,
+                f"{elapsed:.3f}s",
+                f"{requests / elapsed:,.0f}/s",
+                f"{baseline / elapsed:.1f}x",
+            )
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@app.command()
+def processor_pool(
+    tests: Annotated[int, Option("-n", "--tests")] = 200,
+    cpus: Annotated[list[int], Option("-c", "--cpus")] = [1, 2, 4, 8],
+    latency: Annotated[float, Option("--latency")] = 0.002,
+):
+    """Benchmark running riscof-style tests on several CPUs with ProcessorPool.
+
+    Each test sends stop, flash_bytes, start, wait, dump_bytes and status to one of
+    --cpus stub servers (`scripts/stub_server.py`). --latency is the time each
+    request takes, in seconds, standing in for the CPU actually running the test.
+    """
+
+    servers = [
+        StubServer(("localhost", 0), StubProcessor(halt_after=100), latency=latency)
+        for _ in range(max(cpus))
+    ]
+    for server in servers:
+        server.serve_in_background()
+
+    rom = bytes(1024)
+
+    def run_test(processor: ProcessorAccess, _: int):
+        processor.stop()
+        processor.flash_bytes(rom)
+        processor.start()
+        processor.wait(stopped=True, paused=False)
+        signature = processor.dump_bytes(size=64)
+        return signature, processor.status().error_output
+
+    print_row("cpus", "tests", "time", "tests/s", "speedup")
+    baseline = None
+    try:
+        for count in cpus:
+            endpoints = [
+                (str(server.server_address[0]), server.server_address[1])
+                for server in servers[:count]
+            ]
+            with ProcessorPool(endpoints, log_level=logging.NOTSET) as pool:
+                elapsed = timed(lambda: list(pool.map(run_test, range(tests))))
+            baseline = baseline or elapsed
+            print_row(
+                count,
+                tests,
+                f"{elapsed:.3f}s",
+                f"{tests / elapsed:,.1f}/s",
+                f"{baseline / elapsed:.1f}x",
+            )
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+
+class PreviousProcessorAccess(ProcessorAccess):
+    """The request handling from before ProcessorAccess kept a buffered reader and
+    cached its validators, for comparison."""
+
+    def _send_request(
+        self,
+        request: Request,
+        payload: bytes | bytearray | memoryview | None = None,
+    ) -> None:
+        message = request.model_dump_json() + "\n"
+        processor_access_logger.log(
+            self.log_level, f"Sending request: {message.rstrip()}"
+        )
+        self.socket.sendall(message.encode("utf-8"))
+        if payload is not None:
+            self.socket.sendall(payload)
+
+    def _recv_response(self, response_type: Any) -> Any:
+        with self.socket.makefile("r", encoding="utf-8") as f:
+            line = f.readline()
+        processor_access_logger.log(
+            self.log_level, f"Received response: {line.rstrip()}"
+        )
+        union: Any = response_type | ErrorResponse
+        match TypeAdapter[Any](union).validate_json(line):
+            case ErrorResponse() as e:
+                raise ProcessorError(e)
+            case response:
+                return response
+
+
+processor_access_logger = logging.getLogger("mlogv32.processor_access")
+
+
+def ast_key(ast: AST):
+    result = list[tuple[str, list[tuple[object, ...]]]]()
+    for node in ast:
+        match node:
+            case Label(name=name):
+                tokens = [name]
+            case _:
+                tokens = [node.name, *node.args]
+        result.append((type(node).__name__, [token_key(token) for token in tokens]))
+    return result
+
+
+def token_key(token: Token):
+    return (
+        token.type,
+        str(token),
+        token.start_pos,
+        token.line,
+        token.column,
+        token.end_line,
+        token.end_column,
+        token.end_pos,
+    )
+
+
+def worker_links(x: int, y: int):
+    # same shape as the worker links generated by the preprocessor
+    links = [
+        *(ProcessorLink(i % 4, 16 + i // 4, f"processor{i + 1}") for i in range(16)),
+        *(ProcessorLink(5 + i // 2 * 2, 18 - i % 2 * 2, "") for i in range(4)),
+        *(ProcessorLink(9, 16 + i, "") for i in range(4)),
+        ProcessorLink(4, 17, "processor20"),
+        ProcessorLink(4, 18, ""),
+        ProcessorLink(16, 0, ""),
+        ProcessorLink(11, 19, ""),
+    ]
+    return [ProcessorLink(link.x - x, link.y - y, link.name) for link in links]
+
+
+def timed(f: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def print_row(*values: object):
+    print("".join(f"{value!s:>14}" for value in values))
+
+
+if __name__ == "__main__":
+    app()
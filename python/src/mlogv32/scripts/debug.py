@@ -7,7 +7,7 @@ from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
 from typer import Option, Typer
 
-from mlogv32.processor_access import ProcessorAccess, StatusResponse
+from mlogv32.processor_access import ProcessorAccess, StatusResponse, TraceRecord
 
 logger = logging.getLogger(__name__)
 
@@ -58,10 +58,31 @@ def main(
     sail: bool = False,
     log_output: Path = Path("debug.log"),
     json_output: Path = Path("debug.json"),
+    trace: bool = False,
+    until_pc: str | None = None,
+    until_instret: int | None = None,
     verbose: Annotated[bool, Option("-v", "--verbose")] = False,
 ):
+    """Single-step the processor until it stops, and log its state after each step.
+
+    With --trace, only the pc, instruction, and register written by each step are
+    logged, which the server collects in batches instead of pausing after every
+    step. --until-pc and --until-instret stop the trace early.
+    """
+
     setup_logging(verbose)
 
+    if trace:
+        return trace_main(
+            host,
+            port,
+            sail,
+            log_output,
+            json_output,
+            until_pc=int(until_pc, 0) if until_pc is not None else None,
+            until_instret=until_instret,
+        )
+
     def format_status(status: StatusResponse) -> str:
         match status:
             case StatusResponse(running=False):
@@ -127,10 +148,8 @@ def main(
         prev_output = ""
 
         try:
-            while True:
-                processor.wait(stopped=True, paused=True)
-
-                status = processor.status()
+            # the server unpauses after every step, until the processor stops
+            for status in processor.subscribe(unpause=True):
                 result.append(status)
 
                 bar.set_postfix_str(
@@ -160,13 +179,51 @@ def main(
                 )
                 f.write(filtered)
                 prev_formatted = formatted
+        finally:
+            json_output.write_bytes(TypeAdapter(list[StatusResponse]).dump_json(result))
+
+
+def trace_main(
+    host: str,
+    port: int,
+    sail: bool,
+    log_output: Path,
+    json_output: Path,
+    *,
+    until_pc: int | None,
+    until_instret: int | None,
+):
+    def format_record(record: TraceRecord) -> str:
+        lines = [
+            f"{'[M]' if sail else 'pc'}: 0x{record.pc:08X} (0x{record.instruction:08X})"
+        ]
+        if record.rd:
+            name = "" if sail else f" ({REGISTER_NAMES[record.rd]})"
+            lines.append(f"x{record.rd}{name} <- 0x{record.value:08X}")
+        return "\n".join(lines)
 
-                if not status.running:
-                    break
+    with (
+        ProcessorAccess(host, port) as processor,
+        log_output.open("w", encoding="utf-8") as f,
+        logging_redirect_tqdm(),
+        tqdm() as bar,
+    ):
+        if not processor.status().running:
+            processor.start(single_step=True)
 
-                processor.unpause()
+        result = list[TraceRecord]()
+        try:
+            for record in processor.run_until(pc=until_pc, instret=until_instret):
+                result.append(record)
+                bar.set_postfix_str(f"pc: {record.pc:#010x}")
+                bar.update(1)
+                f.write(format_record(record) + "\n")
         finally:
-            json_output.write_bytes(TypeAdapter(list[StatusResponse]).dump_json(result))
+            json_output.write_bytes(TypeAdapter(list[TraceRecord]).dump_json(result))
+
+        status = processor.status()
+        if status.error_output:
+            logger.warning(status.error_output)
 
 
 def setup_logging(verbose: bool = False):
@@ -0,0 +1,488 @@
+from __future__ import annotations
+
+import queue
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from typing import Annotated
+
+from pydantic import TypeAdapter, ValidationError
+from typer import Option, Typer
+
+from mlogv32.processor_access import (
+    DataResponse,
+    DumpBytesRequest,
+    DumpRequest,
+    ErrorResponse,
+    FlashBytesRequest,
+    FlashRequest,
+    MemorySpace,
+    ReadMemoryRequest,
+    Request,
+    SerialRequest,
+    StartRequest,
+    StatusEvent,
+    StatusRequest,
+    StatusResponse,
+    StepRequest,
+    StopRequest,
+    SubscribeRequest,
+    SuccessResponse,
+    TraceRecord,
+    UnpauseRequest,
+    WaitRequest,
+    WriteMemoryRequest,
+)
+
+_REQUEST_ADAPTER = TypeAdapter[Request](Request)
+
+RAM_START = 0x80000000
+
+
+@dataclass
+class DataFrame:
+    """A data response followed by its payload."""
+
+    response: DataResponse
+    data: bytes
+
+
+type StubResponse = SuccessResponse | StatusResponse | ErrorResponse | DataFrame
+
+
+@dataclass
+class StubProcessor:
+    """A fake CPU for `StubServer`, which executes instantly.
+
+    Without single-stepping, a started program runs to completion immediately. With
+    single-stepping, each unpause executes one instruction and pauses again. Either
+    way, the program halts after `halt_after` instructions, if set. Subscriptions
+    push an event for every single step. Serial streams echo back everything written
+    to them.
+    """
+
+    halt_after: int | None = None
+    ram_size: int = 0x10000
+
+    running: bool = False
+    paused: bool = False
+    single_step: bool = False
+    pc: int = 0
+    minstret: int = 0
+    registers: list[int] = field(default_factory=lambda: [0] * 32)
+    csrs: list[int] = field(default_factory=lambda: [0] * 4096)
+    rom: bytes = b""
+    ram: bytearray = field(init=False)
+
+    def __post_init__(self):
+        self.ram = bytearray(self.ram_size)
+
+    def handle(self, request: Request, payload: bytes = b"") -> StubResponse | None:
+        """Returns the response to a request, or None to disconnect.
+
+        `payload` is the inline data following a `FlashBytesRequest`.
+        """
+
+        match request:
+            case FlashRequest(path=path):
+                self.rom = path.read_bytes()
+                return success(
+                    f"Successfully flashed {len(self.rom)} bytes from {path} to ROM."
+                )
+
+            case FlashBytesRequest():
+                if len(payload) % 4 != 0:
+                    return error(
+                        "Bad request: Data length must be a multiple of 4 bytes."
+                    )
+                self.rom = payload
+                return success(f"Successfully flashed {len(self.rom)} bytes to ROM.")
+
+            case DumpRequest(path=path, address=address, bytes=size):
+                try:
+                    data = self.read_ram(address, size)
+                except ValueError as e:
+                    return error(f"Bad request: {e}")
+                path.write_bytes(data)
+                return success(
+                    f"Successfully dumped {len(data)} bytes from RAM to {path}."
+                )
+
+            case DumpBytesRequest(address=address, bytes=size):
+                try:
+                    data = self.read_ram(address, size)
+                except ValueError as e:
+                    return error(f"Bad request: {e}")
+                return DataFrame(DataResponse(type="data", size=len(data)), data)
+
+            case ReadMemoryRequest(space=space, address=address, size=size):
+                try:
+                    data = self.read_memory(space, address, size)
+                except ValueError as e:
+                    return error(f"Bad request: {e}")
+                return DataFrame(DataResponse(type="data", size=len(data)), data)
+
+            case WriteMemoryRequest(space=space, address=address):
+                try:
+                    self.write_memory(space, address, payload)
+                except ValueError as e:
+                    return error(f"Bad request: {e}")
+                return success(f"Successfully wrote {len(payload)} bytes to {space}.")
+
+            case StartRequest(single_step=single_step):
+                self.running = True
+                self.paused = single_step
+                self.single_step = single_step
+                self.pc = 0
+                self.minstret = 0
+                self.registers = [0] * 32
+                if not single_step:
+                    self.run()
+                return success("Processor started.")
+
+            case WaitRequest(stopped=stopped, paused=paused):
+                if stopped and not self.running:
+                    return success("Processor has stopped.")
+                if paused and self.paused:
+                    return success("Processor has paused.")
+                return error("Processor will never stop or pause.")
+
+            case UnpauseRequest():
+                if not self.running:
+                    return error("Bad request: Processor is not running!")
+                if self.single_step:
+                    self.step()
+                else:
+                    self.paused = False
+                    self.run()
+                return success("Processor unpaused.")
+
+            case StopRequest():
+                self.running = False
+                self.paused = False
+                self.single_step = False
+                return success("Processor stopped.")
+
+            case StatusRequest():
+                return self.status()
+
+            case StepRequest(steps=steps, pc=pc, instret=instret):
+                if steps <= 0:
+                    return error("Bad request: Steps must be positive.")
+                if not self.running:
+                    return error("Bad request: Processor is not running!")
+                if not self.single_step:
+                    return error("Bad request: Processor is not single-stepping!")
+
+                data = bytearray()
+                for _ in range(steps):
+                    if not self.running or self.pc == pc:
+                        break
+                    if instret is not None and self.minstret >= instret:
+                        break
+                    record_pc, instruction = self.pc, self.fetch()
+                    registers = self.registers.copy()
+                    self.step()
+                    rd = next(
+                        (i for i in range(1, 32) if self.registers[i] != registers[i]),
+                        0,
+                    )
+                    data += TraceRecord(
+                        record_pc, instruction or 0, rd, self.registers[rd]
+                    ).pack()
+                return DataFrame(DataResponse(type="data", size=len(data)), bytes(data))
+
+            case SubscribeRequest() | SerialRequest():
+                # see StubServerHandler.subscribe and StubServerHandler.serial
+                return None
+
+    def read_ram(self, address: int | None, size: int | None) -> bytes:
+        """Returns RAM for `dump`, where each word is big-endian (like the real
+        server), unlike `read_memory`."""
+
+        offset = (RAM_START if address is None else address) - RAM_START
+        if not 0 <= offset < len(self.ram) or offset % 4 != 0:
+            raise ValueError("Start address must be within RAM and aligned to 4 bytes.")
+
+        if size is None:
+            size = len(self.ram) - offset
+        if not 0 < size <= len(self.ram) or size % 4 != 0:
+            raise ValueError("Bytes must be positive, aligned, and fit in RAM.")
+
+        words = unpack_words(self.ram[offset : offset + size])
+        return struct.pack(f">{len(words)}I", *words)
+
+    def step(self):
+        self.pc = (self.pc + 4) % len(self.rom) if self.rom else self.pc + 4
+        self.minstret += 1
+        self.registers[1] = self.pc
+        if self.halt_after is not None and self.minstret >= self.halt_after:
+            self.running = False
+            self.paused = False
+
+    def run(self):
+        if self.halt_after is None:
+            return
+        while self.running:
+            self.step()
+
+    def read_memory(self, space: MemorySpace, address: int, size: int) -> bytes:
+        region, offset = self._memory_region(space, address, size)
+        return bytes(region[offset : offset + size])
+
+    def write_memory(self, space: MemorySpace, address: int, data: bytes):
+        region, offset = self._memory_region(space, address, len(data))
+        if offset + len(data) > len(region):
+            raise ValueError("Data must fit within the region.")
+        region[offset : offset + len(data)] = data
+
+        match space:
+            case "memory" if address < RAM_START:
+                self.rom = bytes(region)
+            case "registers":
+                self.registers = unpack_words(region)
+            case "csrs":
+                self.csrs = unpack_words(region)
+            case _:
+                pass
+
+    def _memory_region(
+        self,
+        space: MemorySpace,
+        address: int,
+        size: int,
+    ) -> tuple[bytearray, int]:
+        """Returns a region of memory as little-endian bytes, and the offset of
+        `address` within it. RAM is returned directly, and everything else as a
+        copy."""
+
+        if address % 4 or size % 4 or size < 0:
+            raise ValueError("Address and bytes must be aligned to 4 bytes.")
+
+        match space:
+            case "memory" if address >= RAM_START:
+                region, offset = self.ram, address - RAM_START
+            case "memory":
+                region, offset = bytearray(self.rom), address
+            case "registers":
+                region, offset = pack_words(self.registers), address
+            case "csrs":
+                region, offset = pack_words(self.csrs), address
+
+        if not 0 <= offset < len(region):
+            raise ValueError("Address out of range.")
+        return region, offset
+
+    def fetch(self) -> int | None:
+        if self.pc + 4 <= len(self.rom):
+            return int.from_bytes(self.rom[self.pc : self.pc + 4], "little")
+        return None
+
+    def status(self) -> StatusResponse:
+        return StatusResponse(
+            type="status",
+            running=self.running,
+            paused=self.paused,
+            state="executing" if self.running else "halt",
+            error_output="",
+            pc=self.pc,
+            instruction=self.fetch(),
+            privilege_mode=0b11,
+            registers=self.registers,
+            mscratch=self.csrs[0x340],
+            mtvec=self.csrs[0x305],
+            mepc=self.csrs[0x341],
+            mcause=self.csrs[0x342],
+            mtval=self.csrs[0x343],
+            mstatus=0,
+            mip=0,
+            mie=0,
+            mcycle=self.minstret,
+            minstret=self.minstret,
+            mtime=0,
+        )
+
+
+def pack_words(words: list[int]) -> bytearray:
+    return bytearray(struct.pack(f"<{len(words)}I", *words))
+
+
+def unpack_words(data: bytes | bytearray) -> list[int]:
+    return list(struct.unpack(f"<{len(data) // 4}I", data))
+
+
+def success(message: str):
+    return SuccessResponse(type="success", message=message)
+
+
+def error(message: str):
+    return ErrorResponse(type="error", message=message)
+
+
+class StubServerHandler(StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        assert isinstance(self.server, StubServer)
+        self.stub = self.server
+        self.responses = queue.SimpleQueue[tuple[float, bytes] | None]()
+        self.sender = None
+        if self.stub.latency > 0:
+            self.sender = threading.Thread(target=self.send_responses, daemon=True)
+            self.sender.start()
+
+    def finish(self):
+        if self.sender is not None:
+            self.responses.put(None)
+            self.sender.join()
+        super().finish()
+
+    def handle(self):
+        for line in self.rfile:
+            request = None
+            try:
+                request = _REQUEST_ADAPTER.validate_json(line)
+            except ValidationError as e:
+                response = error(f"Bad request: {e}")
+            else:
+                match request:
+                    case SubscribeRequest(unpause=unpause):
+                        response = self.subscribe(unpause)
+                    case _:
+                        payload = b""
+                        if isinstance(request, FlashBytesRequest | WriteMemoryRequest):
+                            payload = self.rfile.read(request.size)
+                        with self.stub.lock:
+                            response = self.stub.processor.handle(request, payload)
+
+            match response:
+                case None:
+                    if isinstance(request, SerialRequest):
+                        self.serial()
+                    break
+                case DataFrame(response=header, data=data):
+                    self.send(
+                        header.__pydantic_serializer__.to_json(header) + b"\n" + data
+                    )
+                case _:
+                    self.send(
+                        response.__pydantic_serializer__.to_json(response) + b"\n"
+                    )
+
+    def send(self, data: bytes):
+        if self.sender is None:
+            self.wfile.write(data)
+        else:
+            self.responses.put((time.perf_counter() + self.stub.latency, data))
+
+    def send_responses(self):
+        """Writes responses after the simulated latency, without blocking requests
+        that were sent after them."""
+
+        while item := self.responses.get():
+            deadline, data = item
+            if (delay := deadline - time.perf_counter()) > 0:
+                time.sleep(delay)
+            try:
+                self.wfile.write(data)
+            except OSError:
+                break
+
+    def subscribe(self, unpause: bool) -> StubResponse:
+        """Pushes an event each time the processor pauses, and returns the final
+        response once it stops."""
+
+        processor = self.stub.processor
+        previous = None
+        while True:
+            with self.stub.lock:
+                if processor.running and not processor.paused:
+                    return error("Processor will never stop or pause.")
+                status = processor.status()
+                minstret = processor.minstret
+                if unpause and processor.running:
+                    processor.handle(UnpauseRequest())
+
+            event = StatusEvent.diff(previous, status)
+            self.send(event.__pydantic_serializer__.to_json(event) + b"\n")
+            previous = status
+
+            if not status.running:
+                return success("Processor stopped.")
+
+            if not unpause:
+                # wait for another connection to unpause it
+                while (
+                    processor.running
+                    and processor.paused
+                    and processor.minstret == minstret
+                ):
+                    time.sleep(1 / 60)
+
+    def serial(self):
+        """Loops back everything sent to the UART, until the client disconnects."""
+
+        while data := self.rfile.read1(4096):
+            self.send(data)
+
+
+class StubServer(ThreadingTCPServer):
+    """A stand-in for the ProcessorAccess server in the mlogv32 mod, for testing and
+    benchmarking clients without running Mindustry.
+
+    Use port 0 to listen on any free port (see `server_address`). If `latency` is
+    set, every response is delayed by that many seconds to simulate a network round
+    trip, while later requests on the same connection are still handled immediately.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        processor: StubProcessor,
+        *,
+        latency: float = 0,
+    ):
+        super().__init__(address, StubServerHandler)
+        self.processor = processor
+        self.latency = latency
+        self.lock = threading.Lock()
+
+    def serve_in_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+app = Typer(
+    pretty_exceptions_show_locals=False,
+)
+
+
+@app.command()
+def main(
+    host: str = "localhost",
+    port: int = 5000,
+    rom: Annotated[Path | None, Option("--bin")] = None,
+    halt_after: Annotated[int | None, Option("--halt-after")] = None,
+    latency: Annotated[float, Option("--latency")] = 0,
+):
+    """Run a stand-in ProcessorAccess server with a fake CPU."""
+
+    processor = StubProcessor(halt_after=halt_after)
+    if rom:
+        processor.rom = rom.read_bytes()
+
+    with StubServer((host, port), processor, latency=latency) as server:
+        print(f"Listening on {host}:{server.server_address[1]}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,17 @@
+import hashlib
+import os
+from pathlib import Path
+
+
+def default_cache_dir() -> Path:
+    if path := os.environ.get("MLOGV32_CACHE_DIR"):
+        return Path(path)
+    if path := os.environ.get("XDG_CACHE_HOME"):
+        return Path(path) / "mlogv32"
+    return Path.home() / ".cache" / "mlogv32"
+
+
+def text_digest(text: str | bytes) -> str:
+    if isinstance(text, str):
+        text = text.encode("utf-8")
+    return hashlib.sha256(text).hexdigest()
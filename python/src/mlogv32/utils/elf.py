@@ -0,0 +1,71 @@
+import struct
+from typing import Iterator, NamedTuple
+
+ELF_MAGIC = b"\x7fELF"
+
+ELFCLASS32 = 1
+ELFDATA2LSB = 1
+PT_LOAD = 1
+
+_ELF32_HEADER = struct.Struct("<16sHHIIIIIHHHHHH")
+_ELF32_PROGRAM_HEADER = struct.Struct("<IIIIIIII")
+
+
+class ElfSegment(NamedTuple):
+    address: int
+    """The physical (load) address of the segment."""
+    data: bytes
+    """The initialized contents of the segment, not including .bss."""
+    memory_size: int
+
+
+def is_elf(data: bytes) -> bool:
+    return data.startswith(ELF_MAGIC)
+
+
+def iter_load_segments(data: bytes) -> Iterator[ElfSegment]:
+    """Yields the `PT_LOAD` segments of a 32-bit little-endian ELF file.
+
+    Segments are placed at their physical address, like `objcopy --output-target
+    binary`, so initialized data that's copied to RAM at startup is stored after the
+    code in ROM.
+    """
+
+    if not is_elf(data):
+        raise ValueError("Not an ELF file")
+
+    (
+        ident,
+        _e_type,
+        _e_machine,
+        _e_version,
+        _e_entry,
+        e_phoff,
+        _e_shoff,
+        _e_flags,
+        _e_ehsize,
+        e_phentsize,
+        e_phnum,
+        *_,
+    ) = _ELF32_HEADER.unpack_from(data)
+
+    if ident[4] != ELFCLASS32 or ident[5] != ELFDATA2LSB:
+        raise ValueError("Only 32-bit little-endian ELF files are supported")
+
+    for i in range(e_phnum):
+        (
+            p_type,
+            p_offset,
+            _p_vaddr,
+            p_paddr,
+            p_filesz,
+            p_memsz,
+            *_,
+        ) = _ELF32_PROGRAM_HEADER.unpack_from(data, e_phoff + i * e_phentsize)
+
+        if p_type == PT_LOAD:
+            yield ElfSegment(
+                address=p_paddr,
+                data=data[p_offset : p_offset + p_filesz],
+                memory_size=p_memsz,
+            )
@@ -1,6 +1,9 @@
+import struct
 import zlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
+from typing import Any, Iterable
 
 from pymsch import (
     ContentBlock,
@@ -20,17 +23,197 @@ class ProcessorConfigUTF8:
 
     def compress(self):
         buffer = _ByteBuffer()
+        _write_code(buffer, self.code)
+        _write_links(buffer, self.links)
+        return bytearray(zlib.compress(buffer.data))
 
-        buffer.writeByte(1)
+    @classmethod
+    def decompress(cls, data: bytes | bytearray):
+        reader = _ByteReader(zlib.decompress(data))
+        reader.read_byte()  # version
 
-        code = self.code.encode("utf-8")
-        buffer.writeInt(len(code))
-        buffer.data.extend(code)
+        code = reader.read_bytes(reader.read_int()).decode("utf-8")
 
-        buffer.writeInt(len(self.links))
-        for link in self.links:
-            buffer.writeUTF(link.name)
-            buffer.writeShort(link.x)
-            buffer.writeShort(link.y)
+        links = list[ProcessorLink]()
+        for _ in range(reader.read_int()):
+            name = reader.read_utf()
+            x = reader.read_short()
+            y = reader.read_short()
+            links.append(ProcessorLink(x, y, name))
 
-        return bytearray(zlib.compress(buffer.data))
+        return cls(code, links)
+
+
+type LinksKey = tuple[tuple[str, int, int], ...]
+
+
+class ProcessorConfigCompressor:
+    """Compresses many processor configs that share the same code.
+
+    The code is encoded and fed to zlib once. For each set of links, the compressor
+    state is copied and only the links are compressed, which produces exactly the
+    same output as `ProcessorConfigUTF8(code, links).compress()`.
+
+    Results are memoized by link table, and `compress_many` spreads the remaining
+    work over a thread pool (zlib releases the GIL while compressing).
+    """
+
+    def __init__(self, code: str, *, max_workers: int | None = None):
+        self.max_workers = max_workers
+
+        buffer = _ByteBuffer()
+        _write_code(buffer, code)
+
+        self._compressor = zlib.compressobj()
+        self._prefix = self._compressor.compress(buffer.data)
+        self._results = dict[LinksKey, bytes]()
+
+    def compress(self, links: list[ProcessorLink]) -> bytearray:
+        key = tuple((link.name, link.x, link.y) for link in links)
+        if (result := self._results.get(key)) is None:
+            buffer = _ByteBuffer()
+            _write_links(buffer, links)
+
+            compressor = self._compressor.copy()
+            result = b"".join(
+                [
+                    self._prefix,
+                    compressor.compress(buffer.data),
+                    compressor.flush(),
+                ]
+            )
+            self._results[key] = result
+
+        return bytearray(result)
+
+    def compress_many(
+        self,
+        links_list: Iterable[list[ProcessorLink]],
+    ) -> list[bytearray]:
+        links_list = list(links_list)
+        if self.max_workers == 1 or len(links_list) <= 1:
+            return [self.compress(links) for links in links_list]
+
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            return list(executor.map(self.compress, links_list))
+
+
+@dataclass
+class SchematicTile:
+    block: str
+    x: int
+    y: int
+    config: Any
+    rotation: int
+
+
+def read_schematic_tiles(data: bytes) -> tuple[dict[str, str], list[SchematicTile]]:
+    """Reads the tags and tiles of a schematic file.
+
+    Unlike `Schematic.read_file`, this doesn't need every block to be in pymsch's
+    content list, it keeps block configs in their raw form (eg. processor configs are
+    left compressed, see `ProcessorConfigUTF8.decompress`), and it runs in linear
+    time, so it's usable for full CPU schematics.
+    """
+
+    if data[:4] != b"msch":
+        raise ValueError("Invalid schematic header")
+    reader = _ByteReader(zlib.decompress(data[5:]))
+
+    reader.read_short()  # width
+    reader.read_short()  # height
+
+    tags = dict[str, str]()
+    for _ in range(reader.read_byte()):
+        key = reader.read_utf()
+        tags[key] = reader.read_utf()
+
+    blocks = [reader.read_utf() for _ in range(reader.read_byte())]
+
+    tiles = list[SchematicTile]()
+    for _ in range(reader.read_int()):
+        block = blocks[reader.read_byte()]
+        x = reader.read_short()
+        y = reader.read_short()
+        config = reader.read_object()
+        rotation = reader.read_byte()
+        tiles.append(SchematicTile(block, x, y, config, rotation))
+
+    return tags, tiles
+
+
+class _ByteReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def _unpack(self, fmt: str) -> Any:
+        (value,) = struct.unpack_from(fmt, self.data, self.pos)
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def read_byte(self) -> int:
+        return self._unpack(">B")
+
+    def read_short(self) -> int:
+        return self._unpack(">h")
+
+    def read_int(self) -> int:
+        return self._unpack(">i")
+
+    def read_bytes(self, n: int) -> bytes:
+        result = self.data[self.pos : self.pos + n]
+        self.pos += n
+        return result
+
+    def read_utf(self) -> str:
+        return self.read_bytes(self._unpack(">H")).decode("utf-8")
+
+    def read_object(self) -> Any:
+        # see mindustry.io.TypeIO.readObject
+        match self.read_byte():
+            case 0:
+                return None
+            case 1:
+                return self.read_int()
+            case 2:
+                return self._unpack(">q")
+            case 3:
+                return self._unpack(">f")
+            case 4:
+                return self.read_utf() if self.read_byte() else None
+            case 5:
+                return (self.read_byte(), self._unpack(">H"))  # content type, id
+            case 7:
+                return (self.read_int(), self.read_int())
+            case 8:
+                return [
+                    (self.read_short(), self.read_short())
+                    for _ in range(self.read_byte())
+                ]
+            case 10:
+                return self.read_byte() != 0
+            case 11:
+                return self._unpack(">d")
+            case 14:
+                return self.read_bytes(self.read_int())
+            case 22:
+                return [self.read_object() for _ in range(self.read_int())]
+            case obj_type:
+                raise ValueError(f"Unsupported object type: {obj_type}")
+
+
+def _write_code(buffer: _ByteBuffer, code: str):
+    buffer.writeByte(1)
+
+    encoded = code.encode("utf-8")
+    buffer.writeInt(len(encoded))
+    buffer.data.extend(encoded)
+
+
+def _write_links(buffer: _ByteBuffer, links: list[ProcessorLink]):
+    buffer.writeInt(len(links))
+    for link in links:
+        buffer.writeUTF(link.name)
+        buffer.writeShort(link.x)
+        buffer.writeShort(link.y)
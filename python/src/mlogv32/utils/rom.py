@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import codecs
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, NamedTuple, cast
+
+from .elf import is_elf, iter_load_segments
+from .msch import ProcessorConfigUTF8
+
+DEFAULT_ROM_BYTE_OFFSET = 174
+DEFAULT_ROM_PROC_BYTES = 16384
+
+# ROM is mapped from 0 until the start of RAM
+ROM_ADDRESS_LIMIT = 0x80000000
+
+
+class RomSegment(NamedTuple):
+    address: int
+    data: bytes
+
+    @property
+    def end(self):
+        return self.address + len(self.data)
+
+
+@dataclass
+class RomImage:
+    """A sparse program image to be stored in ROM, starting at address 0.
+
+    Gaps between segments are read as zeros.
+    """
+
+    segments: list[RomSegment]
+    """Non-overlapping segments, sorted by address."""
+
+    @classmethod
+    def load(cls, path: Path) -> RomImage:
+        """Loads a flat binary, or the `PT_LOAD` segments of an ELF file."""
+
+        data = path.read_bytes()
+        if is_elf(data):
+            return cls.from_elf(data)
+        return cls([RomSegment(0, data)])
+
+    @classmethod
+    def from_elf(cls, data: bytes) -> RomImage:
+        segments = list[RomSegment]()
+        for segment in iter_load_segments(data):
+            if not segment.data:
+                continue
+            if segment.address + len(segment.data) > ROM_ADDRESS_LIMIT:
+                print(
+                    f"[WARNING] Skipping ELF segment at {segment.address:#010x} ({len(segment.data)} bytes), since it's not in ROM."
+                )
+                continue
+            segments.append(RomSegment(segment.address, segment.data))
+
+        segments.sort()
+        for prev, segment in zip(segments, segments[1:]):
+            if segment.address < prev.end:
+                raise ValueError(
+                    f"Overlapping ELF segments at {prev.address:#010x} and {segment.address:#010x}"
+                )
+        return cls(segments)
+
+    @property
+    def size(self) -> int:
+        """The address of the end of the last segment."""
+
+        return self.segments[-1].end if self.segments else 0
+
+    def used_bytes(self, start: int, end: int) -> int:
+        """Returns the number of bytes in the given address range which are covered by
+        a segment."""
+
+        return sum(
+            max(0, min(end, segment.end) - max(start, segment.address))
+            for segment in self.segments
+        )
+
+    def read(self, address: int, size: int) -> bytes:
+        """Reads a range of addresses, including gaps and addresses past the end of
+        the image as zeros."""
+
+        result = bytearray(size)
+        for segment in self.segments:
+            start = max(address, segment.address)
+            end = min(address + size, segment.end)
+            if start < end:
+                result[start - address : end - address] = segment.data[
+                    start - segment.address : end - segment.address
+                ]
+        return bytes(result)
+
+    def pad(self, alignment: int) -> RomImage:
+        """Returns a copy of this image with zeros appended to align the end."""
+
+        if not self.segments or self.size % alignment == 0:
+            return self
+        *segments, last = self.segments
+        return RomImage(
+            [
+                *segments,
+                RomSegment(last.address, last.data + bytes(-self.size % alignment)),
+            ]
+        )
+
+
+@dataclass
+class RomEncoder:
+    """Encodes binary images into ROM proc payloads.
+
+    Each byte `b` is stored as the character `chr(byte_offset + b)` in a string
+    variable `v`, with `proc_bytes` bytes per proc. Procs that would only contain
+    zeros are emitted with an empty payload, since out-of-bounds reads already
+    return 0.
+    """
+
+    byte_offset: int = DEFAULT_ROM_BYTE_OFFSET
+    proc_bytes: int = DEFAULT_ROM_PROC_BYTES
+
+    _decoding_table: str = field(init=False, repr=False)
+    _zeros: bytes = field(init=False, repr=False)
+
+    def __post_init__(self):
+        # charmap_decode maps each byte to the character at that index in C
+        self._decoding_table = "".join(chr(self.byte_offset + b) for b in range(256))
+        self._zeros = bytes(self.proc_bytes)
+
+    def encode(self, data: bytes | memoryview) -> str:
+        """Encodes a chunk of bytes into a ROM string payload."""
+
+        # typeshed only allows a dict or EncodingMap here, but a str decoding table
+        # is also accepted (and is the fastest option)
+        mapping = cast(Any, self._decoding_table)
+        return codecs.charmap_decode(data, "strict", mapping)[0]
+
+    def iter_payloads(self, data: bytes | memoryview) -> Iterator[str]:
+        """Lazily yields the payload for each proc needed to store `data`."""
+
+        view = memoryview(data)
+        for i in range(0, len(view), self.proc_bytes):
+            chunk = view[i : i + self.proc_bytes]
+            if chunk.tobytes() == self._zeros[: len(chunk)]:
+                yield ""
+            else:
+                yield self.encode(chunk)
+
+    def iter_image_payloads(self, image: RomImage) -> Iterator[str]:
+        """Lazily yields the payload for each proc needed to store `image`.
+
+        Procs that don't overlap any segment are skipped without reading the image.
+        """
+
+        if len(image.segments) == 1 and image.segments[0].address == 0:
+            yield from self.iter_payloads(image.segments[0].data)
+            return
+
+        for address in range(0, image.size, self.proc_bytes):
+            size = min(self.proc_bytes, image.size - address)
+            if image.used_bytes(address, address + size) == 0:
+                yield ""
+            else:
+                yield from self.iter_payloads(image.read(address, size))
+
+
+def rom_proc_config(payload: str) -> bytearray:
+    return ProcessorConfigUTF8(
+        code=f'set v "{payload}"; stop',
+        links=[],
+    ).compress()
@@ -0,0 +1,52 @@
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from mlogv32.preprocessor.app import app
+from mlogv32.scripts.stub_server import StubProcessor, StubServer
+from typer.testing import CliRunner
+
+REPO_ROOT = Path(__file__).parents[2]
+
+HALT_AFTER = 100
+"""The number of instructions the stub processor runs before halting."""
+
+
+def build_schematic(bin_path: Path, output: Path, *options: str) -> Path:
+    """Builds a small micropython CPU schematic for the emulator from a program."""
+
+    result = CliRunner().invoke(
+        app,
+        [
+            "build",
+            str(REPO_ROOT / "src/cpu/cpu.yaml"),
+            *("--config", "micropython", "--width", "4", "--height", "4"),
+            *("--cpu", "--peripherals", "--memory", "--no-cache"),
+            *("--bin", str(bin_path), "--output", str(output)),
+            *options,
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    return output
+
+
+@pytest.fixture
+def processor() -> StubProcessor:
+    return StubProcessor(halt_after=HALT_AFTER)
+
+
+@pytest.fixture
+def latency() -> float:
+    """The simulated latency of the stub server, in seconds. Override it with
+    `pytest.mark.parametrize("latency", [...])`."""
+
+    return 0
+
+
+@pytest.fixture
+def server(processor: StubProcessor, latency: float) -> Iterator[StubServer]:
+    server = StubServer(("localhost", 0), processor, latency=latency)
+    server.serve_in_background()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,196 @@
+from textwrap import dedent
+
+import pytest
+from mlogv32.preprocessor.allocator import (
+    _dsatur,  # pyright: ignore[reportPrivateUsage]
+    allocate_local_variables,
+)
+from mlogv32.preprocessor.parser import MlogError
+
+
+def allocate(text: str, reference: str | None = None):
+    return allocate_local_variables(
+        dedent(text),
+        reference=reference and dedent(reference),
+    )
+
+
+def test_disjoint_live_ranges_share_a_variable():
+    result, report = allocate("""
+    set $a 1
+    print $a
+    set $b 2
+    print $b
+    """)
+
+    assert result == dedent("""
+    set local1 1
+    print local1
+    set local1 2
+    print local1
+    """)
+    assert (report.allocated, report.webs, report.names) == (1, 2, 2)
+
+
+def test_overlapping_live_ranges_interfere():
+    result, report = allocate("""
+    set $a 1
+    set $b 2
+    print $a
+    print $b
+    """)
+
+    assert result == dedent("""
+    set local1 1
+    set local2 2
+    print local1
+    print local2
+    """)
+    assert report.allocated == 2
+
+
+def test_each_web_is_allocated_separately():
+    result, report = allocate("""
+    set $a 1
+    print $a
+    set $a 2
+    set $b 3
+    print $a
+    print $b
+    """)
+
+    # the first $a is dead by the time the second one is written
+    assert result == dedent("""
+    set local1 1
+    print local1
+    set local1 2
+    set local2 3
+    print local1
+    print local2
+    """)
+    assert (report.allocated, report.webs, report.names) == (2, 3, 2)
+
+
+def test_loop_carried_values_interfere():
+    result, report = allocate("""
+    set $i 0
+    loop:
+    op mul $t $i 2
+    print $t
+    op add $i $i 1
+    jump loop lessThan $i 10
+    print $i
+    """)
+
+    assert result == dedent("""
+    set local1 0
+    loop:
+    op mul local2 local1 2
+    print local2
+    op add local1 local1 1
+    jump loop lessThan local1 10
+    print local1
+    """)
+    assert report.allocated == 2
+
+
+def test_calls_are_analyzed_per_call_site():
+    result, report = allocate("""
+    set $x 1
+    op add ret @counter 1
+    jump f always
+    print $x
+    set $y 2
+    op add ret @counter 1
+    jump f always
+    print $y
+    end
+    f:
+    set $tmp 5
+    print $tmp
+    set @counter ret
+    """)
+
+    # $x is only live across the first call, and $y across the second, so they can
+    # share a variable, but neither can share with the called code
+    assert result == dedent("""
+    set local2 1
+    op add ret @counter 1
+    jump f always
+    print local2
+    set local2 2
+    op add ret @counter 1
+    jump f always
+    print local2
+    end
+    f:
+    set local1 5
+    print local1
+    set @counter ret
+    """)
+    assert report.allocated == 2
+
+
+def test_reference_allocation_removes_interference():
+    text = """
+    set $a 1
+    set $b 2
+    print $a
+    print $b
+    """
+    reference = """
+    set local1 1
+    set local1 2
+    print local1
+    print local1
+    """
+
+    result, report = allocate(text, reference)
+
+    assert result == dedent(reference)
+    assert (report.manual, report.allocated) == (1, 1)
+
+
+def test_reference_must_match():
+    with pytest.raises(MlogError, match="Reference has 1 statements, expected 2"):
+        allocate("set $a 1\nprint $a\n", "set local1 1\n")
+    with pytest.raises(MlogError, match="Expected a local variable"):
+        allocate("set $a 1\nprint $a\n", "set local1 1\nprint x\n")
+
+
+def test_locals_in_directives_are_rejected():
+    with pytest.raises(MlogError, match="can't be used in directives"):
+        allocate("#directive push_saved $a\nset $a 1\n")
+
+
+def test_no_locals():
+    text = "set x 1\nprint x\n"
+
+    result, report = allocate(text)
+
+    assert result == text
+    assert (report.allocated, report.webs, report.names) == (0, 0, 0)
+
+
+@pytest.mark.parametrize(
+    ("edges", "colors"),
+    [
+        ([], 1),
+        ([(0, 1), (1, 2), (2, 3), (3, 0)], 2),
+        ([(0, 1), (1, 2), (2, 3), (3, 4), (4, 0)], 3),
+        ([(i, j) for i in range(5) for j in range(i)], 5),
+        # a crown graph, which needs only 2 colors but trips up naive greedy order
+        ([(i, 4 + j) for i in range(4) for j in range(4) if i != j], 2),
+    ],
+)
+def test_dsatur(edges: list[tuple[int, int]], colors: int):
+    n = max((max(edge) for edge in edges), default=0) + 1
+    neighbors = [0] * n
+    for a, b in edges:
+        neighbors[a] |= 1 << b
+        neighbors[b] |= 1 << a
+
+    result = _dsatur(neighbors)
+
+    assert all(result[a] != result[b] for a, b in edges)
+    assert max(result) + 1 == colors
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import struct
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Awaitable, Callable, Coroutine
+
+import pytest
+from conftest import HALT_AFTER
+from mlogv32.async_processor_access import AsyncProcessorAccess
+from mlogv32.processor_access import ProcessorError
+from mlogv32.scripts.stub_server import RAM_START, StubProcessor, StubServer
+from pydantic import ValidationError
+
+
+@pytest.fixture
+def client(server: StubServer) -> AsyncProcessorAccess:
+    host, port = str(server.server_address[0]), server.server_address[1]
+    return AsyncProcessorAccess(host, port, log_level=logging.NOTSET)
+
+
+def run[T](client: AsyncProcessorAccess, coro: Coroutine[Any, Any, T]) -> T:
+    async def main():
+        async with client:
+            return await coro
+
+    return asyncio.run(main())
+
+
+type Handler = Callable[[asyncio.StreamReader, asyncio.StreamWriter], Awaitable[None]]
+
+
+@asynccontextmanager
+async def raw_server(handle: Handler) -> AsyncGenerator[AsyncProcessorAccess, None]:
+    """Connects to a server that answers with whatever `handle` writes, for
+    responses the stub server never sends."""
+
+    server = await asyncio.start_server(handle, "localhost", 0)
+    host, port = server.sockets[0].getsockname()[:2]
+    async with server:
+        async with AsyncProcessorAccess(host, port, log_level=logging.NOTSET) as client:
+            yield client
+
+
+def test_pipelined_requests_match_responses(
+    client: AsyncProcessorAccess,
+    processor: StubProcessor,
+):
+    processor.ram[:8] = struct.pack("<2I", 0xDEADBEEF, 0x01234567)
+
+    async def requests():
+        return await asyncio.gather(
+            *(client.status() for _ in range(50)),
+            client.dump_bytes(RAM_START, 8),
+            client.read_memory(RAM_START, 8),
+            client.flash_bytes(b"abc"),
+            client.status(),
+            return_exceptions=True,
+        )
+
+    *statuses, dumped, read, flashed, status = run(client, requests())
+
+    assert all(s == status for s in statuses)
+    assert dumped == bytes.fromhex("deadbeef01234567")
+    assert read == struct.pack("<2I", 0xDEADBEEF, 0x01234567)
+    assert isinstance(flashed, ProcessorError)
+
+
+def test_flash_then_run_then_dump(client: AsyncProcessorAccess):
+    async def requests():
+        await client.stop()
+        await client.flash_bytes(bytes(1024))
+        await client.start()
+        await client.wait(stopped=True, paused=False)
+        return await client.dump_bytes(RAM_START, 64), await client.status()
+
+    data, status = run(client, requests())
+
+    assert data == bytes(64)
+    assert status.minstret == HALT_AFTER
+
+
+def test_step_returns_trace(client: AsyncProcessorAccess):
+    async def requests():
+        await client.flash_bytes(struct.pack("<64I", *range(1000, 1064)))
+        await client.start(single_step=True)
+        return [record async for record in client.step(10, batch_size=4)]
+
+    records = run(client, requests())
+
+    assert [record.pc for record in records] == list(range(0, 40, 4))
+    assert [record.instruction for record in records] == list(range(1000, 1010))
+
+
+def test_write_memory_round_trip(
+    client: AsyncProcessorAccess,
+    processor: StubProcessor,
+):
+    async def requests():
+        await client.read_memory(RAM_START, 16)  # fill the cache
+        await client.write_memory(RAM_START + 4, struct.pack("<I", 0xCAFEF00D))
+        return await client.read_memory(RAM_START, 12)
+
+    assert run(client, requests()) == struct.pack("<3I", 0, 0xCAFEF00D, 0)
+    assert processor.ram[4:8] == struct.pack("<I", 0xCAFEF00D)
+
+
+@pytest.mark.parametrize("latency", [0.2])
+def test_timed_out_response_is_discarded(client: AsyncProcessorAccess):
+    async def requests():
+        with pytest.raises(TimeoutError):
+            await client.status(timeout=0.05)
+        # the late response to the first request must not be mistaken for this one
+        return await client.dump_bytes(RAM_START, 4, timeout=5)
+
+    assert run(client, requests()) == bytes(4)
+
+
+@pytest.mark.parametrize("latency", [0.2])
+def test_timed_out_data_response_is_discarded(
+    client: AsyncProcessorAccess,
+    processor: StubProcessor,
+):
+    processor.ram[:4] = b"\n\n\n\n"
+
+    async def requests():
+        with pytest.raises(TimeoutError):
+            await client.dump_bytes(RAM_START, 4, timeout=0.05)
+        # the payload arrives later, and must be skipped along with its header
+        return await client.status(timeout=5), await client.dump_bytes(RAM_START, 8)
+
+    status, data = run(client, requests())
+
+    assert not status.running
+    assert data == b"\n\n\n\n" + bytes(4)
+
+
+def test_request_after_server_disconnects():
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # stop sending, but leave the connection open for writing
+        writer.write_eof()
+        await reader.read()
+        writer.close()
+
+    async def requests():
+        async with raw_server(handle) as client:
+            with pytest.raises(ConnectionError):
+                await client.status()
+            # the connection is gone, so this must fail rather than wait forever
+            with pytest.raises(ConnectionError):
+                await client.status()
+
+    asyncio.run(asyncio.wait_for(requests(), 5))
+
+
+def test_unexpected_data_response_payload_is_skipped():
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await reader.readline()
+        writer.write(b'{"type": "data", "size": 4}\n1234')
+        await reader.readline()
+        writer.write(b'{"type": "success", "message": "Processor stopped."}\n')
+        await writer.drain()
+        await reader.read()
+        writer.close()
+
+    async def requests():
+        async with raw_server(handle) as client:
+            with pytest.raises(ValidationError):
+                await client.stop()
+            return await client.stop()
+
+    response = asyncio.run(asyncio.wait_for(requests(), 5))
+
+    assert response.message == "Processor stopped."
+
+
+def test_serial_loopback(client: AsyncProcessorAccess):
+    async def requests():
+        reader, writer = await client.serial("uart0")
+        try:
+            writer.write(b"hello\n")
+            await writer.drain()
+            return await asyncio.wait_for(reader.readline(), 5)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    assert run(client, requests()) == b"hello\n"
@@ -0,0 +1,111 @@
+import os
+from pathlib import Path
+
+import pytest
+from mlogv32.preprocessor import cache as cache_module
+from mlogv32.preprocessor.cache import BuildCache, template_digest
+
+
+def age(path: Path, seconds: float):
+    """Moves a cache entry's last use into the past, since mtimes can tie."""
+
+    mtime = path.stat().st_mtime - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_store_and_load(tmp_path: Path):
+    cache = BuildCache(tmp_path)
+    key = cache.key("input", 1)
+
+    assert cache.load("stage", key) is None
+    cache.store("stage", key, {"value": [1, 2]})
+
+    # a new cache, like the next build
+    cache = BuildCache(tmp_path)
+    assert cache.load("stage", key) == {"value": [1, 2]}
+    assert cache.load("other", key) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_key_tracks_template_includes(tmp_path: Path):
+    template = tmp_path / "main.jinja"
+    template.write_text('{% include "part.jinja" %}')
+    part = tmp_path / "part.jinja"
+    part.write_text("set x 1")
+
+    cache = BuildCache(tmp_path / "cache")
+    original_key = cache.key(template_digest(template))
+    cache.store("render", original_key, "set x 1")
+
+    part.write_text("set x 2")
+    changed_key = cache.key(template_digest(template))
+
+    assert changed_key != original_key
+    assert cache.load("render", changed_key) is None
+    cache.store("render", changed_key, "set x 2")
+
+    # changing the input back hits the original entry
+    part.write_text("set x 1")
+    assert cache.key(template_digest(template)) == original_key
+    assert cache.load("render", original_key) == "set x 1"
+
+
+def test_key_includes_tool_version(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    cache = BuildCache(tmp_path)
+    key = cache.key("input")
+    cache.store("stage", key, "value")
+
+    monkeypatch.setattr(cache_module, "tool_version", lambda: "changed")
+
+    assert cache.key("input") != key
+    assert cache.load("stage", cache.key("input")) is None
+
+
+def test_eviction_is_lru_per_stage(tmp_path: Path):
+    cache = BuildCache(tmp_path, max_entries=2)
+    cache.store("a", "1", 1)
+    cache.store("a", "2", 2)
+    cache.store("b", "1", 1)
+    age(cache._path("a", "1"), 20)  # pyright: ignore[reportPrivateUsage]
+    age(cache._path("a", "2"), 10)  # pyright: ignore[reportPrivateUsage]
+
+    # loading marks an entry as recently used, so 2 is the oldest
+    assert cache.load("a", "1") == 1
+    cache.store("a", "3", 3)
+
+    assert cache.load("a", "1") == 1
+    assert cache.load("a", "2") is None
+    assert cache.load("a", "3") == 3
+    assert cache.load("b", "1") == 1
+
+
+def test_memory_eviction_is_lru_per_stage():
+    cache = BuildCache(None, max_entries=2, memory=True)
+    cache.store("a", "1", 1)
+    cache.store("a", "2", 2)
+    cache.store("b", "1", 1)
+
+    assert cache.load("a", "1") == 1
+    cache.store("a", "3", 3)
+
+    assert cache.load("a", "1") == 1
+    assert cache.load("a", "2") is None
+    assert cache.load("a", "3") == 3
+    assert cache.load("b", "1") == 1
+
+
+def test_invalid_entries_are_misses(tmp_path: Path):
+    cache = BuildCache(tmp_path)
+    cache.store("stage", "key", "value")
+    cache._path("stage", "key").write_bytes(b"garbage")  # pyright: ignore[reportPrivateUsage]
+
+    assert cache.load("stage", "key") is None
+    assert cache.misses == 1
+
+
+def test_disabled():
+    cache = BuildCache(None)
+    cache.store("stage", "key", "value")
+
+    assert not cache.enabled
+    assert cache.load("stage", "key") is None
@@ -0,0 +1,65 @@
+from textwrap import dedent
+
+import pytest
+from mlogv32.preprocessor.parser import analyze_mlog, parse_mlog
+from mlogv32.preprocessor.parser.cfg import read_positions, written_positions
+
+
+@pytest.mark.parametrize(
+    ("statement", "written"),
+    [
+        ("set x 1", ["x"]),
+        ("op add x a b", ["x"]),
+        ("read x cell1 0", ["x"]),
+        ("getlink x 0", ["x"]),
+        ("sensor x block1 @copper", ["x"]),
+        ("select x equal a b c d", ["x"]),
+        ("packcolor x 1 0 0 1", ["x"]),
+        ("getflag x flag", ["x"]),
+        ("unpackcolor r g b a color", ["r", "g", "b", "a"]),
+        ("lookup block x 0", ["x"]),
+        ("getblock building x 1 2", ["x"]),
+        ("fetch unit x @sharded 0 @poly", ["x"]),
+        ("ucontrol getBlock 1 2 type building floor", ["type", "building", "floor"]),
+        (
+            "ulocate building core true @copper ox oy found building",
+            ["ox", "oy", "found", "building"],
+        ),
+        ("radar enemy any any distance turret1 1 x", ["x"]),
+        ("write x cell1 0", []),
+        ("print x", []),
+        ("jump 0 equal x 1", []),
+    ],
+)
+def test_written_positions(statement: str, written: list[str]):
+    name, *args = statement.split()
+
+    assert [args[i] for i in written_positions(name, args)] == written
+
+
+def test_read_positions_skip_keywords_and_writes():
+    args = ["unit", "x", "@sharded", "0", "@poly"]
+
+    assert [args[i] for i in read_positions("fetch", args)] == [
+        "@sharded",
+        "0",
+        "@poly",
+    ]
+
+
+def test_analysis_uses_written_positions():
+    ast = parse_mlog(
+        dedent("""
+        #directive start_fetch
+            read pc prev_proc "pc"
+        #directive end_fetch
+            set pc 0
+            getflag flag "name"
+            unpackcolor r g b a color
+            fetch unit u @sharded 0 @poly
+            write flag cell1 0
+        """)
+    )
+
+    # the same variables as the control flow analyses see
+    assert analyze_mlog(ast).unsaved_variables == ["flag", "r", "g", "b", "a", "u"]
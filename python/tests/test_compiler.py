@@ -0,0 +1,119 @@
+import pytest
+from mlogv32.emulator.blocks import Building, MemoryBuild, MessageBuild, SwitchBuild
+from mlogv32.emulator.compiler import CompiledLogicBuild
+from mlogv32.emulator.processor import LogicBuild, Value, load_program
+from mlogv32.emulator.world import World
+
+TICKS = 20
+
+SNIPPETS = [
+    "",
+    "set x 1",
+    'set x 1\nset y x\nset z null\nset s "str"\nset b true',
+    "op add x 0x10 0b11\nop sub y x 1.5\nop mul z y -2\nop div w z 4",
+    "op idiv a -7 2\nop mod b -7 2\nop emod c -7 2\nop pow d 2 10",
+    "op shl a 1 40\nop shr b -256 4\nop ushr c -256 4\nop and d 0xff 0x3c",
+    "op or a 0xf0 0x0f\nop xor b 0xff 0x0f\nop not c 5\nop land d 1 0",
+    "op max a 1 2\nop min b 1 2\nop abs c -3\nop sign d -3\nop floor e 1.5",
+    "op ceil a 1.5\nop round b 2.5\nop sqrt c 16\nop log d 1\nop angle e 1 1",
+    "op equal a 1 1.0\nop notEqual b 1 2\nop strictEqual c null 0\nop len d 3 4",
+    "op lessThan a 1 2\nop lessThanEq b 2 2\nop greaterThan c 1 2",
+    'op equal a null 0\nop equal b "x" "x"\nop add c x 1',
+    "op div a 1 0\nop idiv b 1 0\nop mod c 1 0",
+    "op add i i 1\njump 0 lessThan i 10\nstop",
+    "loop:\nop add i i 1\njump loop notEqual i 100\nend",
+    "jump skip always\nset x 1\nskip:\nset y 2",
+    "jump 100 always\nset x 1",
+    "op add ret @counter 1\njump f always\nset done 1\nstop\nf:\nset x @counter\nset @counter ret",
+    "set @counter 100\nset x 1",
+    "set @counter -1\nset x 1",
+    "select x lessThan 1 2 10 20\nselect y equal 1 2 10 20",
+    "write 42 cell1 3\nread x cell1 3\nwrite x cell1 100\nread y cell1 100",
+    "op add i i 1\nwrite i cell1 i\nread x cell1 i",
+    'print "hello "\nprint 1.5\nprint 3\nprint null\nprintflush message1',
+    'printchar 65\nprintchar "B"\nprintflush message1',
+    'print "{0} and {1}"\nformat 1\nformat "two"\nprintflush message1',
+    "sensor x switch1 @enabled\ncontrol enabled switch1 0\nsensor y switch1 @enabled",
+    "sensor x cell1 @memoryCapacity\nsensor y @this @type\nsensor z cell1 @name",
+    "getlink x 0\ngetlink y 1\ngetlink z 100\nset n @links",
+    "set x @ipt\nset y @thisx\nset z @thisy\nset t @tick\nset u @time",
+    "lookup block x 1\nlookup block y -1",
+    "getblock building x 0 0\nsensor y x @memoryCapacity",
+    'read x @this "y"\nset y 1\nwrite 5 @this "z"',
+    "wait 0.1\nop add i i 1",
+    "op add i i 1\nend\nset x 1",
+    "noop\ndraw clear 0 0 0\nset x 1",
+    "setrate 100\nop add i i 1",
+    "unknown a b c\nop add i i 1",
+]
+
+
+def make_world(code: str, *, compiled: bool) -> tuple[World, LogicBuild]:
+    world = World(compiled=compiled)
+    cell = MemoryBuild("memory-cell", 0, 0)
+    message = MessageBuild("message", 1, 0)
+    switch = SwitchBuild("switch", 2, 0, enabled=True)
+    processor_type = CompiledLogicBuild if compiled else LogicBuild
+    processor = processor_type(
+        "micro-processor",
+        3,
+        0,
+        world=world,
+        program=load_program(code),
+        links=[cell, message, switch],
+        link_names={"cell1": cell, "message1": message, "switch1": switch},
+    )
+    for building in [cell, message, switch, processor]:
+        world.add_building(building)
+    return world, processor
+
+
+def run_key(code: str, *, compiled: bool):
+    world, processor = make_world(code, compiled=compiled)
+    states = list[tuple[object, ...]]()
+    for _ in range(TICKS):
+        world.tick()
+        states.append(state_key(world, processor))
+    return states
+
+
+def state_key(world: World, processor: LogicBuild) -> tuple[object, ...]:
+    [cell, message, switch, _] = world.buildings
+    assert isinstance(cell, MemoryBuild)
+    assert isinstance(message, MessageBuild)
+
+    # the compiled processor resets an out-of-range @counter eagerly
+    counter = processor.counter
+    if not 0 <= counter < len(processor.program):
+        counter = 0
+
+    return (
+        {
+            name: value_key(value)
+            for name, value in processor.variables.items()
+            if value is not None
+        },
+        counter,
+        processor.executed,
+        processor.halted,
+        cell.memory,
+        message.text,
+        switch.enabled,
+    )
+
+
+def value_key(value: Value) -> object:
+    match value:
+        case Building():
+            # buildings compare by identity, and each run has its own world
+            return (value.block, value.x, value.y)
+        case float() if value != value:
+            # so that nan compares equal to itself
+            return "nan"
+        case _:
+            return value
+
+
+@pytest.mark.parametrize("code", SNIPPETS)
+def test_compiler_matches_interpreter(code: str):
+    assert run_key(code, compiled=True) == run_key(code, compiled=False)
@@ -0,0 +1,142 @@
+import struct
+from pathlib import Path
+from typing import NamedTuple
+
+import pytest
+from mlogv32.utils.elf import PT_LOAD, ElfSegment, is_elf, iter_load_segments
+from mlogv32.utils.rom import RomImage, RomSegment
+
+PT_NOTE = 4
+
+
+class ProgramHeader(NamedTuple):
+    vaddr: int
+    paddr: int
+    data: bytes
+    memsz: int | None = None
+    type: int = PT_LOAD
+
+
+def make_elf(headers: list[ProgramHeader], *, ident: bytes | None = None) -> bytes:
+    """Builds a minimal ELF32 file with the given program headers and contents."""
+
+    if ident is None:
+        ident = b"\x7fELF\x01\x01\x01"
+    ehsize = 52
+    phentsize = 32
+    phoff = ehsize
+    offset = phoff + phentsize * len(headers)
+
+    elf = bytearray(
+        struct.pack(
+            "<16sHHIIIIIHHHHHH",
+            ident,
+            2,  # ET_EXEC
+            243,  # EM_RISCV
+            1,  # EV_CURRENT
+            0,  # e_entry
+            phoff,
+            0,  # e_shoff
+            0,  # e_flags
+            ehsize,
+            phentsize,
+            len(headers),
+            40,  # e_shentsize
+            0,  # e_shnum
+            0,  # e_shstrndx
+        )
+    )
+    contents = bytearray()
+    for header in headers:
+        elf += struct.pack(
+            "<IIIIIIII",
+            header.type,
+            offset + len(contents),
+            header.vaddr,
+            header.paddr,
+            len(header.data),
+            len(header.data) if header.memsz is None else header.memsz,
+            0,  # p_flags
+            4,  # p_align
+        )
+        contents += header.data
+    return bytes(elf + contents)
+
+
+def test_iter_load_segments():
+    elf = make_elf(
+        [
+            ProgramHeader(0, 0, b"code"),
+            ProgramHeader(0x1000, 0x1000, b"", type=PT_NOTE),
+            # .data is linked in RAM but loaded after .text in ROM
+            ProgramHeader(0x80000000, 4, b"data", memsz=16),
+        ]
+    )
+
+    assert is_elf(elf)
+    assert list(iter_load_segments(elf)) == [
+        ElfSegment(0, b"code", 4),
+        ElfSegment(4, b"data", 16),
+    ]
+
+
+@pytest.mark.parametrize(
+    "ident",
+    [
+        b"\x7fELF\x02\x01\x01",  # ELFCLASS64
+        b"\x7fELF\x01\x02\x01",  # ELFDATA2MSB
+    ],
+)
+def test_iter_load_segments_rejects_unsupported(ident: bytes):
+    with pytest.raises(ValueError):
+        list(iter_load_segments(make_elf([], ident=ident)))
+
+
+def test_iter_load_segments_rejects_non_elf():
+    assert not is_elf(b"\x13\x00\x00\x00")
+    with pytest.raises(ValueError):
+        list(iter_load_segments(b"\x13\x00\x00\x00"))
+
+
+def test_rom_image_from_elf():
+    elf = make_elf(
+        [
+            ProgramHeader(0x80000000, 0x100, b"data"),
+            ProgramHeader(0, 0, b"text"),
+            # .bss
+            ProgramHeader(0x80000004, 0x80000004, b"", memsz=16),
+            # not in ROM
+            ProgramHeader(0x80001000, 0x80001000, b"heap"),
+            ProgramHeader(0x7FFFFFFC, 0x7FFFFFFC, b"straddle"),
+        ]
+    )
+
+    image = RomImage.from_elf(elf)
+
+    # sorted by physical address
+    assert image.segments == [RomSegment(0, b"text"), RomSegment(0x100, b"data")]
+    assert image.size == 0x104
+    assert image.read(0, 8) == b"text\0\0\0\0"
+    assert image.read(0xFE, 8) == b"\0\0data\0\0"
+
+
+def test_rom_image_from_elf_rejects_overlaps():
+    elf = make_elf(
+        [
+            ProgramHeader(0, 0, b"text"),
+            ProgramHeader(0x80000000, 2, b"data"),
+        ]
+    )
+
+    with pytest.raises(ValueError, match="Overlapping"):
+        RomImage.from_elf(elf)
+
+
+def test_rom_image_load(tmp_path: Path):
+    elf_path = tmp_path / "program.elf"
+    elf_path.write_bytes(make_elf([ProgramHeader(0, 8, b"text")]))
+    bin_path = tmp_path / "program.bin"
+    bin_path.write_bytes(b"\x13\x00\x00\x00")
+
+    assert RomImage.load(elf_path).segments == [RomSegment(8, b"text")]
+    assert RomImage.load(bin_path).segments == [RomSegment(0, b"\x13\x00\x00\x00")]
@@ -0,0 +1,75 @@
+import struct
+from pathlib import Path
+
+import pytest
+from conftest import build_schematic
+from mlogv32.emulator.world import EmulatedCpu, World
+
+PROGRAM = struct.pack(
+    "<12I",
+    0xF00001B7,  # lui x3, 0xf0000
+    0x06100293,  # addi x5, x0, 'a'
+    0x06400313,  # addi x6, x0, 'd'
+    0x0051AA23,  # loop: sw x5, 0x14(x3)
+    0x00128293,  # addi x5, x5, 1
+    0xFE629CE3,  # bne x5, x6, loop
+    0x800000B7,  # lui x1, 0x80000
+    0x0050A023,  # sw x5, 0(x1)
+    0x0000A383,  # lw x7, 0(x1)
+    0x0071AA23,  # sw x7, 0x14(x3)
+    0x00000013,  # nop
+    0xFE002823,  # sw x0, -16(x0) (syscon power off)
+)
+"""Writes "abc" to UART0 in a loop, then "d" after a round trip through RAM, and
+powers off."""
+
+PROGRAM_OUTPUT = b"abcd"
+
+PROGRAM_INSTRUCTIONS = 17
+"""The number of instructions PROGRAM retires, not counting the power off."""
+
+MAX_TICKS = 1000
+
+
+@pytest.fixture(scope="session")
+def schematic(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    tmp_path = tmp_path_factory.mktemp("emulator")
+    bin_path = tmp_path / "program.bin"
+    bin_path.write_bytes(PROGRAM)
+    return build_schematic(bin_path, tmp_path / "program.msch")
+
+
+def run_program(path: Path, *, compiled: bool) -> tuple[World, EmulatedCpu, bytes]:
+    """Runs a CPU schematic until it halts, and returns the UART0 output."""
+
+    world = World.load(path, compiled=compiled)
+    cpu = EmulatedCpu.find(world)
+    cpu.power_on()
+
+    output = bytearray()
+    while not cpu.halted:
+        assert world.ticks < MAX_TICKS, f"CPU didn't halt, output: {output!r}"
+        world.tick()
+        output += cpu.uarts[0].read()
+    return world, cpu, bytes(output)
+
+
+@pytest.mark.parametrize("compiled", [True, False], ids=["compiled", "interpreted"])
+def test_program_runs_to_completion(schematic: Path, compiled: bool):
+    _, cpu, output = run_program(schematic, compiled=compiled)
+
+    assert output == PROGRAM_OUTPUT
+    assert cpu.minstret == PROGRAM_INSTRUCTIONS
+    assert cpu.error_output.text == ""
+
+
+def test_compiler_matches_interpreter(schematic: Path):
+    compiled_world, compiled_cpu, compiled_output = run_program(
+        schematic, compiled=True
+    )
+    world, cpu, output = run_program(schematic, compiled=False)
+
+    assert compiled_output == output
+    assert compiled_world.ticks == world.ticks
+    assert compiled_world.executed == world.executed
+    assert compiled_cpu.minstret == cpu.minstret
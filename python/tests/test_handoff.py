@@ -0,0 +1,113 @@
+from textwrap import dedent
+
+from mlogv32.preprocessor.handoff import (
+    external_variables,
+    replace_fetch_block,
+    saved_variable_report,
+)
+from mlogv32.preprocessor.parser import parse_mlog
+
+WORKER = dedent("""
+reset:
+    set config 5
+    set pc 0
+#directive start_fetch
+    read pc prev_proc "pc"
+    read stale prev_proc "stale"
+#directive end_fetch
+#directive push_saved scratch
+main:
+    op add pc pc 4
+    op add tmp pc config
+    print tmp
+    op add acc acc tmp
+    print scratch
+    set scratch 1
+    set stale 0
+    op add seen csr_mtime 1
+    set csr_minstret seen
+    jump main lessThan pc 100
+    end
+#directive pop_saved scratch
+""")
+
+
+def test_saved_variable_report():
+    report = saved_variable_report(
+        parse_mlog(WORKER),
+        external_reads=["csr_minstret"],
+        external_writes=["csr_mtime"],
+    )
+
+    # the worker can stop between any two statements, so even tmp is live, but
+    # config is only written before the fetch block, scratch is pushed, and stale is
+    # never read
+    assert report.live == ["acc", "csr_minstret", "csr_mtime", "pc", "seen", "tmp"]
+    assert report.restored == ["pc", "stale"]
+    assert report.exempt == {"scratch"}
+    assert report.under_saved == ["acc", "csr_minstret", "csr_mtime", "seen", "tmp"]
+    assert report.over_saved == ["stale"]
+
+
+def test_push_saved_only_exempts_while_pushed():
+    worker = dedent("""
+    #directive start_fetch
+    #directive end_fetch
+    main:
+    #directive push_saved a b
+        set a 1
+        print a
+    #directive pop_saved a
+        set b 1
+    #directive pop_saved b
+        print b
+        jump main always
+    """)
+
+    # a is pushed for its whole live range, but b is popped before it's read
+    report = saved_variable_report(parse_mlog(worker))
+
+    assert report.live == ["b"]
+    assert report.exempt == {"a", "b"}
+
+
+def test_external_variables():
+    controller = parse_mlog(
+        dedent("""
+        read pc prev_proc "pc"
+        write csr_mtime prev_proc "csr_mtime"
+        op add next pc 4
+        print csr_minstret
+        """)
+    )
+    debugger = parse_mlog('read x cpu "csr_mcause"\n')
+
+    reads, writes = external_variables(controller, debugger)
+
+    # the controller's own fetch block and writes back to the worker aren't reads
+    assert reads == {"pc", "csr_minstret", "csr_mcause"}
+    assert writes == {"csr_mtime"}
+
+
+def test_replace_fetch_block():
+    report = saved_variable_report(
+        parse_mlog(WORKER),
+        external_reads=["csr_minstret"],
+        external_writes=["csr_mtime"],
+    )
+
+    result = replace_fetch_block(WORKER, report)
+
+    assert result == WORKER.replace(
+        '    read stale prev_proc "stale"\n',
+        '    read acc prev_proc "acc"\n'
+        '    read csr_minstret prev_proc "csr_minstret"\n'
+        '    read csr_mtime prev_proc "csr_mtime"\n'
+        '    read seen prev_proc "seen"\n'
+        '    read tmp prev_proc "tmp"\n',
+    )
+    assert saved_variable_report(
+        parse_mlog(result),
+        external_reads=["csr_minstret"],
+        external_writes=["csr_mtime"],
+    ).restored == ["pc", "acc", "csr_minstret", "csr_mtime", "seen", "tmp"]
@@ -0,0 +1,131 @@
+import random
+import struct
+from pathlib import Path
+
+import pytest
+from conftest import REPO_ROOT, build_schematic
+from mlogv32.emulator.icache import find_icache_mismatches
+from mlogv32.emulator.world import EmulatedCpu, World
+from mlogv32.preprocessor.icache import (
+    PAGE_SIZE,
+    PAYLOAD_CHAR_OFFSET,
+    PAYLOAD_CHUNK_BITS,
+    PAYLOAD_CHUNKS,
+    IcacheDecoder,
+    encode_payloads,
+    preload_size,
+)
+from mlogv32.preprocessor.models import BuildConfig
+
+CONFIG = BuildConfig.load(REPO_ROOT / "src/cpu/cpu.yaml")
+
+
+def sweep_instructions() -> list[int]:
+    """Returns instructions with every opcode and funct3, several funct7 values, and
+    random registers, followed by a few random words."""
+
+    rng = random.Random(0)
+    values = list[int]()
+    for opcode in range(0b0000011, 0b10000000, 0b100):
+        for funct3 in range(8):
+            for funct7 in [0b0000000, 0b0000001, 0b0100000, rng.getrandbits(7)]:
+                values.append(
+                    (funct7 << 25)
+                    | (rng.getrandbits(10) << 15)  # rs2, rs1
+                    | (funct3 << 12)
+                    | (rng.getrandbits(5) << 7)  # rd
+                    | opcode
+                )
+    values += [rng.getrandbits(32) for _ in range(64)]
+    return values
+
+
+@pytest.fixture
+def decoder() -> IcacheDecoder:
+    return IcacheDecoder(CONFIG.instructions)
+
+
+@pytest.mark.parametrize(
+    ("instruction", "handler", "imm"),
+    [
+        (0xFFF10093, "ADDI", 0xFFFFFFFF),  # addi x1, x2, -1
+        (0x800000B7, "LUI", 0x80000000),  # lui x1, 0x80000
+        (0x0041AA23, "SW", 0x14),  # sw x4, 0x14(x3)
+        (0xFE629CE3, "BNE", 0xFFFFFFF8),  # bne x5, x6, -8
+        (0x0040006F, "JAL", 4),  # jal x0, 4
+        (0x00000073, "PRIV", 0),  # ecall
+        (0x0000000B, "MLOGSYS", 0),
+        (0x00000000, "ILLEGAL_OP", 0),
+    ],
+)
+def test_decode(decoder: IcacheDecoder, instruction: int, handler: str, imm: int):
+    payload = decoder.decode(instruction)
+
+    assert decoder.handler(payload >> 47) == handler
+    assert payload & 0xFFFF_FFFF == imm
+
+
+def test_decode_keeps_stale_imm(decoder: IcacheDecoder):
+    decoder.decode(0x0041AA23)  # sw x4, 0x14(x3)
+
+    # like the mlog decoder, R-type and illegal instructions don't set imm
+    assert decoder.decode(0x002081B3) & 0xFFFF_FFFF == 0x14  # add x3, x1, x2
+    assert decoder.decode(0x402081B3) & 0xFFFF_FFFF == 0x14  # sub x3, x1, x2
+    assert decoder.decode(0x00000000) & 0xFFFF_FFFF == 0x14
+
+
+def test_encode_payloads(decoder: IcacheDecoder):
+    payloads = [decoder.decode(value) for value in sweep_instructions()]
+
+    strings = encode_payloads(payloads)
+
+    # the same arithmetic as icache_loader_code
+    chunk = 1 << PAYLOAD_CHUNK_BITS
+    for i, payload in enumerate(payloads):
+        op_id = ord(strings[0][i]) - PAYLOAD_CHAR_OFFSET - 64
+        low = 0
+        for string in strings[1 : PAYLOAD_CHUNKS + 1]:
+            low = low * chunk + ord(string[i]) - PAYLOAD_CHAR_OFFSET
+        assert (op_id << 47) | low == payload
+
+
+@pytest.mark.parametrize(
+    ("data_size", "capacity", "expected"),
+    [
+        (0, 16384, 0),
+        (1, 16384, PAGE_SIZE),
+        (PAGE_SIZE, 16384, PAGE_SIZE),
+        (PAGE_SIZE + 4, 16384, 2 * PAGE_SIZE),
+        (100_000, 16384, 16384),
+    ],
+)
+def test_preload_size(data_size: int, capacity: int, expected: int):
+    assert preload_size(data_size, capacity) == expected
+
+
+def test_decoder_matches_worker(decoder: IcacheDecoder, tmp_path: Path):
+    values = sweep_instructions()
+    data = struct.pack(f"<{len(values)}I", *values)
+    bin_path = tmp_path / "sweep.bin"
+    bin_path.write_bytes(data)
+    path = build_schematic(bin_path, tmp_path / "sweep.msch", "--preload-icache")
+
+    world = World.load(path)
+    cpu = EmulatedCpu.find(world)
+    cpu.power_on()
+    while not cpu.started:
+        assert world.ticks < 600, "CPU didn't start"
+        world.tick()
+
+    assert world.metadata is not None
+    size = world.metadata.icache_preload_size
+    assert size is not None and size >= len(data)
+
+    mismatches = find_icache_mismatches(
+        world,
+        decoder,
+        data,
+        size,
+        ram_proc_vars=int(CONFIG.inputs["RAM_PROC_VARS"]),
+    )
+    assert list(mismatches) == []
@@ -0,0 +1,155 @@
+"""Round trips against the ProcessorAccess server in the mlogv32 mod, to check the
+wire protocol end to end instead of against the stub server.
+
+Skipped unless MLOGV32_SERVER is set to the `host:port` of a running server, eg.
+`MLOGV32_SERVER=localhost:5000 pytest python/tests/test_mod_server.py`. The tests
+reflash and restart the CPU, so don't point them at one running anything important.
+"""
+
+import logging
+import os
+import struct
+from typing import Iterator
+
+import pytest
+from mlogv32.processor_access import ProcessorAccess, ProcessorError
+from mlogv32.processor_pool import parse_endpoints
+
+SERVER = os.environ.get("MLOGV32_SERVER")
+
+pytestmark = pytest.mark.skipif(not SERVER, reason="MLOGV32_SERVER is not set")
+
+RAM_START = 0x80000000
+
+PROGRAM = struct.pack(
+    "<10I",
+    0x800000B7,  # lui x1, 0x80000
+    0xDEADC137,  # lui x2, 0xdeadc
+    0xEEF10113,  # addi x2, x2, -0x111
+    0x0020A023,  # sw x2, 0(x1)
+    0xF00001B7,  # lui x3, 0xf0000
+    0x06800213,  # addi x4, x0, 'h'
+    0x0041AA23,  # sw x4, 0x14(x3)
+    0x06900213,  # addi x4, x0, 'i'
+    0x0041AA23,  # sw x4, 0x14(x3)
+    0xFE002823,  # sw x0, -16(x0) (syscon power off)
+)
+"""Stores 0xdeadbeef at the start of RAM, writes "hi" to UART0, and powers off."""
+
+
+@pytest.fixture
+def client() -> Iterator[ProcessorAccess]:
+    assert SERVER is not None
+    [(host, port)] = parse_endpoints(SERVER)
+    with ProcessorAccess(host, port, log_level=logging.NOTSET) as client:
+        client.stop()
+        yield client
+        client.stop()
+
+
+def test_flash_run_dump(client: ProcessorAccess):
+    client.flash_bytes(PROGRAM)
+    client.start()
+    client.wait(stopped=True, paused=False)
+
+    # dumps are big-endian words, like the dump request
+    assert client.dump_bytes(RAM_START, 4) == bytes.fromhex("deadbeef")
+    assert client.status().error_output == ""
+
+
+def test_subscribe_unpause(client: ProcessorAccess):
+    client.flash_bytes(PROGRAM)
+    client.start(single_step=True)
+
+    statuses = list(client.subscribe(unpause=True))
+
+    # one event before each instruction, then a final one when it powers off
+    assert [status.pc for status in statuses[:-1]] == list(range(0, len(PROGRAM), 4))
+    assert all(status.running for status in statuses[:-1])
+    assert not statuses[-1].running
+    assert statuses[-1].registers[1:5] == [RAM_START, 0xDEADBEEF, 0xF0000000, ord("i")]
+
+
+def test_subscribe_unpaused_by_other_connection(client: ProcessorAccess):
+    assert SERVER is not None
+    [(host, port)] = parse_endpoints(SERVER)
+    client.flash_bytes(PROGRAM)
+    client.start(single_step=True)
+
+    pcs = list[int | None]()
+    with ProcessorAccess(host, port, log_level=logging.NOTSET) as other:
+        for status in client.subscribe():
+            pcs.append(status.pc)
+            if status.running:
+                other.unpause()
+
+    # every step is reported, even if the processor pauses again right away
+    assert pcs[:-1] == list(range(0, len(PROGRAM), 4))
+
+
+def test_step_trace(client: ProcessorAccess):
+    client.flash_bytes(PROGRAM)
+    client.start(single_step=True)
+
+    records = list(client.step(4, batch_size=3))
+
+    assert [record.pc for record in records] == [0, 4, 8, 12]
+    assert [record.instruction for record in records] == list(
+        struct.unpack_from("<4I", PROGRAM)
+    )
+    assert [(record.rd, record.value) for record in records] == [
+        (1, RAM_START),
+        (2, 0xDEADC000),
+        (2, 0xDEADBEEF),
+        (0, 0),  # sw doesn't write a register
+    ]
+    assert client.status().pc == 16
+
+    records = list(client.run_until(pc=32))
+
+    assert [record.pc for record in records] == [16, 20, 24, 28]
+    assert client.status().pc == 32
+
+
+def test_read_memory_rom_and_ram(client: ProcessorAccess):
+    client.flash_bytes(PROGRAM)
+
+    assert client.read_memory(0, len(PROGRAM)) == PROGRAM
+
+    client.start()
+    client.wait(stopped=True, paused=False)
+
+    # unlike dumps, memory reads are little-endian, ie. in address order
+    assert client.read_memory(RAM_START, 4) == struct.pack("<I", 0xDEADBEEF)
+
+
+def test_write_memory_round_trip(client: ProcessorAccess):
+    client.write_memory(RAM_START + 8, struct.pack("<2I", 0x01234567, 0x89ABCDEF))
+
+    assert client.read_memory(RAM_START + 8, 8) == struct.pack(
+        "<2I", 0x01234567, 0x89ABCDEF
+    )
+    assert client.dump_bytes(RAM_START + 8, 8) == bytes.fromhex("0123456789abcdef")
+
+
+def test_write_memory_rom(client: ProcessorAccess):
+    client.flash_bytes(PROGRAM)
+
+    # patch the first instruction to lui x1, 0x12345
+    client.write_memory(0, struct.pack("<I", 0x123450B7))
+
+    assert client.read_memory(0, len(PROGRAM)) == (
+        struct.pack("<I", 0x123450B7) + PROGRAM[4:]
+    )
+
+
+def test_registers(client: ProcessorAccess):
+    client.write_memory(4 * 5, struct.pack("<I", 42), space="registers")
+
+    assert client.read_memory(4 * 5, 4, space="registers") == struct.pack("<I", 42)
+    assert client.status().registers[5] == 42
+
+
+def test_read_memory_out_of_range(client: ProcessorAccess):
+    with pytest.raises(ProcessorError):
+        client.read_memory(0x70000000, 4)
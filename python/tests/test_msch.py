@@ -0,0 +1,58 @@
+import random
+from pathlib import Path
+
+import pytest
+from mlogv32.utils.msch import ProcessorConfigCompressor, ProcessorConfigUTF8
+from pymsch import ProcessorLink
+
+REPO_ROOT = Path(__file__).parents[2]
+
+LINKS = [
+    [],
+    [ProcessorLink(1, 0, "cell1")],
+    [ProcessorLink(1, 0, "cell1"), ProcessorLink(-3, 7, "processor12")],
+    [ProcessorLink(x, -x, f"bank{x}") for x in range(100)],
+    [ProcessorLink(0, 1, "ünïcödé")],
+]
+
+
+def random_code(size: int) -> str:
+    # mostly incompressible, so the links land past zlib's 32 KiB window
+    rng = random.Random(size)
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz \n") for _ in range(size))
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "",
+        "set x 1\nprint x\n",
+        'print "ünïcödé"\n',
+        (REPO_ROOT / "src/cpu/worker.mlog.jinja").read_text("utf-8"),
+        random_code(100_000),
+    ],
+    ids=["empty", "short", "unicode", "worker", "large"],
+)
+@pytest.mark.parametrize("max_workers", [1, None])
+def test_compressor_matches_zlib(code: str, max_workers: int | None):
+    compressor = ProcessorConfigCompressor(code, max_workers=max_workers)
+
+    # twice, to check the memoized results too
+    results = compressor.compress_many(LINKS + LINKS)
+
+    for links, result in zip(LINKS + LINKS, results, strict=True):
+        assert result == ProcessorConfigUTF8(code, links).compress()
+
+
+def test_compressor_results_are_copies():
+    compressor = ProcessorConfigCompressor("set x 1")
+    links = [ProcessorLink(1, 0, "cell1")]
+
+    result = compressor.compress(links)
+    result[:] = b""
+
+    decompressed = ProcessorConfigUTF8.decompress(compressor.compress(links))
+    assert decompressed.code == "set x 1"
+    assert [(link.x, link.y, link.name) for link in decompressed.links] == [
+        (1, 0, "cell1")
+    ]
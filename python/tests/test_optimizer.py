@@ -0,0 +1,227 @@
+from textwrap import dedent
+
+import pytest
+from mlogv32.preprocessor.optimizer import optimize_mlog
+
+
+def optimize(text: str, *passes: str, shared: tuple[str, ...] = ()) -> str:
+    result, _ = optimize_mlog(dedent(text), passes, shared=shared)
+    return result
+
+
+def test_thread_retargets_jump_chains():
+    text = """
+    start:
+        jump a always
+        print 1
+    a:
+        jump b always
+    b:
+        print x
+        end
+    """
+
+    assert optimize(text, "thread") == dedent("""
+    start:
+        jump b always
+        print 1
+    a:
+    b:
+        print x
+        end
+    """)
+
+
+def test_thread_stops_at_cycles():
+    text = """
+    start:
+        jump a always
+    a:
+        jump b always
+    b:
+        jump a always
+    """
+
+    # still an infinite loop from each label, without following the cycle forever
+    assert optimize(text, "thread") == dedent("""
+    start:
+        jump b always
+    a:
+        jump a always
+    b:
+        jump b always
+    """)
+
+
+def test_thread_retargets_counter_label_refs():
+    text = """
+    start:
+        set @counter %a%
+    a:
+        jump b always
+    b:
+        end
+    """
+
+    assert optimize(text, "thread") == dedent("""
+    start:
+        set @counter %b%
+    a:
+    b:
+        end
+    """)
+
+
+@pytest.mark.parametrize(
+    ("statement", "expected"),
+    [
+        ("op add x 2 0x10", "set x 18"),
+        ("op sub x -0x10 0b11", "set x -19"),
+        ("op shl x 1 52", "set x 4503599627370496"),
+        ("op max x -1 +5", "set x 5"),
+        # would be inexact as a double
+        ("op shl x 1 53", "op shl x 1 53"),
+        ("op shl x 1 64", "op shl x 1 64"),
+        # mlog parses these as variable names, not numbers
+        ("op add x 0o17 1", "op add x 0o17 1"),
+        ("op add x 0X10 1", "op add x 0X10 1"),
+        ("op add x 1_000 1", "op add x 1_000 1"),
+        # not folded, since the result isn't an integer
+        ("op div x 1 2", "op div x 1 2"),
+        ("op add x 1.5 1", "op add x 1.5 1"),
+    ],
+)
+def test_fold_op(statement: str, expected: str):
+    text = f"""
+    start:
+        {statement}
+        print x
+    """
+
+    assert optimize(text, "fold") == dedent(f"""
+    start:
+        {expected}
+        print x
+    """)
+
+
+def test_fold_jumps():
+    text = """
+    start:
+        jump a lessThan 1 2
+        jump a equal 1 0x2
+        jump a equal 1 x
+    a:
+        end
+    """
+
+    assert optimize(text, "fold") == dedent("""
+    start:
+        jump a always
+        jump a equal 1 x
+    a:
+        end
+    """)
+
+
+def test_dse_removes_overwritten_stores():
+    text = """
+    start:
+        set x 1
+        set y y
+        op add x 2 3
+        print x
+    """
+
+    assert optimize(text, "dse") == dedent("""
+    start:
+        op add x 2 3
+        print x
+    """)
+
+
+def test_dse_keeps_stores_that_are_read():
+    text = """
+    start:
+        set x 1
+        op add x x 1
+        set y 1
+        jump start always
+        set y 2
+        set z 1
+        wait 1
+        set z 2
+        print y
+    """
+
+    assert optimize(text, "dse") == dedent(text)
+
+
+def test_dse_keeps_shared_variables():
+    text = """
+    start:
+        set pc 1
+        set pc 2
+        print pc
+    """
+
+    assert optimize(text, "dse", shared=("pc",)) == dedent(text)
+
+
+def test_unreachable_removes_dead_code():
+    text = """
+    start:
+        jump a always
+        print 1
+        print 2
+    a:
+        end
+        print 3
+    """
+
+    assert optimize(text, "unreachable") == dedent("""
+    start:
+        jump a always
+    a:
+        end
+    """)
+
+
+def test_unreachable_keeps_counter_offsets():
+    text = """
+    start:
+        op add ret @counter 1
+        jump a always
+        end
+    a:
+        set @counter ret
+    """
+
+    assert optimize(text, "unreachable") == dedent(text)
+
+
+def test_all_passes_reach_fixed_point():
+    text = """
+    start:
+        op add x 1 1
+        jump a notEqual x 2
+        jump b equal 2 2
+        print 1
+    a:
+        jump b always
+    b:
+        print x
+        end
+    """
+
+    result, report = optimize_mlog(dedent(text))
+
+    assert result == dedent("""
+    start:
+        set x 2
+    a:
+    b:
+        print x
+        end
+    """)
+    assert report.total_saved == 4
@@ -0,0 +1,115 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from lark import Token
+from lark.exceptions import LarkError
+from mlogv32.preprocessor.parser.mlog import (
+    AST,
+    Label,
+    ScanError,
+    parse_mlog,
+    scan_mlog,
+)
+
+REPO_ROOT = Path(__file__).parents[2]
+
+MLOG_PATHS = sorted((REPO_ROOT / "src").rglob("*.mlog"))
+
+SNIPPETS = [
+    "",
+    "\n\n;;\n",
+    "set x 1",
+    "set x 1; set y 2;;set z 3\n",
+    "  \tset\t x   1  \n",
+    "label:\nlabel2: set x 1",
+    "jump %label% always",
+    'print "hello world"',
+    'print "a;b#c" # comment',
+    'print "unterminated',
+    '"string" first',
+    "# only a comment\nset x 1 # trailing",
+    "set x 1#comment",
+    "#directive assert_counter",
+    "#directive start_fetch\n#directive end_fetch",
+    "#directive push_saved a b c\n#directive pop_saved",
+    "#directive start_assert_length 4\n#directive end_assert_length",
+    "#directive unknown",
+    "%label%",
+    "set % 1",
+    "set x: 1",
+    "op add x y: z",
+    "read a b c\r\nwrite a b c",
+]
+
+
+def ast_key(ast: AST):
+    result = list[tuple[str, list[tuple[object, ...]]]]()
+    for node in ast:
+        match node:
+            case Label(name=name):
+                tokens = [name]
+            case _:
+                tokens = [node.name, *node.args]
+        result.append((type(node).__name__, [token_key(token) for token in tokens]))
+    return result
+
+
+def token_key(token: Token):
+    return (
+        token.type,
+        str(token),
+        token.start_pos,
+        token.line,
+        token.column,
+        token.end_line,
+        token.end_column,
+        token.end_pos,
+    )
+
+
+def assert_parsers_agree(text: str):
+    try:
+        want = ast_key(parse_mlog(text, fast=False))
+    except LarkError:
+        want = None
+    try:
+        got = ast_key(scan_mlog(text))
+    except ScanError:
+        got = None
+    assert got == want
+
+
+@pytest.mark.parametrize("text", SNIPPETS)
+def test_scanner_matches_lark_snippet(text: str):
+    assert_parsers_agree(text)
+
+
+@pytest.mark.parametrize(
+    "path",
+    MLOG_PATHS,
+    ids=[path.relative_to(REPO_ROOT).as_posix() for path in MLOG_PATHS],
+)
+def test_scanner_matches_lark_file(path: Path):
+    assert_parsers_agree(path.read_text("utf-8"))
+
+
+@pytest.mark.parametrize(
+    ("module", "heavy"),
+    [
+        ("mlogv32.preprocessor.parser", ["jinja2", "pydantic", "typer"]),
+        ("mlogv32.preprocessor.filters", ["pydantic", "typer"]),
+    ],
+)
+def test_imports_stay_light(module: str, heavy: list[str]):
+    # in a new interpreter, since other tests have already imported everything
+    code = f"import sys, {module}; print(*(m for m in {heavy!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        env={"PYTHONPATH": str(REPO_ROOT / "python/src")},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.split() == []
@@ -0,0 +1,202 @@
+import logging
+import struct
+from typing import Iterator
+
+import pytest
+from conftest import HALT_AFTER
+from mlogv32.processor_access import ProcessorAccess, ProcessorError
+from mlogv32.scripts.stub_server import RAM_START, StubProcessor, StubServer
+
+
+@pytest.fixture
+def client(server: StubServer) -> Iterator[ProcessorAccess]:
+    host, port = str(server.server_address[0]), server.server_address[1]
+    with ProcessorAccess(host, port, log_level=logging.NOTSET) as client:
+        yield client
+
+
+def test_flash_bytes(client: ProcessorAccess, processor: StubProcessor):
+    image = bytes(range(256)) * 4
+
+    client.flash_bytes(image)
+
+    assert processor.rom == image
+
+
+def test_flash_bytes_unaligned(client: ProcessorAccess, processor: StubProcessor):
+    with pytest.raises(ProcessorError):
+        client.flash_bytes(b"abc")
+
+    # the connection is still usable afterwards
+    client.flash_bytes(b"abcd")
+    assert processor.rom == b"abcd"
+
+
+def test_dump_bytes_words_are_big_endian(
+    client: ProcessorAccess,
+    processor: StubProcessor,
+):
+    processor.ram[:8] = struct.pack("<2I", 0xDEADBEEF, 0x01234567)
+
+    assert client.dump_bytes(RAM_START, 8) == bytes.fromhex("deadbeef01234567")
+
+
+def test_dump_bytes_defaults_to_all_of_ram(
+    client: ProcessorAccess,
+    processor: StubProcessor,
+):
+    processor.ram[-4:] = struct.pack("<I", 0x11223344)
+
+    data = client.dump_bytes()
+
+    assert len(data) == len(processor.ram)
+    assert data[-4:] == bytes.fromhex("11223344")
+
+
+def test_flash_then_run_then_dump(client: ProcessorAccess, processor: StubProcessor):
+    client.stop()
+    client.flash_bytes(bytes(1024))
+    client.start()
+    client.wait(stopped=True, paused=False)
+
+    assert client.dump_bytes(RAM_START, 64) == bytes(64)
+    assert client.status().minstret == HALT_AFTER
+
+
+def test_subscribe_tracks_status(client: ProcessorAccess, processor: StubProcessor):
+    client.start(single_step=True)
+
+    statuses = list(client.subscribe(unpause=True))
+
+    # one event per pause, then a final one when the processor stops
+    assert len(statuses) == HALT_AFTER + 1
+    assert [status.minstret for status in statuses] == list(range(HALT_AFTER + 1))
+    assert statuses[-1] == client.status()
+    assert not statuses[-1].running
+
+
+def test_subscribe_when_stopped(client: ProcessorAccess):
+    statuses = list(client.subscribe())
+
+    assert len(statuses) == 1
+    assert statuses[0] == client.status()
+
+
+def test_subscribe_never_pauses(client: ProcessorAccess, processor: StubProcessor):
+    processor.halt_after = None
+    client.start()
+
+    with pytest.raises(ProcessorError):
+        list(client.subscribe())
+
+
+def test_step_returns_trace(client: ProcessorAccess):
+    rom = struct.pack("<64I", *range(1000, 1064))
+    client.flash_bytes(rom)
+    client.start(single_step=True)
+
+    records = list(client.step(10, batch_size=4))
+
+    assert [record.pc for record in records] == list(range(0, 40, 4))
+    assert [record.instruction for record in records] == list(range(1000, 1010))
+    # the stub writes the next pc to x1 after each step
+    assert all(record.rd == 1 for record in records)
+    assert [record.value for record in records] == list(range(4, 44, 4))
+    assert client.status().pc == 40
+
+
+def test_run_until_pc(client: ProcessorAccess):
+    client.flash_bytes(bytes(256))
+    client.start(single_step=True)
+
+    records = list(client.run_until(pc=40, batch_size=3))
+
+    assert records[-1].pc == 36
+    assert client.status().pc == 40
+
+
+def test_run_until_instret(client: ProcessorAccess):
+    client.flash_bytes(bytes(256))
+    client.start(single_step=True)
+
+    records = list(client.run_until(instret=25, batch_size=8))
+
+    assert len(records) == 25
+    assert client.status().minstret == 25
+
+
+def test_run_until_halt(client: ProcessorAccess):
+    client.flash_bytes(bytes(1024))
+    client.start(single_step=True)
+
+    records = list(client.run_until())
+
+    assert len(records) == HALT_AFTER
+    assert not client.status().running
+
+
+def test_read_memory_is_little_endian(
+    client: ProcessorAccess,
+    processor: StubProcessor,
+):
+    processor.ram[1020:1028] = struct.pack("<2I", 0xDEADBEEF, 0x01234567)
+
+    # crosses a page boundary
+    data = client.read_memory(RAM_START + 1020, 8)
+
+    assert data == struct.pack("<2I", 0xDEADBEEF, 0x01234567)
+
+
+def test_write_memory_round_trip(client: ProcessorAccess, processor: StubProcessor):
+    client.read_memory(RAM_START, 16)  # fill the cache
+
+    client.write_memory(RAM_START + 4, struct.pack("<I", 0xCAFEF00D))
+
+    assert client.read_memory(RAM_START, 12) == struct.pack("<3I", 0, 0xCAFEF00D, 0)
+    assert processor.ram[4:8] == struct.pack("<I", 0xCAFEF00D)
+
+
+def test_write_memory_rom(client: ProcessorAccess, processor: StubProcessor):
+    client.flash_bytes(bytes(64))
+
+    client.write_memory(8, b"\x01\x02\x03\x04")
+
+    assert processor.rom[8:12] == b"\x01\x02\x03\x04"
+    assert client.read_memory(0, 16) == bytes(8) + b"\x01\x02\x03\x04" + bytes(4)
+
+
+def test_write_memory_unaligned(client: ProcessorAccess):
+    with pytest.raises(ValueError):
+        client.write_memory(RAM_START + 2, b"\x00\x00\x00\x00")
+    with pytest.raises(ValueError):
+        client.write_memory(RAM_START, b"\x00\x00")
+
+
+def test_registers_and_csrs(client: ProcessorAccess, processor: StubProcessor):
+    processor.csrs[0x340] = 7
+
+    client.write_memory(4 * 5, struct.pack("<I", 42), space="registers")
+
+    assert client.status().registers[5] == 42
+    assert client.read_memory(4 * 5, 4, space="registers") == struct.pack("<I", 42)
+    assert client.read_memory(4 * 0x340, 4, space="csrs") == struct.pack("<I", 7)
+
+
+def test_read_memory_cache_cleared_by_start(
+    client: ProcessorAccess,
+    processor: StubProcessor,
+):
+    assert client.read_memory(RAM_START, 4) == bytes(4)
+
+    # changed behind the client's back, so the cached page is stale
+    processor.ram[:4] = b"\xff\xff\xff\xff"
+    assert client.read_memory(RAM_START, 4) == bytes(4)
+
+    # anything that might run the processor clears the cache
+    client.start()
+    assert client.read_memory(RAM_START, 4) == b"\xff\xff\xff\xff"
+
+
+def test_read_memory_out_of_range(client: ProcessorAccess, processor: StubProcessor):
+    with pytest.raises(ValueError):
+        client.read_memory(RAM_START + len(processor.ram) - 4, 8)
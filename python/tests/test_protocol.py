@@ -0,0 +1,116 @@
+import re
+from pathlib import Path
+from typing import Any, get_args
+
+import pytest
+from mlogv32.processor_access import (
+    TRACE_RECORD,
+    MemorySpace,
+    Request,
+    Response,
+    UartDevice,
+    UartDirection,
+)
+
+KOTLIN_PATH = (
+    Path(__file__).parents[2]
+    / "mod/src/main/kotlin/gay/object/mlogv32/ProcessorAccess.kt"
+)
+
+CLASS_PATTERN = re.compile(
+    r"""
+    @SerialName\("(?P<name>\w+)"\)\s*
+    (?:data\s+)?(?:class|object)\s+\w+\s*
+    (?:\((?P<params>.*?)\)\s*)?
+    :\s*(?P<base>Request|Response)\(\)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+PARAM_PATTERN = re.compile(r"(?P<transient>@Transient\s+)?val\s+(?P<name>\w+)\s*:")
+
+
+ENUM_PATTERN = re.compile(
+    r"enum\s+class\s+(?P<name>\w+)\s*\{(?P<body>.*?)\}", re.DOTALL
+)
+
+
+def kotlin_enum(name: str) -> list[str]:
+    """Returns the entries of an enum class in the mod."""
+
+    source = KOTLIN_PATH.read_text("utf-8")
+    for match in ENUM_PATTERN.finditer(source):
+        if match["name"] == name:
+            body = re.sub(r"/\*.*?\*/", "", match["body"], flags=re.DOTALL)
+            entries = body.split(";")[0].split(",")
+            return [entry.strip() for entry in entries if entry.strip()]
+    raise KeyError(name)
+
+
+def kotlin_models(base: str) -> dict[str, set[str]]:
+    """Returns the JSON keys of each request or response class in the mod, by type."""
+
+    source = KOTLIN_PATH.read_text("utf-8")
+    models = dict[str, set[str]]()
+    for match in CLASS_PATTERN.finditer(source):
+        if match["base"] != base:
+            continue
+        models[match["name"]] = {
+            param["name"]
+            for param in PARAM_PATTERN.finditer(match["params"] or "")
+            if not param["transient"]
+        }
+    return models
+
+
+def python_models(union: Any) -> dict[str, set[str]]:
+    """Returns the JSON keys of each model in a discriminated union, by type."""
+
+    [members, _] = get_args(union.__value__)
+    models = dict[str, set[str]]()
+    for model in get_args(members):
+        [name] = get_args(model.model_fields["type"].annotation)
+        models[name] = {
+            field.alias or key
+            for key, field in model.model_fields.items()
+            if key != "type"
+        }
+    return models
+
+
+@pytest.mark.parametrize(
+    ("union", "base"),
+    [(Request, "Request"), (Response, "Response")],
+)
+def test_models_match_mod(union: Any, base: str):
+    # the mod's Json rejects unknown keys in requests, so both sides need exactly the
+    # same fields
+    assert python_models(union) == kotlin_models(base)
+
+
+@pytest.mark.parametrize(
+    ("alias", "name"),
+    [
+        (MemorySpace, "MemorySpace"),
+        (UartDevice, "UartDevice"),
+        (UartDirection, "UartDirection"),
+    ],
+)
+def test_enums_match_mod(alias: Any, name: str):
+    assert sorted(get_args(alias.__value__)) == sorted(kotlin_enum(name))
+
+
+def test_trace_record_matches_mod():
+    source = KOTLIN_PATH.read_text("utf-8")
+    step = source[source.index('@SerialName("step")') :]
+    step = step[: step.index("companion object")]
+
+    # the fields StepRequest packs into each record, in order
+    writes = re.findall(r"records\.put(Int)?\(", step)
+    fields = "".join("I" if is_int else "B" for is_int in writes)
+
+    assert "ByteOrder.LITTLE_ENDIAN" in step
+    assert TRACE_RECORD.format == f"<{fields}"
+    match = re.search(r"TRACE_RECORD_BYTES = (\d+)", source)
+    assert match is not None
+    assert int(match[1]) == TRACE_RECORD.size
@@ -0,0 +1,96 @@
+import random
+
+import pytest
+from mlogv32.utils.rom import RomEncoder, RomImage, RomSegment
+
+PROC_BYTES = 16
+
+
+def decode(encoder: RomEncoder, payloads: list[str], size: int) -> bytes:
+    """Reassembles an image from its ROM payloads, like the CPU reads it."""
+
+    result = bytearray()
+    for payload in payloads:
+        chunk = bytes(ord(c) - encoder.byte_offset for c in payload)
+        result += chunk.ljust(encoder.proc_bytes, b"\0")
+    return bytes(result[:size])
+
+
+@pytest.mark.parametrize("byte_offset", [0, 174])
+def test_encode_maps_each_byte(byte_offset: int):
+    encoder = RomEncoder(byte_offset=byte_offset)
+    data = bytes(range(256))
+
+    assert encoder.encode(data) == "".join(chr(byte_offset + b) for b in data)
+    assert encoder.encode(memoryview(data)[1:3]) == encoder.encode(data[1:3])
+
+
+def test_iter_payloads_round_trip():
+    encoder = RomEncoder(proc_bytes=PROC_BYTES)
+    data = random.Random(0).randbytes(5 * PROC_BYTES + 3)
+
+    payloads = list(encoder.iter_payloads(data))
+
+    assert len(payloads) == 6
+    assert [len(payload) for payload in payloads] == [PROC_BYTES] * 5 + [3]
+    assert decode(encoder, payloads, len(data)) == data
+
+
+def test_iter_payloads_skips_zero_procs():
+    encoder = RomEncoder(proc_bytes=PROC_BYTES)
+    data = (
+        bytes(PROC_BYTES)
+        + b"\1" * PROC_BYTES
+        + bytes(PROC_BYTES - 1)
+        + b"\2"
+        + bytes(PROC_BYTES)
+        + bytes(5)
+    )
+
+    payloads = list(encoder.iter_payloads(data))
+
+    assert [len(payload) for payload in payloads] == [0, PROC_BYTES, PROC_BYTES, 0, 0]
+    assert decode(encoder, payloads, len(data)) == data
+
+
+@pytest.mark.parametrize(
+    "segments",
+    [
+        [],
+        [RomSegment(0, bytes(range(40)))],
+        [RomSegment(0, b"\1" * 4), RomSegment(3 * PROC_BYTES + 2, b"\2" * 20)],
+        [RomSegment(PROC_BYTES - 1, b"\3\4"), RomSegment(5 * PROC_BYTES, bytes(4))],
+    ],
+    ids=["empty", "flat", "gap", "straddle"],
+)
+def test_iter_image_payloads_round_trip(segments: list[RomSegment]):
+    encoder = RomEncoder(proc_bytes=PROC_BYTES)
+    image = RomImage(segments)
+
+    payloads = list(encoder.iter_image_payloads(image))
+
+    # the same as encoding the flattened image
+    flat = image.read(0, image.size)
+    assert payloads == list(encoder.iter_payloads(flat))
+    assert decode(encoder, payloads, image.size) == flat
+
+
+def test_rom_image_used_bytes():
+    image = RomImage([RomSegment(4, b"\1" * 4), RomSegment(12, b"\2" * 8)])
+
+    assert image.used_bytes(0, 4) == 0
+    assert image.used_bytes(0, 32) == 12
+    assert image.used_bytes(6, 14) == 4
+    assert image.used_bytes(8, 12) == 0
+    assert image.used_bytes(20, 32) == 0
+
+
+def test_rom_image_pad():
+    image = RomImage([RomSegment(0, b"\1"), RomSegment(8, b"\2\3")])
+
+    padded = image.pad(4)
+
+    assert padded.segments == [RomSegment(0, b"\1"), RomSegment(8, b"\2\3\0\0")]
+    assert padded.size == 12
+    assert padded.pad(4) is padded
+    assert RomImage([]).pad(4).segments == []
@@ -6,6 +6,7 @@ from typing import Any
 
 import colorlog
 from mlogv32.processor_access import ProcessorAccess
+from mlogv32.processor_pool import ProcessorPool, parse_endpoints
 
 import riscof.log
 import riscof.utils as utils
@@ -54,13 +55,18 @@ class mlogv32(pluginTemplate):
         self.isa_spec: str = os.path.abspath(config["ispec"])
         self.platform_spec: str = os.path.abspath(config["pspec"])
 
-        self.host_repo_path: str = config["host_repo_path"]
-        self.riscof_repo_path: str = config["riscof_repo_path"]
-
         self.reloc_tests: list[str] = config["reloc_tests"].split(",")
 
         self.make = config["make"] if "make" in config else "make"
 
+        # ProcessorAccess servers to run the tests on, one per CPU; tests are dispatched
+        # to whichever CPU is idle
+        self.processors = parse_endpoints(
+            config["processors"]
+            if "processors" in config
+            else "host.docker.internal:5000"
+        )
+
         # We capture if the user would like the run the tests on the target or
         # not. If you are interested in just compiling the tests and not running
         # them on the target, then following variable should be set to False
@@ -155,22 +161,26 @@ class mlogv32(pluginTemplate):
 
         # run tests
 
-        with ProcessorAccess(
-            "host.docker.internal",
-            5000,
-            log_level=logging.DEBUG,
-        ) as processor:
+        logger.info(f"Running {len(testlist)} tests on {len(self.processors)} CPUs.")
+
+        with ProcessorPool(self.processors, log_level=logging.DEBUG) as pool:
             # we will iterate over each entry in the testlist. Each entry node will be refered to by the
             # variable testname.
-            for i, testname in enumerate(testlist):
+            for i, testname in enumerate(
+                pool.map(
+                    lambda processor, testname: self.run_test(
+                        testlist, testname, processor
+                    ),
+                    testlist,
+                )
+            ):
                 # hack
                 _, _, test_display_name = testname.partition(
                     "riscv-arch-test/riscv-test-suite/"
                 )
                 logger.info(
-                    f"Running test {i + 1}/{len(testlist)}: {test_display_name}"
+                    f"Finished test {i + 1}/{len(testlist)}: {test_display_name}"
                 )
-                self.run_test(testlist, testname, processor)
 
     def get_compile_command(self, testlist: dict[str, Any], testname: str):
         # hack
@@ -257,16 +267,8 @@ class mlogv32(pluginTemplate):
         # name of the elf file after compilation of the test
         elf = "dut.elf"
         binary = "dut.bin"
-        out = "out.bin"
 
         binary_file = os.path.join(test_dir, binary)
-        out_file = os.path.join(test_dir, out)
-
-        # hack
-        binary_file_host = binary_file.replace(
-            self.riscof_repo_path, self.host_repo_path
-        )
-        out_file_host = out_file.replace(self.riscof_repo_path, self.host_repo_path)
 
         # name of the signature file as per requirement of RISCOF. RISCOF expects the signature to
         # be named as DUT-<dut-name>.signature. The below variable creates an absolute path of
@@ -287,15 +289,13 @@ class mlogv32(pluginTemplate):
         logger.debug(f"{begin_signature=:#x} {end_signature=:#x} {signature_length=}")
 
         processor.stop()
-        processor.flash(binary_file_host)
+        with open(binary_file, "rb") as f:
+            processor.flash_bytes(f.read())
         processor.start()
         processor.wait(stopped=True, paused=False)
-        processor.dump(out_file_host, begin_signature, signature_length)
-
-        with open(out_file, "rb") as out, open(sig_file, "w") as sig:
-            data = out.read()
-            data += b"\0" * (len(data) % 4)
+        data = processor.dump_bytes(begin_signature, signature_length)
 
+        with open(sig_file, "w") as sig:
             for i in range(0, len(data), 4):
                 # LE -> BE
                 word = data[i : i + 4][::-1]
@@ -306,6 +306,7 @@ class mlogv32(pluginTemplate):
             raise RuntimeError(f"Processor execution failed: {msg}")
 
         logger.debug(f"Finished test: {testname}")
+        return testname
 
     def get_symbol_address(self, elf: str, symbol: str, cwd: str):
         output = subprocess.check_output(